@@ -500,6 +500,7 @@ def dashboard():
 def get_system_status():
     """Return system status information including database and OpenAI API status."""
     from app import SEMANTIC_AVAILABLE, client, LEGAL_KNOWLEDGE, active_model
+    from embedding_profiles import get_embedding_profile
 
     now_iso = datetime.utcnow().isoformat()
     
@@ -538,10 +539,7 @@ def get_system_status():
             "status": "connected" if openai_available else "disconnected",
             "model": active_model or os.getenv('OPENAI_MODEL', 'gpt-4') 
         },
-        "embedding": {
-            "model": os.getenv('EMBEDDING_MODEL', 'text-embedding-3-small'),
-            "dimensions": 1536  # Hardcoded for now
-        },
+        "embedding": get_embedding_profile("full").to_dict(),
         # Legacy fields for backwards compatibility
         "system_healthy": system_healthy,
         "openai_available": openai_available,
@@ -1062,7 +1062,8 @@ def get_llm_config():
         # Add real usage statistics if database is ready
         if is_ready():
             try:
-                with _CONN.cursor() as cur:
+                from db_utils import connection
+                with connection() as conn, conn.cursor() as cur:
                     # LLM usage stats from ask_logs
                     cur.execute(
                         """
@@ -1445,7 +1446,7 @@ def get_realtime_analytics():
     try:
         if is_ready():
             try:
-                from retrieval import get_realtime_analytics, _CONN
+                from retrieval import get_realtime_analytics
                 realtime = get_realtime_analytics()
                 if realtime:
                     return jsonify(realtime)
@@ -1471,7 +1472,7 @@ def get_analytics_overview():
     try:
         if is_ready():
             try:
-                from retrieval import get_analytics_overview, _CONN
+                from retrieval import get_analytics_overview
                 overview = get_analytics_overview(days=7)
                 if overview:
                     return jsonify(overview)
@@ -1500,9 +1501,10 @@ def get_rag_performance():
         if is_ready():
             try:
                 from retrieval_extensions import get_rag_performance_metrics
-                from retrieval import _CONN
+                from db_utils import connection
                 
-                metrics = get_rag_performance_metrics(days=7, conn=_CONN)
+                with connection() as conn:
+                    metrics = get_rag_performance_metrics(days=7, conn=conn)
                 if metrics:
                     return jsonify({
                         'status': 'success',
@@ -1555,9 +1557,10 @@ def get_vector_health():
         if is_ready():
             try:
                 from retrieval_extensions import get_vector_database_health
-                from retrieval import _CONN
+                from db_utils import connection
                 
-                health = get_vector_database_health(conn=_CONN)
+                with connection() as conn:
+                    health = get_vector_database_health(conn=conn)
                 if health:
                     return jsonify({
                         'status': 'operational',
@@ -1593,9 +1596,10 @@ def get_api_libraries_metrics():
         if is_ready():
             try:
                 from retrieval_extensions import get_api_library_metrics
-                from retrieval import _CONN
+                from db_utils import connection
                 
-                metrics = get_api_library_metrics(days=7, conn=_CONN)
+                with connection() as conn:
+                    metrics = get_api_library_metrics(days=7, conn=conn)
                 if metrics:
                     return jsonify({
                         'status': 'success',
@@ -1658,19 +1662,20 @@ def log_api_library_usage():
         if is_ready():
             try:
                 from retrieval_extensions import log_api_usage
-                from retrieval import _CONN
+                from db_utils import connection
                 
-                logged = log_api_usage(
-                    api_name=api_name,
-                    endpoint=endpoint,
-                    success=success,
-                    response_time_ms=response_time_ms,
-                    cost=cost,
-                    error_message=error_message,
-                    request_data=data.get('request_data'),
-                    response_data=data.get('response_data'),
-                    conn=_CONN
-                )
+                with connection() as conn:
+                    logged = log_api_usage(
+                        api_name=api_name,
+                        endpoint=endpoint,
+                        success=success,
+                        response_time_ms=response_time_ms,
+                        cost=cost,
+                        error_message=error_message,
+                        request_data=data.get('request_data'),
+                        response_data=data.get('response_data'),
+                        conn=conn
+                    )
                 
                 if logged:
                     return jsonify({'status': 'logged'})
@@ -1764,7 +1769,8 @@ def openai_dashboard():
         # If database is available, get real stats
         if is_ready():
             try:
-                with _CONN.cursor() as cur:
+                from db_utils import connection
+                with connection() as conn, conn.cursor() as cur:
                     # Get usage statistics
                     cur.execute("""
                         SELECT 
@@ -15,15 +15,18 @@ try:
     # When running as a package: `backend.admin_dashboard_v3`
     from backend.db_utils import get_db_manager  # type: ignore
     from backend.openai_utils import get_openai_status, openai_manager  # type: ignore
+    from backend import analytics_rollup  # type: ignore
 except ImportError:
     try:
         # Relative import when inside the backend package
         from .db_utils import get_db_manager  # type: ignore
         from .openai_utils import get_openai_status, openai_manager  # type: ignore
+        from . import analytics_rollup  # type: ignore
     except ImportError:
         # Fallback for direct script execution
         from db_utils import get_db_manager  # type: ignore
         from openai_utils import get_openai_status, openai_manager  # type: ignore
+        import analytics_rollup  # type: ignore
 
 # Optional imports with fallbacks
 try:
@@ -48,6 +51,9 @@ logger = logging.getLogger(__name__)
 # Create Blueprint
 admin_bp_v3 = Blueprint('admin_v3', __name__, url_prefix='/admin/v3')
 
+# Window of the query analytics page (read from the rollups)
+QUERY_ANALYTICS_DAYS = int(os.getenv("QUERY_ANALYTICS_DAYS", "30"))
+
 @admin_bp_v3.route('/')
 def dashboard():
     """Main dashboard with system overview"""
@@ -82,25 +88,15 @@ def dashboard():
                 })
             
             # Query analytics summary
-            analytics_results = db_manager.execute_query("""
-                SELECT 
-                    COUNT(*) as total_queries,
-                    COUNT(*) FILTER (WHERE success = true) as successful_queries,
-                    SUM(llm_cost) as total_cost,
-                    AVG(response_time_ms) as avg_response_time
-                FROM ask_logs 
-                WHERE created_at > now() - interval '7 days'
-            """)
-            
-            if analytics_results:
-                row = analytics_results[0]
-                query_analytics = {
-                    'total_queries': int(row[0] or 0),
-                    'successful_queries': int(row[1] or 0),
-                    'success_rate': (int(row[1] or 0) / max(int(row[0] or 1), 1)) * 100,
-                    'total_cost': float(row[2] or 0),
-                    'avg_response_time': float(row[3] or 0)
-                }
+            summary = analytics_rollup.get_usage_summary("ask", days=7)
+            query_analytics = {
+                'total_queries': summary['requests'],
+                'successful_queries': summary['successes'],
+                'success_rate': summary['success_rate'] if summary['requests'] else 0,
+                'total_cost': summary['cost'],
+                'avg_response_time': summary['avg_response_time_ms'],
+                'p95_response_time': summary['p95_response_time_ms'] or 0
+            }
         
         return render_template('admin_dashboard_v3.html',
                              db_overview=db_overview,
@@ -191,31 +187,16 @@ def openai_management():
         
         if db_manager.is_ready():
             # Usage statistics for the last 30 days
-            stats_results = db_manager.execute_query("""
-                SELECT 
-                    COUNT(*) as total_calls,
-                    SUM(llm_tokens_used) as total_tokens,
-                    SUM(llm_cost) as total_cost,
-                    AVG(llm_tokens_used) as avg_tokens_per_call,
-                    AVG(llm_cost) as avg_cost_per_call,
-                    COUNT(DISTINCT llm_model) as models_used,
-                    COUNT(*) FILTER (WHERE success = true) * 100.0 / COUNT(*) as success_rate
-                FROM ask_logs 
-                WHERE created_at > now() - interval '30 days' 
-                AND llm_tokens_used > 0
-            """)
-            
-            if stats_results:
-                row = stats_results[0]
-                usage_stats = {
-                    'total_calls': int(row[0] or 0),
-                    'total_tokens': int(row[1] or 0),
-                    'total_cost': float(row[2] or 0),
-                    'avg_tokens_per_call': float(row[3] or 0),
-                    'avg_cost_per_call': float(row[4] or 0),
-                    'models_used': int(row[5] or 0),
-                    'success_rate': float(row[6] or 100)
-                }
+            summary = analytics_rollup.get_usage_summary("ask", days=30)
+            usage_stats = {
+                'total_calls': summary['llm_calls'],
+                'total_tokens': summary['tokens'],
+                'total_cost': summary['cost'],
+                'avg_tokens_per_call': summary['avg_tokens_per_call'],
+                'avg_cost_per_call': summary['avg_cost_per_call'],
+                'models_used': len(summary['models_used']),
+                'success_rate': summary['success_rate']
+            }
             
             # Recent API calls
             calls_results = db_manager.execute_query("""
@@ -334,43 +315,26 @@ def rag_system():
     
     try:
         db_manager = get_db_manager()
-        conn = db_manager.get_connection() if db_manager.is_ready() else None
         
         # Get RAG performance metrics
-        rag_metrics = get_rag_performance_metrics(days=7, conn=conn)
-        vector_health = get_vector_database_health(conn=conn)
+        if db_manager.is_ready():
+            with db_manager.connection() as conn:
+                rag_metrics = get_rag_performance_metrics(days=7, conn=conn)
+                vector_health = get_vector_database_health(conn=conn)
         
         # Get search type distribution
         if db_manager.is_ready():
-            results = db_manager.execute_query("""
-                SELECT search_type, COUNT(*) as count
-                FROM search_logs
-                WHERE created_at > now() - interval '7 days'
-                GROUP BY search_type
-            """)
-            for row in results:
-                search_distribution[row[0]] = int(row[1])
+            for row in analytics_rollup.get_dimension_counts("search_type", kind="search", days=7):
+                search_distribution[row['search_type']] = row['count']
         
         # Get top performing queries
         if db_manager.is_ready():
-            results = db_manager.execute_query("""
-                SELECT 
-                    question, COUNT(*) as frequency,
-                    AVG(context_found) as avg_context,
-                    AVG(CASE WHEN success THEN 1.0 ELSE 0.0 END) * 100 as success_rate
-                FROM ask_logs 
-                WHERE created_at > now() - interval '7 days'
-                GROUP BY question
-                ORDER BY frequency DESC, success_rate DESC
-                LIMIT 10
-            """)
-            
-            for row in results:
+            for q in analytics_rollup.get_top_queries(limit=10, days=7, kind="ask"):
                 top_queries.append({
-                    'question': row[0][:150] + '...' if len(row[0]) > 150 else row[0],
-                    'frequency': int(row[1]),
-                    'avg_context': float(row[2] or 0),
-                    'success_rate': float(row[3] or 0)
+                    'question': q['query'][:150] + '...' if len(q['query']) > 150 else q['query'],
+                    'frequency': q['count'],
+                    'avg_context': q['avg_context_found'],
+                    'success_rate': q['success_rate']
                 })
         
     except Exception as e:
@@ -403,58 +367,37 @@ def query_analytics():
     
     try:
         if db_manager.is_ready():
-            # Get basic stats from ask_logs
-            stats_results = db_manager.execute_query("""
-                SELECT 
-                    COUNT(*) as total_queries,
-                    COUNT(CASE WHEN success = true THEN 1 END) as successful_queries,
-                    AVG(CASE WHEN response_time_ms IS NOT NULL THEN response_time_ms END) as avg_response_time,
-                    SUM(CASE WHEN llm_cost IS NOT NULL THEN llm_cost END) as total_cost
-                FROM ask_logs
-            """)
-            
-            if stats_results and stats_results[0]:
-                row = stats_results[0]
-                total = int(row[0] or 0)
-                successful = int(row[1] or 0)
-                query_stats = {
-                    'total_queries': total,
-                    'successful_queries': successful,
-                    'success_rate': (successful / (total or 1)) * 100,
-                    'avg_response_time': float(row[2] or 0),
-                    'total_cost': float(row[3] or 0),
-                    'unique_sessions': 1  # Simplified
-                }
+            # Basic ask stats from the rollups
+            days = QUERY_ANALYTICS_DAYS
+            summary = analytics_rollup.get_usage_summary("ask", days=days)
+            overview = analytics_rollup.get_overview(days)
+            query_stats = {
+                'total_queries': summary['requests'],
+                'successful_queries': summary['successes'],
+                'success_rate': summary['success_rate'] if summary['requests'] else 0,
+                'avg_response_time': summary['avg_response_time_ms'],
+                'total_cost': summary['cost'],
+                'unique_sessions': overview.get('unique_sessions', 0)
+            }
             
             # Get top queries
-            top_results = db_manager.execute_query("""
-                SELECT 
-                    question, COUNT(*) as frequency,
-                    AVG(CASE WHEN response_time_ms IS NOT NULL THEN response_time_ms END) as avg_response_time,
-                    COUNT(CASE WHEN success = true THEN 1 END) * 100.0 / COUNT(*) as success_rate
-                FROM ask_logs 
-                GROUP BY question
-                ORDER BY frequency DESC
-                LIMIT 10
-            """)
-            
-            for row in top_results or []:
-                if row and row[0]:
-                    top_queries.append({
-                        'question': row[0],
-                        'frequency': int(row[1] or 0),
-                        'avg_response_time': float(row[2] or 0),
-                        'success_rate': float(row[3] or 0),
-                        'priority_score': int(row[1] or 0) * (float(row[3] or 0) / 100),
-                        'avg_context': 3.0  # Mock value
-                    })
+            for q in analytics_rollup.get_top_queries(limit=10, days=days, kind="ask"):
+                top_queries.append({
+                    'question': q['query'],
+                    'frequency': q['count'],
+                    'avg_response_time': q['avg_response_time'],
+                    'success_rate': q['success_rate'],
+                    'priority_score': q['count'] * (q['success_rate'] / 100),
+                    'avg_context': q['avg_context_found']
+                })
 
-            # Simple trend data
-            query_trends = [{
-                'date': '2024-08-20',
-                'query_count': query_stats['total_queries'],
-                'successful_count': query_stats['successful_queries']
-            }]
+            # Daily trend
+            for day in analytics_rollup.get_daily_trend("ask", days=days):
+                query_trends.append({
+                    'date': day['date'],
+                    'query_count': day['count'],
+                    'successful_count': day['successes']
+                })
         
     except Exception as e:
         print(f"Query analytics error: {e}")
@@ -477,8 +420,8 @@ def update_knowledge_item(item_id):
         if not db_manager.is_ready():
             return jsonify({'success': False, 'error': 'Database not available'})
         
-        # Update the item
-        from psycopg.types.json import Json
+        # Update the item (embedding is refreshed only when the content changed)
+        from retrieval import update_legal_chunk
         
         # Prepare metadata
         metadata = {
@@ -490,17 +433,15 @@ def update_knowledge_item(item_id):
             'tags': data.get('tags', [])
         }
         
-        result = db_manager.execute_query("""
-            UPDATE legal_chunks 
-            SET title = %s, content = %s, category = %s, metadata = %s, updated_at = now()
-            WHERE id = %s
-        """, (
-            data.get('title', ''),
-            data.get('content', ''),
-            data.get('category', ''),
-            Json(metadata),
-            item_id
-        ))
+        ok = update_legal_chunk(
+            item_id,
+            title=data.get('title', ''),
+            content=data.get('content', ''),
+            category=data.get('category', ''),
+            metadata=metadata
+        )
+        if not ok:
+            return jsonify({'success': False, 'error': 'Update failed'})
         
         return jsonify({'success': True, 'message': 'Item updated successfully'})
     
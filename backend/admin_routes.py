@@ -11,9 +11,11 @@ from query_storage import query_storage
 from retrieval import (
     admin_list_legal_chunks, admin_list_search_logs, 
     admin_list_ask_logs, admin_update_legal_chunk,
-    admin_get_database_status
+    admin_get_database_status, embed_texts_bulk
 )
 from db_utils import get_db_manager
+from document_cache import notify_changed
+from embedding_backfill import enqueue_backfill
 import openai
 import os
 import requests
@@ -108,9 +110,8 @@ def knowledge_base_item(chunk_id):
     """View and edit a specific knowledge base item"""
     try:
         db_manager = get_db_manager()
-        conn = db_manager.get_connection()
         
-        with conn.cursor() as cur:
+        with db_manager.connection() as conn, conn.cursor() as cur:
             cur.execute("""
                 SELECT 
                     id, parent_id, title, content, category, 
@@ -207,10 +208,9 @@ def openai_dashboard():
         
         # Get usage statistics from database
         db_manager = get_db_manager()
-        conn = db_manager.get_connection()
         
         stats = {}
-        with conn.cursor() as cur:
+        with db_manager.connection() as conn, conn.cursor() as cur:
             # Get total usage
             cur.execute("""
                 SELECT 
@@ -356,28 +356,42 @@ def lextml_add():
     try:
         law_data = request.json
         
+        # Resolved through the embedding store: unchanged text is not re-embedded
+        try:
+            vector = embed_texts_bulk([law_data['content']])[0]
+        except Exception as e:
+            logger.warning(f"Embedding failed during LexML add: {e}")
+            vector = None
+        
         # Add to database
         db_manager = get_db_manager()
-        conn = db_manager.get_connection()
         
-        with conn.cursor() as cur:
+        with db_manager.connection() as conn, conn.cursor() as cur:
+            # Changed content takes the new vector (NULL if embedding failed, for the
+            # backfill worker) so a stale embedding never stays attached to new text
             cur.execute("""
                 INSERT INTO legal_chunks (
-                    id, title, content, category, metadata
-                ) VALUES (%s, %s, %s, %s, %s)
+                    id, title, content, category, metadata, embedding
+                ) VALUES (%s, %s, %s, %s, %s, %s)
                 ON CONFLICT (id) DO UPDATE
                 SET title = EXCLUDED.title,
                     content = EXCLUDED.content,
+                    embedding = CASE WHEN legal_chunks.content IS DISTINCT FROM EXCLUDED.content
+                                     THEN EXCLUDED.embedding ELSE legal_chunks.embedding END,
                     updated_at = now()
+                RETURNING embedding IS NULL
             """, (
                 law_data['id'],
                 law_data['title'],
                 law_data['content'],
                 'lei_federal',
-                json.dumps(law_data.get('metadata', {}))
+                json.dumps(law_data.get('metadata', {})),
+                vector
             ))
-            
-        conn.commit()
+            missing_embedding = cur.fetchone()[0]
+            notify_changed(cur, [law_data['id']])
+        if missing_embedding:
+            enqueue_backfill([law_data['id']], reason="embedding failed during LexML add")
         
         return jsonify({'success': True, 'message': 'Law added successfully'})
         
@@ -0,0 +1,555 @@
+"""
+Analytics Rollup Module for JuSimples
+Hourly and daily rollups of search_logs and ask_logs (counts, successes, latency
+sums and histograms, tokens, cost) maintained incrementally by the log writer, so
+dashboards and the popular-searches endpoint never scan the raw log tables
+"""
+import os
+import bisect
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from db_utils import connection
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS_ENABLED = os.getenv("ANALYTICS_ROLLUPS_ENABLED", "true").lower() == "true"
+# Windows up to this many days are read from the hourly rollup, longer ones from the daily
+ROLLUP_HOURLY_MAX_DAYS = int(os.getenv("ROLLUP_HOURLY_MAX_DAYS", "7"))
+
+# Upper bounds (ms, inclusive) of the latency histogram buckets; one more bucket
+# counts everything slower than the last bound
+LATENCY_BUCKETS_MS: Tuple[int, ...] = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# Requests that found at least this many documents count as having good context
+GOOD_CONTEXT_DOCS = 3
+
+# Raw log table -> rollup kind, and the columns feeding the rollup dimensions
+KINDS = {"search_logs": "search", "ask_logs": "ask"}
+_QUERY_COLUMN = {"search_logs": "query", "ask_logs": "question"}
+_MAX_QUERY_LENGTH = 500
+
+HOURLY = "analytics_rollup_hourly"
+DAILY = "analytics_rollup_daily"
+
+_METRICS = ("requests", "successes", "latency_count", "latency_sum_ms", "context_found_sum",
+            "no_context", "good_context", "llm_calls", "tokens", "input_tokens", "output_tokens", "cost")
+
+_METRICS_UPSERT = """
+    INSERT INTO {table} AS r (bucket, kind, search_type, category, model, requests, successes,
+                              latency_count, latency_sum_ms, latency_hist, context_found_sum,
+                              no_context, good_context, llm_calls, tokens, input_tokens,
+                              output_tokens, cost)
+    VALUES (%(bucket)s, %(kind)s, %(search_type)s, %(category)s, %(model)s, %(requests)s,
+            %(successes)s, %(latency_count)s, %(latency_sum_ms)s, %(latency_hist)s::bigint[],
+            %(context_found_sum)s, %(no_context)s, %(good_context)s, %(llm_calls)s, %(tokens)s, %(input_tokens)s,
+            %(output_tokens)s, %(cost)s)
+    ON CONFLICT (bucket, kind, search_type, category, model) DO UPDATE SET
+        requests = r.requests + EXCLUDED.requests,
+        successes = r.successes + EXCLUDED.successes,
+        latency_count = r.latency_count + EXCLUDED.latency_count,
+        latency_sum_ms = r.latency_sum_ms + EXCLUDED.latency_sum_ms,
+        latency_hist = ARRAY(
+            SELECT COALESCE(a, 0) + COALESCE(b, 0)
+            FROM unnest(r.latency_hist, EXCLUDED.latency_hist) WITH ORDINALITY AS h(a, b, i)
+            ORDER BY i),
+        context_found_sum = r.context_found_sum + EXCLUDED.context_found_sum,
+        no_context = r.no_context + EXCLUDED.no_context,
+        good_context = r.good_context + EXCLUDED.good_context,
+        llm_calls = r.llm_calls + EXCLUDED.llm_calls,
+        tokens = r.tokens + EXCLUDED.tokens,
+        input_tokens = r.input_tokens + EXCLUDED.input_tokens,
+        output_tokens = r.output_tokens + EXCLUDED.output_tokens,
+        cost = r.cost + EXCLUDED.cost,
+        updated_at = now()
+"""
+
+_QUERY_UPSERT = """
+    INSERT INTO query_rollup_daily AS r (day, kind, query_normalized, query_text, requests, successes,
+                                         latency_count, latency_sum_ms, context_found_sum, last_seen)
+    VALUES (%(day)s, %(kind)s, %(query_normalized)s, %(query_text)s, %(requests)s, %(successes)s,
+            %(latency_count)s, %(latency_sum_ms)s, %(context_found_sum)s, %(last_seen)s)
+    ON CONFLICT (day, kind, query_normalized) DO UPDATE SET
+        query_text = CASE WHEN EXCLUDED.last_seen >= r.last_seen THEN EXCLUDED.query_text ELSE r.query_text END,
+        requests = r.requests + EXCLUDED.requests,
+        successes = r.successes + EXCLUDED.successes,
+        latency_count = r.latency_count + EXCLUDED.latency_count,
+        latency_sum_ms = r.latency_sum_ms + EXCLUDED.latency_sum_ms,
+        context_found_sum = r.context_found_sum + EXCLUDED.context_found_sum,
+        last_seen = GREATEST(r.last_seen, EXCLUDED.last_seen)
+"""
+
+_SESSION_INSERT = """
+    INSERT INTO session_rollup_daily (day, session_id) VALUES (%s, %s)
+    ON CONFLICT DO NOTHING
+"""
+
+
+def normalize_query(text: Optional[str]) -> str:
+    """Grouping key of a query: lowercased with whitespace collapsed"""
+    return " ".join((text or "").lower().split())[:_MAX_QUERY_LENGTH]
+
+
+def latency_bucket(ms: float) -> int:
+    """Index of the histogram bucket counting a latency of ms"""
+    return bisect.bisect_left(LATENCY_BUCKETS_MS, ms)
+
+
+def latency_percentile(hist: Iterable[int], q: float) -> Optional[float]:
+    """Estimate the q-quantile (0..1) of a latency histogram, interpolating inside
+    the bucket; the open last bucket reports its lower bound"""
+    counts = [int(c or 0) for c in hist]
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(counts):
+        if count and seen + count >= rank:
+            lower = LATENCY_BUCKETS_MS[i - 1] if i > 0 else 0
+            if i >= len(LATENCY_BUCKETS_MS):
+                return float(lower)
+            return lower + (LATENCY_BUCKETS_MS[i] - lower) * (rank - seen) / count
+        seen += count
+    return float(LATENCY_BUCKETS_MS[-1])
+
+
+def _as_utc(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc)
+
+
+class RollupBatch:
+    """Deltas for a batch of written log rows, merged per rollup key in memory and
+    then upserted: one statement per rollup table however many rows the batch had"""
+
+    def __init__(self):
+        self.metrics: Dict[Tuple, Dict[str, Any]] = {}
+        self.queries: Dict[Tuple, Dict[str, Any]] = {}
+        self.sessions = set()
+        self.rows = 0
+
+    def add(self, table: str, row: Dict[str, Any]) -> None:
+        kind = KINDS.get(table)
+        if kind is None:
+            return
+        at = _as_utc(row.get("created_at"))
+        success = row.get("success") is not False
+        latency = row.get("response_time_ms")
+        context_found = int(row.get("context_found") or 0)
+        tokens = int(row.get("llm_tokens_used") or 0)
+        hour = at.replace(minute=0, second=0, microsecond=0)
+        day = hour.replace(hour=0)
+        dims = (kind, row.get("search_type") or "", row.get("category") or "", row.get("llm_model") or "")
+
+        for grain, bucket in ((HOURLY, hour), (DAILY, day)):
+            m = self.metrics.get((grain, bucket) + dims)
+            if m is None:
+                m = self.metrics[(grain, bucket) + dims] = dict.fromkeys(_METRICS, 0)
+                m["latency_hist"] = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+            m["requests"] += 1
+            m["successes"] += int(success)
+            if latency is not None:
+                m["latency_count"] += 1
+                m["latency_sum_ms"] += int(latency)
+                m["latency_hist"][latency_bucket(latency)] += 1
+            m["context_found_sum"] += context_found
+            m["no_context"] += int(context_found == 0)
+            m["good_context"] += int(context_found >= GOOD_CONTEXT_DOCS)
+            if tokens > 0:
+                m["llm_calls"] += 1
+                m["tokens"] += tokens
+                m["input_tokens"] += int(row.get("input_tokens") or 0)
+                m["output_tokens"] += int(row.get("output_tokens") or 0)
+                m["cost"] += float(row.get("llm_cost") or 0)
+
+        text = (row.get(_QUERY_COLUMN[table]) or "").strip()
+        normalized = normalize_query(text)
+        if normalized:
+            q = self.queries.get((day.date(), kind, normalized))
+            if q is None:
+                q = self.queries[(day.date(), kind, normalized)] = {
+                    "requests": 0, "successes": 0, "latency_count": 0, "latency_sum_ms": 0,
+                    "context_found_sum": 0, "last_seen": at, "query_text": text[:_MAX_QUERY_LENGTH]}
+            q["requests"] += 1
+            q["successes"] += int(success)
+            if latency is not None:
+                q["latency_count"] += 1
+                q["latency_sum_ms"] += int(latency)
+            q["context_found_sum"] += context_found
+            if at >= q["last_seen"]:
+                q["last_seen"] = at
+                q["query_text"] = text[:_MAX_QUERY_LENGTH]
+        if row.get("session_id"):
+            self.sessions.add((day.date(), str(row["session_id"])))
+        self.rows += 1
+
+    def write(self, conn) -> None:
+        """Upsert the merged deltas in one transaction. Keys go in sorted order so
+        writers in several processes lock rollup rows in the same order."""
+        if not self.rows:
+            return
+        by_grain: Dict[str, List[Dict[str, Any]]] = {HOURLY: [], DAILY: []}
+        for key in sorted(self.metrics):
+            grain, bucket, kind, search_type, category, model = key
+            by_grain[grain].append({**self.metrics[key], "bucket": bucket, "kind": kind,
+                                    "search_type": search_type, "category": category, "model": model})
+        queries = [{**self.queries[key], "day": key[0], "kind": key[1], "query_normalized": key[2]}
+                   for key in sorted(self.queries)]
+        with conn.transaction(), conn.cursor() as cur:
+            for grain, params in by_grain.items():
+                if params:
+                    cur.executemany(_METRICS_UPSERT.format(table=grain), params)
+            if queries:
+                cur.executemany(_QUERY_UPSERT, queries)
+            if self.sessions:
+                cur.executemany(_SESSION_INSERT, sorted(self.sessions))
+
+
+def write_rollups(conn, rows_by_table: Dict[str, List[Dict[str, Any]]]) -> int:
+    """Fold rows just written to the raw log tables into the rollups; returns the
+    number of rows rolled up"""
+    if not ROLLUPS_ENABLED:
+        return 0
+    batch = RollupBatch()
+    for table, rows in rows_by_table.items():
+        for row in rows:
+            batch.add(table, row)
+    batch.write(conn)
+    return batch.rows
+
+
+# -- readers ------------------------------------------------------------------
+
+def _window(days: float) -> Tuple[str, datetime]:
+    """Rollup table and first bucket covering the last `days` days"""
+    now = datetime.now(timezone.utc)
+    since = now - timedelta(days=days)
+    if days <= ROLLUP_HOURLY_MAX_DAYS:
+        return HOURLY, since.replace(minute=0, second=0, microsecond=0)
+    return DAILY, since.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _rate(part: float, whole: float, default: float = 100.0) -> float:
+    return part * 100.0 / whole if whole else default
+
+
+def _avg(total: float, n: float) -> float:
+    return float(total) / n if n else 0.0
+
+
+def get_overview(days: int = 7) -> Dict[str, Any]:
+    """Totals, latency, success rates, sessions and top categories for the last N
+    days (same shape as retrieval.get_analytics_overview)"""
+    table, since = _window(days)
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT kind, SUM(requests), SUM(successes), SUM(latency_count), SUM(latency_sum_ms)
+            FROM {table} WHERE bucket >= %s GROUP BY kind;
+        """, (since,))
+        totals = {row[0]: [int(v or 0) for v in row[1:]] for row in cur.fetchall()}
+        cur.execute(f"""
+            SELECT category, SUM(requests) FROM {table}
+            WHERE bucket >= %s AND kind = 'search' AND category <> ''
+            GROUP BY category ORDER BY SUM(requests) DESC LIMIT 5;
+        """, (since,))
+        top_categories = [{"category": row[0], "count": int(row[1])} for row in cur.fetchall()]
+        cur.execute("SELECT COUNT(DISTINCT session_id) FROM session_rollup_daily WHERE day >= %s;",
+                    (since.date(),))
+        unique_sessions = int(cur.fetchone()[0] or 0)
+
+    search = totals.get("search", [0, 0, 0, 0])
+    ask = totals.get("ask", [0, 0, 0, 0])
+    avg_search_time = _avg(search[3], search[2])
+    avg_ask_time = _avg(ask[3], ask[2])
+    search_success_rate = _rate(search[1], search[0])
+    ask_success_rate = _rate(ask[1], ask[0])
+    return {
+        "total_queries": search[0] + ask[0],
+        "total_searches": search[0],
+        "total_asks": ask[0],
+        "avg_response_time": (avg_search_time + avg_ask_time) / 2 if avg_search_time or avg_ask_time else 0,
+        "avg_search_time": avg_search_time,
+        "avg_ask_time": avg_ask_time,
+        "success_rate": (search_success_rate + ask_success_rate) / 2,
+        "search_success_rate": search_success_rate,
+        "ask_success_rate": ask_success_rate,
+        "unique_sessions": unique_sessions,
+        "top_categories": top_categories,
+        "period_days": days,
+    }
+
+
+def _latency_hist(cur, table: str, where: str, params: Tuple) -> List[int]:
+    """Histogram summed over the rollup rows matching where"""
+    cur.execute(f"""
+        SELECT i, SUM(x) FROM {table}, unnest(latency_hist) WITH ORDINALITY AS u(x, i)
+        WHERE {where} GROUP BY i ORDER BY i;
+    """, params)
+    hist = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    for i, count in cur.fetchall():
+        if i <= len(hist):
+            hist[i - 1] = int(count or 0)
+    return hist
+
+
+def get_usage_summary(kind: str = "ask", days: int = 7) -> Dict[str, Any]:
+    """Requests, successes, latency (average and p50/p95 from the histograms),
+    context, tokens, cost and models of one kind over the last N days"""
+    table, since = _window(days)
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT COALESCE(SUM(requests), 0), COALESCE(SUM(successes), 0), COALESCE(SUM(latency_count), 0),
+                   COALESCE(SUM(latency_sum_ms), 0), COALESCE(SUM(llm_calls), 0), COALESCE(SUM(tokens), 0),
+                   COALESCE(SUM(input_tokens), 0), COALESCE(SUM(output_tokens), 0), COALESCE(SUM(cost), 0),
+                   COALESCE(SUM(context_found_sum), 0), COALESCE(SUM(no_context), 0),
+                   COALESCE(SUM(good_context), 0), array_remove(array_agg(DISTINCT model) FILTER (WHERE llm_calls > 0), '')
+            FROM {table} WHERE bucket >= %s AND kind = %s;
+        """, (since, kind))
+        row = cur.fetchone()
+        hist = _latency_hist(cur, table, "bucket >= %s AND kind = %s", (since, kind))
+
+    requests, successes, latency_count, latency_sum, llm_calls, tokens = (int(v) for v in row[:6])
+    cost = float(row[8])
+    return {
+        "kind": kind,
+        "period_days": days,
+        "requests": requests,
+        "successes": successes,
+        "success_rate": _rate(successes, requests),
+        "avg_response_time_ms": _avg(latency_sum, latency_count),
+        "p50_response_time_ms": latency_percentile(hist, 0.5),
+        "p95_response_time_ms": latency_percentile(hist, 0.95),
+        "llm_calls": llm_calls,
+        "tokens": tokens,
+        "input_tokens": int(row[6]),
+        "output_tokens": int(row[7]),
+        "cost": cost,
+        "avg_tokens_per_call": _avg(tokens, llm_calls),
+        "avg_cost_per_call": _avg(cost, llm_calls),
+        "avg_context_found": _avg(int(row[9]), requests),
+        "no_context_rate": _rate(int(row[10]), requests, default=0.0),
+        "good_context_rate": _rate(int(row[11]), requests, default=0.0),
+        "models_used": sorted(row[12] or []),
+    }
+
+
+def get_dimension_counts(dimension: str, kind: Optional[str] = None, days: int = 7,
+                         limit: int = 20) -> List[Dict[str, Any]]:
+    """Requests, success rate and average latency per search_type, category or model"""
+    if dimension not in ("search_type", "category", "model"):
+        raise ValueError(f"Unknown rollup dimension: {dimension}")
+    table, since = _window(days)
+    kind_filter = "AND kind = %s" if kind else ""
+    params: Tuple = (since, kind, limit) if kind else (since, limit)
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT {dimension}, SUM(requests), SUM(successes), SUM(latency_count), SUM(latency_sum_ms)
+            FROM {table} WHERE bucket >= %s {kind_filter} AND {dimension} <> ''
+            GROUP BY {dimension} ORDER BY SUM(requests) DESC LIMIT %s;
+        """, params)
+        return [
+            {
+                dimension: row[0],
+                "count": int(row[1]),
+                "success_rate": _rate(int(row[2] or 0), int(row[1] or 0)),
+                "avg_response_time": _avg(int(row[4] or 0), int(row[3] or 0)),
+            }
+            for row in cur.fetchall()
+        ]
+
+
+def get_query_trends(hours: int = 24) -> List[Dict[str, Any]]:
+    """Per-hour volume, successes and average latency over the last N hours"""
+    since = (datetime.now(timezone.utc) - timedelta(hours=hours)).replace(minute=0, second=0, microsecond=0)
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT bucket, SUM(requests), SUM(successes), SUM(latency_count), SUM(latency_sum_ms)
+            FROM {HOURLY} WHERE bucket >= %s GROUP BY bucket ORDER BY bucket;
+        """, (since,))
+        return [
+            {
+                "hour": str(row[0]),
+                "total_queries": int(row[1]),
+                "successful_queries": int(row[2]),
+                "avg_response_time": _avg(int(row[4] or 0), int(row[3] or 0)),
+            }
+            for row in cur.fetchall()
+        ]
+
+
+def get_daily_trend(kind: Optional[str] = None, days: int = 30) -> List[Dict[str, Any]]:
+    """Per-day volume, success rate and average latency over the last N days"""
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).replace(hour=0, minute=0, second=0,
+                                                                        microsecond=0)
+    kind_filter = "AND kind = %s" if kind else ""
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT bucket, SUM(requests), SUM(successes), SUM(latency_count), SUM(latency_sum_ms)
+            FROM {DAILY} WHERE bucket >= %s {kind_filter} GROUP BY bucket ORDER BY bucket;
+        """, (since, kind) if kind else (since,))
+        return [
+            {
+                "date": row[0].date().isoformat(),
+                "count": int(row[1]),
+                "successes": int(row[2] or 0),
+                "success_rate": _rate(int(row[2] or 0), int(row[1] or 0)),
+                "avg_response_time": _avg(int(row[4] or 0), int(row[3] or 0)),
+            }
+            for row in cur.fetchall()
+        ]
+
+
+def get_top_queries(limit: int = 10, days: int = 7, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Most frequent queries of the last N days (same shape as
+    retrieval.get_popular_queries, plus the average context found)"""
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).date()
+    kind_filter = "AND kind = %s" if kind else ""
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT (array_agg(query_text ORDER BY last_seen DESC))[1], SUM(requests), SUM(successes),
+                   SUM(latency_count), SUM(latency_sum_ms), MAX(last_seen),
+                   string_agg(DISTINCT kind, ', '), SUM(context_found_sum)
+            FROM query_rollup_daily
+            WHERE day >= %s {kind_filter} AND length(query_normalized) > 2
+            GROUP BY query_normalized
+            ORDER BY SUM(requests) DESC, MAX(last_seen) DESC
+            LIMIT %s;
+        """, (since, kind, limit) if kind else (since, limit))
+        return [
+            {
+                "query": (row[0] or "").strip(),
+                "count": int(row[1]),
+                "avg_response_time": _avg(int(row[4] or 0), int(row[3] or 0)),
+                "success_rate": _rate(int(row[2] or 0), int(row[1] or 0)),
+                "last_queried": str(row[5]),
+                "query_types": row[6] or "search",
+                "avg_context_found": _avg(int(row[7] or 0), int(row[1] or 0)),
+            }
+            for row in cur.fetchall()
+        ]
+
+
+# -- backfill -----------------------------------------------------------------
+
+def _hist_sql() -> str:
+    """SQL building a latency histogram array with the same buckets as latency_bucket"""
+    parts = []
+    lower = None
+    for bound in LATENCY_BUCKETS_MS:
+        low = f"response_time_ms > {lower} AND " if lower is not None else ""
+        parts.append(f"COUNT(*) FILTER (WHERE {low}response_time_ms <= {bound})")
+        lower = bound
+    parts.append(f"COUNT(*) FILTER (WHERE response_time_ms > {lower})")
+    return "ARRAY[" + ", ".join(parts) + "]::bigint[]"
+
+
+_NORMALIZE_SQL = "left(lower(btrim(regexp_replace({col}, '\\s+', ' ', 'g'))), %d)" % _MAX_QUERY_LENGTH
+
+_RAW_SOURCES = {
+    # table -> (model, llm_calls, tokens, input_tokens, output_tokens, cost) expressions
+    "search_logs": ("''", "0", "0", "0", "0", "0"),
+    "ask_logs": ("COALESCE(llm_model, '')", "COUNT(*) FILTER (WHERE llm_tokens_used > 0)",
+                 "COALESCE(SUM(llm_tokens_used) FILTER (WHERE llm_tokens_used > 0), 0)",
+                 "COALESCE(SUM(input_tokens) FILTER (WHERE llm_tokens_used > 0), 0)",
+                 "COALESCE(SUM(output_tokens) FILTER (WHERE llm_tokens_used > 0), 0)",
+                 "COALESCE(SUM(llm_cost) FILTER (WHERE llm_tokens_used > 0), 0)"),
+}
+
+
+def _utc_trunc(field: str) -> str:
+    """date_trunc of created_at in UTC, whatever the session time zone"""
+    return f"(date_trunc('{field}', created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC')"
+
+
+def _backfill_day(conn, day: date) -> Dict[str, int]:
+    start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    end = start + timedelta(days=1)
+    counts = {}
+    with conn.transaction(), conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {HOURLY} WHERE bucket >= %s AND bucket < %s;", (start, end))
+        cur.execute(f"DELETE FROM {DAILY} WHERE bucket = %s;", (start,))
+        cur.execute("DELETE FROM query_rollup_daily WHERE day = %s;", (day,))
+        cur.execute("DELETE FROM session_rollup_daily WHERE day = %s;", (day,))
+        for table, kind in KINDS.items():
+            model, llm_calls, tokens, input_tokens, output_tokens, cost = _RAW_SOURCES[table]
+            for grain, field in ((HOURLY, "hour"), (DAILY, "day")):
+                cur.execute(f"""
+                    INSERT INTO {grain} (bucket, kind, search_type, category, model, requests, successes,
+                                         latency_count, latency_sum_ms, latency_hist, context_found_sum,
+                                         no_context, good_context, llm_calls, tokens, input_tokens,
+                                         output_tokens, cost)
+                    SELECT {_utc_trunc(field)}, %s, COALESCE(search_type, ''), COALESCE(category, ''),
+                           {model}, COUNT(*), COUNT(*) FILTER (WHERE success IS NOT FALSE),
+                           COUNT(response_time_ms), COALESCE(SUM(response_time_ms), 0), {_hist_sql()},
+                           COALESCE(SUM(context_found), 0),
+                           COUNT(*) FILTER (WHERE COALESCE(context_found, 0) = 0),
+                           COUNT(*) FILTER (WHERE context_found >= {GOOD_CONTEXT_DOCS}),
+                           {llm_calls}, {tokens}, {input_tokens}, {output_tokens}, {cost}
+                    FROM {table} WHERE created_at >= %s AND created_at < %s
+                    GROUP BY 1, 3, 4, 5;
+                """, (kind, start, end))
+                counts[f"{table}_{field}"] = cur.rowcount
+            column = _QUERY_COLUMN[table]
+            cur.execute(f"""
+                INSERT INTO query_rollup_daily (day, kind, query_normalized, query_text, requests, successes,
+                                                latency_count, latency_sum_ms, context_found_sum, last_seen)
+                SELECT %s, %s, {_NORMALIZE_SQL.format(col=column)},
+                       left(btrim((array_agg({column} ORDER BY created_at DESC))[1]), {_MAX_QUERY_LENGTH}),
+                       COUNT(*), COUNT(*) FILTER (WHERE success IS NOT FALSE), COUNT(response_time_ms),
+                       COALESCE(SUM(response_time_ms), 0), COALESCE(SUM(context_found), 0), MAX(created_at)
+                FROM {table}
+                WHERE created_at >= %s AND created_at < %s AND length(btrim({column})) > 0
+                GROUP BY 3;
+            """, (day, kind, start, end))
+            cur.execute(f"""
+                INSERT INTO session_rollup_daily (day, session_id)
+                SELECT DISTINCT %s::date, session_id FROM {table}
+                WHERE created_at >= %s AND created_at < %s AND session_id IS NOT NULL
+                ON CONFLICT DO NOTHING;
+            """, (day, start, end))
+    return counts
+
+
+def backfill(days: int = 30, until: Optional[date] = None, conn=None) -> Dict[str, Any]:
+    """Rebuild the rollups of the N whole days before `until` (today, UTC, by
+    default) from the raw logs, one transaction per day.
+
+    Run once after deploying, for the history that predates the log writer keeping
+    the rollups; today is excluded because its rollups are already being written
+    live (a day rebuilt while the writer is adding to it would count rows twice).
+    """
+    until = until or datetime.now(timezone.utc).date()
+    days_done: List[str] = []
+    own = conn is None
+    if own:
+        from db_utils import DatabaseManager
+        conn = DatabaseManager().get_connection()
+    try:
+        for offset in range(days, 0, -1):
+            day = until - timedelta(days=offset)
+            counts = _backfill_day(conn, day)
+            days_done.append(day.isoformat())
+            logger.info(f"Rollups rebuilt for {day}: {counts}")
+    finally:
+        if own:
+            conn.close()
+    return {"days": days_done, "until": until.isoformat()}
+
+
+if __name__ == "__main__":
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description="JuSimples analytics rollups")
+    parser.add_argument("command", choices=["backfill", "overview"])
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.command == "backfill":
+        print(json.dumps(backfill(args.days), indent=2))
+    else:
+        print(json.dumps(get_overview(args.days), indent=2, default=str))
@@ -0,0 +1,211 @@
+"""
+Answer Cache Module for JuSimples
+In-process cache of generated /api/ask answers: exact matches on the normalized
+question plus retrieved chunk ids, and near-duplicate questions (by embedding
+similarity) over the same chunks
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from embedding_cache import normalize_text
+from document_cache import get_document_cache
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+# Expired answers are kept this long to serve when the LLM is unavailable
+ANSWER_CACHE_STALE_TTL = float(os.getenv("ANSWER_CACHE_STALE_TTL_SECONDS", "86400"))
+# Cosine similarity between question embeddings to count as the same question
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+
+def context_key(doc_ids: Iterable[str]) -> Tuple[str, ...]:
+    """Order-independent identity of the retrieved context"""
+    return tuple(sorted({str(d) for d in doc_ids if d}))
+
+
+def answer_key(question: str, doc_ids: Iterable[str]) -> str:
+    base = normalize_text(question) + "\x1f" + "\x1f".join(context_key(doc_ids))
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("key", "question", "answer", "context", "vector", "created_at", "hits")
+
+    def __init__(self, key: str, question: str, answer: str, context: Tuple[str, ...],
+                 vector: Optional[array]):
+        self.key = key
+        self.question = question
+        self.answer = answer
+        self.context = context
+        self.vector = vector
+        self.created_at = time.time()
+        self.hits = 0
+
+
+class AnswerCache:
+    """LRU answer cache with TTL, near-duplicate lookup and per-chunk invalidation.
+
+    Near-duplicate matching only compares questions whose retrieved context is the
+    same set of chunks, so an answer is never reused for different sources. Entries
+    citing a chunk are dropped when that chunk changes (document cache NOTIFY).
+    """
+
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, ttl: float = ANSWER_CACHE_TTL,
+                 stale_ttl: float = ANSWER_CACHE_STALE_TTL, similarity: float = ANSWER_CACHE_SIMILARITY):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = max(stale_ttl, ttl)
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._by_context: Dict[Tuple[str, ...], List[str]] = {}
+        self._by_doc: Dict[str, set] = {}
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "stale_hits": 0, "misses": 0,
+                      "stores": 0, "evictions": 0, "expired": 0, "invalidations": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, question: str, doc_ids: Iterable[str], vector: Optional[List[float]] = None,
+            allow_stale: bool = False) -> Optional[Dict[str, Any]]:
+        """Cached answer for this question and context, or None.
+
+        allow_stale also returns entries past their TTL (up to the stale TTL), for
+        use when a fresh answer cannot be generated.
+        """
+        if not ANSWER_CACHE_ENABLED:
+            return None
+        context = context_key(doc_ids)
+        key = answer_key(question, context)
+        now = time.time()
+        max_age = self.stale_ttl if allow_stale else self.ttl
+        with self._lock:
+            entry = self._entries.get(key)
+            kind = "exact"
+            if entry is None and vector is not None and self.similarity < 1.0:
+                entry, kind = self._nearest(context, vector, now, max_age), "semantic"
+            if entry is None or now - entry.created_at > max_age:
+                self.stats["misses"] += 1
+                return None
+            age = now - entry.created_at
+            if age > self.ttl:
+                kind = "stale"
+            self._entries.move_to_end(entry.key)
+            entry.hits += 1
+            self.stats[f"{kind}_hits"] += 1
+            return {"answer": entry.answer, "type": kind, "age_seconds": round(age, 1),
+                    "cached_question": entry.question}
+
+    def _nearest(self, context: Tuple[str, ...], vector: List[float], now: float,
+                 max_age: float) -> Optional[_Entry]:
+        best, best_sim = None, self.similarity
+        for key in self._by_context.get(context, ()):
+            entry = self._entries.get(key)
+            if entry is None or entry.vector is None or now - entry.created_at > max_age:
+                continue
+            # Embeddings are unit length, so the dot product is the cosine similarity
+            sim = sum(a * b for a, b in zip(entry.vector, vector))
+            if sim >= best_sim:
+                best, best_sim = entry, sim
+        return best
+
+    def put(self, question: str, doc_ids: Iterable[str], answer: str,
+            vector: Optional[List[float]] = None) -> None:
+        if not ANSWER_CACHE_ENABLED or self.max_size <= 0 or not answer:
+            return
+        context = context_key(doc_ids)
+        key = answer_key(question, context)
+        entry = _Entry(key, question, answer, context, array("f", vector) if vector else None)
+        with self._lock:
+            if key in self._entries:
+                self._unlink(self._entries.pop(key))
+            self._entries[key] = entry
+            self._by_context.setdefault(context, []).append(key)
+            for doc_id in context:
+                self._by_doc.setdefault(doc_id, set()).add(key)
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_size:
+                _, oldest = self._entries.popitem(last=False)
+                self._unlink(oldest)
+                self.stats["evictions"] += 1
+            sweep = self.stats["stores"] % 100 == 0
+        if sweep:
+            self.purge_expired()
+
+    def _unlink(self, entry: _Entry) -> None:
+        keys = self._by_context.get(entry.context)
+        if keys is not None:
+            if entry.key in keys:
+                keys.remove(entry.key)
+            if not keys:
+                del self._by_context[entry.context]
+        for doc_id in entry.context:
+            refs = self._by_doc.get(doc_id)
+            if refs is not None:
+                refs.discard(entry.key)
+                if not refs:
+                    del self._by_doc[doc_id]
+
+    def invalidate_documents(self, doc_ids: Optional[List[str]]) -> int:
+        """Drop answers citing any of doc_ids (None drops everything)"""
+        with self._lock:
+            if doc_ids is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                self._by_context.clear()
+                self._by_doc.clear()
+            else:
+                keys = set()
+                for doc_id in doc_ids:
+                    keys |= self._by_doc.get(str(doc_id), set())
+                for key in keys:
+                    entry = self._entries.pop(key, None)
+                    if entry is not None:
+                        self._unlink(entry)
+                removed = len(keys)
+            self.stats["invalidations"] += removed
+        return removed
+
+    def purge_expired(self) -> int:
+        """Remove entries past the stale TTL"""
+        cutoff = time.time() - self.stale_ttl
+        with self._lock:
+            expired = [e for e in self._entries.values() if e.created_at < cutoff]
+            for entry in expired:
+                del self._entries[entry.key]
+                self._unlink(entry)
+            self.stats["expired"] += len(expired)
+        return len(expired)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.stats["exact_hits"] + self.stats["semantic_hits"] + self.stats["stale_hits"]
+            lookups = hits + self.stats["misses"]
+            return {
+                **self.stats,
+                "enabled": ANSWER_CACHE_ENABLED,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "similarity_threshold": self.similarity,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Singleton instance
+answer_cache = AnswerCache()
+get_document_cache().subscribe(answer_cache.invalidate_documents)
+
+
+def get_answer_cache() -> AnswerCache:
+    """Get the answer cache singleton"""
+    return answer_cache
@@ -4,16 +4,16 @@ import time
 import logging
 from datetime import datetime
 from typing import List, Dict, Any, Tuple
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 # Import our custom OpenAI utilities
 try:
-    from backend.openai_utils import openai_manager, is_openai_available, get_completion, get_openai_status, handle_api_status_request, initialize_openai_client
+    from backend.openai_utils import openai_manager, is_openai_available, get_completion, stream_completion, get_openai_status, handle_api_status_request, initialize_openai_client
 except ImportError:
     try:
-        from .openai_utils import openai_manager, is_openai_available, get_completion, get_openai_status, handle_api_status_request, initialize_openai_client
+        from .openai_utils import openai_manager, is_openai_available, get_completion, stream_completion, get_openai_status, handle_api_status_request, initialize_openai_client
     except ImportError:
-        from openai_utils import openai_manager, is_openai_available, get_completion, get_openai_status, handle_api_status_request, initialize_openai_client
+        from openai_utils import openai_manager, is_openai_available, get_completion, stream_completion, get_openai_status, handle_api_status_request, initialize_openai_client
 # Import LexML API utilities
 try:
     from backend.lexml_api import lexml_api, search_legal_documents, get_legal_document, get_lexml_status, handle_lexml_status_request
@@ -68,8 +68,12 @@ try:
         from backend.retrieval import (
             init_pgvector,
             is_ready as semantic_is_ready,
+            semantic_available,
             seed_static_kb_from_list,
             semantic_search,
+            embed_query,
+            keyword_search,
+            hybrid_search,
             get_doc_by_id,
             log_search,
             log_ask,
@@ -85,8 +89,12 @@ try:
             from .retrieval import (
                 init_pgvector,
                 is_ready as semantic_is_ready,
+                semantic_available,
                 seed_static_kb_from_list,
                 semantic_search,
+                embed_query,
+                keyword_search,
+                hybrid_search,
                 get_doc_by_id,
                 log_search,
                 log_ask,
@@ -101,8 +109,12 @@ try:
             from retrieval import (
                 init_pgvector,
                 is_ready as semantic_is_ready,
+                semantic_available,
                 seed_static_kb_from_list,
                 semantic_search,
+                embed_query,
+                keyword_search,
+                hybrid_search,
                 get_doc_by_id,
                 log_search,
                 log_ask,
@@ -120,6 +132,15 @@ except Exception as e:
 
 # Feature flag for semantic retrieval (default on)
 USE_SEMANTIC_RETRIEVAL = os.getenv('USE_SEMANTIC_RETRIEVAL', 'true').lower() == 'true'
+# Fuse vector and full-text results (reciprocal rank fusion) instead of vector-only retrieval
+USE_HYBRID_RETRIEVAL = os.getenv('USE_HYBRID_RETRIEVAL', 'true').lower() == 'true'
+# Recall/latency mode per endpoint (see vector_index.SEARCH_MODES): interactive search
+# favours latency, answer generation favours recall
+SEARCH_MODES = ("fast", "balanced", "exact")
+SEARCH_MODE_DEFAULT = os.getenv('SEARCH_MODE_DEFAULT', 'fast')
+ASK_MODE_DEFAULT = os.getenv('ASK_MODE_DEFAULT', 'balanced')
+# Metadata filters accepted by /api/search (mirrors retrieval.SEARCH_FILTERS)
+SEARCH_FILTER_KEYS = ("category", "law_type", "jurisdiction", "date_from", "date_to")
 # Control whether to seed the semantic store on startup (default off to avoid embedding costs)
 SEED_SEMANTIC_ON_START = os.getenv('SEED_SEMANTIC_ON_START', 'false').lower() == 'true'
 
@@ -159,6 +180,28 @@ if OPENAI_DASHBOARD_AVAILABLE:
 allowed_origins = os.getenv('CORS_ORIGINS', 'http://localhost:3000,https://jusimples.netlify.app,https://jusimplesbeta.netlify.app').split(',')
 CORS(app, origins=allowed_origins)
 
+# Endpoints whose synchronous DB round trips are held to DB_ROUND_TRIP_BUDGET
+HOT_PATH_ENDPOINTS = {"search_legal", "ask_question", "ask_question_stream"}
+
+@app.before_request
+def begin_db_trace():
+    start_trace(request.endpoint or request.path)
+
+@app.after_request
+def add_db_trace_header(response):
+    trace = current_trace()
+    # Streamed bodies run after this hook; they report the trace in their done event
+    if trace is not None and not response.is_streamed:
+        response.headers["X-DB-Trace"] = trace.header_value()
+        response.headers["Server-Timing"] = f'db;dur={trace.time_ms:.1f};desc="{trace.round_trips} round trips"'
+    return response
+
+@app.teardown_request
+def finish_db_trace(exc=None):
+    trace = end_trace()
+    if trace is not None:
+        get_trace_stats().add(trace, hot_path=trace.label in HOT_PATH_ENDPOINTS)
+
 # OpenAI configuration through our utilities module
 logger.info("=== OpenAI Client Initialization ===")
 logger.info(f"OpenAI available: {is_openai_available()}")
@@ -180,6 +223,69 @@ except ImportError:
     except ImportError:
         from db_utils import get_db_manager
 
+# In-process BM25 index for the offline keyword path
+try:
+    from backend.keyword_index import get_keyword_index
+except ImportError:
+    try:
+        from .keyword_index import get_keyword_index
+    except ImportError:
+        from keyword_index import get_keyword_index
+
+# Cache of generated answers (exact and near-duplicate questions over the same sources)
+try:
+    from backend.answer_cache import get_answer_cache
+except ImportError:
+    try:
+        from .answer_cache import get_answer_cache
+    except ImportError:
+        from answer_cache import get_answer_cache
+
+# Background batched writer for analytics logs
+try:
+    from backend.log_writer import get_log_writer
+except ImportError:
+    try:
+        from .log_writer import get_log_writer
+    except ImportError:
+        from log_writer import get_log_writer
+
+# In-memory popular/trending query sketches
+try:
+    from backend.heavy_hitters import get_heavy_hitters
+except ImportError:
+    try:
+        from .heavy_hitters import get_heavy_hitters
+    except ImportError:
+        from heavy_hitters import get_heavy_hitters
+
+# Per-request database round-trip counting
+try:
+    from backend.db_trace import start_trace, end_trace, current_trace, get_trace_stats
+except ImportError:
+    try:
+        from .db_trace import start_trace, end_trace, current_trace, get_trace_stats
+    except ImportError:
+        from db_trace import start_trace, end_trace, current_trace, get_trace_stats
+
+# Token-budgeted packing of retrieved documents into the prompt
+try:
+    from backend.context_packer import pack_context, count_message_tokens
+except ImportError:
+    try:
+        from .context_packer import pack_context, count_message_tokens
+    except ImportError:
+        from context_packer import pack_context, count_message_tokens
+
+# Extractive compression of retrieved documents (best sentences/incisos per chunk)
+try:
+    from backend.context_compressor import compress_context
+except ImportError:
+    try:
+        from .context_compressor import compress_context
+    except ImportError:
+        from context_compressor import compress_context
+
 # Function to load legal knowledge from the database
 def get_legal_knowledge():
     """Load legal knowledge from database, fall back to mock data if not available."""
@@ -357,6 +463,9 @@ logger.info(f"DATABASE_URL configured: {bool(os.getenv('DATABASE_URL'))}")
 logger.info(f"SEMANTIC_AVAILABLE: {SEMANTIC_AVAILABLE}")
 logger.info(f"USE_SEMANTIC_RETRIEVAL: {USE_SEMANTIC_RETRIEVAL}")
 
+# Open the connection pool in the background so readiness checks never block a request
+get_db_manager().start_pool()
+
 # Allow skipping heavy DB init during module import to speed startup (use readiness checks instead)
 DB_INIT_ON_IMPORT = os.getenv('DB_INIT_ON_IMPORT', 'false').lower() == 'true'
 if DB_INIT_ON_IMPORT:
@@ -402,8 +511,35 @@ else:
     logger.info("⏭️ Skipping DB initialization during import (DB_INIT_ON_IMPORT=false). Will check readiness asynchronously.")
 
 # Define function to retrieve context
-def retrieve_context(query, top_k=3):
-    """Retrieve context from database with semantic search or keyword fallback"""
+def parse_search_mode(raw_mode, default):
+    """Validate a user-supplied search mode, falling back to the endpoint default"""
+    mode = str(raw_mode or '').strip().lower()
+    return mode if mode in SEARCH_MODES else default
+
+def parse_search_filters(source):
+    """Extract optional metadata filters (category, law_type, jurisdiction, date_from, date_to)"""
+    filters = {}
+    for key in SEARCH_FILTER_KEYS:
+        value = source.get(key)
+        if value is not None and str(value).strip():
+            filters[key] = str(value).strip()
+    return filters
+
+def _matches_filters(item, filters):
+    """In-memory equivalent of the SQL filters for the offline keyword path"""
+    for key in ("category", "law_type", "jurisdiction"):
+        if key in filters and str(item.get(key) or "").lower() != filters[key].lower():
+            return False
+    return True
+
+def retrieve_context(query, top_k=3, mode=ASK_MODE_DEFAULT, filters=None, min_relevance=None):
+    """Retrieve context from database with semantic search or keyword fallback
+    
+    mode: 'fast', 'balanced' or 'exact' - controls ANN recall vs latency
+    filters: optional metadata filters applied in SQL (see parse_search_filters)
+    min_relevance: pushed into the vector query as a distance bound
+    """
+    filters = filters or {}
     if not query or not query.strip():
         logger.warning("Empty query passed to retrieve_context")
         return [], "none"
@@ -418,20 +554,25 @@ def retrieve_context(query, top_k=3):
             # Check if semantic search is ready
             semantic_ready = False
             try:
-                semantic_ready = semantic_is_ready()
+                # The local vector index can answer while Postgres is unavailable
+                semantic_ready = semantic_available()
             except Exception as ready_err:
                 logger.warning(f"Error checking semantic_is_ready: {ready_err}")
                 
             if semantic_ready:
-                logger.info(f"Attempting semantic search for: '{query[:50]}...' with top_k={top_k}")
+                strategy = "hybrid" if USE_HYBRID_RETRIEVAL else "semantic"
+                logger.info(f"Attempting {strategy} search for: '{query[:50]}...' with top_k={top_k}, mode={mode}")
                 try:
-                    results = semantic_search(query, top_k=top_k)
+                    if USE_HYBRID_RETRIEVAL:
+                        results = hybrid_search(query, top_k=top_k, mode=mode, filters=filters, min_relevance=min_relevance)
+                    else:
+                        results = semantic_search(query, top_k=top_k, mode=mode, filters=filters, min_relevance=min_relevance)
                     search_duration = time.time() - start_time
                     
                     # If semantic search yields results, return them
                     if results:
-                        logger.info(f"✅ Semantic search found {len(results)} results in {search_duration:.2f}s")
-                        return results, "semantic"
+                        logger.info(f"✅ {strategy.capitalize()} search found {len(results)} results in {search_duration:.2f}s")
+                        return results, strategy
                     else:
                         logger.info(f"⚠️ Semantic search returned 0 results in {search_duration:.2f}s; falling back to keyword search")
                 except Exception as search_err:
@@ -449,7 +590,7 @@ def retrieve_context(query, top_k=3):
     # Fallback to keyword search
     keyword_start = time.time()
     try:
-        results, search_type = search_legal_knowledge(query, top_k), "keyword"
+        results, search_type = search_legal_knowledge(query, top_k, filters=filters), "keyword"
         keyword_duration = time.time() - keyword_start
         logger.info(f"Keyword search found {len(results)} results in {keyword_duration:.2f}s")
     except Exception as keyword_err:
@@ -461,13 +602,13 @@ def retrieve_context(query, top_k=3):
     return results, search_type
     
 # Define keyword search function
-def search_legal_knowledge(query, limit=10):
+def search_legal_knowledge(query, limit=10, filters=None):
     """Keyword-based retrieval from database or fallback to static KB."""
+    filters = filters or {}
     if not query or not query.strip():
         logger.warning("Empty query passed to search_legal_knowledge")
         return []
         
-    query_lower = query.lower()
     results = []
     
     # Try database search first
@@ -480,65 +621,17 @@ def search_legal_knowledge(query, limit=10):
         elif not db_ready:
             logger.warning("Database not ready for search operation") 
             
-        if db_ready:
+        if db_ready and SEMANTIC_AVAILABLE:
             try:
-                # Use SQL ILIKE for case-insensitive substring matching
-                search_query = f"%{query_lower}%"
-                sql = """
-                    SELECT 
-                        id, 
-                        parent_id, 
-                        title, 
-                        content, 
-                        category, 
-                        metadata
-                    FROM legal_chunks
-                    WHERE 
-                        LOWER(title) LIKE %s OR 
-                        LOWER(content) LIKE %s
-                    LIMIT %s
-                """
-                
-                results_db = db_manager.execute_query(sql, (search_query, search_query, limit))
+                # Full-text search on the GIN-indexed tsvector (accent-insensitive, OR-ed terms)
+                for item in keyword_search(query, top_k=limit, filters=filters):
+                    result = dict(item)
+                    result["parent_id"] = None
+                    result["relevance_score"] = 0.5
+                    result["score"] = item["relevance"]
+                    results.append(result)
                 
-                if results_db:
-                    for row in results_db:
-                        # Extract metadata
-                        metadata = row[5] or {}
-                        keywords = metadata.get("keywords", [])
-                        
-                        # Calculate match score
-                        match_score = 0
-                        for keyword in keywords:
-                            if isinstance(keyword, str) and (keyword.lower() in query_lower or query_lower in keyword.lower()):
-                                match_score += 0.2
-                                
-                        if query_lower in row[2].lower():  # title
-                            match_score += 0.5
-                            
-                        if query_lower in row[3].lower():  # content
-                            match_score += 0.3
-                        
-                        # Ensure minimum score
-                        match_score = max(match_score, 0.1)  # At least some relevance since it matched SQL
-                        
-                        # Create result
-                        result = {
-                            "id": row[0],
-                            "parent_id": row[1],
-                            "title": row[2],
-                            "content": row[3],
-                            "category": row[4],
-                            "keywords": keywords,
-                            "source": metadata.get("source", "Unknown"),
-                            "relevance_score": metadata.get("relevance_score", 0.5),
-                            "score": match_score
-                        }
-                        results.append(result)
-                    
-                    # Sort by score
-                    results = sorted(results, key=lambda x: x["score"], reverse=True)
-                    
+                if results:
                     logger.info(f"Found {len(results)} results in database for keyword query: {query}")
                     return results[:limit]
             except Exception as e:
@@ -549,39 +642,38 @@ def search_legal_knowledge(query, limit=10):
     # Fallback to in-memory search
     logger.warning(f"Falling back to in-memory search for: {query}")
     
-    # Get most current data
-    kb_data = get_legal_knowledge()
+    # BM25 inverted index over the KB, built once and re-synced incrementally
+    # (only new/changed items are re-tokenized) when older than its refresh interval
+    index = get_keyword_index()
+    index.maybe_refresh(get_legal_knowledge)
     
-    for item in kb_data:
-        # Check if query matches keywords or content
-        match_score = 0
-        for keyword in item.get("keywords", []):
-            if keyword.lower() in query_lower or query_lower in keyword.lower():
-                match_score += 0.2
-                
-        if query_lower in item.get("title", "").lower():
-            match_score += 0.5
-            
-        if query_lower in item.get("content", "").lower():
-            match_score += 0.3
-            
-        if match_score > 0:
-            result = item.copy()
-            result["score"] = match_score
-            results.append(result)
+    # Over-fetch when filtering so enough matching items survive
+    candidates = limit * 5 if filters else limit
+    for item, bm25 in index.search(query, limit=candidates):
+        if filters and not _matches_filters(item, filters):
+            continue
+        result = item.copy()
+        result["score"] = bm25 / (bm25 + 1.0)  # squash into [0, 1) like ts_rank_cd(..., 32)
+        result["bm25"] = bm25
+        results.append(result)
     
-    # Sort by score
-    results = sorted(results, key=lambda x: x["score"], reverse=True)
-    
-    # Limit results
     return results[:limit]
 
-def generate_ai_response(question, relevant_context):
-    """Generate AI response using OpenAI with relevant legal context - VERSION 2.3.0"""
+def generate_ai_response(question, relevant_context, metrics=None):
+    """Generate AI response using OpenAI with relevant legal context - VERSION 2.3.0
+    
+    If metrics is a dict it receives the completion metrics (exact token usage and
+    cost), the model, the context packing summary and success: False when the
+    returned text is an error message rather than an answer.
+    """
     logger.info(f"🔄 [v2.3.0] Starting AI response generation for: {question[:50]}...")
+    if metrics is not None:
+        metrics["success"] = False
     
     # FORCE RETURN REAL RESPONSE FOR TESTING
     if "teste" in question.lower():
+        if metrics is not None:
+            metrics["success"] = True
         return f"✅ VERSÃO 2.3.0 ATIVA! Pergunta recebida: {question}. Sistema OpenAI funcionando corretamente."
     
     # Check if OpenAI is available
@@ -591,42 +683,23 @@ def generate_ai_response(question, relevant_context):
         return f"ERRO: {error_msg}"
         
     try:
-        # Prepare context for the AI
-        context_text = "\n\n".join([
-            f"--- Documento: {doc.get('title', 'Sem título')} ---\n{doc.get('content', '')}" 
-            for doc in relevant_context
-        ])
-        
-        # Prompt template
-        prompt = f"""
-        Sua tarefa é responder a perguntas sobre direito brasileiro com base nas informações fornecidas.
-        
-        PERGUNTA DO USUÁRIO:
-        {question}
-        
-        CONTEXTO JURÍDICO RELEVANTE:
-        {context_text if context_text.strip() else "Não há informações específicas disponíveis sobre este tema."}
-        
-        INSTRUÇÕES:
-        - Sua resposta deve ser baseada APENAS nas informações fornecidas no CONTEXTO acima.
-        - Seja conciso, claro e preciso.
-        - Estruture sua resposta de forma organizada, usando marcadores ou numeração quando apropriado.
-        - Se o CONTEXTO não tiver informações suficientes, diga que não possui informações suficientes e sugira que o usuário reformule a pergunta.
-        - Não invente informações ou cite leis que não estejam no CONTEXTO.
-        - Sempre mencione a fonte legal relevante (artigo, lei, etc.)"""
-
-        # System message for the assistant
-        system_message = """Você é um assistente jurídico especializado em direito brasileiro. 
-        Responda apenas com base no contexto fornecido e siga as instruções do usuário."""
+        model = openai_manager.active_model or openai_manager.preferred_model
+        prompt, system_message, packed = build_answer_prompt(question, relevant_context, model)
         
         # Get completion from our utilities module
         logger.info(f"🚀 [v2.3.0] Calling OpenAI API through utilities module")
         result = get_completion(
             prompt=prompt,
             system_message=system_message,
+            model=model,
             temperature=0.3,
             max_tokens=1024
         )
+        if metrics is not None:
+            metrics.update(result["metrics"])
+            metrics["model"] = result.get("model") or model
+            metrics["context"] = packed.to_dict()
+            metrics["success"] = bool(result["success"])
         
         if result["success"]:
             ai_response = result["content"]
@@ -647,6 +720,76 @@ def generate_ai_response(question, relevant_context):
         logger.error(error_msg)
         return f"Erro inesperado na consulta à IA v2.3.0: {str(e)}"
 
+def build_answer_prompt(question, relevant_context, model=None):
+    """User prompt, system message and PackedContext for answering question from
+    relevant_context within the model's context token budget"""
+    # Prepare context for the AI: compressed to the spans relevant to the question,
+    # then deduplicated and cut to the token budget
+    compressed_context, compression = compress_context(question, relevant_context)
+    packed = pack_context(question, compressed_context, model)
+    packed.compression = compression
+    context_text = packed.text
+    
+    # Prompt template
+    prompt = f"""
+        Sua tarefa é responder a perguntas sobre direito brasileiro com base nas informações fornecidas.
+        
+        PERGUNTA DO USUÁRIO:
+        {question}
+        
+        CONTEXTO JURÍDICO RELEVANTE:
+        {context_text if context_text.strip() else "Não há informações específicas disponíveis sobre este tema."}
+        
+        INSTRUÇÕES:
+        - Sua resposta deve ser baseada APENAS nas informações fornecidas no CONTEXTO acima.
+        - Seja conciso, claro e preciso.
+        - Estruture sua resposta de forma organizada, usando marcadores ou numeração quando apropriado.
+        - Se o CONTEXTO não tiver informações suficientes, diga que não possui informações suficientes e sugira que o usuário reformule a pergunta.
+        - Não invente informações ou cite leis que não estejam no CONTEXTO.
+        - Sempre mencione a fonte legal relevante (artigo, lei, etc.)"""
+
+    # System message for the assistant
+    system_message = """Você é um assistente jurídico especializado em direito brasileiro. 
+        Responda apenas com base no contexto fornecido e siga as instruções do usuário."""
+    packed.prompt_tokens = count_message_tokens(
+        [{"role": "system", "content": system_message}, {"role": "user", "content": prompt}], model)
+    return prompt, system_message, packed
+
+def question_embedding(question):
+    """Query embedding for near-duplicate answer lookup (usually already cached by retrieval)"""
+    if not (SEMANTIC_AVAILABLE and USE_SEMANTIC_RETRIEVAL):
+        return None
+    try:
+        return embed_query(question)
+    except Exception as e:
+        logger.warning(f"Question embedding unavailable for answer cache: {e}")
+        return None
+
+def cached_or_generated_answer(question, relevant_context, metrics=None):
+    """Answer from the answer cache, else from the LLM (cached on success), else a stale
+    cached answer when generation fails. Returns (answer, cache_info); metrics as for
+    generate_ai_response (left empty on a cache hit)."""
+    metrics = metrics if metrics is not None else {}
+    answer_cache = get_answer_cache()
+    context_ids = [str(item.get("id")) for item in relevant_context if item.get("id")]
+    if not context_ids:
+        return generate_ai_response(question, relevant_context, metrics), {"hit": False, "type": None}
+    vector = question_embedding(question)
+    cached = answer_cache.get(question, context_ids, vector)
+    if cached:
+        logger.info(f"Answer cache {cached['type']} hit (age {cached['age_seconds']}s)")
+        return cached["answer"], {"hit": True, "type": cached["type"], "age_seconds": cached["age_seconds"]}
+    answer = generate_ai_response(question, relevant_context, metrics)
+    if metrics.get("success"):
+        answer_cache.put(question, context_ids, answer, vector)
+        return answer, {"hit": False, "type": None}
+    stale = answer_cache.get(question, context_ids, vector, allow_stale=True)
+    if stale:
+        logger.warning(f"LLM unavailable; serving cached answer ({stale['type']}, age {stale['age_seconds']}s)")
+        return stale["answer"], {"hit": True, "type": stale["type"], "age_seconds": stale["age_seconds"],
+                                 "stale": True}
+    return answer, {"hit": False, "type": None}
+
 @app.route('/')
 def home():
     """Home endpoint with deployment info - VERSION 2.5.0"""
@@ -657,7 +800,7 @@ def home():
         "mode": "simplified",
         "deployment_time": datetime.now().isoformat(),
         "cache_bust": "20250117_2010",
-        "endpoints": ["/api/ask", "/api/test-rag", "/health", "/ready", "/admin/"]
+        "endpoints": ["/api/ask", "/api/ask/stream", "/api/test-rag", "/health", "/ready", "/admin/"]
     })
 
 @app.route('/api/status/kb')
@@ -731,36 +874,101 @@ def readiness_probe():
     # Readiness probe with deeper checks (DB count, etc.)
     return get_health()
 
+def parse_ask_request():
+    """Read the /api/ask body (JSON or form): (question, top_k, min_relevance, search_mode)"""
+    # Safely parse JSON payload; fallback to form data if needed
+    data = {}
+    try:
+        data = request.get_json(silent=True) or {}
+    except Exception as parse_err:
+        logger.warning(f"Invalid JSON in /api/ask: {parse_err}")
+        data = {}
+    if not data and request.form:
+        # Handle x-www-form-urlencoded
+        data = request.form.to_dict(flat=True)
+    if not data:
+        logger.warning(f"/api/ask received empty or non-JSON body. Content-Type={request.headers.get('Content-Type')}, Content-Length={request.headers.get('Content-Length')}")
+
+    question = (data.get('question') or '').strip()
+    # Optional tuning params
+    top_k_raw = data.get('top_k', 3)
+    min_rel_raw = data.get('min_relevance', 0.5)
+    try:
+        top_k = int(top_k_raw)
+    except Exception:
+        top_k = 3
+    top_k = max(1, min(10, top_k))
+    try:
+        min_relevance = float(min_rel_raw)
+    except Exception:
+        min_relevance = 0.5
+    search_mode = parse_search_mode(data.get('mode'), ASK_MODE_DEFAULT)
+    return question, top_k, min_relevance, search_mode
+
+def select_ask_context(question, top_k, min_relevance, search_mode):
+    """Retrieve context for a question and apply the (lenient) relevance threshold"""
+    # Search relevant legal knowledge (semantic preferred)
+    relevant_context, search_type = retrieve_context(question, top_k=top_k, mode=search_mode)
+    
+    # Normalize scores to a common 'relevance' key and defensively filter
+    normalized_context = []
+    for it in (relevant_context or []):
+        try:
+            rel_val = it.get("relevance", it.get("score", 0.0))
+            rel = float(rel_val) if rel_val is not None else 0.0
+        except (ValueError, TypeError):
+            rel = 0.0
+        new_it = it.copy()
+        new_it["relevance"] = rel
+        normalized_context.append(new_it)
+    relevant_context = normalized_context
+    
+    def passes(it, threshold):
+        # Hybrid results found only by the keyword leg carry a ts_rank, not a cosine
+        # similarity; the threshold applies to what the vector leg returned
+        if search_type == "hybrid" and it.get("semantic_rank") is None:
+            return True
+        return it.get("relevance", 0.0) >= threshold
+    
+    # Log relevance scores before filtering
+    if search_type in ("semantic", "hybrid") and relevant_context:
+        scores = [f"{it.get('relevance', 0.0):.3f}" for it in relevant_context]
+        logger.info(f"{search_type.capitalize()} search relevance scores: {scores} (threshold: {min_relevance})")
+    
+    # Apply threshold only to vector similarities, but be more lenient
+    if search_type in ("semantic", "hybrid"):
+        pre_filter_count = len(relevant_context)
+        relevant_context = [it for it in relevant_context if passes(it, min_relevance)]
+        
+        # If no results pass threshold but we had results, lower threshold dynamically
+        if len(relevant_context) == 0 and pre_filter_count > 0:
+            # Use a more lenient threshold (half of the requested)
+            fallback_threshold = max(0.2, min_relevance * 0.6)
+            relevant_context = [it for it in normalized_context if passes(it, fallback_threshold)]
+            logger.info(f"Applied fallback threshold {fallback_threshold:.2f}, recovered {len(relevant_context)} documents")
+    return relevant_context, search_type
+
+def format_sources(relevant_context):
+    """Source list for answers: metadata and a 200-char preview per context item"""
+    return [
+        {
+            "id": item.get("id"),
+            "title": item.get("title", "Sem título"),
+            "category": item.get("category", "Desconhecida"),
+            "content_preview": ((item.get("content") or "")[:200] + ("..." if (item.get("content") or "") else "")),
+            "relevance": (
+                float(item.get("relevance", item.get("score", 0.0)) or 0.0)
+                if not isinstance(item.get("relevance"), (dict, list)) else 0.0
+            )
+        }
+        for item in relevant_context
+    ]
+
 @app.route('/api/ask', methods=['POST'])
 def ask_question():
     start_time = time.time()
     try:
-        # Safely parse JSON payload; fallback to form data if needed
-        data = {}
-        try:
-            data = request.get_json(silent=True) or {}
-        except Exception as parse_err:
-            logger.warning(f"Invalid JSON in /api/ask: {parse_err}")
-            data = {}
-        if not data and request.form:
-            # Handle x-www-form-urlencoded
-            data = request.form.to_dict(flat=True)
-        if not data:
-            logger.warning(f"/api/ask received empty or non-JSON body. Content-Type={request.headers.get('Content-Type')}, Content-Length={request.headers.get('Content-Length')}")
-
-        question = (data.get('question') or '').strip()
-        # Optional tuning params
-        top_k_raw = data.get('top_k', 3)
-        min_rel_raw = data.get('min_relevance', 0.5)
-        try:
-            top_k = int(top_k_raw)
-        except Exception:
-            top_k = 3
-        top_k = max(1, min(10, top_k))
-        try:
-            min_relevance = float(min_rel_raw)
-        except Exception:
-            min_relevance = 0.5
+        question, top_k, min_relevance, search_mode = parse_ask_request()
         
         logger.info(f"Received question request: {question[:100] if question else 'No question provided'}")
         logger.info(f"OpenAI client status: {'Available' if is_openai_available() else 'Not available'}")
@@ -775,43 +983,14 @@ def ask_question():
         
         logger.info(f"Processing question: {question[:100]}...")
         
-        # Search relevant legal knowledge (semantic preferred)
-        relevant_context, search_type = retrieve_context(question, top_k=top_k)
-        
-        # Normalize scores to a common 'relevance' key and defensively filter
-        normalized_context = []
-        for it in (relevant_context or []):
-            try:
-                rel_val = it.get("relevance", it.get("score", 0.0))
-                rel = float(rel_val) if rel_val is not None else 0.0
-            except (ValueError, TypeError):
-                rel = 0.0
-            new_it = it.copy()
-            new_it["relevance"] = rel
-            normalized_context.append(new_it)
-        relevant_context = normalized_context
-        
-        # Log relevance scores before filtering
-        if search_type == "semantic" and relevant_context:
-            scores = [f"{it.get('relevance', 0.0):.3f}" for it in relevant_context]
-            logger.info(f"Semantic search relevance scores: {scores} (threshold: {min_relevance})")
-        
-        # Apply threshold only for semantic results, but be more lenient
-        if search_type == "semantic":
-            pre_filter_count = len(relevant_context)
-            relevant_context = [it for it in relevant_context if it.get("relevance", 0.0) >= min_relevance]
-            
-            # If no results pass threshold but we had results, lower threshold dynamically
-            if len(relevant_context) == 0 and pre_filter_count > 0:
-                # Use a more lenient threshold (half of the requested)
-                fallback_threshold = max(0.2, min_relevance * 0.6)
-                relevant_context = [it for it in normalized_context if it.get("relevance", 0.0) >= fallback_threshold]
-                logger.info(f"Applied fallback threshold {fallback_threshold:.2f}, recovered {len(relevant_context)} documents")
+        # Search relevant legal knowledge (semantic preferred) and apply the threshold
+        relevant_context, search_type = select_ask_context(question, top_k, min_relevance, search_mode)
         
         logger.info(f"Found {len(relevant_context)} relevant documents via {search_type}")
         
-        # Generate AI response
-        ai_answer = generate_ai_response(question, relevant_context)
+        # Generate AI response (or reuse a cached answer for the same sources)
+        llm_metrics = {}
+        ai_answer, cache_info = cached_or_generated_answer(question, relevant_context, llm_metrics)
         logger.info(f"Generated AI response: {ai_answer[:100]}...")
 
         # Log ask analytics (enhanced with detailed tracking)
@@ -828,42 +1007,19 @@ def ask_question():
             if SEMANTIC_AVAILABLE:
                 logger.info(f"🔍 semantic_is_ready(): {semantic_is_ready()}")
             
-            # Extract comprehensive OpenAI API response data
-            tokens_used = 0
-            input_tokens = 0  
-            output_tokens = 0
-            llm_cost = 0.0
-            finish_reason = None
-            system_fingerprint = None
+            # Exact token usage and cost as reported by the completion (none on cache hits)
+            llm_tokens = llm_metrics.get("tokens", {})
+            tokens_used = llm_tokens.get("total", 0)
+            input_tokens = llm_tokens.get("input", 0)
+            output_tokens = llm_tokens.get("output", 0)
+            llm_cost = llm_metrics.get("cost", 0.0)
+            finish_reason = llm_metrics.get("finish_reason")
+            system_fingerprint = llm_metrics.get("system_fingerprint")
             response_id = None
-            model_used = None
+            model_used = llm_metrics.get("model")
             created_timestamp = None
             logprobs = None
             
-            # Estimate token usage and cost based on text length (OpenAI response object not available here)
-            if tokens_used == 0 and is_openai_available() and ai_answer and "Erro" not in ai_answer:
-                # Rough estimation: ~4 characters per token
-                estimated_input_tokens = len(question) // 4 + sum(len(doc.get('content', '')) for doc in relevant_context) // 4
-                estimated_output_tokens = len(ai_answer) // 4
-                tokens_used = estimated_input_tokens + estimated_output_tokens
-                input_tokens = estimated_input_tokens
-                output_tokens = estimated_output_tokens
-                
-                # Calculate cost based on model
-                model_for_cost = (openai_manager.active_model or 'gpt-4o-mini')
-                if 'gpt-4o-mini' in model_for_cost.lower():
-                    llm_cost = (input_tokens * 0.00015 / 1000) + (output_tokens * 0.0006 / 1000)
-                elif 'gpt-4o' in model_for_cost.lower():
-                    llm_cost = (input_tokens * 0.005 / 1000) + (output_tokens * 0.015 / 1000)
-                elif 'gpt-4' in model_for_cost.lower():
-                    llm_cost = (input_tokens * 0.03 / 1000) + (output_tokens * 0.06 / 1000)
-                else:
-                    # Default to gpt-4o-mini pricing
-                    llm_cost = (input_tokens * 0.00015 / 1000) + (output_tokens * 0.0006 / 1000)
-                
-                # Set model used
-                model_used = (openai_manager.active_model or 'gpt-4o-mini')
-            
             # ALWAYS LOG TO DATABASE IF AVAILABLE
             if SEMANTIC_AVAILABLE:
                 try:
@@ -873,7 +1029,6 @@ def ask_question():
                         init_pgvector()
                     
                     from retrieval_extensions import log_ask_advanced
-                    from retrieval import _CONN
                     log_ask_advanced(
                         question=question,
                         answer=ai_answer,
@@ -881,7 +1036,7 @@ def ask_question():
                         min_relevance=min_relevance,
                         result_ids=result_ids,
                         search_type=search_type,
-                        success="Erro" not in ai_answer,
+                        success=cache_info["hit"] or llm_metrics.get("success", False),
                         session_id=session_id,
                         user_id=user_id,
                         response_time_ms=int(processing_time * 1000) if processing_time else 0,
@@ -897,18 +1052,15 @@ def ask_question():
                         system_fingerprint=system_fingerprint,
                         response_id=response_id,
                         created_timestamp=created_timestamp,
-                        logprobs=logprobs,
-                        conn=_CONN
+                        logprobs=logprobs
                     )
                 except ImportError:
                     # Fallback to basic logging
                     logger.info("⚠️ Using fallback basic logging")
-                    from retrieval import log_ask
                     log_ask(question, top_k, min_relevance, result_ids)
                 except Exception as log_err:
                     logger.error(f"❌ Advanced logging failed: {log_err}, trying basic logging")
                     try:
-                        from retrieval import log_ask
                         log_ask(question, top_k, min_relevance, result_ids)
                         logger.info("✅ Basic logging succeeded")
                     except Exception as basic_err:
@@ -919,7 +1071,6 @@ def ask_question():
             # Try emergency basic logging
             try:
                 if SEMANTIC_AVAILABLE:
-                    from retrieval import log_ask
                     log_ask(question, 3, 0.5, [])
                     logger.info("🔧 Emergency basic logging succeeded")
             except Exception as emergency_err:
@@ -928,19 +1079,7 @@ def ask_question():
         response = {
             "question": question,
             "answer": ai_answer,
-            "sources": [
-                {
-                    "id": item.get("id"),
-                    "title": item.get("title", "Sem título"),
-                    "category": item.get("category", "Desconhecida"),
-                    "content_preview": ((item.get("content") or "")[:200] + ("..." if (item.get("content") or "") else "")),
-                    "relevance": (
-                        float(item.get("relevance", item.get("score", 0.0)) or 0.0)
-                        if not isinstance(item.get("relevance"), (dict, list)) else 0.0
-                    )
-                }
-                for item in relevant_context
-            ],
+            "sources": format_sources(relevant_context),
             "confidence": 0.85,
             "timestamp": datetime.utcnow().isoformat(),
             "system_status": {
@@ -948,14 +1087,17 @@ def ask_question():
                 "knowledge_base_size": len(relevant_context),
                 "search_type": search_type
             },
+            "cache": cache_info,
             "disclaimer": "Esta resposta é baseada em IA e tem caráter informativo. Para casos complexos, consulte um advogado especializado.",
             "debug_info": {
                 "openai_available": is_openai_available(),
                 "active_model": openai_manager.active_model,
                 "context_found": len(relevant_context),
+                "context_packing": llm_metrics.get("context"),
+                "db": current_trace().to_dict() if current_trace() else None,
                 "api_key_configured": bool(openai_manager.api_key) and openai_manager.api_key != 'your_openai_api_key_here'
             },
-            "params": {"top_k": top_k, "min_relevance": min_relevance}
+            "params": {"top_k": top_k, "min_relevance": min_relevance, "mode": search_mode}
         }
         
         logger.info("Successfully processed question and returning response")
@@ -972,13 +1114,196 @@ def ask_question():
             }
         }), 500
 
+def sse_event(event, data):
+    """One Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+def log_streamed_ask(question, answer, success, top_k, min_relevance, relevant_context, search_type,
+                     request_meta, processing_time, metrics, model):
+    """Ask analytics for /api/ask/stream, recorded once the stream has closed"""
+    if not SEMANTIC_AVAILABLE:
+        return
+    result_ids = [str(item.get("id")) for item in relevant_context if item.get("id")]
+    tokens = (metrics or {}).get("tokens", {})
+    try:
+        from retrieval_extensions import log_ask_advanced
+        log_ask_advanced(
+            question=question,
+            answer=answer,
+            top_k=top_k,
+            min_relevance=min_relevance,
+            result_ids=result_ids,
+            search_type=search_type,
+            success=success,
+            session_id=request_meta["session_id"],
+            user_id=request_meta["user_id"],
+            response_time_ms=int(processing_time * 1000),
+            llm_model=model,
+            llm_tokens_used=tokens.get("total", 0),
+            llm_cost=(metrics or {}).get("cost", 0.0),
+            user_agent=request_meta["user_agent"],
+            ip_address=request_meta["ip_address"],
+            context_found=len(relevant_context),
+            input_tokens=tokens.get("input", 0),
+            output_tokens=tokens.get("output", 0),
+            finish_reason=(metrics or {}).get("finish_reason"),
+            system_fingerprint=(metrics or {}).get("system_fingerprint")
+        )
+    except Exception as log_err:
+        logger.error(f"❌ Advanced logging failed for streamed ask: {log_err}, trying basic logging")
+        try:
+            log_ask(question, top_k, min_relevance, result_ids)
+        except Exception as basic_err:
+            logger.error(f"❌ All logging failed: {basic_err}")
+
+@app.route('/api/ask/stream', methods=['POST'])
+def ask_question_stream():
+    """
+    Streaming variant of /api/ask (text/event-stream).
+    
+    Same request body as /api/ask. Events, in order:
+      sources - retrieved sources, sent as soon as retrieval finishes
+      token   - answer text deltas as the model produces them
+      done    - metrics (tokens, cost, time_to_first_token_ms), cache info, database trace
+                (db; not sent as headers, which go out before the body), timestamp
+      error   - instead of done, if generation failed and no cached answer exists
+    
+    When generation fails but an expired cached answer exists, it is sent as one token
+    event (with replace: true if partial text was already streamed) and done carries
+    cache.stale: true.
+    """
+    start_time = time.time()
+    question, top_k, min_relevance, search_mode = parse_ask_request()
+    if not question:
+        return jsonify({"error": "Pergunta não fornecida"}), 400
+    if len(question) < 10:
+        return jsonify({"error": "Pergunta muito curta. Forneça mais detalhes."}), 400
+    
+    # Request data is read now: the generator runs after this view has returned
+    request_meta = {
+        "session_id": request.headers.get('X-Session-ID') or f"web_{int(time.time())}",
+        "user_id": request.headers.get('X-User-ID'),
+        "user_agent": request.headers.get('User-Agent', ''),
+        "ip_address": request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR')),
+    }
+    
+    def generate():
+        answer, metrics, model = "", None, openai_manager.active_model
+        succeeded = False
+        relevant_context, search_type = [], "none"
+        try:
+            relevant_context, search_type = select_ask_context(question, top_k, min_relevance, search_mode)
+            logger.info(f"[stream] Found {len(relevant_context)} relevant documents via {search_type}")
+            yield sse_event("sources", {
+                "question": question,
+                "sources": format_sources(relevant_context),
+                "search_type": search_type,
+                "params": {"top_k": top_k, "min_relevance": min_relevance, "mode": search_mode}
+            })
+            
+            answer_cache = get_answer_cache()
+            context_ids = [str(item.get("id")) for item in relevant_context if item.get("id")]
+            vector = question_embedding(question) if context_ids else None
+            cached = answer_cache.get(question, context_ids, vector) if context_ids else None
+            if cached:
+                answer, succeeded = cached["answer"], True
+                yield sse_event("token", {"content": answer})
+                yield sse_event("done", {
+                    "cache": {"hit": True, "type": cached["type"], "age_seconds": cached["age_seconds"]},
+                    "metrics": None,
+                    "db": current_trace().to_dict() if current_trace() else None,
+                    "timestamp": datetime.utcnow().isoformat()
+                })
+                return
+            
+            def stale_answer(streamed):
+                """Token + done events for an expired cached answer, if there is one"""
+                stale = answer_cache.get(question, context_ids, vector, allow_stale=True) if context_ids else None
+                if not stale:
+                    return None
+                logger.warning(f"[stream] LLM unavailable; serving cached answer ({stale['type']}, age {stale['age_seconds']}s)")
+                return stale["answer"], [
+                    sse_event("token", {"content": stale["answer"], "replace": streamed}),
+                    sse_event("done", {
+                        "cache": {"hit": True, "type": stale["type"], "age_seconds": stale["age_seconds"],
+                                  "stale": True},
+                        "metrics": metrics,
+                        "db": current_trace().to_dict() if current_trace() else None,
+                        "timestamp": datetime.utcnow().isoformat()
+                    }),
+                ]
+            
+            if not is_openai_available():
+                answer = "ERRO: OpenAI API não está disponível. Verifique a configuração da chave API."
+                fallback = stale_answer(False)
+                if fallback:
+                    answer, events = fallback
+                    succeeded = True
+                    yield from events
+                    return
+                yield sse_event("error", {"error": answer})
+                return
+            
+            model = model or openai_manager.preferred_model
+            prompt, system_message, packed = build_answer_prompt(question, relevant_context, model)
+            parts = []
+            result = None
+            for event in stream_completion(prompt, system_message, model=model, temperature=0.3, max_tokens=1024):
+                if event["type"] == "token":
+                    parts.append(event["content"])
+                    yield sse_event("token", {"content": event["content"]})
+                else:
+                    result = event["result"]
+            
+            answer = "".join(parts)
+            metrics = result["metrics"] if result else None
+            model = (result or {}).get("model") or model
+            if not result or not result["success"]:
+                error = (result or {}).get("error") or "resposta vazia"
+                fallback = stale_answer(bool(parts))
+                if fallback:
+                    answer, events = fallback
+                    succeeded = True
+                    yield from events
+                    return
+                answer = answer or f"Erro na consulta à IA: {error}"
+                yield sse_event("error", {"error": error, "metrics": metrics})
+                return
+            succeeded = True
+            if context_ids:
+                answer_cache.put(question, context_ids, answer, vector)
+            yield sse_event("done", {
+                "cache": {"hit": False, "type": None},
+                "metrics": metrics,
+                "context": packed.to_dict(),
+                "db": current_trace().to_dict() if current_trace() else None,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+        except Exception as e:
+            logger.error(f"Error in ask_question_stream: {str(e)}", exc_info=True)
+            answer = answer or f"Erro inesperado: {str(e)}"
+            yield sse_event("error", {"error": "Erro interno do servidor", "error_type": type(e).__name__})
+        finally:
+            # Runs on normal end and on client disconnect (GeneratorExit); only queues the row
+            log_streamed_ask(question, answer, succeeded, top_k, min_relevance, relevant_context, search_type,
+                             request_meta, time.time() - start_time, metrics, model)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.route('/api/search', methods=['POST', 'GET'])
 def search_legal():
     """
     Search API endpoint - supports both GET and POST methods
     
-    GET: /api/search?q=query_text&top_k=3&min_relevance=0.0
-    POST: {"query": "query_text", "top_k": 3, "min_relevance": 0.0}
+    GET: /api/search?q=query_text&top_k=3&min_relevance=0.0&mode=fast&category=trabalhista
+    POST: {"query": "query_text", "top_k": 3, "min_relevance": 0.0, "mode": "fast", "category": "trabalhista"}
+    
+    mode is one of fast (default), balanced or exact.
+    Optional filters: category, law_type, jurisdiction, date_from, date_to (ISO dates).
     
     Returns legal knowledge base items matching the query using semantic search with
     keyword search fallback if semantic search is not available or returns no results.
@@ -994,6 +1319,8 @@ def search_legal():
                 raw_query = data.get('query', '').strip()
                 top_k_raw = data.get('top_k', 3)
                 min_rel_raw = data.get('min_relevance', 0.0)
+                mode_raw = data.get('mode')
+                filters = parse_search_filters(data)
             except Exception as e:
                 logger.error(f"Error parsing POST JSON: {e}")
                 return jsonify({
@@ -1012,6 +1339,8 @@ def search_legal():
                 
             top_k_raw = request.args.get('top_k', 3)
             min_rel_raw = request.args.get('min_relevance', 0.0)
+            mode_raw = request.args.get('mode')
+            filters = parse_search_filters(request.args)
             
             # Convert string params to correct types for GET
             try:
@@ -1033,18 +1362,18 @@ def search_legal():
             min_relevance = float(min_rel_raw)
         except Exception:
             min_relevance = 0.0
+        search_mode = parse_search_mode(mode_raw, SEARCH_MODE_DEFAULT)
         
         if not raw_query:
             return jsonify({"error": "Query não fornecida"}), 400
         
-        logger.info(f"Search request: query='{raw_query}', top_k={top_k}, min_relevance={min_relevance}")
+        logger.info(f"Search request: query='{raw_query}', top_k={top_k}, min_relevance={min_relevance}, mode={search_mode}, filters={filters}")
         
-        # Search legal knowledge (semantic preferred)
-        results, search_type = retrieve_context(raw_query, top_k=top_k)
-        if search_type == "semantic":
-            results = [it for it in results if float(it.get("relevance", 0.0)) >= min_relevance]
+        # Search legal knowledge (semantic preferred); min_relevance is applied in SQL
+        results, search_type = retrieve_context(raw_query, top_k=top_k, mode=search_mode,
+                                                 filters=filters, min_relevance=min_relevance)
         # For keyword-only, ensure we reflect the lowercased query used
-        query_for_return = raw_query if search_type == "semantic" else query_lower
+        query_for_return = raw_query if search_type in ("semantic", "hybrid") else query_lower
         
         # Log search analytics (enhanced with detailed tracking)
         try:
@@ -1064,7 +1393,6 @@ def search_legal():
                         init_pgvector()
                     
                     from retrieval_extensions import log_search_advanced
-                    from retrieval import _CONN
                     log_search_advanced(
                         query=raw_query,
                         top_k=top_k,
@@ -1077,19 +1405,16 @@ def search_legal():
                         response_time_ms=int(processing_time * 1000) if processing_time else 0,
                         user_agent=request.headers.get('User-Agent', ''),
                         ip_address=request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR')),
-                        context_found=len(results),
-                        conn=_CONN
+                        context_found=len(results)
                     )
                     logger.info(f"✅ Advanced search logging succeeded")
                 except ImportError:
                     # Fallback to basic logging
                     logger.info("⚠️ Using fallback basic search logging")
-                    from retrieval import log_search
                     log_search(raw_query, top_k, min_relevance, search_type, result_ids)
                 except Exception as log_err:
                     logger.error(f"❌ Advanced search logging failed: {log_err}, trying basic logging")
                     try:
-                        from retrieval import log_search
                         log_search(raw_query, top_k, min_relevance, search_type, result_ids)
                         logger.info("✅ Basic search logging succeeded")
                     except Exception as basic_err:
@@ -1100,7 +1425,6 @@ def search_legal():
             # Try emergency basic logging
             try:
                 if SEMANTIC_AVAILABLE:
-                    from retrieval import log_search
                     log_search(raw_query, 3, 0.0, "keyword", [])
                     logger.info("🔧 Emergency search logging succeeded")
             except Exception as emergency_err:
@@ -1120,7 +1444,7 @@ def search_legal():
             ],
             "total": len(results),
             "search_type": search_type,
-            "params": {"top_k": top_k, "min_relevance": min_relevance}
+            "params": {"top_k": top_k, "min_relevance": min_relevance, "mode": search_mode, "filters": filters}
         })
             
     except Exception as e:
@@ -1265,8 +1589,11 @@ def get_status():
             "ready": db_ready,
             "knowledge_base_size": kb_count,
             "semantic_available": SEMANTIC_AVAILABLE,
-            "semantic_ready": semantic_is_ready() if SEMANTIC_AVAILABLE else False
+            "semantic_ready": semantic_is_ready() if SEMANTIC_AVAILABLE else False,
+            "pool": get_db_manager().get_pool_stats()
         },
+        "log_writer": get_log_writer().get_stats(),
+        "heavy_hitters": get_heavy_hitters().get_stats(),
         "timestamp": datetime.utcnow().isoformat()
     })
 
@@ -1284,6 +1611,23 @@ def get_openai_api_status():
     """
     return jsonify(handle_api_status_request())
 
+@app.route('/api/status/db')
+def get_db_trace_status():
+    """Database round trips per endpoint
+    
+    GET /api/status/db
+    
+    Returns:
+    - Requests, round trips, statements and DB time per endpoint (totals, averages, max)
+    - Hot-path requests over the round-trip budget
+    - Connection pool stats
+    """
+    return jsonify({
+        **get_trace_stats().get_stats(),
+        "pool": get_db_manager().get_pool_stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
 @app.route('/api/status/lexml')
 def get_lexml_api_status():
     """LexML API status endpoint with test query
@@ -1297,6 +1641,44 @@ def get_lexml_api_status():
     """
     return jsonify(handle_lexml_status_request())
 
+@app.route('/api/status/embeddings')
+def get_embeddings_status():
+    """Query embedding cache status endpoint
+
+    GET /api/status/embeddings
+
+    Returns:
+    - Memory and persistent hit/miss counters
+    - Estimated embedding latency and calls saved
+    - Micro-batching dispatcher counters
+    - Content-addressed embedding store hit rate
+    - Embedding backfill worker and queue depth
+    - Document cache hit rate and invalidation listener state
+    - Answer cache exact/near-duplicate/stale hits
+    """
+    try:
+        from embedding_cache import get_embedding_cache_stats, get_content_embedding_store
+        from retrieval import get_embedding_batcher
+        from embedding_backfill import get_backfill_worker, get_backfill_queue_status
+        from local_vector_index import get_local_vector_index
+        from document_cache import get_document_cache
+        return jsonify({
+            "query_cache": get_embedding_cache_stats(),
+            "document_cache": get_document_cache().get_stats(),
+            "answer_cache": get_answer_cache().get_stats(),
+            "content_store": get_content_embedding_store().get_stats(),
+            "local_vector_index": get_local_vector_index().get_stats(),
+            "backfill": {
+                "worker": get_backfill_worker().get_stats(),
+                "queue": get_backfill_queue_status()
+            },
+            "batcher": get_embedding_batcher().get_stats(),
+            "timestamp": datetime.utcnow().isoformat()
+        })
+    except Exception as e:
+        logger.error(f"Error getting embedding cache status: {e}")
+        return jsonify({"error": "Failed to fetch embedding cache status"}), 500
+
 @app.route('/api/legal-data')
 def get_legal_data():
     # Fetch fresh data from database
@@ -1328,10 +1710,17 @@ def get_legal_item_details(item_id):
         # First try to fetch from database
         db_manager = get_db_manager()
         if db_manager and db_manager.is_ready():
-            # Get base item data
-            sql = """SELECT id, parent_id, title, content, category, metadata 
-                   FROM legal_chunks WHERE id = %s"""
-            result = db_manager.execute_query(sql, (item_id,))
+            # Get base item data (from the in-process document cache when available)
+            result = None
+            if SEMANTIC_AVAILABLE:
+                doc = get_doc_by_id(item_id)
+                if doc:
+                    result = [(doc["id"], doc["parent_id"], doc["title"], doc["content"],
+                               doc["category"], doc["metadata"])]
+            if result is None:
+                sql = """SELECT id, parent_id, title, content, category, metadata 
+                       FROM legal_chunks WHERE id = %s"""
+                result = db_manager.execute_query(sql, (item_id,))
             
             if result:
                 # Format item data
@@ -1793,7 +2182,8 @@ def api_admin_delete_legal_chunk(doc_id: str):
 
 @app.route('/api/popular-searches', methods=['GET'])
 def api_popular_searches():
-    """Get popular searches from actual database logs (search_logs and ask_logs)"""
+    """Popular (all-time) and trending searches, served from the in-memory
+    heavy-hitters sketches (merged across workers; no database query)"""
     # Default Brazilian legal search examples for new users
     default_searches = [
         "direitos do consumidor",
@@ -1807,58 +2197,36 @@ def api_popular_searches():
         "indenização por danos materiais",
         "revisão de aposentadoria"
     ]
-    
-    if not SEMANTIC_AVAILABLE:
-        return jsonify({
-            "popular_searches": default_searches,
-            "search_data": [{"term": term, "count": 0, "types": "example"} for term in default_searches],
-            "from_database": False,
-            "total_found": len(default_searches)
-        })
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 50)
     
     try:
-        from retrieval import get_popular_queries
-        
-        # Get popular queries from last 30 days from real database logs
-        popular_queries = get_popular_queries(limit=10, days=30)
-        
-        # Extract just the terms for the frontend with metadata
-        search_data = []
-        for q in popular_queries:
-            if q.get('query') and len(q.get('query', '').strip()) > 2:
-                search_data.append({
-                    'term': q.get('query').strip(),
-                    'count': q.get('count', 0),
-                    'types': q.get('query_types', 'search'),
-                    'success_rate': q.get('success_rate', 100)
-                })
-        
-        # If we have real data, use it; otherwise use defaults
-        if search_data:
-            return jsonify({
-                "popular_searches": [item['term'] for item in search_data],
-                "search_data": search_data,
-                "from_database": True,
-                "total_found": len(search_data)
-            })
-        else:
-            # No searches yet, return defaults
-            return jsonify({
-                "popular_searches": default_searches,
-                "search_data": [{"term": term, "count": 0, "types": "example"} for term in default_searches],
-                "from_database": False,
-                "total_found": len(default_searches)
-            })
-        
+        hitters = get_heavy_hitters()
+        search_data = [{'term': q['query'], 'count': q['count'], 'error': q['error']}
+                       for q in hitters.popular(limit)]
+        trending_data = [{'term': q['query'], 'score': q['score']} for q in hitters.trending(limit)]
     except Exception as e:
         logger.error(f"Error getting popular searches: {e}")
-        # Return default Brazilian legal search examples for new users
+        search_data, trending_data = [], []
+    
+    # If we have real data, use it; otherwise use defaults
+    if search_data:
         return jsonify({
-            "popular_searches": default_searches,
-            "search_data": [{"term": term, "count": 0, "types": "example"} for term in default_searches],
-            "from_database": False,
-            "total_found": len(default_searches)
+            "popular_searches": [item['term'] for item in search_data],
+            "search_data": search_data,
+            "trending_searches": [item['term'] for item in trending_data],
+            "trending_data": trending_data,
+            "from_database": True,
+            "total_found": len(search_data)
         })
+    # No searches yet, return defaults
+    return jsonify({
+        "popular_searches": default_searches,
+        "search_data": [{"term": term, "count": 0, "types": "example"} for term in default_searches],
+        "trending_searches": [],
+        "trending_data": [],
+        "from_database": False,
+        "total_found": len(default_searches)
+    })
 
 @app.errorhandler(404)
 def not_found(error):
@@ -1932,6 +2300,30 @@ if __name__ == '__main__':
         except Exception as bg_e:
             logger.warning(f"Could not start background DB check: {bg_e}")
         
+        # Evict cached documents when another worker changes legal_chunks (LISTEN/NOTIFY)
+        if SEMANTIC_AVAILABLE:
+            try:
+                from document_cache import start_invalidation_listener
+                start_invalidation_listener()
+            except Exception as dc_e:
+                logger.warning(f"Could not start document cache listener: {dc_e}")
+        
+        # Keep the memory-mapped local vector index in sync with legal_chunks
+        if SEMANTIC_AVAILABLE:
+            try:
+                from local_vector_index import get_local_vector_index
+                get_local_vector_index().start_refresher()
+            except Exception as lv_e:
+                logger.warning(f"Could not start local vector index refresher: {lv_e}")
+        
+        # Re-embed chunks stored without a vector (failed or deferred embeddings)
+        if SEMANTIC_AVAILABLE:
+            try:
+                from embedding_backfill import start_backfill_worker
+                start_backfill_worker()
+            except Exception as bf_e:
+                logger.warning(f"Could not start embedding backfill worker: {bf_e}")
+        
         # Run Flask app
         port = int(os.getenv('PORT', 5000))
         logger.info(f"🚀 Starting JuSimples Flask app on port {port}")
@@ -0,0 +1,202 @@
+"""
+Bulk Embedding Module for JuSimples
+Token-budgeted, concurrent batch embedding for ingestion and seeding
+"""
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Provider limits: text-embedding-3-* accepts up to 2048 inputs and ~300k tokens per
+# request, and 8191 tokens per input. Defaults stay well under both.
+BULK_BATCH_TOKEN_BUDGET = int(os.getenv("EMBED_BULK_TOKEN_BUDGET", "100000"))
+BULK_BATCH_MAX_INPUTS = int(os.getenv("EMBED_BULK_MAX_INPUTS", "512"))
+BULK_MAX_INPUT_TOKENS = int(os.getenv("EMBED_MAX_INPUT_TOKENS", "8191"))
+BULK_CONCURRENCY = int(os.getenv("EMBED_BULK_CONCURRENCY", "4"))
+BULK_MAX_RETRIES = int(os.getenv("EMBED_BULK_MAX_RETRIES", "3"))
+BULK_RETRY_BASE_DELAY = float(os.getenv("EMBED_BULK_RETRY_DELAY", "1.0"))
+
+try:
+    import tiktoken  # type: ignore
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+
+# HTTP statuses meaning the provider rejected the content of this request, and
+# meaning no request with these credentials/settings can succeed
+_INPUT_ERROR_STATUSES = (400, 413, 422)
+_FATAL_ERROR_STATUSES = (401, 403, 404)
+_CONNECTION_ERRORS = ("APIConnectionError", "APITimeoutError")
+
+
+def classify_error(exc: BaseException) -> str:
+    """'input' (split the batch), 'fatal' (auth or connection: stop) or 'transient'
+    (rate limits, 5xx: back off and retry), looking through wrapped causes"""
+    while exc is not None:
+        status = getattr(exc, "status_code", None)
+        if status in _INPUT_ERROR_STATUSES:
+            return "input"
+        if status in _FATAL_ERROR_STATUSES:
+            return "fatal"
+        if status is not None:
+            return "transient"
+        if isinstance(exc, (ConnectionError, TimeoutError)) or type(exc).__name__ in _CONNECTION_ERRORS:
+            return "fatal"
+        exc = exc.__cause__
+    return "transient"
+
+
+def estimate_tokens(text: str) -> int:
+    """Count tokens with tiktoken when available, else ~4 characters per token"""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        try:
+            return len(_ENCODING.encode(text, disallowed_special=()))
+        except Exception:
+            pass
+    return max(1, len(text) // 4)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Trim text so it fits in a single embedding input"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    if _ENCODING is not None:
+        try:
+            return _ENCODING.decode(_ENCODING.encode(text, disallowed_special=())[:max_tokens])
+        except Exception:
+            pass
+    return text[: max_tokens * 4]
+
+
+class BulkEmbedder:
+    """Splits inputs into token-budgeted batches and embeds them concurrently.
+
+    embed_fn makes one attempt and raises the provider's error on failure (it should
+    not return placeholder vectors or retry itself). Errors are handled by kind
+    (classify_error): transient ones are retried with exponential backoff; a batch
+    the provider rejects for its content is split into single inputs, so one bad
+    input cannot sink its neighbours; auth and connection errors fail the batch at
+    once and stop the remaining ones. Inputs that never succeed come back as None.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], List[List[float]]],
+                 token_budget: int = BULK_BATCH_TOKEN_BUDGET,
+                 max_inputs: int = BULK_BATCH_MAX_INPUTS,
+                 concurrency: int = BULK_CONCURRENCY,
+                 max_retries: int = BULK_MAX_RETRIES,
+                 retry_delay: float = BULK_RETRY_BASE_DELAY):
+        self.embed_fn = embed_fn
+        self.token_budget = max(1, token_budget)
+        self.max_inputs = max(1, max_inputs)
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max(0, max_retries)
+        self.retry_delay = retry_delay
+        self.last_stats: Dict[str, Any] = {}
+        self._abort = threading.Event()
+
+    def make_batches(self, texts: List[str]) -> List[List[Tuple[int, str, int]]]:
+        """Group (index, text, tokens) triples into batches under the token budget"""
+        batches: List[List[Tuple[int, str, int]]] = []
+        current: List[Tuple[int, str, int]] = []
+        current_tokens = 0
+        for idx, text in enumerate(texts):
+            text = truncate_to_tokens(text or " ", BULK_MAX_INPUT_TOKENS)
+            tokens = estimate_tokens(text)
+            if current and (current_tokens + tokens > self.token_budget or len(current) >= self.max_inputs):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append((idx, text, tokens))
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def embed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Embed all texts, preserving input order"""
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        if not texts:
+            self.last_stats = self._stats(0, 0, 0, 0, 0, 0.0)
+            return results
+
+        start = time.time()
+        self._abort.clear()
+        batches = self.make_batches(texts)
+        total_tokens = sum(tok for batch in batches for _, _, tok in batch)
+        failed_batches = 0
+
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(batches))) as pool:
+            futures = {pool.submit(self._embed_batch, batch): batch for batch in batches}
+            for fut in as_completed(futures):
+                batch = futures[fut]
+                vectors, batch_failed = fut.result()
+                failed_batches += 1 if batch_failed else 0
+                for (idx, _, _), vec in zip(batch, vectors):
+                    results[idx] = vec
+
+        failed_inputs = sum(1 for v in results if v is None)
+        self.last_stats = self._stats(len(texts), total_tokens, len(batches), failed_batches,
+                                      failed_inputs, time.time() - start)
+        logger.info(
+            f"Bulk embedded {len(texts) - failed_inputs}/{len(texts)} text(s) in {len(batches)} batch(es): "
+            f"{self.last_stats['docs_per_second']} docs/s, {self.last_stats['tokens_per_second']} tokens/s"
+        )
+        return results
+
+    def _embed_batch(self, batch: List[Tuple[int, str, int]]) -> Tuple[List[Optional[List[float]]], bool]:
+        texts = [text for _, text, _ in batch]
+        vectors, kind = self._call_with_retries(texts)
+        if vectors is not None:
+            return vectors, False
+        if kind != "input" or len(texts) == 1:
+            return [None] * len(texts), True
+        logger.warning(f"Batch of {len(texts)} input(s) was rejected; embedding inputs individually")
+        singles: List[Optional[List[float]]] = []
+        for text in texts:
+            vec, _ = self._call_with_retries([text])
+            singles.append(vec[0] if vec else None)
+        return singles, True
+
+    def _call_with_retries(self, texts: List[str]) -> Tuple[Optional[List[List[float]]], Optional[str]]:
+        """(vectors, None) on success, else (None, error kind); only transient errors retry"""
+        for attempt in range(self.max_retries + 1):
+            if self._abort.is_set():
+                return None, "fatal"
+            try:
+                vectors = self.embed_fn(texts)
+                if len(vectors) != len(texts):
+                    raise ValueError(f"got {len(vectors)} vectors for {len(texts)} inputs")
+                return vectors, None
+            except Exception as e:
+                kind = classify_error(e)
+                if kind == "fatal":
+                    logger.error(f"Embedding failed ({e}); skipping the remaining batches")
+                    self._abort.set()
+                    return None, kind
+                if kind == "input" or attempt >= self.max_retries:
+                    logger.warning(f"Embedding batch of {len(texts)} failed after {attempt + 1} attempt(s): {e}")
+                    return None, kind
+                delay = self.retry_delay * (2 ** attempt)
+                logger.info(f"Embedding batch of {len(texts)} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+        return None, "transient"
+
+    @staticmethod
+    def _stats(docs: int, tokens: int, batches: int, failed_batches: int,
+               failed_inputs: int, seconds: float) -> Dict[str, Any]:
+        return {
+            "documents": docs,
+            "tokens": tokens,
+            "batches": batches,
+            "failed_batches": failed_batches,
+            "failed_inputs": failed_inputs,
+            "seconds": round(seconds, 3),
+            "docs_per_second": round(docs / seconds, 2) if seconds > 0 else 0.0,
+            "tokens_per_second": round(tokens / seconds, 2) if seconds > 0 else 0.0,
+        }
@@ -0,0 +1,161 @@
+"""
+Context Compressor Module for JuSimples
+Extractive compression of retrieved documents before answer generation: chunks are
+split into sentences and incisos, scored against the question, and only the best
+spans (with the article headers they belong to) are sent to the LLM
+"""
+import os
+import re
+import time
+import logging
+from typing import Dict, Any, List, Tuple
+
+from keyword_index import tokenize
+from context_packer import split_segments, join_segments, count_tokens
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:  # optional dependency: documents pass through uncompressed without it
+    np = None
+    NUMPY_AVAILABLE = False
+
+COMPRESSION_ENABLED = os.getenv("CONTEXT_COMPRESSION_ENABLED", "true").lower() == "true"
+# Documents shorter than this are sent whole
+COMPRESSION_MIN_TOKENS = int(os.getenv("CONTEXT_COMPRESSION_MIN_TOKENS", "150"))
+COMPRESSION_MAX_SPANS = int(os.getenv("CONTEXT_COMPRESSION_MAX_SPANS", "8"))
+# Spans scoring below this share of the best span in the request are dropped
+COMPRESSION_MIN_SCORE = float(os.getenv("CONTEXT_COMPRESSION_MIN_SCORE", "0.2"))
+# How much the retrieval (embedding) similarity of a chunk weighs on its spans
+COMPRESSION_EMBEDDING_WEIGHT = float(os.getenv("CONTEXT_COMPRESSION_EMBEDDING_WEIGHT", "0.3"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Incisos and paragraphs written inline: "... seguintes: I - ...; II - ...; § 1º ..."
+_INCISO_RE = re.compile(r"(?<=\S)\s+(?=(?:§+\s*\d|[IVXLC]+\s*[-–]\s))")
+_HEADER_RE = re.compile(r"^\s*(?:art(?:igo)?\.?\s*\d|cap[ií]tulo\b|t[ií]tulo\b|se[cç][aã]o\b|subse[cç][aã]o\b)",
+                        re.IGNORECASE)
+
+
+def split_spans(text: str) -> List[Tuple[str, str]]:
+    """Sentences of text, with inline incisos and paragraphs split into spans of their own"""
+    spans: List[Tuple[str, str]] = []
+    for sentence, sep in split_segments(text):
+        parts = _INCISO_RE.split(sentence)
+        spans.extend((part, " ") for part in parts[:-1])
+        spans.append((parts[-1], sep))
+    return spans
+
+
+def is_header(span: str) -> bool:
+    return bool(_HEADER_RE.match(span))
+
+
+def _lexical_scores(span_terms: List[List[str]], query_terms: List[str]):
+    """BM25 of every span against the question, spans as the collection (vectorized)"""
+    vocab = {term: j for j, term in enumerate(dict.fromkeys(query_terms))}
+    tf = np.zeros((len(span_terms), len(vocab)), dtype=np.float32)
+    for i, terms in enumerate(span_terms):
+        for term in terms:
+            j = vocab.get(term)
+            if j is not None:
+                tf[i, j] += 1.0
+    lengths = np.array([max(1, len(t)) for t in span_terms], dtype=np.float32)
+    df = (tf > 0).sum(axis=0)
+    n = float(len(span_terms))
+    idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5))
+    norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths / lengths.mean())
+    return ((tf * (BM25_K1 + 1.0)) / (tf + norm[:, None]) * idf).sum(axis=1)
+
+
+def _doc_similarity(doc: Dict[str, Any]) -> float:
+    try:
+        return max(0.0, float(doc.get("relevance", doc.get("score", 0.0)) or 0.0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def compress_context(question: str, documents: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Keep the spans of each document most relevant to question.
+
+    A span's score is its BM25 against the question (over all spans of the request),
+    scaled by its chunk's retrieval similarity, which reuses the query/chunk embedding
+    comparison already made by vector search. Kept spans bring along the article
+    header above them; a long document with no matching span keeps its opening.
+
+    Returns (documents with compressed content, report with the compression ratio).
+    """
+    start = time.time()
+    report: Dict[str, Any] = {"enabled": COMPRESSION_ENABLED and NUMPY_AVAILABLE, "documents": len(documents),
+                              "compressed_documents": 0, "spans_total": 0, "spans_kept": 0,
+                              "tokens_before": 0, "tokens_after": 0, "ratio": 1.0, "duration_ms": 0}
+    query_terms = tokenize(question)
+    if not report["enabled"] or not documents or not query_terms:
+        return documents, report
+
+    # Split every document long enough to be worth compressing
+    plans = []
+    for doc in documents:
+        content = (doc.get("content") or "").strip()
+        tokens = count_tokens(content)
+        report["tokens_before"] += tokens
+        spans = split_spans(content) if tokens >= COMPRESSION_MIN_TOKENS else []
+        plans.append((doc, content, tokens, spans if len(spans) > 1 else []))
+    spans_flat = [(d, i) for d, (_, _, _, spans) in enumerate(plans) for i in range(len(spans))]
+    if not spans_flat:
+        report["tokens_after"] = report["tokens_before"]
+        return documents, report
+
+    span_terms = [tokenize(plans[d][3][i][0]) for d, i in spans_flat]
+    lexical = _lexical_scores(span_terms, query_terms)
+    similarity = np.array([_doc_similarity(plans[d][0]) for d, _ in spans_flat], dtype=np.float32)
+    if similarity.max() > 0:
+        similarity /= similarity.max()
+    scores = lexical * (1.0 - COMPRESSION_EMBEDDING_WEIGHT + COMPRESSION_EMBEDDING_WEIGHT * similarity)
+    best = float(scores.max()) if len(scores) else 0.0
+    threshold = best * COMPRESSION_MIN_SCORE
+
+    compressed: List[Dict[str, Any]] = []
+    offset = 0
+    for doc, content, tokens, spans in plans:
+        if not spans:
+            compressed.append(doc)
+            report["tokens_after"] += tokens
+            continue
+        doc_scores = scores[offset:offset + len(spans)]
+        offset += len(spans)
+        ranked = [i for i in np.argsort(-doc_scores, kind="stable") if doc_scores[i] > 0 and doc_scores[i] >= threshold]
+        keep = set(int(i) for i in ranked[:COMPRESSION_MAX_SPANS])
+        if not keep:
+            # Vector search found it relevant without shared terms: keep the opening
+            keep = {0, 1}
+        # Each kept span brings the nearest header above it
+        for i in list(keep):
+            for h in range(i, -1, -1):
+                if is_header(spans[h][0]):
+                    keep.add(h)
+                    break
+        indexes = sorted(keep)
+        text = join_segments(spans, indexes)
+        after = count_tokens(text)
+        if after >= tokens:
+            compressed.append(doc)
+            report["tokens_after"] += tokens
+        else:
+            new_doc = dict(doc)
+            new_doc["content"] = text
+            compressed.append(new_doc)
+            report["tokens_after"] += after
+            report["compressed_documents"] += 1
+        report["spans_total"] += len(spans)
+        report["spans_kept"] += len(indexes)
+
+    if report["tokens_before"]:
+        report["ratio"] = round(report["tokens_after"] / report["tokens_before"], 3)
+    report["duration_ms"] = int((time.time() - start) * 1000)
+    logger.info(f"Context compressed: {report['tokens_before']} -> {report['tokens_after']} tokens "
+                f"(ratio {report['ratio']}), {report['spans_kept']}/{report['spans_total']} spans "
+                f"in {report['duration_ms']}ms")
+    return compressed, report
@@ -0,0 +1,281 @@
+"""
+Context Packer Module for JuSimples
+Fits retrieved legal documents into a per-model token budget before they are sent
+to the LLM: local token counting, removal of duplicate and overlapping chunks, and
+query-driven sentence selection for documents that do not fit whole
+"""
+import os
+import re
+import logging
+import hashlib
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from keyword_index import tokenize, fold_accents
+from openai_utils import MODEL_CONFIGS
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:  # optional dependency: token counts fall back to an estimate
+    tiktoken = None
+    TIKTOKEN_AVAILABLE = False
+
+# Overrides the per-model "context_budget" from MODEL_CONFIGS when > 0
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+DEFAULT_CONTEXT_BUDGET = 3000
+# Share of a chunk's word 5-grams found in an already packed chunk to count as a duplicate
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8"))
+# Do not add a document if less than this many tokens of budget are left for it
+CONTEXT_MIN_DOC_TOKENS = int(os.getenv("CONTEXT_MIN_DOC_TOKENS", "48"))
+
+ELISION = " [...] "
+_SHINGLE = 5
+# Sentence ends (., !, ?, ;, :) followed by whitespace, or line breaks
+_SEGMENT_RE = re.compile(r"(?<=[.!?;:])\s+|\s*\n\s*")
+# Abbreviations common in legal text that end in a period but not a sentence
+_ABBREVIATIONS = frozenset("art arts inc par n nº no cf p pp fl fls lei dec min rel proc res".split())
+
+# ChatML framing per message and for the primed reply (OpenAI cookbook figures)
+_TOKENS_PER_MESSAGE = 3
+_TOKENS_PER_REPLY = 3
+
+_encodings: Dict[str, Any] = {}
+
+
+def _encoding(model: Optional[str]):
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    key = model or ""
+    if key not in _encodings:
+        try:
+            _encodings[key] = tiktoken.encoding_for_model(model)
+        except Exception:
+            # Unknown (newer) model names: the GPT-4o tokenizer is the best guess
+            try:
+                _encodings[key] = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                logger.warning(f"tiktoken encoding unavailable, estimating tokens: {e}")
+                _encodings[key] = None
+    return _encodings[key]
+
+
+def tokens_are_exact(model: Optional[str] = None) -> bool:
+    return _encoding(model) is not None
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """Token count of text for model (estimated at ~4 characters per token without tiktoken)"""
+    if not text:
+        return 0
+    enc = _encoding(model)
+    if enc is None:
+        return max(1, (len(text) + 3) // 4)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: Optional[str] = None) -> int:
+    """Prompt tokens a chat completion request with these messages is billed for"""
+    total = _TOKENS_PER_REPLY
+    for message in messages:
+        total += _TOKENS_PER_MESSAGE + count_tokens(message.get("content", ""), model)
+    return total
+
+
+def context_budget(model: Optional[str] = None) -> int:
+    """Token budget for packed context: CONTEXT_TOKEN_BUDGET, else the model's config"""
+    if CONTEXT_TOKEN_BUDGET > 0:
+        return CONTEXT_TOKEN_BUDGET
+    config = MODEL_CONFIGS.get(model or "", MODEL_CONFIGS.get("gpt-4o-mini", {}))
+    return int(config.get("context_budget", DEFAULT_CONTEXT_BUDGET))
+
+
+def _ends_with_abbreviation(sentence: str) -> bool:
+    words = sentence.rsplit(None, 1)
+    return bool(words) and sentence.endswith(".") and fold_accents(words[-1]).rstrip(".") in _ABBREVIATIONS
+
+
+def _append_segment(segments: List[Tuple[str, str]], sentence: str, sep: str) -> None:
+    if not sentence.strip():
+        return
+    if segments and segments[-1][1] == " " and _ends_with_abbreviation(segments[-1][0]):
+        # "Art. 5º": glue the abbreviation back onto what follows it
+        prev, prev_sep = segments.pop()
+        sentence = prev + prev_sep + sentence
+    segments.append((sentence, sep))
+
+
+def split_segments(text: str) -> List[Tuple[str, str]]:
+    """Split text into (sentence, separator) pairs; joining them restores the text
+    up to whitespace"""
+    segments: List[Tuple[str, str]] = []
+    pos = 0
+    for match in _SEGMENT_RE.finditer(text):
+        _append_segment(segments, text[pos:match.start()], "\n" if "\n" in match.group(0) else " ")
+        pos = match.end()
+    _append_segment(segments, text[pos:], "")
+    return segments
+
+
+def _sentence_key(sentence: str) -> str:
+    return hashlib.md5(" ".join(tokenize(sentence)).encode("utf-8")).hexdigest()
+
+
+def _shingles(text: str) -> Set[int]:
+    words = tokenize(text)
+    if len(words) < _SHINGLE:
+        return {hash(" ".join(words))} if words else set()
+    return {hash(" ".join(words[i:i + _SHINGLE])) for i in range(len(words) - _SHINGLE + 1)}
+
+
+def _containment(a: Set[int], b: Set[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def join_segments(segments: List[Tuple[str, str]], indexes: List[int]) -> str:
+    """Selected segments in document order, marking gaps with an elision"""
+    parts: List[str] = []
+    previous = None
+    for i in indexes:
+        if previous is not None:
+            parts.append(segments[previous][1] if i == previous + 1 else ELISION)
+        elif i > 0:
+            parts.append(ELISION.lstrip())
+        parts.append(segments[i][0].strip())
+        previous = i
+    if previous is not None and previous < len(segments) - 1:
+        parts.append(ELISION.rstrip())
+    return "".join(parts)
+
+
+def select_sentences(segments: List[Tuple[str, str]], query_terms: Set[str], budget: int,
+                     model: Optional[str] = None) -> str:
+    """Highest query-overlap sentences of a document (its opening always ranks first)
+    that fit in budget tokens, in their original order"""
+    scores: Dict[int, float] = {}
+    for i, (sentence, _) in enumerate(segments):
+        overlap = len(set(tokenize(sentence)) & query_terms) / (len(query_terms) or 1)
+        # The opening sentence usually names the article/law the rest refers to
+        scores[i] = 1.0 + overlap if i == 0 else overlap
+    chosen: List[int] = []
+    used = 0
+    for i in sorted(scores, key=lambda i: (-scores[i], i)):
+        if scores[i] <= 0 and chosen:
+            break
+        cost = count_tokens(segments[i][0], model) + 2
+        if used + cost <= budget:
+            chosen.append(i)
+            used += cost
+    chosen.sort()
+    text = join_segments(segments, chosen)
+    # Per-sentence sums can be off by a few tokens at the joins: trim until it fits
+    while chosen and count_tokens(text, model) > budget:
+        chosen.remove(min(chosen, key=lambda i: (scores[i], -i)))
+        text = join_segments(segments, chosen)
+    return text if chosen else ""
+
+
+class PackedContext:
+    """Result of pack_context: the context text plus what was kept, cut and dropped"""
+
+    def __init__(self, model: Optional[str], budget: int):
+        self.model = model
+        self.budget = budget
+        self.text = ""
+        self.tokens = 0
+        self.documents: List[Dict[str, Any]] = []
+        self.source_tokens = 0
+        self.duplicates = 0
+        self.over_budget = 0
+        self.truncated = 0
+        self.exact = tokens_are_exact(model)
+        self.prompt_tokens: Optional[int] = None
+        # Report of an extractive compression run before packing, if any
+        self.compression: Optional[Dict[str, Any]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "budget": self.budget,
+            "context_tokens": self.tokens,
+            "source_tokens": self.source_tokens,
+            "prompt_tokens": self.prompt_tokens,
+            "documents": len(self.documents),
+            "document_ids": [d["id"] for d in self.documents],
+            "truncated": self.truncated,
+            "dropped_duplicates": self.duplicates,
+            "dropped_over_budget": self.over_budget,
+            "exact": self.exact,
+            "compression": self.compression,
+        }
+
+
+def pack_context(question: str, documents: List[Dict[str, Any]], model: Optional[str] = None,
+                 budget: Optional[int] = None) -> PackedContext:
+    """Pack documents (most relevant first) into at most budget tokens of context.
+
+    Chunks mostly contained in an already packed chunk are dropped, and sentences
+    already packed (chunk overlap) are not repeated. A document that does not fit
+    whole is cut down to its sentences sharing the most terms with the question.
+    """
+    packed = PackedContext(model, budget if budget is not None else context_budget(model))
+    query_terms = set(tokenize(question))
+    separator = "\n\n"
+    separator_tokens = count_tokens(separator, model)
+    seen_sentences: Set[str] = set()
+    packed_shingles: List[Set[int]] = []
+    parts: List[str] = []
+
+    for doc in documents:
+        content = (doc.get("content") or "").strip()
+        if not content:
+            continue
+        packed.source_tokens += count_tokens(content, model)
+        shingles = _shingles(content)
+        if any(_containment(shingles, other) >= CONTEXT_DEDUP_THRESHOLD for other in packed_shingles):
+            packed.duplicates += 1
+            continue
+
+        segments = split_segments(content)
+        keys = [_sentence_key(s) for s, _ in segments]
+        fresh = [i for i, key in enumerate(keys) if key not in seen_sentences]
+        if not fresh:
+            packed.duplicates += 1
+            continue
+        if len(fresh) < len(segments):
+            segments = [segments[i] for i in fresh]
+            keys = [keys[i] for i in fresh]
+            body = join_segments(segments, list(range(len(segments))))
+        else:
+            body = content
+
+        header = f"--- Documento: {doc.get('title', 'Sem título')} ---\n"
+        remaining = packed.budget - packed.tokens - count_tokens(header, model) - \
+            (separator_tokens if parts else 0)
+        if remaining < CONTEXT_MIN_DOC_TOKENS:
+            packed.over_budget += 1
+            continue
+        truncated = False
+        if count_tokens(body, model) > remaining:
+            body = select_sentences(segments, query_terms, remaining, model)
+            truncated = True
+            if not body:
+                packed.over_budget += 1
+                continue
+
+        parts.append(header + body)
+        packed.text = separator.join(parts)
+        packed.tokens = count_tokens(packed.text, model)
+        packed_shingles.append(shingles)
+        seen_sentences.update(keys)
+        packed.truncated += int(truncated)
+        packed.documents.append({"id": doc.get("id"), "truncated": truncated})
+
+    if packed.duplicates or packed.over_budget or packed.truncated:
+        logger.info(f"Context packed: {packed.tokens}/{packed.budget} tokens from {packed.source_tokens}, "
+                    f"{len(packed.documents)} docs ({packed.truncated} cut), "
+                    f"{packed.duplicates} duplicates, {packed.over_budget} over budget")
+    return packed
@@ -0,0 +1,258 @@
+"""
+Database Trace Module for JuSimples
+Per-request counting of database round trips, statements and time per statement
+class, so regressions on the /api/search and /api/ask hot paths are visible
+"""
+import os
+import re
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+import psycopg
+
+logger = logging.getLogger(__name__)
+
+DB_TRACE_ENABLED = os.getenv("DB_TRACE_ENABLED", "true").lower() == "true"
+# Synchronous round trips a hot-path request may make before it is logged as over budget
+DB_ROUND_TRIP_BUDGET = int(os.getenv("DB_ROUND_TRIP_BUDGET", "2"))
+
+_FIRST_WORD_RE = re.compile(r"^\s*(?:/\*.*?\*/\s*)*([A-Za-z]+)", re.DOTALL)
+
+_current: ContextVar[Optional["DbTrace"]] = ContextVar("db_trace", default=None)
+
+
+def statement_class(query: Any, context: Any = None) -> str:
+    """Coarse class of a statement: select, insert, update, delete, set, copy, ..."""
+    if isinstance(query, bytes):
+        text = query[:200].decode("utf-8", "replace")
+    elif isinstance(query, str):
+        text = query[:200]
+    else:
+        try:
+            text = query.as_string(context)[:200]
+        except Exception:
+            return "other"
+    match = _FIRST_WORD_RE.match(text)
+    word = match.group(1).lower() if match else "other"
+    if word == "with":
+        return "select"
+    if word == "select" and "set_config" in text:
+        return "set"
+    return word
+
+
+class DbTrace:
+    """Round trips, statements and time spent in the database by one request"""
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.round_trips = 0
+        self.statements = 0
+        self.time_ms = 0.0
+        self.by_class: Dict[str, Dict[str, float]] = {}
+
+    def record(self, kind: str, seconds: float, statements: int = 1, round_trips: int = 1) -> None:
+        ms = seconds * 1000.0
+        self.round_trips += round_trips
+        self.statements += statements
+        self.time_ms += ms
+        entry = self.by_class.setdefault(kind, {"count": 0, "time_ms": 0.0})
+        entry["count"] += statements
+        entry["time_ms"] += ms
+
+    def header_value(self) -> str:
+        return f"round_trips={self.round_trips}; statements={self.statements}; time_ms={self.time_ms:.1f}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "round_trips": self.round_trips,
+            "statements": self.statements,
+            "time_ms": round(self.time_ms, 2),
+            "by_class": {k: {"count": int(v["count"]), "time_ms": round(v["time_ms"], 2)}
+                         for k, v in sorted(self.by_class.items())},
+        }
+
+
+def current_trace() -> Optional[DbTrace]:
+    return _current.get()
+
+
+def start_trace(label: str = "") -> Optional[DbTrace]:
+    """Start counting database work in the current context (one per request)"""
+    if not DB_TRACE_ENABLED:
+        return None
+    trace = DbTrace(label)
+    _current.set(trace)
+    return trace
+
+
+def end_trace() -> Optional[DbTrace]:
+    """Stop counting; worker threads are reused, so always call this after start_trace"""
+    trace = _current.get()
+    _current.set(None)
+    return trace
+
+
+class TracedCursor(psycopg.Cursor):
+    """Cursor recording its statements in the current trace.
+
+    Outside pipeline mode every execute is one round trip; in a pipeline queued
+    statements cost one round trip when results are fetched or the pipeline syncs.
+    """
+
+    def execute(self, query, params=None, **kwargs):
+        trace = _current.get()
+        if trace is None:
+            return super().execute(query, params, **kwargs)
+        start = time.perf_counter()
+        try:
+            return super().execute(query, params, **kwargs)
+        finally:
+            self.connection._trace_statement(trace, statement_class(query, self), time.perf_counter() - start)
+
+    def executemany(self, query, params_seq, **kwargs):
+        trace = _current.get()
+        if trace is None:
+            return super().executemany(query, params_seq, **kwargs)
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, params_seq, **kwargs)
+        finally:
+            # psycopg runs executemany as one pipeline: one sync for the whole batch
+            trace.record(statement_class(query, self), time.perf_counter() - start)
+
+    @contextmanager
+    def copy(self, statement, params=None, **kwargs):
+        trace = _current.get()
+        start = time.perf_counter()
+        try:
+            with super().copy(statement, params, **kwargs) as copy:
+                yield copy
+        finally:
+            if trace is not None:
+                trace.record("copy", time.perf_counter() - start)
+
+    def fetchone(self):
+        self.connection._trace_sync()
+        return super().fetchone()
+
+    def fetchmany(self, size: int = 0):
+        self.connection._trace_sync()
+        return super().fetchmany(size)
+
+    def fetchall(self):
+        self.connection._trace_sync()
+        return super().fetchall()
+
+
+class TracedConnection(psycopg.Connection):
+    """Connection counting BEGIN/COMMIT and pipeline syncs in the current trace"""
+
+    _trace_pipeline_depth = 0
+    _trace_pending = False
+
+    def _trace_statement(self, trace: DbTrace, kind: str, seconds: float) -> None:
+        if self._trace_pipeline_depth:
+            trace.record(kind, seconds, round_trips=0)
+            self._trace_pending = True
+        else:
+            trace.record(kind, seconds)
+
+    def _trace_sync(self) -> None:
+        """Fetching results in a pipeline waits for everything queued so far"""
+        if self._trace_pending:
+            trace = _current.get()
+            if trace is not None:
+                trace.round_trips += 1
+            self._trace_pending = False
+
+    @contextmanager
+    def pipeline(self) -> Iterator[psycopg.Pipeline]:
+        self._trace_pipeline_depth += 1
+        start = time.perf_counter()
+        try:
+            with super().pipeline() as p:
+                yield p
+        finally:
+            self._trace_pipeline_depth -= 1
+            if not self._trace_pipeline_depth:
+                trace = _current.get()
+                if trace is not None and self._trace_pending:
+                    trace.record("sync", time.perf_counter() - start, statements=0)
+                self._trace_pending = False
+
+    @contextmanager
+    def transaction(self, savepoint_name: Optional[str] = None,
+                    force_rollback: bool = False) -> Iterator[psycopg.Transaction]:
+        trace = _current.get()
+        if trace is None:
+            with super().transaction(savepoint_name, force_rollback) as tx:
+                yield tx
+            return
+        start = time.perf_counter()
+        entered = False
+        try:
+            with super().transaction(savepoint_name, force_rollback) as tx:
+                self._trace_statement(trace, "begin", time.perf_counter() - start)
+                entered = True
+                try:
+                    yield tx
+                finally:
+                    start = time.perf_counter()
+        finally:
+            if entered:
+                self._trace_statement(trace, "commit", time.perf_counter() - start)
+
+
+class DbTraceStats:
+    """Round-trip totals per endpoint, with a count of hot-path requests over budget"""
+
+    def __init__(self, budget: int = DB_ROUND_TRIP_BUDGET):
+        self.budget = budget
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, trace: DbTrace, hot_path: bool = False) -> bool:
+        """Record a finished request trace; True if a hot path went over budget"""
+        over = hot_path and trace.round_trips > self.budget
+        with self._lock:
+            entry = self._endpoints.setdefault(trace.label or "unknown", {
+                "requests": 0, "round_trips": 0, "max_round_trips": 0, "statements": 0,
+                "time_ms": 0.0, "over_budget": 0, "hot_path": hot_path})
+            entry["requests"] += 1
+            entry["round_trips"] += trace.round_trips
+            entry["max_round_trips"] = max(entry["max_round_trips"], trace.round_trips)
+            entry["statements"] += trace.statements
+            entry["time_ms"] += trace.time_ms
+            entry["over_budget"] += int(over)
+        if over:
+            logger.warning(f"DB round-trip budget exceeded on {trace.label}: {trace.round_trips} > "
+                           f"{self.budget} ({trace.to_dict()['by_class']})")
+        return over
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            endpoints = {}
+            for name, e in sorted(self._endpoints.items()):
+                n = e["requests"] or 1
+                endpoints[name] = {
+                    **e,
+                    "time_ms": round(e["time_ms"], 2),
+                    "avg_round_trips": round(e["round_trips"] / n, 2),
+                    "avg_statements": round(e["statements"] / n, 2),
+                    "avg_time_ms": round(e["time_ms"] / n, 2),
+                }
+        return {"enabled": DB_TRACE_ENABLED, "round_trip_budget": self.budget, "endpoints": endpoints}
+
+
+# Singleton instance
+trace_stats = DbTraceStats()
+
+
+def get_trace_stats() -> DbTraceStats:
+    """Get the per-endpoint trace statistics singleton"""
+    return trace_stats
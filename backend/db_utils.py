@@ -5,50 +5,227 @@ Provides reliable database connection and management functions
 import os
 import logging
 import time
-from typing import Optional, Dict, Any, Tuple, List
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Optional, Dict, Any, Iterator, Tuple, List
 
 import psycopg
 from pgvector.psycopg import register_vector
 from psycopg.types.json import Json
 from dotenv import load_dotenv
 
+try:
+    from psycopg_pool import ConnectionPool
+    POOL_AVAILABLE = True
+except ImportError:  # optional dependency: falls back to one shared connection
+    ConnectionPool = None
+    POOL_AVAILABLE = False
+
 # Load environment variables
 load_dotenv()
 
+# After load_dotenv: profiles read EMBEDDING_* settings at import time
+from embedding_profiles import get_embedding_profile
+from db_trace import TracedConnection, TracedCursor
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-EMBED_DIM = 1536  # text-embedding-3-small
+EMBED_DIM = get_embedding_profile("full").dimensions
+
+# Connection pool (psycopg_pool). Request code checks connections out with
+# connection(); get_connection() keeps returning one long-lived connection for
+# scripts and listeners.
+DB_POOL_ENABLED = os.getenv("DB_POOL_ENABLED", "true").lower() == "true"
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# Seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Idle connections above min size are closed after this many seconds; every
+# connection is replaced after max lifetime
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "1800"))
+# Background health check of idle pooled connections (seconds)
+DB_POOL_CHECK_INTERVAL = float(os.getenv("DB_POOL_CHECK_INTERVAL", "30"))
+# Behind a transaction-mode pooler (PgBouncer, Supabase port 6543) a session may
+# land on a different server connection per transaction: no server-side prepared statements
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
 
 class DatabaseManager:
     """Centralized database connection and management"""
     
     def __init__(self):
         self.conn = None
+        self.pool = None
         self.ready = False
         self.last_error = None
         self.connect_attempts = 0
         self.max_retries = 3
         self.retry_delay = 2  # seconds
+        self._pool_lock = threading.Lock()
+        self._pool_opened = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
         
     def get_connection(self, force_new=False) -> Optional[psycopg.Connection]:
-        """Get a database connection, creating a new one if needed"""
-        if self.conn is None or force_new:
+        """Get this manager's long-lived connection (scripts, LISTEN); request code
+        should use connection() instead"""
+        if self.conn is None or force_new or self.conn.closed or self.conn.broken:
             self.conn = self._establish_connection()
+        return self.conn
+    
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[psycopg.Connection]:
+        """Check a connection out of the pool for the duration of the block.
         
-        # Verify connection is still valid
-        if self.conn:
+        Connections are autocommit; use conn.transaction() for multi-statement work.
+        Before the pool has opened this waits up to timeout for it. Raises RuntimeError
+        if the database is unavailable (psycopg_pool.PoolTimeout if no connection frees
+        up within timeout).
+        """
+        pool = self._get_pool(wait=timeout or DB_POOL_TIMEOUT)
+        if pool is None:
+            if self._use_pool():
+                raise RuntimeError(f"Database unavailable: {self.last_error}")
+            conn = self.get_connection()
+            if conn is None:
+                raise RuntimeError(f"Database unavailable: {self.last_error}")
+            yield conn
+            return
+        with pool.connection(timeout=timeout or DB_POOL_TIMEOUT) as conn:
+            yield conn
+    
+    def _use_pool(self) -> bool:
+        return POOL_AVAILABLE and DB_POOL_ENABLED
+    
+    def _connect_kwargs(self) -> Dict[str, Any]:
+        # Enhanced connection parameters for better reliability
+        kwargs: Dict[str, Any] = {
+            "application_name": "jusimples_app",
+            "connect_timeout": 30,
+            "keepalives": 1,
+            "keepalives_idle": 60,
+            "keepalives_interval": 10,
+            "keepalives_count": 3,
+            "sslmode": "require",
+            "client_encoding": "utf8",
+            "autocommit": True,
+            # Counts round trips per request (db_trace); no-op outside a traced request
+            "cursor_factory": TracedCursor,
+        }
+        if DB_PGBOUNCER:
+            kwargs["prepare_threshold"] = None
+        return kwargs
+    
+    @staticmethod
+    def _configure(conn: psycopg.Connection) -> None:
+        try:
+            register_vector(conn)
+        except Exception as e:
+            logger.warning(f"Failed to register vector extension: {e}")
+    
+    def start_pool(self) -> None:
+        """Open the pool in the background (called at startup; idempotent)"""
+        if self.pool is not None or not self._use_pool():
+            return
+        with self._pool_lock:
+            if self._health_thread is not None and self._health_thread.is_alive():
+                return
+            self._health_thread = threading.Thread(target=self._pool_loop, name="db-pool-health", daemon=True)
+            self._health_thread.start()
+    
+    def _get_pool(self, wait: Optional[float] = None):
+        """The open pool, or None. Never opens it on the calling thread: the db-pool-health
+        thread does; wait is how long to block for that (0 for readiness checks)"""
+        if self.pool is None and self._use_pool():
+            self.start_pool()
+            if wait:
+                self._pool_opened.wait(wait)
+        return self.pool
+    
+    def _open_pool(self):
+        """Create and open the pool; None (with last_error set) if the server is unreachable"""
+        db_url = os.getenv("DATABASE_URL", "").strip()
+        if not db_url:
+            self.last_error = "DATABASE_URL not set"
+            return None
+        pool = ConnectionPool(
+            db_url,
+            connection_class=TracedConnection,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=max(DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE),
+            kwargs=self._connect_kwargs(),
+            configure=self._configure,
+            timeout=DB_POOL_TIMEOUT,
+            max_idle=DB_POOL_MAX_IDLE,
+            max_lifetime=DB_POOL_MAX_LIFETIME,
+            name="jusimples",
+            open=False,
+        )
+        try:
+            pool.open(wait=True, timeout=30)
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"❌ Could not open database pool: {e}")
+            pool.close()
+            return None
+        logger.info(f"✅ Database pool open (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE}"
+                    f"{', pgbouncer mode' if DB_PGBOUNCER else ''})")
+        return pool
+    
+    def _pool_loop(self) -> None:
+        """Open the pool (retrying every retry_delay seconds), then health-check it"""
+        while self.pool is None:
+            pool = self._open_pool()
+            if pool is None:
+                self.ready = False
+                time.sleep(self.retry_delay)
+                continue
+            self.pool = pool
+            self.ready = True
+            self.last_error = None
+            self._pool_opened.set()
+        self._health_loop()
+    
+    def _health_loop(self) -> None:
+        """Validate idle pooled connections off the request path, so checkout needs no round trip"""
+        while self.pool is not None and not self.pool.closed:
+            time.sleep(DB_POOL_CHECK_INTERVAL)
             try:
-                with self.conn.cursor() as cur:
-                    cur.execute("SELECT 1")
-                    cur.fetchone()
-                return self.conn
+                # Replaces broken idle connections; then one round trip proves the server is up
+                self.pool.check()
+                with self.pool.connection(timeout=DB_POOL_TIMEOUT) as conn:
+                    conn.execute("SELECT 1")
+                if not self.ready:
+                    logger.info("✅ Database reachable again")
+                self.ready = True
+                self.last_error = None
             except Exception as e:
-                logger.warning(f"Connection validation failed: {e}")
-                self.conn = self._establish_connection()
-                
-        return self.conn
+                if self.ready:
+                    logger.warning(f"Database health check failed: {e}")
+                self.ready = False
+                self.last_error = str(e)
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {
+            "enabled": self._use_pool(),
+            "available": POOL_AVAILABLE,
+            "pgbouncer_mode": DB_PGBOUNCER,
+            "ready": self.ready,
+            "last_error": self.last_error,
+        }
+        if self.pool is not None:
+            stats.update(self.pool.get_stats())
+        return stats
+    
+    def close(self) -> None:
+        if self.pool is not None:
+            self._pool_opened.clear()
+            self.pool.close()
+            self.pool = None
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
         
     def _establish_connection(self) -> Optional[psycopg.Connection]:
         """Establish a new database connection with retry logic"""
@@ -64,20 +241,7 @@ class DatabaseManager:
         logger.info(f"Connecting to database (attempt {self.connect_attempts}/{self.max_retries})...")
         
         try:
-            # Enhanced connection parameters for better reliability
-            conn_params = {
-                "application_name": "jusimples_app",
-                "connect_timeout": 30,
-                "keepalives": 1,
-                "keepalives_idle": 60,
-                "keepalives_interval": 10,
-                "keepalives_count": 3,
-                "sslmode": "require",
-                "client_encoding": "utf8"
-            }
-            
-            conn = psycopg.connect(db_url, **conn_params)
-            conn.autocommit = True
+            conn = TracedConnection.connect(db_url, **self._connect_kwargs())
             
             try:
                 register_vector(conn)
@@ -110,21 +274,28 @@ class DatabaseManager:
                 return None
     
     def is_ready(self) -> bool:
-        """Check if database connection is ready"""
+        """Check if database connection is ready (kept current by the pool health check).
+        With the pool this is a flag read: it never connects on the calling thread."""
+        if self._use_pool():
+            return self._get_pool() is not None and self.ready
         if not self.ready or not self.conn:
             conn = self.get_connection()
             self.ready = (conn is not None)
         return self.ready
     
+    def wait_ready(self, timeout: float = 30) -> bool:
+        """is_ready(), first waiting up to timeout for the pool to open (scripts and CLIs)"""
+        self._get_pool(wait=timeout)
+        return self.is_ready()
+    
     def execute_query(self, query: str, params: tuple = None) -> List[tuple]:
         """Execute a query and return all results"""
-        conn = self.get_connection()
-        if not conn:
+        if not self.is_ready():
             logger.error("Cannot execute query: No database connection")
             return []
         
         try:
-            with conn.cursor() as cur:
+            with self.connection() as conn, conn.cursor() as cur:
                 cur.execute(query, params)
                 try:
                     results = cur.fetchall()
@@ -140,243 +311,30 @@ class DatabaseManager:
     
     def execute_transaction(self, queries: List[Tuple[str, tuple]]) -> bool:
         """Execute multiple queries in a transaction"""
-        conn = self.get_connection()
-        if not conn:
+        if not self.is_ready():
             logger.error("Cannot execute transaction: No database connection")
             return False
         
         try:
-            with conn.cursor() as cur:
+            with self.connection() as conn, conn.transaction(), conn.cursor() as cur:
                 for query, params in queries:
                     cur.execute(query, params)
-                conn.commit()
-                return True
+            return True
         except Exception as e:
-            conn.rollback()
             logger.error(f"Transaction error: {str(e)}")
             return False
     
     def initialize_schema(self) -> bool:
-        """Initialize the database schema with all required tables"""
+        """Check the schema is migrated (applying pending migrations only with
+        DB_MIGRATE_ON_START). Schema changes belong in migrations.py, not here."""
         conn = self.get_connection()
         if not conn:
             logger.error("Cannot initialize schema: No database connection")
             return False
         
         try:
-            with conn.cursor() as cur:
-                # Enable vector extension
-                cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
-                logger.info("✅ Vector extension enabled")
-                
-                # Create legal_chunks table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS legal_chunks (
-                        id VARCHAR(255) PRIMARY KEY,
-                        parent_id VARCHAR(255),
-                        title TEXT NOT NULL,
-                        content TEXT NOT NULL,
-                        category VARCHAR(100),
-                        embedding vector(1536),
-                        metadata JSONB,
-                        created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
-                        updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
-                    );
-                """)
-                logger.info("✅ legal_chunks table created/verified")
-                
-                # Create indexes
-                cur.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_legal_chunks_category 
-                    ON legal_chunks(category);
-                """)
-                
-                cur.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_legal_chunks_embedding 
-                    ON legal_chunks USING ivfflat (embedding vector_cosine_ops) 
-                    WITH (lists = 100);
-                """)
-                logger.info("✅ Indexes created/verified")
-                
-                # Create search_logs table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS search_logs (
-                        id BIGSERIAL PRIMARY KEY,
-                        created_at TIMESTAMPTZ DEFAULT now(),
-                        query TEXT,
-                        top_k INT,
-                        min_relevance DOUBLE PRECISION,
-                        search_type TEXT,
-                        total INT,
-                        result_ids JSONB,
-                        user_id TEXT,
-                        session_id TEXT,
-                        response_time_ms INT,
-                        user_agent TEXT,
-                        ip_address INET,
-                        context_found INT DEFAULT 0,
-                        category TEXT,
-                        success BOOLEAN DEFAULT true
-                    );
-                """)
-                
-                # Create ask_logs table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS ask_logs (
-                        id BIGSERIAL PRIMARY KEY,
-                        created_at TIMESTAMPTZ DEFAULT now(),
-                        question TEXT,
-                        answer TEXT,
-                        top_k INT,
-                        min_relevance DOUBLE PRECISION,
-                        total_sources INT,
-                        result_ids JSONB,
-                        user_id TEXT,
-                        session_id TEXT,
-                        response_time_ms INT,
-                        user_agent TEXT,
-                        ip_address INET,
-                        context_found INT DEFAULT 0,
-                        search_type TEXT DEFAULT 'keyword',
-                        llm_model TEXT,
-                        llm_tokens_used INT,
-                        llm_cost DECIMAL(10,6),
-                        input_tokens INT DEFAULT 0,
-                        output_tokens INT DEFAULT 0,
-                        finish_reason TEXT,
-                        system_fingerprint TEXT,
-                        response_id TEXT,
-                        created_timestamp INT,
-                        logprobs TEXT,
-                        category TEXT,
-                        success BOOLEAN DEFAULT true,
-                        error_message TEXT
-                    );
-                """)
-                
-                # Create API usage tracking
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS api_usage_logs (
-                        id BIGSERIAL PRIMARY KEY,
-                        created_at TIMESTAMPTZ DEFAULT now(),
-                        endpoint TEXT,
-                        method TEXT,
-                        status_code INT,
-                        response_time_ms INT,
-                        user_id TEXT,
-                        session_id TEXT,
-                        ip_address INET,
-                        user_agent TEXT,
-                        request_size_bytes INT,
-                        response_size_bytes INT,
-                        error_message TEXT
-                    );
-                """)
-                
-                # Create query analytics
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS query_analytics (
-                        id BIGSERIAL PRIMARY KEY,
-                        query_normalized TEXT UNIQUE,
-                        total_count INT DEFAULT 1,
-                        last_queried TIMESTAMPTZ DEFAULT now(),
-                        avg_response_time_ms DECIMAL(10,2),
-                        success_rate DECIMAL(5,2),
-                        categories JSONB DEFAULT '[]'::jsonb,
-                        related_queries JSONB DEFAULT '[]'::jsonb,
-                        trending_score DECIMAL(10,2) DEFAULT 0,
-                        created_at TIMESTAMPTZ DEFAULT now(),
-                        updated_at TIMESTAMPTZ DEFAULT now()
-                    );
-                """)
-                
-                # Create system metrics
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS system_metrics (
-                        id BIGSERIAL PRIMARY KEY,
-                        recorded_at TIMESTAMPTZ DEFAULT now(),
-                        metric_type TEXT,
-                        metric_name TEXT,
-                        value DECIMAL(15,4),
-                        unit TEXT,
-                        metadata JSONB
-                    );
-                """)
-                
-                # Create user sessions
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS user_sessions (
-                        id BIGSERIAL PRIMARY KEY,
-                        session_id TEXT UNIQUE,
-                        user_id TEXT,
-                        started_at TIMESTAMPTZ DEFAULT now(),
-                        last_activity TIMESTAMPTZ DEFAULT now(),
-                        ip_address INET,
-                        user_agent TEXT,
-                        total_queries INT DEFAULT 0,
-                        total_time_seconds INT DEFAULT 0,
-                        pages_visited JSONB DEFAULT '[]'::jsonb,
-                        ended_at TIMESTAMPTZ
-                    );
-                """)
-                
-                # Create OpenAI API logs
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS openai_usage_logs (
-                        id BIGSERIAL PRIMARY KEY,
-                        created_at TIMESTAMPTZ DEFAULT now(),
-                        request_id TEXT,
-                        model TEXT,
-                        prompt_tokens INT DEFAULT 0,
-                        completion_tokens INT DEFAULT 0,
-                        total_tokens INT DEFAULT 0,
-                        cost DECIMAL(10,6) DEFAULT 0,
-                        finish_reason TEXT,
-                        system_fingerprint TEXT,
-                        response_time_ms INT DEFAULT 0,
-                        success BOOLEAN DEFAULT true,
-                        error_message TEXT,
-                        endpoint TEXT,
-                        session_id TEXT,
-                        user_id TEXT,
-                        prompt_preview TEXT,
-                        response_preview TEXT
-                    );
-                """)
-                
-                # Create LexML API logs
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS lexml_api_logs (
-                        id BIGSERIAL PRIMARY KEY,
-                        created_at TIMESTAMPTZ DEFAULT now(),
-                        endpoint TEXT,
-                        request_params JSONB DEFAULT '{}'::jsonb,
-                        response_data JSONB DEFAULT '{}'::jsonb,
-                        response_time_ms INT DEFAULT 0,
-                        success BOOLEAN DEFAULT true,
-                        error_message TEXT,
-                        documents_found INT DEFAULT 0,
-                        session_id TEXT,
-                        user_id TEXT,
-                        law_type TEXT,
-                        search_query TEXT
-                    );
-                """)
-                
-                # Create vector index
-                try:
-                    cur.execute("""
-                        CREATE INDEX IF NOT EXISTS legal_chunks_embedding_ivfflat_cos
-                        ON legal_chunks
-                        USING ivfflat (embedding vector_cosine_ops)
-                        WITH (lists = 100);
-                    """)
-                except Exception as e:
-                    logger.warning(f"Could not create IVFFlat index: {e}")
-                
-                logger.info("✅ All database tables created successfully")
-                return True
-                
+            from migrations import ensure_schema
+            return ensure_schema(conn)
         except Exception as e:
             logger.error(f"Schema initialization error: {str(e)}")
             return False
@@ -469,13 +427,49 @@ def get_db_manager() -> DatabaseManager:
 
 # Convenience functions to match existing API
 def get_connection() -> Optional[psycopg.Connection]:
-    """Get a database connection"""
+    """Get the shared long-lived connection (scripts and CLIs)"""
     return db_manager.get_connection()
 
+def connection(timeout: Optional[float] = None):
+    """Context manager checking a pooled connection out for a block of work"""
+    return db_manager.connection(timeout)
+
+@contextmanager
+def optional_connection(conn: Optional[psycopg.Connection] = None) -> Iterator[Optional[psycopg.Connection]]:
+    """For functions taking conn=None: use the caller's connection, else check one out
+    of the pool; yields None when the database is unavailable"""
+    if conn is not None:
+        yield conn
+    elif not db_manager.is_ready():
+        yield None
+    else:
+        with db_manager.connection() as pooled:
+            yield pooled
+
+def shared_connection(conn: Optional[psycopg.Connection] = None):
+    """The caller's connection if given, else a pooled checkout (see connection())"""
+    return nullcontext(conn) if conn is not None else db_manager.connection()
+
+def pipelined(conn: Optional[psycopg.Connection]):
+    """conn.pipeline(): statements queued inside the block share round trips. A no-op
+    block for None, inside an open pipeline (a nested one would sync on exit) or where
+    libpq lacks pipeline mode (< 14)"""
+    if conn is None or conn.pgconn.pipeline_status or not psycopg.Pipeline.is_supported():
+        return nullcontext()
+    return conn.pipeline()
+
 def is_ready() -> bool:
     """Check if database connection is ready"""
     return db_manager.is_ready()
 
+def wait_ready(timeout: float = 30) -> bool:
+    """Block until the database is ready or timeout passes (scripts and CLIs)"""
+    return db_manager.wait_ready(timeout)
+
+def start_pool() -> None:
+    """Start opening the connection pool in the background"""
+    db_manager.start_pool()
+
 def initialize_schema() -> bool:
     """Initialize database schema"""
     return db_manager.initialize_schema()
@@ -0,0 +1,209 @@
+"""
+Document Cache Module for JuSimples
+In-process LRU of legal_chunks documents for two-phase retrieval (ids and scores
+from the index, documents from this cache), kept fresh with LISTEN/NOTIFY
+"""
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DOC_CACHE_SIZE = int(os.getenv("DOC_CACHE_SIZE", "5000"))
+DOC_CACHE_ENABLED = os.getenv("DOC_CACHE_ENABLED", "true").lower() == "true"
+NOTIFY_CHANNEL = "legal_chunks_changed"
+# pg_notify payloads are limited to 8000 bytes; larger id sets flush every worker instead
+_MAX_PAYLOAD = 7900
+_FLUSH_ALL = "*"
+
+
+class DocumentCache:
+    """LRU of documents keyed by id, each stored with its version (updated_at).
+
+    Callers that know the current version (phase one of semantic search returns it)
+    only get an entry whose version matches, so a missed notification can never
+    serve stale text there; direct id lookups rely on NOTIFY-driven eviction.
+    Cached dicts are shared between requests and must be treated as read-only.
+    """
+
+    def __init__(self, max_size: int = DOC_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._docs: "OrderedDict[str, Tuple[Any, Dict[str, Any]]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0, "invalidations": 0, "flushes": 0}
+        self._subscribers: List[Callable[[Optional[List[str]]], None]] = []
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def get(self, doc_id: str, version: Any = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._docs.get(doc_id)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if version is not None and entry[0] != version:
+                del self._docs[doc_id]
+                self.stats["stale"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._docs.move_to_end(doc_id)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, doc: Dict[str, Any]) -> None:
+        if not DOC_CACHE_ENABLED or self.max_size <= 0:
+            return
+        with self._lock:
+            self._docs[doc["id"]] = (doc.get("updated_at"), doc)
+            self._docs.move_to_end(doc["id"])
+            while len(self._docs) > self.max_size:
+                self._docs.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def get_many(self, keys: Iterable[Tuple[str, Any]],
+                 loader: Callable[[List[str]], List[Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+        """Resolve (id, version) pairs from the cache, loading misses in one call"""
+        found: Dict[str, Dict[str, Any]] = {}
+        missing: List[str] = []
+        for doc_id, version in keys:
+            doc = self.get(doc_id, version)
+            if doc is None:
+                missing.append(doc_id)
+            else:
+                found[doc_id] = doc
+        if missing:
+            for doc in loader(missing):
+                self.put(doc)
+                found[doc["id"]] = doc
+        return found
+
+    def invalidate(self, doc_ids: Iterable[str]) -> int:
+        removed = 0
+        with self._lock:
+            for doc_id in doc_ids:
+                if self._docs.pop(doc_id, None) is not None:
+                    removed += 1
+            self.stats["invalidations"] += removed
+        return removed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._docs.clear()
+            self.stats["flushes"] += 1
+
+    def subscribe(self, callback: Callable[[Optional[List[str]]], None]) -> None:
+        """Also call callback(ids) on every invalidation (None = everything), e.g. for
+        caches derived from documents"""
+        self._subscribers.append(callback)
+
+    def handle_notification(self, payload: str) -> None:
+        ids = None if not payload or payload == _FLUSH_ALL else [p for p in payload.split(",") if p]
+        if ids is None:
+            self.clear()
+        else:
+            self.invalidate(ids)
+        for callback in self._subscribers:
+            try:
+                callback(ids)
+            except Exception as e:
+                logger.warning(f"Document invalidation subscriber failed: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "size": len(self._docs),
+                "max_size": self.max_size,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+                "listening": _listener_running,
+            }
+
+
+def notify_changed(cur, doc_ids: Optional[Iterable[str]] = None) -> None:
+    """Tell every worker (this one included) to evict doc_ids; None evicts everything.
+
+    Call with a cursor on the connection that made the change: NOTIFY is delivered
+    when that transaction commits, so listeners never reload the old row.
+    """
+    payload = _FLUSH_ALL if doc_ids is None else ",".join(str(d) for d in doc_ids)
+    if not payload:
+        return
+    if len(payload.encode("utf-8")) > _MAX_PAYLOAD:
+        payload = _FLUSH_ALL
+    # Local eviction too, in case the listener is down
+    document_cache.handle_notification(payload)
+    try:
+        cur.execute("SELECT pg_notify(%s, %s);", (NOTIFY_CHANNEL, payload))
+    except Exception as e:
+        logger.warning(f"Could not send document cache invalidation: {e}")
+
+
+_listener_lock = threading.Lock()
+_listener_thread: Optional[threading.Thread] = None
+_listener_running = False
+_stop_event = threading.Event()
+
+
+def _listen_forever(stop: threading.Event) -> None:
+    global _listener_running
+    backoff = 1.0
+    while not stop.is_set():
+        conn = None
+        try:
+            # LISTEN needs a connection of its own that stays idle between notifications
+            from db_utils import DatabaseManager
+            conn = DatabaseManager().get_connection()
+            if conn is None:
+                raise RuntimeError("no database connection")
+            conn.execute(f"LISTEN {NOTIFY_CHANNEL};")
+            # Anything changed while we were not listening is unknown: start clean
+            document_cache.handle_notification(_FLUSH_ALL)
+            _listener_running = True
+            backoff = 1.0
+            logger.info(f"📡 Document cache listening on '{NOTIFY_CHANNEL}'")
+            while not stop.is_set():
+                for notify in conn.notifies(timeout=5.0):
+                    document_cache.handle_notification(notify.payload)
+        except Exception as e:
+            logger.warning(f"Document cache listener error: {e}; retrying in {backoff:.0f}s")
+        finally:
+            _listener_running = False
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        stop.wait(backoff)
+        backoff = min(60.0, backoff * 2)
+
+
+def start_invalidation_listener() -> bool:
+    """Start the LISTEN thread once per process; False if already running or disabled"""
+    global _listener_thread
+    if not DOC_CACHE_ENABLED:
+        return False
+    with _listener_lock:
+        if _listener_thread is not None and _listener_thread.is_alive():
+            return False
+        _stop_event.clear()
+        _listener_thread = threading.Thread(target=_listen_forever, args=(_stop_event,),
+                                            name="document-cache-listener", daemon=True)
+        _listener_thread.start()
+    return True
+
+
+def stop_invalidation_listener() -> None:
+    _stop_event.set()
+
+
+# Singleton instance
+document_cache = DocumentCache()
+
+
+def get_document_cache() -> DocumentCache:
+    """Get the document cache singleton"""
+    return document_cache
@@ -0,0 +1,285 @@
+"""
+Embedding Backfill Module for JuSimples
+Deferred embedding queue: chunks whose embedding failed are stored with a NULL
+vector and re-embedded in batches by a background worker with backoff
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+from typing import Dict, Any, List, Optional
+
+from db_utils import connection, optional_connection, is_ready as db_is_ready, wait_ready
+from document_cache import notify_changed
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_ENABLED = os.getenv("EMBED_BACKFILL_ENABLED", "true").lower() == "true"
+BACKFILL_INTERVAL = float(os.getenv("EMBED_BACKFILL_INTERVAL_SECONDS", "30"))
+BACKFILL_BATCH_SIZE = int(os.getenv("EMBED_BACKFILL_BATCH_SIZE", "256"))
+BACKFILL_BASE_DELAY = int(os.getenv("EMBED_BACKFILL_BASE_DELAY_SECONDS", "60"))
+BACKFILL_MAX_DELAY = int(os.getenv("EMBED_BACKFILL_MAX_DELAY_SECONDS", "21600"))
+BACKFILL_SWEEP_INTERVAL = float(os.getenv("EMBED_BACKFILL_SWEEP_SECONDS", "600"))
+
+
+def enqueue_backfill(doc_ids: List[str], reason: Optional[str] = None, conn=None) -> int:
+    """Queue chunk ids for (re-)embedding. Safe to call repeatedly for the same id."""
+    ids = [str(i) for i in doc_ids if i]
+    if not ids:
+        return 0
+    with optional_connection(conn) as conn:
+        if not conn:
+            logger.warning(f"Cannot enqueue {len(ids)} chunk(s) for embedding backfill: no database connection")
+            return 0
+        try:
+            with conn.cursor() as cur:
+                cur.executemany(
+                    """
+                    INSERT INTO embedding_backfill_queue (chunk_id, last_error)
+                    VALUES (%s, %s)
+                    ON CONFLICT (chunk_id) DO UPDATE SET
+                        next_attempt_at = LEAST(embedding_backfill_queue.next_attempt_at, now()),
+                        last_error = COALESCE(EXCLUDED.last_error, embedding_backfill_queue.last_error);
+                    """,
+                    [(i, reason) for i in ids],
+                )
+            logger.info(f"Queued {len(ids)} chunk(s) for embedding backfill")
+            return len(ids)
+        except Exception as e:
+            logger.warning(f"Failed to enqueue embedding backfill: {e}")
+            return 0
+
+
+def get_backfill_queue_status(conn=None) -> Dict[str, Any]:
+    """Queue depth for dashboards: pending, due now, and retrying entries"""
+    status = {"pending": 0, "due": 0, "retrying": 0, "max_attempts": 0, "oldest_enqueued_at": None}
+    with optional_connection(conn) as conn:
+        if not conn:
+            return status
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT
+                        COUNT(*),
+                        COUNT(*) FILTER (WHERE next_attempt_at <= now()),
+                        COUNT(*) FILTER (WHERE attempts > 0),
+                        COALESCE(MAX(attempts), 0),
+                        MIN(enqueued_at)
+                    FROM embedding_backfill_queue;
+                    """
+                )
+                row = cur.fetchone()
+            if row:
+                status.update({
+                    "pending": int(row[0] or 0),
+                    "due": int(row[1] or 0),
+                    "retrying": int(row[2] or 0),
+                    "max_attempts": int(row[3] or 0),
+                    "oldest_enqueued_at": row[4].isoformat() if row[4] else None,
+                })
+        except Exception as e:
+            logger.warning(f"Could not read embedding backfill queue: {e}")
+        return status
+
+
+class EmbeddingBackfillWorker:
+    """Background thread that drains embedding_backfill_queue in batches"""
+
+    def __init__(self, interval: float = BACKFILL_INTERVAL, batch_size: int = BACKFILL_BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._last_sweep = 0.0
+        self.stats = {"runs": 0, "embedded": 0, "failed": 0, "stale": 0, "swept": 0, "last_run_at": None, "last_error": None}
+
+    def start(self) -> bool:
+        if self._thread and self._thread.is_alive():
+            return True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="embedding-backfill", daemon=True)
+        self._thread.start()
+        logger.info(f"Embedding backfill worker started (interval={self.interval}s, batch={self.batch_size})")
+        return True
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if time.time() - self._last_sweep >= BACKFILL_SWEEP_INTERVAL:
+                    self.sweep_missing()
+                # Keep draining while full batches come back
+                while self.run_once() >= self.batch_size and not self._stop.is_set():
+                    pass
+            except Exception as e:
+                self.stats["last_error"] = str(e)
+                logger.warning(f"Embedding backfill cycle failed: {e}")
+            self._stop.wait(self.interval)
+
+    def sweep_missing(self) -> int:
+        """Enqueue chunks written with a NULL embedding by paths that did not enqueue them"""
+        self._last_sweep = time.time()
+        if not db_is_ready():
+            return 0
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO embedding_backfill_queue (chunk_id, last_error)
+                SELECT c.id, 'missing embedding (sweep)'
+                FROM legal_chunks c
+                WHERE c.embedding IS NULL
+                ON CONFLICT (chunk_id) DO NOTHING;
+                """
+            )
+            swept = cur.rowcount or 0
+        if swept:
+            self.stats["swept"] += swept
+            logger.info(f"Backfill sweep queued {swept} chunk(s) with missing embeddings")
+        return swept
+
+    def run_once(self) -> int:
+        """Embed one batch of due queue entries. Returns how many entries were claimed."""
+        # Imported lazily: retrieval imports this module for enqueue_backfill
+        from retrieval import embed_texts_bulk
+
+        if not db_is_ready():
+            return 0
+
+        self.stats["runs"] += 1
+        self.stats["last_run_at"] = time.time()
+        with connection() as conn, conn.cursor() as cur:
+            # Claim a batch by pushing next_attempt_at forward so concurrent workers skip it
+            cur.execute(
+                """
+                UPDATE embedding_backfill_queue q
+                SET next_attempt_at = now() + interval '10 minutes'
+                WHERE q.chunk_id IN (
+                    SELECT chunk_id FROM embedding_backfill_queue
+                    WHERE next_attempt_at <= now()
+                    ORDER BY next_attempt_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING q.chunk_id, q.attempts;
+                """,
+                (self.batch_size,),
+            )
+            claimed = cur.fetchall()
+            if not claimed:
+                return 0
+
+            attempts = {row[0]: int(row[1] or 0) for row in claimed}
+            cur.execute(
+                "SELECT id, content FROM legal_chunks WHERE id = ANY(%s);",
+                (list(attempts.keys()),),
+            )
+            docs = cur.fetchall()
+
+            # Chunks deleted since they were queued
+            gone = set(attempts) - {d[0] for d in docs}
+            if gone:
+                cur.execute("DELETE FROM embedding_backfill_queue WHERE chunk_id = ANY(%s);", (list(gone),))
+
+        if not docs:
+            return len(claimed)
+
+        # No connection is held during the embeddings calls; the claim keeps other
+        # workers off these entries meanwhile
+        vectors = embed_texts_bulk([d[1] or "" for d in docs])
+        done: List[str] = []
+        stale: List[str] = []
+        with connection() as conn, conn.cursor() as cur:
+            for (doc_id, content), vec in zip(docs, vectors):
+                if vec is None:
+                    n = attempts[doc_id] + 1
+                    delay = min(BACKFILL_MAX_DELAY, BACKFILL_BASE_DELAY * (2 ** (n - 1)))
+                    cur.execute(
+                        """
+                        UPDATE embedding_backfill_queue
+                        SET attempts = %s, last_error = %s,
+                            next_attempt_at = now() + make_interval(secs => %s)
+                        WHERE chunk_id = %s;
+                        """,
+                        (n, "embedding failed", delay, doc_id),
+                    )
+                    self.stats["failed"] += 1
+                    continue
+                # The content may have been edited while it was being embedded; never
+                # store a vector computed from the old text
+                cur.execute(
+                    """
+                    UPDATE legal_chunks SET embedding = %s, updated_at = now()
+                    WHERE id = %s AND content IS NOT DISTINCT FROM %s;
+                    """,
+                    (vec, doc_id, content),
+                )
+                (done if cur.rowcount else stale).append(doc_id)
+
+            if stale:
+                # Re-embed the current text on the next run, without counting an attempt
+                cur.execute(
+                    "UPDATE embedding_backfill_queue SET next_attempt_at = now() WHERE chunk_id = ANY(%s);",
+                    (stale,),
+                )
+                self.stats["stale"] += len(stale)
+            if done:
+                cur.execute("DELETE FROM embedding_backfill_queue WHERE chunk_id = ANY(%s);", (done,))
+                notify_changed(cur, done)
+                self.stats["embedded"] += len(done)
+                logger.info(f"Backfilled embeddings for {len(done)} chunk(s)")
+        if done:
+            from vector_index import get_vector_index_manager
+            get_vector_index_manager().maybe_maintain()
+        return len(claimed)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "running": bool(self._thread and self._thread.is_alive()),
+            "interval_seconds": self.interval,
+            "batch_size": self.batch_size,
+        }
+
+
+# Singleton instance
+backfill_worker = EmbeddingBackfillWorker()
+
+
+def get_backfill_worker() -> EmbeddingBackfillWorker:
+    """Get the embedding backfill worker singleton"""
+    return backfill_worker
+
+
+def start_backfill_worker() -> bool:
+    """Start the background backfill worker if enabled"""
+    if not BACKFILL_ENABLED:
+        logger.info("Embedding backfill worker disabled (EMBED_BACKFILL_ENABLED=false)")
+        return False
+    return backfill_worker.start()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Drain the embedding backfill queue")
+    parser.add_argument("--sweep", action="store_true", help="Enqueue all chunks with a NULL embedding first")
+    args = parser.parse_args()
+
+    if not wait_ready():
+        logger.error("Database not ready")
+        sys.exit(1)
+    worker = get_backfill_worker()
+    if args.sweep:
+        worker.sweep_missing()
+    total = 0
+    while True:
+        claimed = worker.run_once()
+        total += claimed
+        if claimed < worker.batch_size:
+            break
+    logger.info(f"Processed {total} queue entries: {worker.get_stats()}")
+    logger.info(f"Queue status: {get_backfill_queue_status()}")
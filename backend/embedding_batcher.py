@@ -0,0 +1,140 @@
+"""
+Embedding Batcher Module for JuSimples
+Coalesces concurrent single-query embedding requests into batched API calls
+"""
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BATCHING_ENABLED = os.getenv("EMBED_BATCHING_ENABLED", "true").lower() == "true"
+BATCH_WINDOW_MS = float(os.getenv("EMBED_BATCH_WINDOW_MS", "5"))
+BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "64"))
+BATCH_WAIT_TIMEOUT = float(os.getenv("EMBED_BATCH_WAIT_TIMEOUT", "30"))
+# API calls that may be in flight at once; collecting continues while they run
+BATCH_MAX_INFLIGHT = int(os.getenv("EMBED_BATCH_MAX_INFLIGHT", "4"))
+
+
+class EmbeddingBatcher:
+    """Collects embedding requests for a short window and dispatches them as one call.
+
+    Callers block on embed(); a single collector thread drains the queue, waits up to
+    window_ms for more requests (or until max_batch is reached) and hands the batch to a
+    small worker pool, which deduplicates identical texts, calls embed_fn once and fans
+    the vectors back out to the waiting futures. A request arriving during an API call
+    goes out in the next batch without waiting for that call to return.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], List[Optional[List[float]]]],
+                 window_ms: float = BATCH_WINDOW_MS, max_batch: int = BATCH_MAX_SIZE,
+                 max_inflight: int = BATCH_MAX_INFLIGHT):
+        self.embed_fn = embed_fn
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.max_inflight = max(1, max_inflight)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_inflight, thread_name_prefix="embedding-call")
+        self._inflight = 0
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "batches": 0,
+            "api_inputs": 0,
+            "deduplicated": 0,
+            "max_batch_seen": 0,
+            "max_inflight_seen": 0,
+            "errors": 0,
+        }
+
+    def embed(self, text: str, timeout: float = BATCH_WAIT_TIMEOUT) -> Optional[List[float]]:
+        """Embed one text, sharing the outbound API call with concurrent callers"""
+        self._ensure_started()
+        fut: Future = Future()
+        self._queue.put((text, fut))
+        with self._stats_lock:
+            self.stats["requests"] += 1
+        return fut.result(timeout=timeout)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["avg_batch_size"] = round(stats["requests"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["window_ms"] = self.window * 1000.0
+        stats["max_batch"] = self.max_batch
+        stats["max_inflight"] = self.max_inflight
+        stats["inflight"] = self._inflight
+        stats["pending"] = self._queue.qsize()
+        return stats
+
+    def _ensure_started(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+            self._thread.start()
+
+    def _collect(self) -> List[tuple]:
+        """Block for the first request, then gather more until the window closes"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            with self._stats_lock:
+                self._inflight += 1
+                self.stats["max_inflight_seen"] = max(self.stats["max_inflight_seen"], self._inflight)
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: List[tuple]) -> None:
+        try:
+            self._call(batch)
+        finally:
+            with self._stats_lock:
+                self._inflight -= 1
+
+    def _call(self, batch: List[tuple]) -> None:
+        waiters: Dict[str, List[Future]] = {}
+        for text, fut in batch:
+            waiters.setdefault(text, []).append(fut)
+        texts = list(waiters.keys())
+
+        with self._stats_lock:
+            self.stats["batches"] += 1
+            self.stats["api_inputs"] += len(texts)
+            self.stats["deduplicated"] += len(batch) - len(texts)
+            self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(batch))
+
+        try:
+            vectors = self.embed_fn(texts)
+            if len(vectors) != len(texts):
+                raise ValueError(f"embed_fn returned {len(vectors)} vectors for {len(texts)} inputs")
+            for text, vec in zip(texts, vectors):
+                for fut in waiters[text]:
+                    fut.set_result(vec)
+        except Exception as e:
+            with self._stats_lock:
+                self.stats["errors"] += 1
+            logger.warning(f"Batched embedding call failed for {len(texts)} input(s): {e}")
+            for futs in waiters.values():
+                for fut in futs:
+                    if not fut.done():
+                        fut.set_exception(e)
@@ -0,0 +1,337 @@
+"""
+Embedding Cache Module for JuSimples
+Two-tier cache for query embeddings (in-process LRU plus a persistent Postgres table)
+and a content-addressed store so unchanged document text is never re-embedded
+"""
+import os
+import time
+import atexit
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, Any, List, Optional
+
+from db_utils import connection, is_ready as db_is_ready
+
+logger = logging.getLogger(__name__)
+
+QUERY_CACHE_SIZE = int(os.getenv("EMBED_QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_PERSIST = os.getenv("EMBED_QUERY_CACHE_PERSIST", "true").lower() == "true"
+# Persistent-tier hit counts and last_used_at are written in batches, this often
+QUERY_CACHE_TOUCH_SECONDS = float(os.getenv("EMBED_QUERY_CACHE_TOUCH_SECONDS", "30"))
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text for cache keys: NFC, lowercase, collapsed whitespace"""
+    text = unicodedata.normalize("NFC", text or "")
+    return " ".join(text.lower().split())
+
+
+def make_cache_key(text: str, model: str, dim: int) -> str:
+    """Build a stable cache key from normalized text, model name and dimension"""
+    base = f"{model}|{dim}|{normalize_text(text)}"
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+
+class QueryEmbeddingCache:
+    """In-process LRU for query embeddings backed by the query_embedding_cache table.
+
+    Persistent lookups are plain reads; hits and last_used_at are accumulated in
+    memory and written by a background thread in one batched UPDATE.
+    """
+
+    def __init__(self, max_size: int = QUERY_CACHE_SIZE, persist: bool = QUERY_CACHE_PERSIST,
+                 touch_seconds: float = QUERY_CACHE_TOUCH_SECONDS):
+        self.max_size = max(1, max_size)
+        self.persist = persist
+        self.touch_seconds = max(1.0, touch_seconds)
+        self._lru: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # cache_key -> persistent hits not yet written
+        self._touched: Dict[str, int] = {}
+        self._toucher: Optional[threading.Thread] = None
+        self.stats = {
+            "memory_hits": 0,
+            "persistent_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "persistent_errors": 0,
+            "touch_writes": 0,
+            "embed_calls": 0,
+            "embed_time_ms": 0.0,
+        }
+
+    def get(self, text: str, model: str, dim: int) -> Optional[List[float]]:
+        """Look up an embedding in memory first, then in the persistent tier"""
+        key = make_cache_key(text, model, dim)
+        with self._lock:
+            vec = self._lru.get(key)
+            if vec is not None:
+                self._lru.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return vec
+
+        vec = self._load_persistent(key)
+        if vec is not None:
+            self._ensure_toucher()
+        with self._lock:
+            if vec is not None:
+                self.stats["persistent_hits"] += 1
+                self._remember(key, vec)
+                self._touched[key] = self._touched.get(key, 0) + 1
+            else:
+                self.stats["misses"] += 1
+        return vec
+
+    def put(self, text: str, model: str, dim: int, vector: List[float]) -> None:
+        """Store an embedding in both tiers"""
+        if not vector:
+            return
+        key = make_cache_key(text, model, dim)
+        with self._lock:
+            self._remember(key, vector)
+            self.stats["stores"] += 1
+        self._store_persistent(key, text, model, dim, vector)
+
+    def record_embed_call(self, duration_ms: float) -> None:
+        """Track latency of real embedding calls so savings can be estimated"""
+        with self._lock:
+            self.stats["embed_calls"] += 1
+            self.stats["embed_time_ms"] += duration_ms
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and estimated latency saved"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_size"] = len(self._lru)
+            stats["touch_pending"] = len(self._touched)
+        hits = stats["memory_hits"] + stats["persistent_hits"]
+        lookups = hits + stats["misses"]
+        avg_embed_ms = stats["embed_time_ms"] / stats["embed_calls"] if stats["embed_calls"] else 0.0
+        stats.update({
+            "max_size": self.max_size,
+            "persist": self.persist,
+            "hits": hits,
+            "lookups": lookups,
+            "hit_rate": round(hits / lookups * 100, 2) if lookups else 0.0,
+            "avg_embed_time_ms": round(avg_embed_ms, 2),
+            "estimated_time_saved_ms": round(hits * avg_embed_ms, 2),
+            "embed_calls_saved": hits,
+        })
+        return stats
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        """Insert into the LRU (caller holds the lock)"""
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _load_persistent(self, key: str) -> Optional[List[float]]:
+        if not self.persist or not db_is_ready():
+            return None
+        try:
+            with connection() as conn, conn.cursor() as cur:
+                cur.execute("SELECT embedding FROM query_embedding_cache WHERE cache_key = %s;", (key,))
+                row = cur.fetchone()
+            if not row or row[0] is None:
+                return None
+            return [float(x) for x in row[0]]
+        except Exception as e:
+            with self._lock:
+                self.stats["persistent_errors"] += 1
+            logger.warning(f"Query embedding cache lookup failed: {e}")
+            return None
+
+    def _ensure_toucher(self) -> None:
+        if self._toucher is not None and self._toucher.is_alive():
+            return
+        with self._lock:
+            if self._toucher is not None and self._toucher.is_alive():
+                return
+            self._toucher = threading.Thread(target=self._touch_loop, name="embed-cache-touch", daemon=True)
+            self._toucher.start()
+
+    def _touch_loop(self) -> None:
+        while True:
+            time.sleep(self.touch_seconds)
+            self.flush_touches()
+
+    def flush_touches(self) -> int:
+        """Write the accumulated persistent hits (hits, last_used_at) in one statement"""
+        with self._lock:
+            touched, self._touched = self._touched, {}
+        if not touched or not db_is_ready():
+            return 0
+        try:
+            with connection() as conn, conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE query_embedding_cache AS c
+                    SET hits = c.hits + t.n, last_used_at = now()
+                    FROM unnest(%s::text[], %s::int[]) AS t(cache_key, n)
+                    WHERE c.cache_key = t.cache_key;
+                    """,
+                    (list(touched.keys()), list(touched.values())),
+                )
+            with self._lock:
+                self.stats["touch_writes"] += 1
+            return len(touched)
+        except Exception as e:
+            # Bookkeeping only: the counts are dropped rather than retried
+            with self._lock:
+                self.stats["persistent_errors"] += 1
+            logger.warning(f"Query embedding cache hit bookkeeping failed: {e}")
+            return 0
+
+    def _store_persistent(self, key: str, text: str, model: str, dim: int, vector: List[float]) -> None:
+        if not self.persist or not db_is_ready():
+            return
+        try:
+            with connection() as conn, conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO query_embedding_cache (cache_key, query_normalized, model, dim, embedding)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (cache_key) DO UPDATE SET last_used_at = now();
+                    """,
+                    (key, normalize_text(text)[:1000], model, dim, vector),
+                )
+        except Exception as e:
+            with self._lock:
+                self.stats["persistent_errors"] += 1
+            logger.warning(f"Query embedding cache store failed: {e}")
+
+
+def content_hash(text: str) -> str:
+    """Hash of normalized document text, used as the content-addressed store key"""
+    normalized = " ".join(unicodedata.normalize("NFC", text or "").split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class ContentEmbeddingStore:
+    """Content-addressed embedding store keyed by (content_hash, model, dim).
+
+    Write paths resolve vectors here before calling the embeddings API, so identical
+    text (re-seeds, no-op edits, boilerplate shared across articles) is embedded once.
+    Document text is hashed case-sensitively; only whitespace and Unicode form are
+    normalized, since casing can carry meaning in legal text.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats = {
+            "lookups": 0,
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "batch_duplicates": 0,
+            "errors": 0,
+        }
+
+    def get_many(self, hashes: List[str], model: str, dim: int) -> Dict[str, List[float]]:
+        """Fetch stored vectors for the given content hashes in one round trip"""
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(h for h in hashes if h))
+        if not unique or not db_is_ready():
+            self._count(lookups=len(unique), misses=len(unique))
+            return found
+        try:
+            with connection() as conn, conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT content_hash, embedding FROM embedding_store
+                    WHERE model = %s AND dim = %s AND content_hash = ANY(%s);
+                    """,
+                    (model, dim, unique),
+                )
+                for h, emb in cur.fetchall():
+                    if emb is not None:
+                        found[h] = [float(x) for x in emb]
+        except Exception as e:
+            self._count(errors=1)
+            logger.warning(f"Embedding store lookup failed: {e}")
+        self._count(lookups=len(unique), hits=len(found), misses=len(unique) - len(found))
+        return found
+
+    def put_many(self, entries: Dict[str, List[float]], model: str, dim: int) -> int:
+        """Persist newly computed vectors; zero/placeholder vectors are skipped"""
+        rows = [(h, model, dim, vec) for h, vec in entries.items() if vec and len(vec) == dim and any(vec)]
+        if not rows or not db_is_ready():
+            return 0
+        try:
+            with connection() as conn, conn.cursor() as cur:
+                cur.executemany(
+                    """
+                    INSERT INTO embedding_store (content_hash, model, dim, embedding)
+                    VALUES (%s, %s, %s, %s)
+                    ON CONFLICT (content_hash, model, dim) DO NOTHING;
+                    """,
+                    rows,
+                )
+            self._count(stores=len(rows))
+            return len(rows)
+        except Exception as e:
+            self._count(errors=1)
+            logger.warning(f"Embedding store write failed: {e}")
+            return 0
+
+    def resolve(self, texts: List[str], model: str, dim: int,
+                embed_fn: Callable[[List[str]], List[Optional[List[float]]]]) -> List[Optional[List[float]]]:
+        """Return vectors for texts, calling embed_fn only for unseen unique content"""
+        hashes = [content_hash(t) for t in texts]
+        vectors = self.get_many(hashes, model, dim)
+
+        missing: Dict[str, str] = {}
+        for h, text in zip(hashes, texts):
+            if h not in vectors and h not in missing:
+                missing[h] = text
+        self._count(batch_duplicates=len(texts) - len(set(hashes)))
+
+        if missing:
+            new_vectors = embed_fn(list(missing.values()))
+            fresh = {h: vec for h, vec in zip(missing.keys(), new_vectors) if vec is not None}
+            self.put_many(fresh, model, dim)
+            vectors.update(fresh)
+
+        return [vectors.get(h) for h in hashes]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["hit_rate"] = round(stats["hits"] / stats["lookups"] * 100, 2) if stats["lookups"] else 0.0
+        return stats
+
+    def _count(self, **deltas: int) -> None:
+        with self._lock:
+            for k, v in deltas.items():
+                self.stats[k] += v
+
+
+# Singleton instances
+query_embedding_cache = QueryEmbeddingCache()
+atexit.register(query_embedding_cache.flush_touches)
+content_embedding_store = ContentEmbeddingStore()
+
+
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    """Get the query embedding cache singleton"""
+    return query_embedding_cache
+
+
+def get_content_embedding_store() -> ContentEmbeddingStore:
+    """Get the content-addressed embedding store singleton"""
+    return content_embedding_store
+
+
+def get_embedding_cache_stats() -> Dict[str, Any]:
+    """Get hit/miss counters for the query embedding cache"""
+    return query_embedding_cache.get_stats()
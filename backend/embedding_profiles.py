@@ -0,0 +1,93 @@
+"""
+Embedding Profiles Module for JuSimples
+Registry of embedding profiles (model, dimensions, storage column) and the
+Matryoshka-style short profile used for two-stage vector search
+"""
+import os
+import logging
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+EMBED_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBED_DIM = int(os.getenv("EMBEDDING_DIMENSIONS", "1536"))
+# Leading dimensions used for the candidate pass of two-stage search
+SHORT_EMBED_DIM = int(os.getenv("EMBEDDING_SHORT_DIMENSIONS", "256"))
+TWO_STAGE_SEARCH = os.getenv("VECTOR_TWO_STAGE_SEARCH", "false").lower() == "true"
+# Candidates fetched from the short-vector index per requested result
+TWO_STAGE_CANDIDATE_FACTOR = int(os.getenv("VECTOR_TWO_STAGE_FACTOR", "10"))
+
+# Models trained Matryoshka-style: they accept `dimensions`, and a truncated,
+# re-normalized vector is equivalent to asking for fewer dimensions
+MATRYOSHKA_MODELS = ("text-embedding-3-small", "text-embedding-3-large")
+
+
+class EmbeddingProfile:
+    """One embedding space: which model produces it, its size and where it is stored.
+
+    A profile with prefix_of set is not requested from the API; it is the leading
+    `dimensions` of its parent profile's vectors (compared by cosine, so no
+    re-normalization is needed) and is indexed as an expression over the column.
+    """
+
+    def __init__(self, name: str, model: str, dimensions: int, column: str = "embedding",
+                 prefix_of: Optional[str] = None):
+        self.name = name
+        self.model = model
+        self.dimensions = dimensions
+        self.column = column
+        self.prefix_of = prefix_of
+
+    def supports_dimensions(self, model: Optional[str] = None) -> bool:
+        return (model or self.model) in MATRYOSHKA_MODELS
+
+    def request_kwargs(self, model: Optional[str] = None) -> Dict[str, Any]:
+        """Arguments for client.embeddings.create, pinning the size for Matryoshka models"""
+        model = model or self.model
+        kwargs: Dict[str, Any] = {"model": model}
+        if self.supports_dimensions(model):
+            kwargs["dimensions"] = self.dimensions
+        return kwargs
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "model": self.model,
+            "dimensions": self.dimensions,
+            "column": self.column,
+            "prefix_of": self.prefix_of,
+        }
+
+
+_PROFILES: Dict[str, EmbeddingProfile] = {}
+
+
+def register_profile(profile: EmbeddingProfile) -> EmbeddingProfile:
+    if profile.prefix_of:
+        parent = _PROFILES.get(profile.prefix_of)
+        if parent is None:
+            raise ValueError(f"Unknown parent profile '{profile.prefix_of}'")
+        if profile.dimensions >= parent.dimensions or not parent.supports_dimensions():
+            raise ValueError(f"Profile '{profile.name}' cannot be a prefix of '{parent.name}'")
+    _PROFILES[profile.name] = profile
+    return profile
+
+
+def get_embedding_profile(name: str = "full") -> EmbeddingProfile:
+    """Get a registered profile ('full' is what legal_chunks.embedding holds)"""
+    try:
+        return _PROFILES[name]
+    except KeyError:
+        raise KeyError(f"Unknown embedding profile '{name}'") from None
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    return [p.to_dict() for p in _PROFILES.values()]
+
+
+register_profile(EmbeddingProfile("full", EMBED_MODEL, EMBED_DIM))
+if 0 < SHORT_EMBED_DIM < EMBED_DIM and EMBED_MODEL in MATRYOSHKA_MODELS:
+    register_profile(EmbeddingProfile("short", EMBED_MODEL, SHORT_EMBED_DIM, prefix_of="full"))
+elif TWO_STAGE_SEARCH:
+    logger.warning(f"Two-stage search needs a Matryoshka model and a short size below {EMBED_DIM}; disabled")
+    TWO_STAGE_SEARCH = False
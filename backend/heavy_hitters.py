@@ -0,0 +1,354 @@
+"""
+Heavy Hitters Module for JuSimples
+In-process Space-Saving sketches of the queries sent to /api/search and /api/ask:
+all-time popular terms and exponentially decayed trending terms, merged across
+workers through the heavy_hitters table and served from memory
+"""
+import os
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg.types.json import Json
+
+from analytics_rollup import normalize_query
+
+logger = logging.getLogger(__name__)
+
+HH_ENABLED = os.getenv("HEAVY_HITTERS_ENABLED", "true").lower() == "true"
+# Counters per sketch; any term seen more than total/capacity times is guaranteed kept
+HH_CAPACITY = int(os.getenv("HH_CAPACITY", "500"))
+# Half-life of a query's weight in the trending sketch
+HH_TRENDING_HALF_LIFE = float(os.getenv("HH_TRENDING_HALF_LIFE_SECONDS", "3600"))
+# How often each worker merges its counts into the shared table
+HH_SYNC_SECONDS = float(os.getenv("HH_SYNC_SECONDS", "30"))
+# Served lists are rebuilt at most this often
+HH_VIEW_REFRESH_SECONDS = float(os.getenv("HH_VIEW_REFRESH_SECONDS", "1"))
+# Trending terms whose score is written to query_analytics.trending_score
+HH_TRENDING_SCORES = int(os.getenv("HH_TRENDING_SCORES", "50"))
+
+POPULAR = "popular"
+TRENDING = "trending"
+
+# Forward-decay weights grow as 2^(age / half-life); rescale long before floats overflow
+_MAX_DECAY_EXPONENT = 64
+
+
+class Summary:
+    """Point-in-time Space-Saving summary: term -> (count, error, display text).
+
+    Mergeable (Agarwal et al.): a term missing from a full summary may have had up
+    to its smallest count, so the merge credits it that much as count and error.
+    Decayed counts are valued as of `as_of` (seconds since the epoch).
+    """
+
+    def __init__(self, entries: Optional[Dict[str, Tuple[float, float, str]]] = None,
+                 min_count: float = 0.0, total: float = 0.0, as_of: Optional[float] = None):
+        self.entries = entries or {}
+        self.min_count = min_count
+        self.total = total
+        self.as_of = as_of if as_of is not None else time.time()
+
+    def decayed(self, now: float, half_life: Optional[float]) -> "Summary":
+        """This summary valued at `now` (unchanged without a half-life)"""
+        if not half_life or now <= self.as_of:
+            return Summary(dict(self.entries), self.min_count, self.total, now)
+        f = 2.0 ** (-(now - self.as_of) / half_life)
+        return Summary({k: (c * f, e * f, d) for k, (c, e, d) in self.entries.items()},
+                       self.min_count * f, self.total * f, now)
+
+    def merge(self, other: "Summary", capacity: int) -> "Summary":
+        """Sum of two summaries valued at the same time, cut to the top capacity terms"""
+        merged = {}
+        for key in self.entries.keys() | other.entries.keys():
+            c1, e1, d1 = self.entries.get(key, (self.min_count, self.min_count, ""))
+            c2, e2, d2 = other.entries.get(key, (other.min_count, other.min_count, ""))
+            merged[key] = (c1 + c2, e1 + e2, d2 or d1)
+        kept = sorted(merged.items(), key=lambda kv: -kv[1][0])[:capacity]
+        min_count = kept[-1][1][0] if len(kept) >= capacity else 0.0
+        return Summary(dict(kept), min_count, self.total + other.total, max(self.as_of, other.as_of))
+
+    def top(self, n: int) -> List[Tuple[str, float, float, str]]:
+        ranked = sorted(self.entries.items(), key=lambda kv: (-kv[1][0], kv[0]))[:n]
+        return [(key, c, e, d) for key, (c, e, d) in ranked]
+
+    def to_json(self) -> List[List[Any]]:
+        return [[key, round(c, 4), round(e, 4), d] for key, (c, e, d) in self.entries.items()]
+
+    @classmethod
+    def from_row(cls, entries: Any, min_count: float, total: float, as_of: datetime) -> "Summary":
+        return cls({k: (float(c), float(e), d or k) for k, c, e, d in entries or []},
+                   float(min_count or 0), float(total or 0), as_of.timestamp())
+
+
+class SpaceSaving:
+    """Space-Saving top-k counters (Metwally et al.) with optional forward decay.
+
+    At most capacity terms are tracked; a new term takes over the smallest counter
+    and inherits its count as overestimation error, so counts are never
+    underestimated. With a half-life each hit weighs 2^((t - landmark)/half_life):
+    ranking needs no rescans as time passes, and dividing by the current weight
+    gives the exponentially decayed count.
+    """
+
+    def __init__(self, capacity: int = HH_CAPACITY, half_life: Optional[float] = None):
+        self.capacity = max(1, capacity)
+        self.half_life = half_life
+        self.landmark = time.time()
+        self.counts: Dict[str, float] = {}
+        self.errors: Dict[str, float] = {}
+        self.labels: Dict[str, str] = {}
+        self.total = 0.0
+
+    def _weight(self, now: float) -> float:
+        if not self.half_life:
+            return 1.0
+        exponent = (now - self.landmark) / self.half_life
+        if exponent > _MAX_DECAY_EXPONENT:
+            self._rescale(now)
+            exponent = 0.0
+        return 2.0 ** exponent
+
+    def _rescale(self, now: float) -> None:
+        f = 2.0 ** (-(now - self.landmark) / self.half_life)
+        self.counts = {k: c * f for k, c in self.counts.items()}
+        self.errors = {k: e * f for k, e in self.errors.items()}
+        self.total *= f
+        self.landmark = now
+
+    def add(self, key: str, label: Optional[str] = None, now: Optional[float] = None) -> None:
+        w = self._weight(now if now is not None else time.time())
+        self.total += w
+        if key in self.counts:
+            self.counts[key] += w
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = w
+            self.errors[key] = 0.0
+        else:
+            # O(capacity) scan, but only for a term not already tracked
+            victim = min(self.counts, key=self.counts.__getitem__)
+            floor = self.counts.pop(victim)
+            self.errors.pop(victim)
+            self.labels.pop(victim, None)
+            self.counts[key] = floor + w
+            self.errors[key] = floor
+        if label:
+            self.labels[key] = label
+
+    def summary(self, now: Optional[float] = None) -> Summary:
+        now = now if now is not None else time.time()
+        f = 1.0 / self._weight(now)
+        entries = {k: (c * f, self.errors[k] * f, self.labels.get(k, k)) for k, c in self.counts.items()}
+        min_count = min(self.counts.values()) * f if len(self.counts) >= self.capacity else 0.0
+        return Summary(entries, min_count, self.total * f, now)
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+
+class HeavyHitters:
+    """Popular (all-time) and trending (decayed) query sketches for this worker.
+
+    record() only touches memory. A background thread periodically folds the
+    worker's counts into the shared heavy_hitters rows (SELECT ... FOR UPDATE, merge,
+    UPDATE) and keeps the merged result, so every worker serves the global view;
+    counts not yet synced are merged in when the served lists are rebuilt.
+    """
+
+    def __init__(self, capacity: int = HH_CAPACITY, half_life: float = HH_TRENDING_HALF_LIFE,
+                 sync_seconds: float = HH_SYNC_SECONDS):
+        self.capacity = capacity
+        self.half_lives = {POPULAR: None, TRENDING: half_life}
+        self.sync_seconds = sync_seconds
+        self._lock = threading.Lock()
+        self._local = {name: SpaceSaving(capacity, hl) for name, hl in self.half_lives.items()}
+        # Counts taken out of _local but not yet in the shared table (failed sync)
+        self._unsynced: Dict[str, Summary] = {}
+        self._shared: Dict[str, Summary] = {}
+        self._views: Dict[str, List[Tuple[str, float, float, str]]] = {POPULAR: [], TRENDING: []}
+        self._view_at = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.stats = {"recorded": 0, "syncs": 0, "sync_errors": 0, "last_sync": None, "last_error": None}
+
+    # ------------------------------------------------------------------ record
+    def record(self, query: Optional[str]) -> None:
+        """Count one search/ask query"""
+        if not HH_ENABLED:
+            return
+        key = normalize_query(query)
+        if len(key) <= 2:
+            return
+        label = " ".join((query or "").split())[:len(key)]
+        now = time.time()
+        with self._lock:
+            for sketch in self._local.values():
+                sketch.add(key, label, now)
+            self.stats["recorded"] += 1
+        self._ensure_started()
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="heavy-hitters-sync", daemon=True)
+            self._thread.start()
+
+    # ------------------------------------------------------------------ serve
+    def _current(self, name: str, now: float) -> Summary:
+        """Shared summary plus this worker's unsynced counts, valued at now"""
+        half_life = self.half_lives[name]
+        merged = self._local[name].summary(now)
+        for extra in (self._unsynced.get(name), self._shared.get(name)):
+            if extra is not None:
+                merged = merged.merge(extra.decayed(now, half_life), self.capacity)
+        return merged
+
+    def _refresh(self) -> None:
+        now = time.time()
+        if now - self._view_at < HH_VIEW_REFRESH_SECONDS:
+            return
+        with self._lock:
+            self._views = {name: self._current(name, now).top(self.capacity) for name in self._local}
+            self._view_at = now
+
+    def top(self, name: str = POPULAR, limit: int = 10) -> List[Dict[str, Any]]:
+        """Top terms of a sketch from the cached view (rebuilt at most once per
+        HH_VIEW_REFRESH_SECONDS): query, estimated count/score and max overcount"""
+        if HH_ENABLED:
+            self._ensure_started()
+        self._refresh()
+        value = "count" if name == POPULAR else "score"
+        return [{"query": label, "key": key, value: round(c, 2) if name == TRENDING else int(round(c)),
+                 "error": round(e, 2)}
+                for key, c, e, label in self._views.get(name, [])[:limit]]
+
+    def popular(self, limit: int = 10) -> List[Dict[str, Any]]:
+        return self.top(POPULAR, limit)
+
+    def trending(self, limit: int = 10) -> List[Dict[str, Any]]:
+        return self.top(TRENDING, limit)
+
+    # ------------------------------------------------------------------ sync
+    def _run(self) -> None:
+        # Sync at once so a fresh worker serves the shared view, not just its own counts
+        self.sync()
+        while not self._stop.wait(self.sync_seconds):
+            self.sync()
+
+    def sync(self, conn=None) -> bool:
+        """Merge this worker's counts into the shared table and adopt the result"""
+        now = time.time()
+        with self._lock:
+            pending = {}
+            for name, sketch in self._local.items():
+                summary = sketch.summary(now)
+                if name in self._unsynced:
+                    summary = summary.merge(self._unsynced[name].decayed(now, self.half_lives[name]), self.capacity)
+                pending[name] = summary
+                self._local[name] = SpaceSaving(self.capacity, self.half_lives[name])
+            self._unsynced = pending
+        try:
+            from db_utils import shared_connection
+            with shared_connection(conn) as c:
+                shared = self._merge_shared(c, pending, now)
+        except Exception as e:
+            with self._lock:
+                self.stats["sync_errors"] += 1
+                self.stats["last_error"] = str(e)
+            logger.debug(f"Heavy hitters sync failed, keeping counts locally: {e}")
+            return False
+        with self._lock:
+            self._unsynced = {}
+            self._shared = shared
+            self._view_at = 0.0
+            self.stats["syncs"] += 1
+            self.stats["last_sync"] = datetime.fromtimestamp(now, timezone.utc).isoformat()
+        return True
+
+    def _merge_shared(self, conn, pending: Dict[str, Summary], now: float) -> Dict[str, Summary]:
+        shared = {}
+        with conn.transaction(), conn.cursor() as cur:
+            for name, summary in pending.items():
+                cur.execute("INSERT INTO heavy_hitters (name) VALUES (%s) ON CONFLICT DO NOTHING RETURNING name;",
+                            (name,))
+                created = cur.fetchone() is not None
+                cur.execute("SELECT entries, min_count, total, as_of FROM heavy_hitters WHERE name = %s FOR UPDATE;",
+                            (name,))
+                stored = Summary.from_row(*cur.fetchone())
+                if created and name == POPULAR:
+                    stored = self._seed_popular(cur, now)
+                merged = stored.decayed(now, self.half_lives[name]).merge(summary, self.capacity)
+                cur.execute("""
+                    UPDATE heavy_hitters SET entries = %s, min_count = %s, total = %s,
+                        as_of = %s, updated_at = now()
+                    WHERE name = %s;
+                """, (Json(merged.to_json()), merged.min_count, merged.total,
+                      datetime.fromtimestamp(now, timezone.utc), name))
+                shared[name] = merged
+            self._write_trending_scores(cur, shared[TRENDING])
+        return shared
+
+    def _seed_popular(self, cur, now: float) -> Summary:
+        """First sync ever: start the all-time sketch from the daily query rollup"""
+        cur.execute("""
+            SELECT query_normalized, (array_agg(query_text ORDER BY last_seen DESC))[1], SUM(requests)
+            FROM query_rollup_daily GROUP BY query_normalized
+            ORDER BY SUM(requests) DESC LIMIT %s;
+        """, (self.capacity,))
+        rows = cur.fetchall()
+        entries = {key: (float(n), 0.0, label or key) for key, label, n in rows}
+        min_count = float(rows[-1][2]) if len(rows) >= self.capacity else 0.0
+        return Summary(entries, min_count, float(sum(e[0] for e in entries.values())), now)
+
+    @staticmethod
+    def _write_trending_scores(cur, trending: Summary) -> None:
+        """Keep query_analytics.trending_score equal to the decayed hit count of the
+        current top trending terms (zero for the rest)"""
+        top = [(key, round(c, 2)) for key, c, _, _ in trending.top(HH_TRENDING_SCORES)]
+        keys = [key for key, _ in top]
+        cur.execute("UPDATE query_analytics SET trending_score = 0 "
+                    "WHERE trending_score <> 0 AND NOT (query_normalized = ANY(%s));", (keys,))
+        if top:
+            cur.executemany("UPDATE query_analytics SET trending_score = %s WHERE query_normalized = %s;",
+                            [(score, key) for key, score in sorted(top)])
+
+    def flush(self) -> None:
+        """Stop the sync thread after a last sync (best effort, at exit)"""
+        self._stop.set()
+        if self.stats["recorded"]:
+            self.sync()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "enabled": HH_ENABLED,
+                "capacity": self.capacity,
+                "trending_half_life_s": self.half_lives[TRENDING],
+                "sync_seconds": self.sync_seconds,
+                "tracked": {name: len(s) for name, s in self._local.items()},
+                "shared_terms": {name: len(s.entries) for name, s in self._shared.items()},
+                "running": self._thread is not None and self._thread.is_alive(),
+            }
+
+
+# Singleton instance
+heavy_hitters = HeavyHitters()
+atexit.register(heavy_hitters.flush)
+
+
+def get_heavy_hitters() -> HeavyHitters:
+    """Get the heavy hitters singleton"""
+    return heavy_hitters
+
+
+def record_query(query: Optional[str]) -> None:
+    """Count a search/ask query in the popular and trending sketches"""
+    heavy_hitters.record(query)
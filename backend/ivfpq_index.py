@@ -0,0 +1,424 @@
+"""
+IVF-PQ Index Module for JuSimples
+NumPy inverted-file index with product quantization for corpora too large for a
+flat in-memory matrix: coarse k-means lists, uint8 PQ codes of list residuals and
+exact re-ranking of the best candidates from a float16 memory-mapped copy
+"""
+import os
+import json
+import math
+import time
+import logging
+import shutil
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:  # optional dependency: IVF-PQ is disabled without it
+    np = None
+    NUMPY_AVAILABLE = False
+
+from db_utils import get_connection, is_ready as db_is_ready, wait_ready, EMBED_DIM
+
+logger = logging.getLogger(__name__)
+
+IVFPQ_DIR = os.getenv("IVFPQ_INDEX_DIR", os.path.join(tempfile.gettempdir(), "jusimples_ivfpq"))
+IVFPQ_SUBQUANTIZERS = int(os.getenv("IVFPQ_M", "96"))        # 1536 / 96 = 16 dims per code byte
+IVFPQ_NPROBE = int(os.getenv("IVFPQ_NPROBE", "16"))
+IVFPQ_RERANK = int(os.getenv("IVFPQ_RERANK", "100"))         # candidates re-ranked exactly
+IVFPQ_TRAIN_SIZE = int(os.getenv("IVFPQ_TRAIN_SIZE", "65536"))
+_PQ_CENTROIDS = 256  # one uint8 per sub-vector
+_BATCH = 8192
+# Names the published generation directory; replaced atomically by publish()
+_POINTER_FILE = "current.json"
+
+
+def generation_dir(generation: int, root: str = IVFPQ_DIR) -> str:
+    return os.path.join(root, f"gen-{generation}")
+
+
+def default_nlist(rows: int) -> int:
+    """sqrt(N)-ish coarse lists, bounded so training stays cheap"""
+    return int(min(65536, max(16, 4 * math.sqrt(max(1, rows)))))
+
+
+def _sq_distances(x, centroids, centroid_norms=None):
+    """Squared L2 distances between rows of x and centroids"""
+    if centroid_norms is None:
+        centroid_norms = (centroids ** 2).sum(axis=1)
+    return (x ** 2).sum(axis=1, keepdims=True) - 2.0 * x @ centroids.T + centroid_norms
+
+
+def _assign(x, centroids):
+    norms = (centroids ** 2).sum(axis=1)
+    out = np.empty(x.shape[0], dtype=np.int32)
+    for start in range(0, x.shape[0], _BATCH):
+        out[start:start + _BATCH] = np.argmin(_sq_distances(x[start:start + _BATCH], centroids, norms), axis=1)
+    return out
+
+
+def kmeans(x, k: int, iters: int = 20, seed: int = 0):
+    """Lloyd's k-means; empty clusters are re-seeded from random points"""
+    rng = np.random.default_rng(seed)
+    k = min(k, x.shape[0])
+    centroids = x[rng.choice(x.shape[0], k, replace=False)].astype(np.float32)
+    for _ in range(iters):
+        labels = _assign(x, centroids)
+        counts = np.bincount(labels, minlength=k)
+        nonempty = counts > 0
+        # Per-cluster sums via one sorted pass (np.add.at is far slower on large inputs)
+        order = np.argsort(labels, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+        centroids[nonempty] = np.add.reduceat(x[order], starts, axis=0) / counts[nonempty, None]
+        empty = np.flatnonzero(~nonempty)
+        if empty.size:
+            centroids[empty] = x[rng.choice(x.shape[0], empty.size, replace=False)]
+    return centroids
+
+
+class IVFPQIndex:
+    """IVF coarse quantizer + product-quantized residuals, searched with ADC lookup tables.
+
+    Codes are stored grouped by inverted list (list_offsets delimit each list) so a
+    probe reads one contiguous uint8 slice. Only ids, codes and the small codebooks
+    are resident; full vectors for exact re-ranking stay in a float16 memmap.
+
+    Each build writes its own generation directory, which is never modified after
+    publish(); an instance only ever reads the generation it was created for.
+    """
+
+    def __init__(self, directory: str, generation: Optional[int] = None):
+        self.directory = directory
+        self.generation = generation
+        self.centroids = None        # (nlist, dim) float32
+        self.codebooks = None        # (m, 256, dim/m) float32
+        self.codes = None            # (N, m) uint8, grouped by list
+        self.list_offsets = None     # (nlist + 1,) int64
+        self.ids: List[str] = []     # chunk ids in code order
+        self.vectors = None          # (N, dim) float16 memmap, same order
+        self.meta: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def m(self) -> int:
+        return self.codebooks.shape[0]
+
+    def is_loaded(self) -> bool:
+        return self.codes is not None
+
+    # -- building ---------------------------------------------------------
+
+    def train(self, sample, nlist: int, m: int = IVFPQ_SUBQUANTIZERS, iters: int = 20) -> None:
+        dim = sample.shape[1]
+        if dim % m:
+            raise ValueError(f"dimension {dim} is not divisible by m={m}")
+        self.centroids = kmeans(sample, nlist, iters=iters)
+        residuals = sample - self.centroids[_assign(sample, self.centroids)]
+        sub = dim // m
+        self.codebooks = np.stack([
+            kmeans(residuals[:, j * sub:(j + 1) * sub], _PQ_CENTROIDS, iters=iters, seed=j + 1)
+            for j in range(m)
+        ])
+
+    def encode(self, x) -> Tuple[Any, Any]:
+        """Return (coarse list per row, PQ codes per row)"""
+        m, sub = self.m, self.codebooks.shape[2]
+        lists = _assign(x, self.centroids)
+        codes = np.empty((x.shape[0], m), dtype=np.uint8)
+        for start in range(0, x.shape[0], _BATCH):
+            batch = x[start:start + _BATCH] - self.centroids[lists[start:start + _BATCH]]
+            for j in range(m):
+                codes[start:start + _BATCH, j] = np.argmin(
+                    _sq_distances(batch[:, j * sub:(j + 1) * sub], self.codebooks[j]), axis=1)
+        return lists, codes
+
+    def add_all(self, ids: List[str], x) -> None:
+        """Encode every vector and lay codes, ids and vectors out grouped by list"""
+        lists, codes = self.encode(x)
+        order = np.argsort(lists, kind="stable")
+        counts = np.bincount(lists, minlength=self.centroids.shape[0])
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.codes = codes[order]
+        self.ids = [ids[i] for i in order]
+        os.makedirs(self.directory, exist_ok=True)
+        vectors = np.memmap(os.path.join(self.directory, "vectors.f16"), dtype=np.float16,
+                            mode="w+", shape=x.shape)
+        for start in range(0, x.shape[0], _BATCH):
+            vectors[start:start + _BATCH] = x[order[start:start + _BATCH]].astype(np.float16)
+        vectors.flush()
+        self.vectors = np.memmap(os.path.join(self.directory, "vectors.f16"), dtype=np.float16,
+                                 mode="r", shape=x.shape)
+
+    def save(self, report: Optional[Dict[str, Any]] = None) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        np.savez(os.path.join(self.directory, "index.npz"), centroids=self.centroids,
+                 codebooks=self.codebooks, codes=self.codes, list_offsets=self.list_offsets)
+        with open(os.path.join(self.directory, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump(self.ids, f)
+        self.meta = {
+            "count": len(self.ids),
+            "dim": int(self.centroids.shape[1]),
+            "nlist": int(self.centroids.shape[0]),
+            "m": self.m,
+            "generation": self.generation,
+            "built_at": datetime.utcnow().isoformat(),
+            "report": report or {},
+        }
+        with open(os.path.join(self.directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f, indent=2)
+
+    def publish(self) -> None:
+        """Make this saved generation the one every process loads, then drop generations
+        older than the previous one (workers may still be loading it)"""
+        root = os.path.dirname(self.directory)
+        previous = _read_pointer(root)
+        tmp = os.path.join(root, f"{_POINTER_FILE}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"generation": self.generation}, f)
+        os.replace(tmp, os.path.join(root, _POINTER_FILE))
+        # Newer directories belong to builds still running, so only older ones go
+        oldest = min(self.generation, previous["generation"]) if previous else self.generation
+        for name in os.listdir(root):
+            if name.startswith("gen-") and name[4:].isdigit() and int(name[4:]) < oldest:
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        logger.info(f"IVF-PQ index generation {self.generation} published")
+
+    def load(self) -> bool:
+        with self._lock:
+            if self.is_loaded():
+                return True
+            if not NUMPY_AVAILABLE:
+                return False
+            try:
+                with open(os.path.join(self.directory, "meta.json"), "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                data = np.load(os.path.join(self.directory, "index.npz"))
+                with open(os.path.join(self.directory, "ids.json"), "r", encoding="utf-8") as f:
+                    ids = json.load(f)
+                self.vectors = np.memmap(os.path.join(self.directory, "vectors.f16"), dtype=np.float16,
+                                         mode="r", shape=(meta["count"], meta["dim"]))
+            except (OSError, ValueError, KeyError):
+                return False
+            self.centroids, self.codebooks = data["centroids"], data["codebooks"]
+            self.list_offsets = data["list_offsets"]
+            self.codes, self.ids, self.meta = data["codes"], ids, meta
+            logger.info(f"IVF-PQ index loaded: {meta['count']} vectors, nlist={meta['nlist']}, m={meta['m']}")
+            return True
+
+    # -- searching --------------------------------------------------------
+
+    def search(self, qvec, top_k: int = 3, nprobe: int = IVFPQ_NPROBE,
+               rerank: int = IVFPQ_RERANK) -> List[Tuple[str, float]]:
+        """Return (chunk_id, cosine similarity) pairs, best first"""
+        q = np.asarray(qvec, dtype=np.float32)
+        norm = float(np.linalg.norm(q))
+        if norm == 0:
+            return []
+        q = q / norm
+        m, sub = self.m, self.codebooks.shape[2]
+        nlist = self.centroids.shape[0]
+        nprobe = max(1, min(nprobe, nlist))
+
+        coarse = _sq_distances(q[None, :], self.centroids)[0]
+        probes = np.argpartition(coarse, nprobe - 1)[:nprobe]
+
+        cand_rows, cand_dist = [], []
+        for lst in probes:
+            start, end = int(self.list_offsets[lst]), int(self.list_offsets[lst + 1])
+            if start == end:
+                continue
+            residual = (q - self.centroids[lst]).reshape(m, sub)
+            # ADC: distance from each residual sub-vector to every codeword, then table lookups
+            table = ((self.codebooks - residual[:, None, :]) ** 2).sum(axis=2)
+            dist = table[np.arange(m), self.codes[start:end]].sum(axis=1)
+            cand_rows.append(np.arange(start, end))
+            cand_dist.append(dist)
+        if not cand_rows:
+            return []
+        rows = np.concatenate(cand_rows)
+        dist = np.concatenate(cand_dist)
+
+        keep = min(max(rerank, top_k), rows.shape[0])
+        # Sorted row numbers give sequential reads from the re-rank memmap
+        best = np.sort(rows[np.argpartition(dist, keep - 1)[:keep]])
+        exact = self.vectors[best].astype(np.float32) @ q
+        order = np.argsort(-exact)[:top_k]
+        return [(self.ids[int(best[i])], float(exact[i])) for i in order]
+
+    def memory_report(self) -> Dict[str, int]:
+        codes = int(self.codes.nbytes)
+        centroids = int(self.centroids.nbytes)
+        codebooks = int(self.codebooks.nbytes)
+        ids = sum(len(i) + 49 for i in self.ids)  # rough CPython str overhead
+        return {
+            "codes_bytes": codes,
+            "centroids_bytes": centroids,
+            "codebooks_bytes": codebooks,
+            "ids_bytes_estimate": ids,
+            "resident_bytes": codes + centroids + codebooks + ids,
+            "flat_float32_bytes": len(self.ids) * self.centroids.shape[1] * 4,
+            "rerank_memmap_bytes": int(self.vectors.size * 2) if self.vectors is not None else 0,
+        }
+
+
+def _read_pointer(root: str = IVFPQ_DIR) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(root, _POINTER_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# Index of the published generation, swapped as a whole when a build publishes a new one
+_EMPTY_INDEX = IVFPQIndex(IVFPQ_DIR)
+_current_index: Optional[IVFPQIndex] = None
+_pointer_mtime = 0.0
+_index_lock = threading.Lock()
+
+
+def get_ivfpq_index() -> IVFPQIndex:
+    """Get the IVF-PQ index of the latest published generation (unloaded if none).
+
+    Checks the generation pointer on every call, so callers that fetch the index per
+    query pick up a rebuild; a loaded instance is never modified, so a query keeps a
+    consistent view while another thread swaps in the new generation.
+    """
+    global _current_index, _pointer_mtime
+    if not NUMPY_AVAILABLE:
+        return _EMPTY_INDEX
+    try:
+        mtime = os.path.getmtime(os.path.join(IVFPQ_DIR, _POINTER_FILE))
+    except OSError:
+        return _current_index or _EMPTY_INDEX
+    if _current_index is not None and mtime == _pointer_mtime:
+        return _current_index
+    with _index_lock:
+        if _current_index is None or mtime != _pointer_mtime:
+            pointer = _read_pointer()
+            generation = pointer.get("generation") if pointer else None
+            if generation is None or (_current_index is not None and _current_index.generation == generation):
+                _pointer_mtime = mtime
+            else:
+                index = IVFPQIndex(generation_dir(generation), generation)
+                if index.load():
+                    _current_index, _pointer_mtime = index, mtime
+    return _current_index or _EMPTY_INDEX
+
+
+def export_embeddings(conn, limit: Optional[int] = None) -> Tuple[List[str], Any]:
+    """Stream (id, embedding) from legal_chunks into a normalized float32 matrix"""
+    ids: List[str] = []
+    chunks = []
+    with conn.transaction():
+        with conn.cursor(name="ivfpq_export") as cur:
+            cur.execute(
+                "SELECT id, embedding::vector FROM legal_chunks WHERE embedding IS NOT NULL ORDER BY id"
+                + (f" LIMIT {int(limit)}" if limit else "") + ";"
+            )
+            while True:
+                batch = cur.fetchmany(5000)
+                if not batch:
+                    break
+                ids.extend(row[0] for row in batch)
+                chunks.append(np.asarray([row[1] for row in batch], dtype=np.float32))
+    if not chunks:
+        return ids, np.zeros((0, EMBED_DIM), dtype=np.float32)
+    x = np.vstack(chunks)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return ids, x / norms
+
+
+def evaluate(index: IVFPQIndex, x, ids: List[str], queries: int = 200, top_k: int = 10,
+             nprobes: Tuple[int, ...] = (4, 8, 16, 32)) -> Dict[str, Any]:
+    """recall@k against exact search and per-query latency for several nprobe values"""
+    rng = np.random.default_rng(42)
+    sample = rng.choice(x.shape[0], min(queries, x.shape[0]), replace=False)
+    truth = []
+    for qi in sample:
+        scores = x @ x[qi]
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        truth.append({ids[i] for i in top})
+
+    results = {}
+    for nprobe in nprobes:
+        latencies, hits = [], 0
+        for qi, expected in zip(sample, truth):
+            start = time.perf_counter()
+            found = index.search(x[qi], top_k=top_k, nprobe=nprobe)
+            latencies.append((time.perf_counter() - start) * 1000.0)
+            hits += len(expected & {doc_id for doc_id, _ in found})
+        latencies.sort()
+        results[f"nprobe_{nprobe}"] = {
+            f"recall_at_{top_k}": round(hits / (len(sample) * top_k), 4),
+            "latency_ms_p50": round(latencies[len(latencies) // 2], 3),
+            "latency_ms_p95": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        }
+    return results
+
+
+def build(nlist: Optional[int] = None, m: int = IVFPQ_SUBQUANTIZERS, train_size: int = IVFPQ_TRAIN_SIZE,
+          eval_queries: int = 200, limit: Optional[int] = None) -> Dict[str, Any]:
+    """Export embeddings, train, encode and save a new generation, publish it and report
+    memory/recall/latency"""
+    if not NUMPY_AVAILABLE:
+        raise RuntimeError("numpy is required to build the IVF-PQ index")
+    if not db_is_ready():
+        raise RuntimeError("Database not ready")
+    start = time.time()
+    ids, x = export_embeddings(get_connection(), limit=limit)
+    if x.shape[0] < _PQ_CENTROIDS:
+        raise RuntimeError(f"Need at least {_PQ_CENTROIDS} embedded chunks to train PQ (have {x.shape[0]})")
+    nlist = nlist or default_nlist(x.shape[0])
+    export_seconds = time.time() - start
+
+    rng = np.random.default_rng(0)
+    sample = x[rng.choice(x.shape[0], min(train_size, x.shape[0]), replace=False)]
+    generation = int(time.time() * 1000)
+    index = IVFPQIndex(generation_dir(generation), generation)
+    t0 = time.time()
+    index.train(sample, nlist=nlist, m=m)
+    train_seconds = time.time() - t0
+    t0 = time.time()
+    index.add_all(ids, x)
+    encode_seconds = time.time() - t0
+
+    report = {
+        "vectors": len(ids),
+        "nlist": nlist,
+        "m": m,
+        "export_seconds": round(export_seconds, 2),
+        "train_seconds": round(train_seconds, 2),
+        "encode_seconds": round(encode_seconds, 2),
+        "memory": index.memory_report(),
+        "evaluation": evaluate(index, x, ids, queries=eval_queries) if eval_queries else {},
+    }
+    index.save(report)
+    index.publish()
+    return report
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Build and evaluate the IVF-PQ index over legal_chunks")
+    parser.add_argument("command", choices=["build", "status"], nargs="?", default="build")
+    parser.add_argument("--nlist", type=int, help="Coarse lists (default ~4*sqrt(N))")
+    parser.add_argument("--m", type=int, default=IVFPQ_SUBQUANTIZERS, help="PQ sub-quantizers (bytes per vector)")
+    parser.add_argument("--train-size", type=int, default=IVFPQ_TRAIN_SIZE)
+    parser.add_argument("--eval-queries", type=int, default=200, help="0 to skip the recall/latency evaluation")
+    parser.add_argument("--limit", type=int, help="Only index the first N chunks (for experiments)")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        wait_ready()
+        result = build(nlist=args.nlist, m=args.m, train_size=args.train_size,
+                       eval_queries=args.eval_queries, limit=args.limit)
+    else:
+        index = get_ivfpq_index()
+        result = index.meta if index.is_loaded() else {"status": "not_built"}
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,245 @@
+"""
+Keyword Index Module for JuSimples
+In-process BM25 inverted index used by the in-memory keyword search fallback
+(when the database, and with it full-text search, is unavailable)
+"""
+import os
+import re
+import math
+import time
+import hashlib
+import logging
+import threading
+import unicodedata
+from array import array
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+REFRESH_SECONDS = float(os.getenv("KEYWORD_INDEX_REFRESH_SECONDS", "60"))
+
+# Field weights (BM25F-style: weighted term frequencies summed into one document)
+FIELD_WEIGHTS = {"title": 2.0, "keywords": 1.5, "content": 1.0}
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Common Portuguese function words (accent-folded), they carry no retrieval signal
+STOPWORDS = frozenset("""
+a ao aos as ate com como da das de del dela dele deles do dos e ela elas ele eles em entre era
+essa esse esta este eu foi ha isso isto ja la lhe mais mas me mesmo meu minha muito na nao nas
+nem no nos nossa nosso num numa o os ou para pela pelas pelo pelos por qual quando que quem se
+sem ser seu seus sua suas sao tambem te tem tu um uma umas uns voce voces
+""".split())
+
+
+def fold_accents(text: str) -> str:
+    """Lowercase and strip diacritics (ação -> acao)"""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def _light_stem(token: str) -> str:
+    """Minimal Portuguese plural reduction so 'direitos'/'direito' and 'acoes'/'acao' meet"""
+    if len(token) > 5 and token.endswith("oes"):
+        return token[:-3] + "ao"
+    if len(token) > 4 and token.endswith("ais"):
+        return token[:-2] + "l"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Accent-folded Portuguese tokens without stopwords"""
+    tokens = []
+    for tok in _TOKEN_RE.findall(fold_accents(text)):
+        if len(tok) < 2 or tok in STOPWORDS:
+            continue
+        tokens.append(_light_stem(tok))
+    return tokens
+
+
+def _item_text(item: Dict[str, Any], field: str) -> str:
+    value = item.get(field) or ""
+    if isinstance(value, (list, tuple)):
+        return " ".join(str(v) for v in value)
+    return str(value)
+
+
+def _signature(item: Dict[str, Any]) -> str:
+    raw = "\x1f".join(_item_text(item, f) for f in FIELD_WEIGHTS)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class _Postings:
+    """Parallel arrays of internal doc ids and weighted term frequencies"""
+    __slots__ = ("docs", "freqs")
+
+    def __init__(self):
+        self.docs = array("i")
+        self.freqs = array("f")
+
+
+class BM25Index:
+    """Inverted index with BM25 scoring, refreshed incrementally from the KB.
+
+    Documents are keyed by their KB id; sync() re-tokenizes only new or changed
+    items and tombstones removed ones. Postings of tombstoned documents are skipped
+    at query time and compacted away once they make up a quarter of the index.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._postings: Dict[str, _Postings] = {}
+        self._df: Dict[str, int] = {}
+        self._doc_len = array("f")
+        self._items: List[Optional[Dict[str, Any]]] = []
+        self._terms: List[Tuple[str, ...]] = []
+        self._by_key: Dict[str, Tuple[int, str]] = {}
+        self._total_len = 0.0
+        self._live = 0
+        self._dead = 0
+        self.last_refresh = 0.0
+        self.stats = {"syncs": 0, "added": 0, "updated": 0, "removed": 0, "compactions": 0, "queries": 0}
+
+    def __len__(self) -> int:
+        return self._live
+
+    # -- building ---------------------------------------------------------
+
+    def sync(self, items: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Bring the index in line with items, touching only what changed"""
+        added = updated = removed = 0
+        with self._lock:
+            seen = set()
+            for item in items:
+                key = str(item.get("id") or _signature(item))
+                seen.add(key)
+                sig = _signature(item)
+                current = self._by_key.get(key)
+                if current is not None:
+                    if current[1] == sig:
+                        continue
+                    self._remove(current[0])
+                    updated += 1
+                else:
+                    added += 1
+                self._by_key[key] = (self._add(item), sig)
+
+            for key in [k for k in self._by_key if k not in seen]:
+                self._remove(self._by_key.pop(key)[0])
+                removed += 1
+
+            if self._dead and self._dead * 4 > len(self._items):
+                self._compact()
+            self.last_refresh = time.time()
+            self.stats["syncs"] += 1
+            self.stats["added"] += added
+            self.stats["updated"] += updated
+            self.stats["removed"] += removed
+        if added or updated or removed:
+            logger.info(f"Keyword index synced: +{added} ~{updated} -{removed} ({self._live} documents)")
+        return {"added": added, "updated": updated, "removed": removed}
+
+    def maybe_refresh(self, loader: Callable[[], List[Dict[str, Any]]],
+                      max_age: float = REFRESH_SECONDS) -> bool:
+        """Sync from loader() when the index is empty or older than max_age seconds"""
+        if self._live and time.time() - self.last_refresh < max_age:
+            return False
+        self.sync(loader() or [])
+        return True
+
+    def _add(self, item: Dict[str, Any]) -> int:
+        tf: Dict[str, float] = {}
+        length = 0.0
+        for field, weight in FIELD_WEIGHTS.items():
+            for tok in tokenize(_item_text(item, field)):
+                tf[tok] = tf.get(tok, 0.0) + weight
+                length += weight
+
+        doc_id = len(self._items)
+        self._items.append(item)
+        self._terms.append(tuple(tf))
+        self._doc_len.append(length)
+        for term, freq in tf.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = _Postings()
+            postings.docs.append(doc_id)
+            postings.freqs.append(freq)
+            self._df[term] = self._df.get(term, 0) + 1
+        self._total_len += length
+        self._live += 1
+        return doc_id
+
+    def _remove(self, doc_id: int) -> None:
+        if self._items[doc_id] is None:
+            return
+        for term in self._terms[doc_id]:
+            self._df[term] -= 1
+        self._total_len -= self._doc_len[doc_id]
+        self._items[doc_id] = None
+        self._terms[doc_id] = ()
+        self._live -= 1
+        self._dead += 1
+
+    def _compact(self) -> None:
+        """Rebuild from live documents, dropping tombstoned postings"""
+        live = [(key, self._items[doc_id], sig) for key, (doc_id, sig) in self._by_key.items()]
+        self._postings, self._df = {}, {}
+        self._doc_len, self._items, self._terms = array("f"), [], []
+        self._total_len, self._live, self._dead = 0.0, 0, 0
+        self._by_key = {key: (self._add(item), sig) for key, item, sig in live}
+        self.stats["compactions"] += 1
+
+    # -- querying ---------------------------------------------------------
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[Dict[str, Any], float]]:
+        """Return (item, bm25_score) pairs for documents containing any query term"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            self.stats["queries"] += 1
+            n = self._live
+            if n == 0:
+                return []
+            avg_len = self._total_len / n if n else 1.0
+            scores: Dict[int, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                df = self._df.get(term, 0)
+                if postings is None or df <= 0:
+                    continue
+                idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+                for doc_id, freq in zip(postings.docs, postings.freqs):
+                    if self._items[doc_id] is None:
+                        continue
+                    norm = self.k1 * (1.0 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (self.k1 + 1.0) / (freq + norm)
+            top = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+            return [(self._items[doc_id], score) for doc_id, score in top]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "documents": self._live,
+                "tombstones": self._dead,
+                "terms": sum(1 for df in self._df.values() if df > 0),
+                "postings": sum(len(p.docs) for p in self._postings.values()),
+                "last_refresh": self.last_refresh,
+            }
+
+
+# Singleton instance
+keyword_index = BM25Index()
+
+
+def get_keyword_index() -> BM25Index:
+    """Get the in-process keyword index singleton"""
+    return keyword_index
@@ -0,0 +1,376 @@
+"""
+Local Vector Index Module for JuSimples
+Memory-mapped flat vector index over legal_chunks embeddings: a hot, in-process
+retrieval tier that answers semantic queries without a Postgres round trip and
+keeps answering when the database is slow or unavailable
+"""
+import os
+import json
+import time
+import logging
+import argparse
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:  # optional dependency: the local tier is disabled without it
+    np = None
+    NUMPY_AVAILABLE = False
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process refresh only
+    fcntl = None
+
+from db_utils import connection, is_ready as db_is_ready, wait_ready, EMBED_DIM
+
+logger = logging.getLogger(__name__)
+
+# off: never used; fallback: only when Postgres is unavailable; prefer: serve all semantic queries
+LOCAL_INDEX_MODE = os.getenv("LOCAL_VECTOR_INDEX", "fallback").lower()
+LOCAL_INDEX_DIR = os.getenv("LOCAL_VECTOR_INDEX_DIR", os.path.join(tempfile.gettempdir(), "jusimples_vector_index"))
+LOCAL_INDEX_DTYPE = os.getenv("LOCAL_VECTOR_INDEX_DTYPE", "float32")
+LOCAL_INDEX_REFRESH_SECONDS = float(os.getenv("LOCAL_VECTOR_INDEX_REFRESH_SECONDS", "60"))
+# Re-read rows updated slightly before the watermark to cover transactions committed out of order
+_WATERMARK_OVERLAP = timedelta(minutes=5)
+_META_FILE = "meta.json"
+# Row table fields: ids plus what _filter_mask needs; documents come from the document cache
+_ROW_FIELDS = ("id", "category", "law_type", "jurisdiction", "published_at", "updated_at")
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class LocalVectorIndex:
+    """Flat cosine index stored as a contiguous row-normalized matrix file plus a row table
+    of ids and filter fields.
+
+    A refresh writes a new generation (vectors.<gen>.bin + rows.<gen>.json) and then
+    atomically swaps meta.json, so every worker process maps the same file read-only
+    and picks up the new generation on its next query. Only rows whose updated_at is
+    past the stored watermark are fetched; unchanged vectors are copied from the
+    previous generation.
+    """
+
+    def __init__(self, directory: str = LOCAL_INDEX_DIR, dtype: str = LOCAL_INDEX_DTYPE):
+        self.directory = directory
+        self.dtype = "float16" if dtype == "float16" else "float32"
+        self._lock = threading.Lock()
+        self._generation: Optional[int] = None
+        self._meta_mtime = 0.0
+        # (matrix, rows) of the mapped generation, replaced as one object on remap
+        self._view: Optional[Tuple[Any, List[Dict[str, Any]]]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.stats = {"queries": 0, "refreshes": 0, "rows_fetched": 0, "last_refresh_at": None,
+                      "last_refresh_seconds": 0.0, "last_error": None}
+
+    # -- loading ----------------------------------------------------------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(_META_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _ensure_loaded(self) -> bool:
+        """Map the current generation, remapping if another process published a new one"""
+        if not NUMPY_AVAILABLE:
+            return False
+        try:
+            mtime = os.path.getmtime(self._path(_META_FILE))
+        except OSError:
+            return False
+        if self._view is not None and mtime == self._meta_mtime:
+            return True
+        with self._lock:
+            meta = self._read_meta()
+            if not meta or not meta.get("count"):
+                return False
+            if meta["generation"] != self._generation:
+                matrix = np.memmap(self._path(meta["vectors"]), dtype=meta["dtype"], mode="r",
+                                   shape=(meta["count"], meta["dim"]))
+                with open(self._path(meta["rows"]), "r", encoding="utf-8") as f:
+                    rows = json.load(f)
+                self._view, self._generation = (matrix, rows), meta["generation"]
+            self._meta_mtime = mtime
+        return True
+
+    def is_available(self) -> bool:
+        return LOCAL_INDEX_MODE != "off" and self._ensure_loaded()
+
+    # -- searching --------------------------------------------------------
+
+    def search(self, qvec: List[float], top_k: int = 3, filters: Optional[Dict[str, Any]] = None,
+               min_relevance: Optional[float] = None) -> Optional[List[Tuple[str, float]]]:
+        """Exact top-k (id, cosine similarity) pairs; returns None when the index is unavailable"""
+        if not self._ensure_loaded():
+            return None
+        matrix, rows = self._view
+        q = np.asarray(qvec, dtype=np.float32)
+        norm = float(np.linalg.norm(q))
+        if norm == 0 or q.shape[0] != matrix.shape[1]:
+            return []
+        scores = matrix.dot(q / norm).astype(np.float32, copy=False)
+
+        mask = self._filter_mask(rows, filters)
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        if min_relevance is not None and min_relevance > 0:
+            scores = np.where(scores >= min_relevance, scores, -np.inf)
+
+        k = min(top_k, scores.shape[0])
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        self.stats["queries"] += 1
+
+        hits: List[Tuple[str, float]] = []
+        for idx in top:
+            score = float(scores[idx])
+            if score == -np.inf:
+                break
+            hits.append((rows[idx]["id"], score))
+        return hits
+
+    @staticmethod
+    def _filter_mask(rows: List[Dict[str, Any]], filters: Optional[Dict[str, Any]]):
+        """Boolean row mask matching retrieval.build_filter_clause semantics"""
+        filters = {k: str(v) for k, v in (filters or {}).items() if v not in (None, "")}
+        if not filters:
+            return None
+        date_to = filters.get("date_to")
+        keep = []
+        for row in rows:
+            ok = True
+            if "category" in filters and row.get("category") != filters["category"]:
+                ok = False
+            for key in ("law_type", "jurisdiction"):
+                if ok and key in filters and row.get(key) != filters[key]:
+                    ok = False
+            published = row.get("published_at") or ""
+            if ok and "date_from" in filters and published < filters["date_from"]:
+                ok = False
+            if ok and date_to and (not published or published[:len(date_to)] > date_to):
+                ok = False
+            keep.append(ok)
+        return np.array(keep, dtype=bool)
+
+    # -- refreshing -------------------------------------------------------
+
+    def refresh(self, full: bool = False) -> Dict[str, Any]:
+        """Publish a new generation with rows changed since the last watermark"""
+        if not NUMPY_AVAILABLE:
+            return {"status": "numpy_unavailable"}
+        if not db_is_ready():
+            return {"status": "database_not_ready"}
+        os.makedirs(self.directory, exist_ok=True)
+        lock_file = open(self._path(".lock"), "w")
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return {"status": "refresh_in_progress"}
+            return self._refresh_locked(full)
+        except Exception as e:
+            self.stats["last_error"] = str(e)
+            logger.warning(f"Local vector index refresh failed: {e}")
+            return {"status": "error", "error": str(e)}
+        finally:
+            lock_file.close()
+
+    def _refresh_locked(self, full: bool) -> Dict[str, Any]:
+        start = time.time()
+        meta = None if full else self._read_meta()
+        if meta and (meta.get("dim") != EMBED_DIM or meta.get("dtype") != self.dtype):
+            meta = None
+        watermark = datetime.fromisoformat(meta["watermark"]) if meta and meta.get("watermark") else None
+
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT id FROM legal_chunks WHERE embedding IS NOT NULL;")
+            live_ids = {row[0] for row in cur.fetchall()}
+            # embedding::vector so halfvec storage also comes back as float arrays
+            if watermark is None:
+                cur.execute(
+                    """
+                    SELECT id, category, metadata, embedding::vector, updated_at
+                    FROM legal_chunks WHERE embedding IS NOT NULL;
+                    """
+                )
+            else:
+                cur.execute(
+                    """
+                    SELECT id, category, metadata, embedding::vector, updated_at
+                    FROM legal_chunks WHERE embedding IS NOT NULL AND updated_at > %s;
+                    """,
+                    (watermark - _WATERMARK_OVERLAP,),
+                )
+            changed = cur.fetchall()
+        self.stats["rows_fetched"] += len(changed)
+
+        # Previous generation rows/vectors that are still live and unchanged
+        old_rows: List[Dict[str, Any]] = []
+        old_matrix = None
+        if meta and meta.get("count"):
+            with open(self._path(meta["rows"]), "r", encoding="utf-8") as f:
+                old_rows = json.load(f)
+            old_matrix = np.memmap(self._path(meta["vectors"]), dtype=meta["dtype"], mode="r",
+                                   shape=(meta["count"], meta["dim"]))
+        # Rows re-read only because of the watermark overlap are not changes
+        old_updated = {r["id"]: r.get("updated_at") for r in old_rows}
+        changed = [row for row in changed
+                   if row[4] is None or old_updated.get(row[0]) != row[4].isoformat()]
+        changed_ids = {row[0] for row in changed}
+        keep_idx = [i for i, r in enumerate(old_rows) if r["id"] in live_ids and r["id"] not in changed_ids]
+        removed = sum(1 for r in old_rows if r["id"] not in live_ids)
+        if meta and not changed and removed == 0:
+            self._mark_refreshed(start)
+            return {"status": "unchanged", "count": meta["count"]}
+
+        # Projected so rows written by older versions drop their title/content
+        new_rows: List[Dict[str, Any]] = [{k: old_rows[i].get(k) for k in _ROW_FIELDS} for i in keep_idx]
+        new_vectors = []
+        max_updated = watermark
+        for doc_id, category, metadata, embedding, updated_at in changed:
+            md = metadata if isinstance(metadata, dict) else {}
+            new_rows.append({
+                "id": doc_id,
+                "category": category,
+                "law_type": md.get("law_type"),
+                "jurisdiction": md.get("jurisdiction"),
+                "published_at": md.get("published_at") or md.get("date"),
+                "updated_at": updated_at.isoformat() if updated_at else None,
+            })
+            new_vectors.append(np.asarray(embedding, dtype=np.float32))
+            if updated_at is not None and (max_updated is None or updated_at > max_updated):
+                max_updated = updated_at
+
+        generation = int(time.time() * 1000)
+        vectors_name, rows_name = f"vectors.{generation}.bin", f"rows.{generation}.json"
+        count = len(new_rows)
+        out = np.memmap(self._path(vectors_name), dtype=self.dtype, mode="w+", shape=(max(count, 1), EMBED_DIM))
+        if keep_idx:
+            out[:len(keep_idx)] = old_matrix[keep_idx]
+        if new_vectors:
+            out[len(keep_idx):count] = _normalize_rows(np.vstack(new_vectors)).astype(self.dtype)
+        out.flush()
+        del out
+        with open(self._path(rows_name), "w", encoding="utf-8") as f:
+            json.dump(new_rows, f, ensure_ascii=False)
+
+        new_meta = {
+            "generation": generation,
+            "vectors": vectors_name,
+            "rows": rows_name,
+            "count": count,
+            "dim": EMBED_DIM,
+            "dtype": self.dtype,
+            "watermark": max_updated.isoformat() if max_updated else None,
+            "built_at": datetime.utcnow().isoformat(),
+        }
+        tmp_meta = self._path(f"{_META_FILE}.tmp")
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(new_meta, f)
+        os.replace(tmp_meta, self._path(_META_FILE))
+        self._cleanup(keep={vectors_name, rows_name, meta["vectors"] if meta else None, meta["rows"] if meta else None})
+        self._mark_refreshed(start)
+        logger.info(f"Local vector index generation {generation}: {count} rows "
+                    f"(+{len(changed)} changed, -{removed} removed) in {time.time() - start:.2f}s")
+        return {"status": "refreshed", "count": count, "changed": len(changed), "removed": removed}
+
+    def _mark_refreshed(self, start: float) -> None:
+        self.stats["refreshes"] += 1
+        self.stats["last_refresh_at"] = time.time()
+        self.stats["last_refresh_seconds"] = round(time.time() - start, 3)
+
+    def _cleanup(self, keep: set) -> None:
+        # The previous generation stays on disk one more cycle for workers still mapping it
+        for name in os.listdir(self.directory):
+            if name.startswith(("vectors.", "rows.")) and name not in keep:
+                try:
+                    os.remove(self._path(name))
+                except OSError:
+                    pass
+
+    # -- background refresher ---------------------------------------------
+
+    def start_refresher(self, interval: float = LOCAL_INDEX_REFRESH_SECONDS) -> bool:
+        if LOCAL_INDEX_MODE == "off" or not NUMPY_AVAILABLE:
+            return False
+        if self._thread and self._thread.is_alive():
+            return True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(interval,), name="local-vector-index", daemon=True)
+        self._thread.start()
+        logger.info(f"Local vector index refresher started (mode={LOCAL_INDEX_MODE}, every {interval}s)")
+        return True
+
+    def stop_refresher(self) -> None:
+        self._stop.set()
+
+    def _loop(self, interval: float) -> None:
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        meta = self._read_meta() or {}
+        return {
+            **self.stats,
+            "mode": LOCAL_INDEX_MODE,
+            "numpy_available": NUMPY_AVAILABLE,
+            "directory": self.directory,
+            "generation": meta.get("generation"),
+            "count": meta.get("count", 0),
+            "dtype": meta.get("dtype", self.dtype),
+            "watermark": meta.get("watermark"),
+            "matrix_bytes": int(meta.get("count", 0)) * int(meta.get("dim", EMBED_DIM)) * (2 if meta.get("dtype") == "float16" else 4),
+        }
+
+
+# Singleton instance
+local_vector_index = LocalVectorIndex()
+
+
+def get_local_vector_index() -> LocalVectorIndex:
+    """Get the local vector index singleton"""
+    return local_vector_index
+
+
+def local_semantic_search(qvec: List[float], top_k: int = 3, filters: Optional[Dict[str, Any]] = None,
+                          min_relevance: Optional[float] = None) -> Optional[List[Tuple[str, float]]]:
+    """(id, relevance) hits from the local tier; None means it cannot answer (disabled,
+    no numpy, not built). retrieval fills in the documents from the document cache."""
+    if LOCAL_INDEX_MODE == "off":
+        return None
+    try:
+        return local_vector_index.search(qvec, top_k=top_k, filters=filters, min_relevance=min_relevance)
+    except Exception as e:
+        logger.warning(f"Local vector index search failed: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Build or refresh the local memory-mapped vector index")
+    parser.add_argument("command", choices=["build", "refresh", "status"], nargs="?", default="refresh")
+    args = parser.parse_args()
+
+    index = get_local_vector_index()
+    if args.command in ("build", "refresh"):
+        wait_ready()
+        logger.info(f"Result: {index.refresh(full=args.command == 'build')}")
+    logger.info(f"Status: {index.get_stats()}")
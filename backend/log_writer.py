@@ -0,0 +1,348 @@
+"""
+Log Writer Module for JuSimples
+Background, batched writer for analytics logs (search_logs, ask_logs,
+api_usage_logs, query_analytics): request handlers enqueue rows in memory and a
+writer thread flushes them with COPY on a connection of its own, then folds the
+search and ask rows into the analytics rollups
+"""
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from psycopg.types.json import Json
+
+from analytics_rollup import write_rollups, KINDS as ROLLUP_TABLES
+
+logger = logging.getLogger(__name__)
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# A batch is written when it has this many rows or its oldest row is this old
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "500"))
+LOG_FLUSH_MS = int(os.getenv("LOG_FLUSH_MS", "1000"))
+# Seconds allowed at shutdown to write what is still queued
+LOG_SHUTDOWN_TIMEOUT = float(os.getenv("LOG_SHUTDOWN_TIMEOUT", "5"))
+
+# Columns written per table, in COPY order
+TABLE_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "search_logs": (
+        "query", "top_k", "min_relevance", "search_type", "total", "result_ids", "user_id",
+        "session_id", "response_time_ms", "user_agent", "ip_address", "context_found",
+        "category", "success", "created_at",
+    ),
+    "ask_logs": (
+        "question", "answer", "top_k", "min_relevance", "total_sources", "result_ids",
+        "search_type", "success", "session_id", "user_id", "response_time_ms", "llm_model",
+        "llm_tokens_used", "llm_cost", "user_agent", "ip_address", "context_found",
+        "input_tokens", "output_tokens", "finish_reason", "system_fingerprint",
+        "response_id", "created_timestamp", "logprobs", "category", "error_message",
+        "created_at",
+    ),
+    "api_usage_logs": (
+        "endpoint", "method", "status_code", "response_time_ms", "user_id", "session_id",
+        "ip_address", "user_agent", "request_size_bytes", "response_size_bytes", "error_message",
+        "created_at",
+    ),
+}
+QUERY_ANALYTICS = "query_analytics"
+_JSON_COLUMNS = frozenset({"result_ids"})
+
+# One row per distinct query in the batch, aggregated: n requests, summed latency
+# and successes (running averages are merged with the stored totals)
+_ANALYTICS_UPSERT = """
+    INSERT INTO query_analytics (query_normalized, total_count, last_queried,
+                                 avg_response_time_ms, success_rate, categories)
+    VALUES (%(query)s, %(n)s, %(last)s, %(avg_rt)s, %(success_rate)s, %(categories)s)
+    ON CONFLICT (query_normalized) DO UPDATE SET
+        total_count = query_analytics.total_count + EXCLUDED.total_count,
+        last_queried = GREATEST(query_analytics.last_queried, EXCLUDED.last_queried),
+        avg_response_time_ms = CASE
+            WHEN %(rt_n)s > 0 THEN
+                (COALESCE(query_analytics.avg_response_time_ms, 0) * query_analytics.total_count + %(rt_sum)s)
+                / (query_analytics.total_count + %(rt_n)s)
+            ELSE query_analytics.avg_response_time_ms
+        END,
+        success_rate = (COALESCE(query_analytics.success_rate, 100) * query_analytics.total_count + %(success_sum)s)
+            / (query_analytics.total_count + EXCLUDED.total_count),
+        categories = COALESCE(query_analytics.categories, '{}') || EXCLUDED.categories,
+        updated_at = now()
+"""
+
+
+def _clean_ip(ip: Optional[str]) -> Optional[str]:
+    """First address of an X-Forwarded-For chain (the column is INET)"""
+    if not ip:
+        return None
+    return str(ip).split(",")[0].strip() or None
+
+
+class LogWriter:
+    """Bounded in-memory queue of log rows drained by one writer thread.
+
+    submit() never blocks and never touches the database: when the queue is full
+    the row is dropped and counted. Rows are grouped per table and written with
+    COPY; a batch that COPY rejects (e.g. a bad value) is retried row by row so one
+    row cannot lose the others.
+    """
+
+    def __init__(self, max_size: int = LOG_QUEUE_SIZE, batch_size: int = LOG_BATCH_SIZE,
+                 flush_ms: int = LOG_FLUSH_MS):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.01, flush_ms / 1000.0)
+        self._queue: "queue.Queue[Tuple[str, Dict[str, Any]]]" = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._conn = None
+        self.stats = {"enqueued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0,
+                      "copy_fallbacks": 0, "rolled_up": 0, "rollup_errors": 0, "last_flush_ms": 0,
+                      "last_error": None}
+
+    # ------------------------------------------------------------------ producer
+    def submit(self, table: str, row: Dict[str, Any]) -> bool:
+        """Queue a row for table (a TABLE_COLUMNS table or query_analytics); False if dropped"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((table, row))
+        except queue.Full:
+            with self._lock:
+                self.stats["dropped"] += 1
+                dropped = self.stats["dropped"]
+            if dropped == 1 or dropped % 1000 == 0:
+                logger.warning(f"Log queue full ({self._queue.maxsize}); {dropped} rows dropped so far")
+            return False
+        with self._lock:
+            self.stats["enqueued"] += 1
+        return True
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    # ------------------------------------------------------------------ consumer
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+        # Shutdown: drain whatever is left
+        batch = self._take_batch(block=False)
+        while batch:
+            self._write(batch)
+            batch = self._take_batch(block=False)
+
+    def _take_batch(self, block: bool = True) -> List[Tuple[str, Dict[str, Any]]]:
+        batch: List[Tuple[str, Dict[str, Any]]] = []
+        if block:
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                return batch
+        deadline = time.time() + (self.flush_interval if block else 0)
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.time()
+            try:
+                if timeout > 0 and not self._stop.is_set():
+                    batch.append(self._queue.get(timeout=timeout))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _connection(self):
+        if self._conn is not None and not self._conn.closed:
+            return self._conn
+        # Own connection: log writes never queue behind (or hold up) request queries
+        from db_utils import DatabaseManager
+        self._conn = DatabaseManager().get_connection()
+        return self._conn
+
+    def _write(self, batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+        start = time.time()
+        by_table: Dict[str, List[Dict[str, Any]]] = {}
+        for table, row in batch:
+            by_table.setdefault(table, []).append(row)
+        conn = None
+        try:
+            conn = self._connection()
+        except Exception as e:
+            self.stats["last_error"] = str(e)
+        if conn is None:
+            with self._lock:
+                self.stats["failed"] += len(batch)
+            logger.warning(f"Log writer has no database connection; {len(batch)} rows lost")
+            return
+        to_roll_up: Dict[str, List[Dict[str, Any]]] = {}
+        for table, rows in by_table.items():
+            try:
+                if table == QUERY_ANALYTICS:
+                    self._write_analytics(conn, rows)
+                else:
+                    self._copy(conn, table, rows)
+                written_rows, failed = rows, 0
+            except Exception as e:
+                self.stats["last_error"] = f"{table}: {e}"
+                if conn.broken:
+                    # Lost connection, not a bad row: reconnect for the next batch
+                    self._conn = None
+                    written_rows, failed = [], len(rows)
+                    logger.warning(f"Log writer connection lost; {len(rows)} {table} rows lost")
+                else:
+                    logger.warning(f"Batched write to {table} failed ({e}); retrying row by row")
+                    self.stats["copy_fallbacks"] += 1
+                    written_rows, failed = self._insert_each(conn, table, rows)
+            if table in ROLLUP_TABLES and written_rows:
+                to_roll_up[table] = written_rows
+            with self._lock:
+                self.stats["written"] += len(written_rows)
+                self.stats["failed"] += failed
+        if to_roll_up and self._conn is not None:
+            self._roll_up(conn, to_roll_up)
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["last_flush_ms"] = int((time.time() - start) * 1000)
+
+    def _roll_up(self, conn, rows_by_table: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Add the rows just written to the rollups; a failure here loses rollup
+        counts (rebuildable with analytics_rollup backfill), never the raw rows"""
+        try:
+            rolled = write_rollups(conn, rows_by_table)
+            with self._lock:
+                self.stats["rolled_up"] += rolled
+        except Exception as e:
+            n = sum(len(rows) for rows in rows_by_table.values())
+            self.stats["last_error"] = f"rollups: {e}"
+            with self._lock:
+                self.stats["rollup_errors"] += n
+            if conn.broken:
+                self._conn = None
+            logger.warning(f"Rollup update failed for {n} rows: {e}")
+
+    @staticmethod
+    def _values(table: str, row: Dict[str, Any]) -> List[Any]:
+        values = []
+        for column in TABLE_COLUMNS[table]:
+            value = row.get(column)
+            if column in _JSON_COLUMNS and value is not None:
+                value = Json(value)
+            elif column == "ip_address":
+                value = _clean_ip(value)
+            values.append(value)
+        return values
+
+    def _copy(self, conn, table: str, rows: List[Dict[str, Any]]) -> None:
+        columns = ", ".join(TABLE_COLUMNS[table])
+        with conn.transaction():
+            with conn.cursor() as cur:
+                with cur.copy(f"COPY {table} ({columns}) FROM STDIN") as copy:
+                    for row in rows:
+                        copy.write_row(self._values(table, row))
+
+    def _insert_each(self, conn, table: str,
+                     rows: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+        """Write rows one at a time; returns the rows written and the number dropped"""
+        written: List[Dict[str, Any]] = []
+        failed = 0
+        for row in rows:
+            try:
+                if table == QUERY_ANALYTICS:
+                    self._write_analytics(conn, [row])
+                else:
+                    columns = TABLE_COLUMNS[table]
+                    placeholders = ", ".join(["%s"] * len(columns))
+                    with conn.cursor() as cur:
+                        cur.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})",
+                                    self._values(table, row))
+                written.append(row)
+            except Exception as e:
+                failed += 1
+                logger.warning(f"Dropping {table} log row: {e}")
+        return written, failed
+
+    @staticmethod
+    def _write_analytics(conn, rows: List[Dict[str, Any]]) -> None:
+        merged: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            query = (row.get("query") or "").lower().strip()
+            if not query:
+                continue
+            agg = merged.setdefault(query, {"query": query, "n": 0, "rt_n": 0, "rt_sum": 0.0,
+                                            "success_sum": 0.0, "last": row["at"], "categories": {}})
+            agg["n"] += 1
+            if row.get("response_time_ms") is not None:
+                agg["rt_n"] += 1
+                agg["rt_sum"] += float(row["response_time_ms"])
+            agg["success_sum"] += 100.0 if row.get("success", True) else 0.0
+            agg["last"] = max(agg["last"], row["at"])
+            if row.get("category"):
+                agg["categories"][row["category"]] = 1
+        params = []
+        for agg in merged.values():
+            params.append({
+                **agg,
+                "avg_rt": agg["rt_sum"] / agg["rt_n"] if agg["rt_n"] else None,
+                "success_rate": agg["success_sum"] / agg["n"],
+                "categories": Json(agg["categories"]),
+            })
+        if params:
+            with conn.cursor() as cur:
+                cur.executemany(_ANALYTICS_UPSERT, params)
+
+    # ------------------------------------------------------------------ lifecycle
+    def flush(self, timeout: float = LOG_SHUTDOWN_TIMEOUT) -> None:
+        """Stop the writer after it has written everything queued (or timeout passed)"""
+        thread = self._thread
+        self._stop.set()
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+            if thread.is_alive():
+                logger.warning(f"Log writer did not finish within {timeout}s; {self._queue.qsize()} rows lost")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "queued": self._queue.qsize(),
+                "capacity": self._queue.maxsize,
+                "batch_size": self.batch_size,
+                "flush_ms": int(self.flush_interval * 1000),
+                "running": self._thread is not None and self._thread.is_alive(),
+            }
+
+
+# Singleton instance
+log_writer = LogWriter()
+atexit.register(log_writer.flush)
+
+
+def get_log_writer() -> LogWriter:
+    """Get the log writer singleton"""
+    return log_writer
+
+
+def submit_log(table: str, **row: Any) -> bool:
+    """Queue one analytics row for table; returns immediately. Rows are stamped
+    here, so created_at is the request time rather than the flush time."""
+    row.setdefault("created_at", datetime.now(timezone.utc))
+    return log_writer.submit(table, row)
+
+
+def submit_query_analytics(query: str, response_time_ms: Optional[int] = None, success: bool = True,
+                           category: Optional[str] = None) -> bool:
+    """Queue a query_analytics update (aggregated per query at write time)"""
+    if not query:
+        return False
+    return log_writer.submit(QUERY_ANALYTICS, {"query": query, "response_time_ms": response_time_ms,
+                                               "success": success, "category": category,
+                                               "at": datetime.now(timezone.utc)})
@@ -0,0 +1,602 @@
+"""
+Schema Migrations Module for JuSimples
+Ordered, versioned schema changes recorded in schema_migrations and applied once
+per deploy (python migrations.py) instead of as DDL at startup or in request paths
+"""
+import os
+import time
+import logging
+import argparse
+from typing import Any, Callable, Dict, List, Optional
+
+from db_utils import DatabaseManager, EMBED_DIM
+
+logger = logging.getLogger(__name__)
+
+# Apply pending migrations when the app initializes its schema (otherwise only report them)
+DB_MIGRATE_ON_START = os.getenv("DB_MIGRATE_ON_START", "false").lower() == "true"
+# Transactional migrations give up instead of queueing writes behind their lock
+MIGRATION_LOCK_TIMEOUT = os.getenv("MIGRATION_LOCK_TIMEOUT", "5s")
+# Arbitrary key so only one process migrates at a time
+_ADVISORY_LOCK_KEY = 7305115
+
+
+class Migration:
+    """One schema change. Transactional migrations run in a transaction together with
+    their schema_migrations row; the others (CREATE INDEX CONCURRENTLY) run in
+    autocommit and must be safe to re-run after a failure."""
+
+    def __init__(self, version: int, name: str, apply: Callable, transactional: bool = True):
+        self.version = version
+        self.name = name
+        self.apply = apply
+        self.transactional = transactional
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, name: str, transactional: bool = True):
+    def register(fn: Callable) -> Callable:
+        if any(m.version == version for m in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append(Migration(version, name, fn, transactional))
+        MIGRATIONS.sort(key=lambda m: m.version)
+        return fn
+    return register
+
+
+def create_index_concurrently(conn, name: str, table: str, definition: str) -> None:
+    """CREATE INDEX CONCURRENTLY IF NOT EXISTS, replacing an invalid leftover of an
+    interrupted build (IF NOT EXISTS alone would keep it)"""
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT x.indisvalid FROM pg_index x JOIN pg_class c ON c.oid = x.indexrelid WHERE c.relname = %s;",
+            (name,),
+        )
+        row = cur.fetchone()
+        if row is not None and not row[0]:
+            logger.info(f"Dropping invalid index {name} left by an interrupted build")
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+        cur.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {definition};")
+
+
+def add_columns(cur, table: str, columns: List[tuple]) -> None:
+    cur.execute(f"ALTER TABLE {table} " + ", ".join(
+        f"ADD COLUMN IF NOT EXISTS {name} {definition}" for name, definition in columns) + ";")
+
+
+# -- migrations ---------------------------------------------------------------
+# Every migration must also be a no-op on databases created before this module
+# (IF NOT EXISTS everywhere): they are adopted by recording the versions.
+
+@migration(1, "initial schema")
+def _initial_schema(conn) -> None:
+    with conn.cursor() as cur:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS legal_chunks (
+                id VARCHAR(255) PRIMARY KEY,
+                parent_id VARCHAR(255),
+                title TEXT NOT NULL,
+                content TEXT NOT NULL,
+                category VARCHAR(100),
+                embedding vector({EMBED_DIM}),
+                metadata JSONB,
+                created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+                updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS search_logs (
+                id BIGSERIAL PRIMARY KEY,
+                created_at TIMESTAMPTZ DEFAULT now(),
+                query TEXT,
+                top_k INT,
+                min_relevance DOUBLE PRECISION,
+                search_type TEXT,
+                total INT,
+                result_ids JSONB,
+                user_id TEXT,
+                session_id TEXT,
+                response_time_ms INT,
+                user_agent TEXT,
+                ip_address INET,
+                context_found INT DEFAULT 0,
+                category TEXT,
+                success BOOLEAN DEFAULT true
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS ask_logs (
+                id BIGSERIAL PRIMARY KEY,
+                created_at TIMESTAMPTZ DEFAULT now(),
+                question TEXT,
+                answer TEXT,
+                top_k INT,
+                min_relevance DOUBLE PRECISION,
+                total_sources INT,
+                result_ids JSONB,
+                user_id TEXT,
+                session_id TEXT,
+                response_time_ms INT,
+                user_agent TEXT,
+                ip_address INET,
+                context_found INT DEFAULT 0,
+                search_type TEXT DEFAULT 'keyword',
+                llm_model TEXT,
+                llm_tokens_used INT,
+                llm_cost DECIMAL(10,6),
+                input_tokens INT DEFAULT 0,
+                output_tokens INT DEFAULT 0,
+                finish_reason TEXT,
+                system_fingerprint TEXT,
+                response_id TEXT,
+                created_timestamp INT,
+                logprobs TEXT,
+                category TEXT,
+                success BOOLEAN DEFAULT true,
+                error_message TEXT
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS api_usage_logs (
+                id BIGSERIAL PRIMARY KEY,
+                created_at TIMESTAMPTZ DEFAULT now(),
+                endpoint TEXT,
+                method TEXT,
+                status_code INT,
+                response_time_ms INT,
+                user_id TEXT,
+                session_id TEXT,
+                ip_address INET,
+                user_agent TEXT,
+                request_size_bytes INT,
+                response_size_bytes INT,
+                error_message TEXT
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS query_analytics (
+                id BIGSERIAL PRIMARY KEY,
+                query_normalized TEXT UNIQUE,
+                total_count INT DEFAULT 1,
+                last_queried TIMESTAMPTZ DEFAULT now(),
+                avg_response_time_ms DECIMAL(10,2),
+                success_rate DECIMAL(5,2),
+                categories JSONB DEFAULT '[]'::jsonb,
+                related_queries JSONB DEFAULT '[]'::jsonb,
+                trending_score DECIMAL(10,2) DEFAULT 0,
+                created_at TIMESTAMPTZ DEFAULT now(),
+                updated_at TIMESTAMPTZ DEFAULT now()
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS system_metrics (
+                id BIGSERIAL PRIMARY KEY,
+                recorded_at TIMESTAMPTZ DEFAULT now(),
+                metric_type TEXT,
+                metric_name TEXT,
+                value DECIMAL(15,4),
+                unit TEXT,
+                metadata JSONB
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS user_sessions (
+                id BIGSERIAL PRIMARY KEY,
+                session_id TEXT UNIQUE,
+                user_id TEXT,
+                started_at TIMESTAMPTZ DEFAULT now(),
+                last_activity TIMESTAMPTZ DEFAULT now(),
+                ip_address INET,
+                user_agent TEXT,
+                total_queries INT DEFAULT 0,
+                total_time_seconds INT DEFAULT 0,
+                pages_visited JSONB DEFAULT '[]'::jsonb,
+                ended_at TIMESTAMPTZ
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS openai_usage_logs (
+                id BIGSERIAL PRIMARY KEY,
+                created_at TIMESTAMPTZ DEFAULT now(),
+                request_id TEXT,
+                model TEXT,
+                prompt_tokens INT DEFAULT 0,
+                completion_tokens INT DEFAULT 0,
+                total_tokens INT DEFAULT 0,
+                cost DECIMAL(10,6) DEFAULT 0,
+                finish_reason TEXT,
+                system_fingerprint TEXT,
+                response_time_ms INT DEFAULT 0,
+                success BOOLEAN DEFAULT true,
+                error_message TEXT,
+                endpoint TEXT,
+                session_id TEXT,
+                user_id TEXT,
+                prompt_preview TEXT,
+                response_preview TEXT
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS lexml_api_logs (
+                id BIGSERIAL PRIMARY KEY,
+                created_at TIMESTAMPTZ DEFAULT now(),
+                endpoint TEXT,
+                request_params JSONB DEFAULT '{}'::jsonb,
+                response_data JSONB DEFAULT '{}'::jsonb,
+                response_time_ms INT DEFAULT 0,
+                success BOOLEAN DEFAULT true,
+                error_message TEXT,
+                documents_found INT DEFAULT 0,
+                session_id TEXT,
+                user_id TEXT,
+                law_type TEXT,
+                search_query TEXT
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS query_embedding_cache (
+                cache_key TEXT PRIMARY KEY,
+                query_normalized TEXT,
+                model TEXT NOT NULL,
+                dim INT NOT NULL,
+                embedding vector NOT NULL,
+                hits INT DEFAULT 0,
+                created_at TIMESTAMPTZ DEFAULT now(),
+                last_used_at TIMESTAMPTZ DEFAULT now()
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_store (
+                content_hash TEXT NOT NULL,
+                model TEXT NOT NULL,
+                dim INT NOT NULL,
+                embedding vector NOT NULL,
+                created_at TIMESTAMPTZ DEFAULT now(),
+                PRIMARY KEY (content_hash, model, dim)
+            );
+        """)
+        # Deferred embedding queue (drained by embedding_backfill)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_backfill_queue (
+                chunk_id VARCHAR(255) PRIMARY KEY,
+                attempts INT DEFAULT 0,
+                last_error TEXT,
+                enqueued_at TIMESTAMPTZ DEFAULT now(),
+                next_attempt_at TIMESTAMPTZ DEFAULT now()
+            );
+        """)
+
+
+@migration(2, "full-text search column")
+def _full_text_search(conn) -> None:
+    """pt_unaccent text search config (Portuguese stemming, accents folded) and the
+    generated search_tsv column. Falls back to plain Portuguese stemming when the
+    unaccent extension is unavailable, so the config name is always valid."""
+    with conn.cursor() as cur:
+        try:
+            with conn.transaction():
+                cur.execute("CREATE EXTENSION IF NOT EXISTS unaccent;")
+            mapping = """
+                ALTER TEXT SEARCH CONFIGURATION pt_unaccent
+                    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;"""
+        except Exception as e:
+            logger.warning(f"unaccent not available, using Portuguese config without accent folding: {e}")
+            mapping = ""
+        cur.execute(f"""
+            DO $$
+            BEGIN
+                IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'pt_unaccent') THEN
+                    CREATE TEXT SEARCH CONFIGURATION pt_unaccent (COPY = portuguese);{mapping}
+                END IF;
+            END
+            $$;
+        """)
+        # Rewrites legal_chunks once (ACCESS EXCLUSIVE); a no-op where the column exists
+        cur.execute("""
+            ALTER TABLE legal_chunks ADD COLUMN IF NOT EXISTS search_tsv tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('pt_unaccent'::regconfig, coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('pt_unaccent'::regconfig, coalesce(metadata->>'keywords', '')), 'B') ||
+                setweight(to_tsvector('pt_unaccent'::regconfig, coalesce(content, '')), 'C')
+            ) STORED;
+        """)
+
+
+@migration(3, "log and analytics columns")
+def _log_columns(conn) -> None:
+    """Columns previously added by the one-off fix_*/update_schema scripts and at
+    request time by retrieval_extensions"""
+    with conn.cursor() as cur:
+        add_columns(cur, "search_logs", [
+            ("category", "TEXT"),
+            ("model_version", "VARCHAR(100)"),
+            ("embedding_model", "VARCHAR(100)"),
+            ("similarity_threshold", "DECIMAL(4,3)"),
+            ("vector_search_time_ms", "INT DEFAULT 0"),
+        ])
+        add_columns(cur, "ask_logs", [
+            ("model_version", "VARCHAR(100)"),
+            ("temperature", "DECIMAL(3,2) DEFAULT 0.7"),
+            ("max_tokens", "INT"),
+            ("top_p", "DECIMAL(3,2) DEFAULT 1.0"),
+            ("response_quality_score", "DECIMAL(3,2)"),
+            ("context_relevance_score", "DECIMAL(3,2)"),
+        ])
+        # External API calls (retrieval_extensions.log_api_usage) share the table
+        # with the HTTP request log
+        add_columns(cur, "api_usage_logs", [
+            ("api_name", "VARCHAR(100)"),
+            ("success", "BOOLEAN DEFAULT true"),
+            ("cost", "DECIMAL(10,6) DEFAULT 0.0"),
+            ("request_data", "JSONB"),
+            ("response_data", "JSONB"),
+        ])
+        cur.execute("UPDATE search_logs SET success = true WHERE success IS NULL;")
+        cur.execute("UPDATE ask_logs SET success = true WHERE success IS NULL;")
+
+
+@migration(4, "analytics views")
+def _analytics_views(conn) -> None:
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE OR REPLACE VIEW popular_queries AS
+            SELECT
+                qa.query_normalized,
+                qa.total_count,
+                qa.success_rate,
+                qa.avg_response_time_ms,
+                qa.last_queried,
+                CASE
+                    WHEN qa.total_count >= 50 THEN 'Very Popular'
+                    WHEN qa.total_count >= 20 THEN 'Popular'
+                    WHEN qa.total_count >= 5 THEN 'Moderate'
+                    ELSE 'Low'
+                END AS popularity_level
+            FROM query_analytics qa
+            ORDER BY qa.total_count DESC, qa.last_queried DESC;
+        """)
+        cur.execute("""
+            CREATE OR REPLACE VIEW analytics_overview AS
+            SELECT 'ask' AS operation_type, created_at, success, response_time_ms,
+                   llm_tokens_used AS tokens_used, input_tokens, output_tokens,
+                   llm_cost AS cost, llm_model AS model, session_id, user_id,
+                   finish_reason, system_fingerprint
+            FROM ask_logs
+            UNION ALL
+            SELECT 'search' AS operation_type, created_at, success, response_time_ms,
+                   0, 0, 0, 0, embedding_model, session_id, user_id, NULL, NULL
+            FROM search_logs;
+        """)
+
+
+@migration(5, "indexes", transactional=False)
+def _indexes(conn) -> None:
+    for name, table, definition in (
+        ("idx_legal_chunks_category", "legal_chunks", "(category)"),
+        ("idx_legal_chunks_search_tsv", "legal_chunks", "USING gin (search_tsv)"),
+        ("idx_embedding_backfill_next_attempt", "embedding_backfill_queue", "(next_attempt_at)"),
+        ("idx_search_logs_created_at", "search_logs", "(created_at)"),
+        ("idx_search_logs_session", "search_logs", "(session_id)"),
+        ("idx_ask_logs_created_at", "ask_logs", "(created_at)"),
+        ("idx_ask_logs_session", "ask_logs", "(session_id)"),
+        ("idx_api_usage_created_at", "api_usage_logs", "(created_at)"),
+        ("idx_api_usage_api_name", "api_usage_logs", "(api_name)"),
+    ):
+        create_index_concurrently(conn, name, table, definition)
+
+
+@migration(6, "vector index", transactional=False)
+def _vector_index(conn) -> None:
+    # Type and sizing chosen by vector_index, which also keeps it maintained afterwards
+    from vector_index import ensure_vector_index
+    ensure_vector_index(conn, concurrently=True)
+
+
+@migration(7, "analytics rollups")
+def _analytics_rollups(conn) -> None:
+    """Pre-aggregated search/ask metrics kept up to date by the log writer
+    (analytics_rollup); dashboards read these instead of scanning the raw logs"""
+    metrics = """
+        bucket TIMESTAMPTZ NOT NULL,
+        kind TEXT NOT NULL,
+        search_type TEXT NOT NULL DEFAULT '',
+        category TEXT NOT NULL DEFAULT '',
+        model TEXT NOT NULL DEFAULT '',
+        requests BIGINT NOT NULL DEFAULT 0,
+        successes BIGINT NOT NULL DEFAULT 0,
+        latency_count BIGINT NOT NULL DEFAULT 0,
+        latency_sum_ms BIGINT NOT NULL DEFAULT 0,
+        latency_hist BIGINT[] NOT NULL DEFAULT '{}',
+        context_found_sum BIGINT NOT NULL DEFAULT 0,
+        no_context BIGINT NOT NULL DEFAULT 0,
+        good_context BIGINT NOT NULL DEFAULT 0,
+        llm_calls BIGINT NOT NULL DEFAULT 0,
+        tokens BIGINT NOT NULL DEFAULT 0,
+        input_tokens BIGINT NOT NULL DEFAULT 0,
+        output_tokens BIGINT NOT NULL DEFAULT 0,
+        cost NUMERIC(14,6) NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ DEFAULT now(),
+        PRIMARY KEY (bucket, kind, search_type, category, model)
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE TABLE IF NOT EXISTS analytics_rollup_hourly ({metrics});")
+        cur.execute(f"CREATE TABLE IF NOT EXISTS analytics_rollup_daily ({metrics});")
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS query_rollup_daily (
+                day DATE NOT NULL,
+                kind TEXT NOT NULL,
+                query_normalized TEXT NOT NULL,
+                query_text TEXT,
+                requests BIGINT NOT NULL DEFAULT 0,
+                successes BIGINT NOT NULL DEFAULT 0,
+                latency_count BIGINT NOT NULL DEFAULT 0,
+                latency_sum_ms BIGINT NOT NULL DEFAULT 0,
+                context_found_sum BIGINT NOT NULL DEFAULT 0,
+                last_seen TIMESTAMPTZ,
+                PRIMARY KEY (day, kind, query_normalized)
+            );
+        """)
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS session_rollup_daily (
+                day DATE NOT NULL,
+                session_id TEXT NOT NULL,
+                PRIMARY KEY (day, session_id)
+            );
+        """)
+
+
+@migration(8, "heavy hitters")
+def _heavy_hitters(conn) -> None:
+    """One row per shared query sketch (heavy_hitters module): its Space-Saving
+    entries as [term, count, error, display] and the time decayed counts are valued at"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS heavy_hitters (
+                name TEXT PRIMARY KEY,
+                entries JSONB NOT NULL DEFAULT '[]'::jsonb,
+                min_count DOUBLE PRECISION NOT NULL DEFAULT 0,
+                total DOUBLE PRECISION NOT NULL DEFAULT 0,
+                as_of TIMESTAMPTZ NOT NULL DEFAULT now(),
+                updated_at TIMESTAMPTZ DEFAULT now()
+            );
+        """)
+
+
+# -- runner -------------------------------------------------------------------
+
+def _ensure_table(conn) -> None:
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMPTZ DEFAULT now(),
+                duration_ms INT
+            );
+        """)
+
+
+def applied_versions(conn) -> Dict[int, Any]:
+    """version -> applied_at; empty if schema_migrations does not exist yet"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            return {}
+        cur.execute("SELECT version, applied_at FROM schema_migrations;")
+        return {version: applied_at for version, applied_at in cur.fetchall()}
+
+
+def pending_migrations(conn) -> List[Migration]:
+    applied = applied_versions(conn)
+    return [m for m in MIGRATIONS if m.version not in applied]
+
+
+def _apply(conn, m: Migration) -> int:
+    start = time.time()
+    if m.transactional:
+        with conn.transaction(), conn.cursor() as cur:
+            cur.execute("SELECT set_config('lock_timeout', %s, true);", (MIGRATION_LOCK_TIMEOUT,))
+            m.apply(conn)
+            duration_ms = int((time.time() - start) * 1000)
+            cur.execute("INSERT INTO schema_migrations (version, name, duration_ms) VALUES (%s, %s, %s);",
+                        (m.version, m.name, duration_ms))
+        return duration_ms
+    m.apply(conn)
+    duration_ms = int((time.time() - start) * 1000)
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO schema_migrations (version, name, duration_ms) VALUES (%s, %s, %s) "
+                    "ON CONFLICT (version) DO NOTHING;", (m.version, m.name, duration_ms))
+    return duration_ms
+
+
+def migrate(conn=None, target: Optional[int] = None) -> Dict[str, Any]:
+    """Apply pending migrations up to target (all by default), in version order.
+
+    Needs an autocommit connection (CREATE INDEX CONCURRENTLY); an advisory lock
+    serializes concurrent runs, e.g. several instances starting at once. Stops at
+    the first failure, which is raised after releasing the lock.
+    """
+    conn = conn or DatabaseManager().get_connection()
+    if conn is None:
+        raise RuntimeError("No database connection")
+    if not conn.autocommit:
+        raise RuntimeError("Migrations need an autocommit connection")
+    report: Dict[str, Any] = {"applied": [], "current_version": 0}
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s);", (_ADVISORY_LOCK_KEY,))
+    try:
+        _ensure_table(conn)
+        # Re-read under the lock: another process may have just migrated
+        for m in pending_migrations(conn):
+            if target is not None and m.version > target:
+                break
+            logger.info(f"Applying migration {m.version:04d} {m.name}...")
+            duration_ms = _apply(conn, m)
+            logger.info(f"✅ Migration {m.version:04d} {m.name} applied in {duration_ms}ms")
+            report["applied"].append({"version": m.version, "name": m.name, "duration_ms": duration_ms})
+        applied = applied_versions(conn)
+        report["current_version"] = max(applied) if applied else 0
+        report["pending"] = [m.version for m in MIGRATIONS if m.version not in applied]
+        return report
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s);", (_ADVISORY_LOCK_KEY,))
+
+
+def get_migration_status(conn=None) -> Dict[str, Any]:
+    conn = conn or DatabaseManager().get_connection()
+    if conn is None:
+        return {"available": False}
+    applied = applied_versions(conn)
+    return {
+        "available": True,
+        "current_version": max(applied) if applied else 0,
+        "latest_version": MIGRATIONS[-1].version if MIGRATIONS else 0,
+        "migrations": [
+            {"version": m.version, "name": m.name,
+             "applied_at": applied[m.version].isoformat() if m.version in applied else None}
+            for m in MIGRATIONS
+        ],
+    }
+
+
+def ensure_schema(conn=None, apply: bool = DB_MIGRATE_ON_START) -> bool:
+    """Called at app start: apply pending migrations if apply, otherwise log them.
+
+    True when the initial schema (version 1) is in place.
+    """
+    conn = conn or DatabaseManager().get_connection()
+    if conn is None:
+        return False
+    if apply:
+        applied = migrate(conn)["applied"]
+        if applied:
+            logger.info(f"Applied {len(applied)} pending migrations at startup")
+        return True
+    applied = applied_versions(conn)
+    pending = [m.version for m in MIGRATIONS if m.version not in applied]
+    if pending:
+        logger.error(f"❌ Database schema has pending migrations {pending}: run 'python migrations.py'")
+    return 1 in applied
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Apply versioned database schema migrations")
+    parser.add_argument("command", choices=["migrate", "status"], nargs="?", default="migrate")
+    parser.add_argument("--to", type=int, help="Stop after this version")
+    args = parser.parse_args()
+
+    conn = DatabaseManager().get_connection()
+    if conn is None:
+        logger.error("Database not available")
+        raise SystemExit(1)
+    if args.command == "migrate":
+        result = migrate(conn, target=args.to)
+        logger.info(f"Schema at version {result['current_version']} "
+                    f"({len(result['applied'])} applied, pending: {result['pending'] or 'none'})")
+    for m in get_migration_status(conn)["migrations"]:
+        logger.info(f"{m['version']:04d} {m['name']:<28} {m['applied_at'] or 'pending'}")
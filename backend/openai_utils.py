@@ -7,7 +7,7 @@ import os
 import json
 import time
 import logging
-from typing import Dict, Any, Optional, Tuple, List
+from typing import Dict, Any, Optional, Tuple, List, Iterator
 from datetime import datetime
 from openai import OpenAI, APIError, RateLimitError, APIConnectionError
 # Try to import additional exception types; define fallbacks if not available
@@ -32,28 +32,32 @@ MODEL_CONFIGS = {
         "output_cost_per_1k": 0.015,  # $0.015 per 1K output tokens
         "supports_json_mode": True,
         "max_tokens": 128000,
-        "display_name": "GPT-4o"
+        "display_name": "GPT-4o",
+        "context_budget": 3000  # tokens of retrieved context per prompt (context_packer)
     },
     "gpt-4o-mini": {
         "input_cost_per_1k": 0.00015,  # $0.00015 per 1K input tokens
         "output_cost_per_1k": 0.0006,  # $0.0006 per 1K output tokens
         "supports_json_mode": True,
         "max_tokens": 128000,
-        "display_name": "GPT-4o Mini"
+        "display_name": "GPT-4o Mini",
+        "context_budget": 3000
     },
     "gpt-3.5-turbo": {
         "input_cost_per_1k": 0.0005,   # $0.0005 per 1K input tokens
         "output_cost_per_1k": 0.0015,  # $0.0015 per 1K output tokens
         "supports_json_mode": True,
         "max_tokens": 16385,
-        "display_name": "GPT-3.5 Turbo"
+        "display_name": "GPT-3.5 Turbo",
+        "context_budget": 2000
     },
     "gpt-5-nano": {  # Use this as default since it might be renamed gpt-4o-mini
         "input_cost_per_1k": 0.00015,
         "output_cost_per_1k": 0.0006,
         "supports_json_mode": True,
         "max_tokens": 128000,
-        "display_name": "GPT-5 Nano (alias for gpt-4o-mini)"
+        "display_name": "GPT-5 Nano (alias for gpt-4o-mini)",
+        "context_budget": 3000
     }
 }
 
@@ -246,15 +250,7 @@ class OpenAIManager:
             
             # Extract metrics
             if response.usage:
-                result["metrics"]["tokens"]["input"] = response.usage.prompt_tokens
-                result["metrics"]["tokens"]["output"] = response.usage.completion_tokens
-                result["metrics"]["tokens"]["total"] = response.usage.total_tokens
-                
-                # Calculate cost
-                model_config = MODEL_CONFIGS.get(model, MODEL_CONFIGS.get("gpt-4o-mini"))
-                input_cost = (response.usage.prompt_tokens * model_config["input_cost_per_1k"]) / 1000
-                output_cost = (response.usage.completion_tokens * model_config["output_cost_per_1k"]) / 1000
-                result["metrics"]["cost"] = input_cost + output_cost
+                self._apply_usage(result, model, response.usage)
                 
             # Extract additional metadata
             if hasattr(response.choices[0], "finish_reason"):
@@ -307,6 +303,106 @@ class OpenAIManager:
             
         return result
     
+    def stream_completion(
+        self,
+        prompt: str,
+        system_message: str = "Você é um assistente jurídico brasileiro útil, preciso e conciso.",
+        model: str = None,
+        temperature: float = 0.3,
+        max_tokens: int = 1024,
+        timeout: Optional[float] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream a completion: yields {"type": "token", "content": ...} per delta and
+        finally {"type": "done", "result": ...} with the same result structure as
+        generate_completion (plus time_to_first_token_ms in metrics)
+        """
+        start_time = time.time()
+        model = model or self.active_model or self.preferred_model
+        result = {
+            "success": False,
+            "content": None,
+            "error": None,
+            "model": model,
+            "metrics": {
+                "tokens": {
+                    "input": 0,
+                    "output": 0,
+                    "total": 0
+                },
+                "cost": 0.0,
+                "duration_ms": 0,
+                "time_to_first_token_ms": None,
+                "finish_reason": None,
+                "created_at": datetime.utcnow().isoformat(),
+                "system_fingerprint": None
+            }
+        }
+        
+        if not self.is_ready():
+            result["error"] = f"OpenAI client not initialized: {self.last_error}"
+            yield {"type": "done", "result": result}
+            return
+        
+        parts: List[str] = []
+        try:
+            messages = [
+                {"role": "system", "content": system_message},
+                {"role": "user", "content": prompt}
+            ]
+            logger.info(f"🔎 OpenAI streaming request -> model={model}, temp={temperature}, max_tokens={max_tokens}")
+            request_client = self.client.with_options(timeout=timeout or self.timeout)
+            stream = request_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                # The last chunk carries token usage (it has no choices)
+                stream_options={"include_usage": True}
+            )
+            for chunk in stream:
+                if getattr(chunk, "system_fingerprint", None):
+                    result["metrics"]["system_fingerprint"] = chunk.system_fingerprint
+                if chunk.usage:
+                    self._apply_usage(result, model, chunk.usage)
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.finish_reason:
+                    result["metrics"]["finish_reason"] = choice.finish_reason
+                delta = choice.delta.content if choice.delta else None
+                if delta:
+                    if result["metrics"]["time_to_first_token_ms"] is None:
+                        result["metrics"]["time_to_first_token_ms"] = int((time.time() - start_time) * 1000)
+                    parts.append(delta)
+                    yield {"type": "token", "content": delta}
+            
+            result["success"] = True
+            self._update_usage_stats(result)
+            
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {str(e)}"
+            self.usage_stats["error_count"] += 1
+            logger.error(f"❌ OpenAI streaming error: {type(e).__name__}: {str(e)}")
+            
+        finally:
+            result["content"] = "".join(parts)
+            result["metrics"]["duration_ms"] = int((time.time() - start_time) * 1000)
+        
+        yield {"type": "done", "result": result}
+    
+    def _apply_usage(self, result: Dict[Any, Any], model: str, usage: Any) -> None:
+        """Copy token usage into result metrics and price it with MODEL_CONFIGS"""
+        result["metrics"]["tokens"]["input"] = usage.prompt_tokens
+        result["metrics"]["tokens"]["output"] = usage.completion_tokens
+        result["metrics"]["tokens"]["total"] = usage.total_tokens
+        
+        model_config = MODEL_CONFIGS.get(model, MODEL_CONFIGS.get("gpt-4o-mini"))
+        input_cost = (usage.prompt_tokens * model_config["input_cost_per_1k"]) / 1000
+        output_cost = (usage.completion_tokens * model_config["output_cost_per_1k"]) / 1000
+        result["metrics"]["cost"] = input_cost + output_cost
+    
     def _update_usage_stats(self, result: Dict[Any, Any]) -> None:
         """Update internal usage statistics from a request result"""
         self.usage_stats["request_count"] += 1
@@ -403,6 +499,14 @@ def get_completion(prompt: str, system_message: str = None, **kwargs) -> Dict[An
         **kwargs
     )
 
+def stream_completion(prompt: str, system_message: str = None, **kwargs) -> Iterator[Dict[str, Any]]:
+    """Stream a completion using the OpenAI manager (see OpenAIManager.stream_completion)"""
+    return openai_manager.stream_completion(
+        prompt=prompt,
+        system_message=system_message or "Você é um assistente jurídico brasileiro útil, preciso e conciso.",
+        **kwargs
+    )
+
 def get_openai_status() -> Dict[str, Any]:
     """Get the current status of the OpenAI client"""
     is_ready = openai_manager.is_ready()
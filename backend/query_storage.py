@@ -30,11 +30,6 @@ class QueryStorage:
                 logger.error("Database not ready for query storage")
                 return False
                 
-            conn = self.db_manager.get_connection()
-            if not conn:
-                logger.error("No database connection available")
-                return False
-                
             # Extract user information
             user_id = user_info.get('user_id') if user_info else None
             session_id = user_info.get('session_id') if user_info else None
@@ -52,7 +47,7 @@ class QueryStorage:
             # Extract document IDs
             result_ids = [doc.get('id', '') for doc in context_docs if doc.get('id')]
             
-            with conn.cursor() as cur:
+            with self.db_manager.connection() as conn, conn.transaction(), conn.cursor() as cur:
                 # Save to ask_logs
                 cur.execute("""
                     INSERT INTO ask_logs (
@@ -86,7 +81,6 @@ class QueryStorage:
                         updated_at = now()
                 """, (normalized_query, response_time_ms, response_time_ms))
                 
-            conn.commit()
             logger.info(f"✅ Query saved successfully with ID: {query_id}")
             return True
             
@@ -107,8 +101,7 @@ class QueryStorage:
             if not self.db_manager.is_ready():
                 return []
                 
-            conn = self.db_manager.get_connection()
-            with conn.cursor() as cur:
+            with self.db_manager.connection() as conn, conn.cursor() as cur:
                 cur.execute("""
                     SELECT 
                         query_normalized,
@@ -144,8 +137,7 @@ class QueryStorage:
             if not self.db_manager.is_ready():
                 return []
                 
-            conn = self.db_manager.get_connection()
-            with conn.cursor() as cur:
+            with self.db_manager.connection() as conn, conn.cursor() as cur:
                 cur.execute("""
                     SELECT 
                         id,
@@ -194,10 +186,9 @@ class QueryStorage:
             if not self.db_manager.is_ready():
                 return {}
                 
-            conn = self.db_manager.get_connection()
             stats = {}
             
-            with conn.cursor() as cur:
+            with self.db_manager.connection() as conn, conn.cursor() as cur:
                 # Total queries
                 cur.execute("""
                     SELECT 
@@ -1,25 +1,59 @@
 import os
+import time
 import logging
 import uuid
+import threading
 from typing import List, Dict, Any, Optional
 
 import psycopg  # psycopg 3
+from psycopg import sql
 from psycopg.types.json import Json
 from pgvector.psycopg import register_vector
 from openai import OpenAI
 
 # Import our new database utility module
-from db_utils import get_db_manager, get_connection, is_ready as db_is_ready
+from db_utils import (get_db_manager, get_connection, connection, optional_connection, shared_connection,
+                      pipelined, is_ready as db_is_ready)
+from embedding_cache import get_query_embedding_cache, get_content_embedding_store, content_hash
+from embedding_batcher import EmbeddingBatcher, BATCHING_ENABLED
+from bulk_embeddings import BulkEmbedder
+from embedding_backfill import enqueue_backfill
+from vector_index import get_vector_index_manager, normalize_search_mode, set_local, DEFAULT_SEARCH_MODE
+from local_vector_index import get_local_vector_index, local_semantic_search, LOCAL_INDEX_MODE
+from ivfpq_index import get_ivfpq_index, IVFPQ_NPROBE
+from vector_storage import get_vector_storage, build_knn_query, candidate_pass, normalize_vector
+from embedding_profiles import get_embedding_profile
+from document_cache import get_document_cache, notify_changed
+from log_writer import submit_log, submit_query_analytics
+from heavy_hitters import record_query
+import analytics_rollup
 
 LOGGER = logging.getLogger(__name__)
 
-EMBED_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
-EMBED_DIM = 1536  # text-embedding-3-small
+# Model and size of legal_chunks.embedding (see embedding_profiles)
+EMBED_PROFILE = get_embedding_profile("full")
+EMBED_MODEL = EMBED_PROFILE.model
+EMBED_DIM = EMBED_PROFILE.dimensions
+# Calls per embeddings request (same model every time; see _request_embeddings)
+EMBED_ATTEMPTS = max(1, int(os.getenv("EMBEDDING_ATTEMPTS", "2")))
 
-# For backward compatibility
-_CONN = None
+# Full-text search config created in db_utils (Portuguese stemming + unaccent)
+TS_CONFIG = "pt_unaccent"
+# Reciprocal rank fusion constant and per-retriever candidate depth for hybrid search
+RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+
+# Serve unfiltered ANN queries from the in-process IVF-PQ index (built with ivfpq_index.py)
+IVFPQ_SEARCH = os.getenv("IVFPQ_SEARCH", "false").lower() == "true"
+
+# Optional metadata filters accepted by semantic/keyword/hybrid search
+SEARCH_FILTERS = ("category", "law_type", "jurisdiction", "date_from", "date_to")
+
+# Last known database readiness (connections are checked out per query from the db_utils pool)
 _READY = False
 _OPENAI: Optional[OpenAI] = None
+_BATCHER: Optional[EmbeddingBatcher] = None
+_BATCHER_LOCK = threading.Lock()
 
 
 def _get_openai() -> Optional[OpenAI]:
@@ -37,16 +71,13 @@ def _get_openai() -> Optional[OpenAI]:
 
 
 def _connect() -> Optional[psycopg.Connection]:
-    """Legacy function that now uses db_utils.get_connection"""
-    global _CONN
-    # Use our new db_utils module to get a connection
-    _CONN = get_connection()
-    return _CONN
+    """Legacy function: the shared long-lived connection from db_utils (scripts only)"""
+    return get_connection()
 
 
 def init_pgvector() -> bool:
     """Initialize pgvector schema and table. Returns True if ready."""
-    global _CONN, _READY
+    global _READY
     
     # Use our new db_utils module
     db_manager = get_db_manager()
@@ -54,17 +85,15 @@ def init_pgvector() -> bool:
     if db_manager.is_ready():
         LOGGER.info("pgvector already initialized and ready")
         _READY = True
-        _CONN = db_manager.get_connection()
         return True
 
     LOGGER.info("Initializing pgvector connection and schema...")
     
     # Initialize database schema using the db_utils module
     if db_manager.initialize_schema():
-        _CONN = db_manager.get_connection()
-        _READY = True
+        _READY = db_manager.is_ready()
         LOGGER.info("pgvector ready: table legal_chunks available")
-        return True
+        return _READY
     else:
         LOGGER.error("Failed to initialize database schema")
         _READY = False
@@ -72,80 +101,129 @@ def init_pgvector() -> bool:
 
 
 def _ensure_connection() -> bool:
-    """Ensure we have a valid database connection, reconnecting if needed"""
-    global _CONN, _READY
-    
-    # Use our db_utils module
-    db_manager = get_db_manager()
-    
-    if not db_manager.is_ready():
-        LOGGER.info("No active connection, attempting to connect")
-        _CONN = db_manager.get_connection(force_new=True)
-        _READY = (_CONN is not None)
-    else:
-        # Get a connection from the manager
-        _CONN = db_manager.get_connection()
-        _READY = True
-        
+    """Ensure the database is reachable (the pool reconnects on its own)"""
+    global _READY
+    _READY = get_db_manager().is_ready()
     return _READY
 
 
 def is_ready() -> bool:
     """Check if the database connection is ready"""
-    global _READY, _CONN
-    
-    # Use db_utils to check if database is ready
-    db_ready = db_is_ready()
-    
-    # Ensure our local state is consistent
-    if db_ready and (_CONN is None or not _READY):
-        _CONN = get_connection()
-        _READY = (_CONN is not None)
-    elif not db_ready:
-        _READY = False
-        
+    global _READY
+    # Cheap: db_utils tracks readiness with a background health check
+    _READY = db_is_ready()
     return _READY
 
 
-def embed_texts(texts: List[str]) -> List[List[float]]:
-    """Embed texts with OpenAI, with robust fallbacks.
+def _embed_once(texts: List[str]) -> List[List[float]]:
+    """One embeddings API call with EMBED_MODEL (no SDK retries); raises the API error.
 
-    Order:
-    1) Try EMBED_MODEL (default text-embedding-3-small, 1536 dims)
-    2) Fallback to text-embedding-3-large
-    3) Fallback to zero-vector of EMBED_DIM to keep semantic search operational
+    Bulk paths pass this to BulkEmbedder, which owns retries and splitting.
     """
     client = _get_openai()
     if not client:
+        raise RuntimeError("OPENAI_API_KEY not configured for embeddings")
+    LOGGER.info(f"Embedding {len(texts)} text(s) with model: {EMBED_MODEL}")
+    resp = client.with_options(max_retries=0).embeddings.create(input=texts, **EMBED_PROFILE.request_kwargs())
+    # Unit length regardless of model, so inner-product storage (vector_storage.py)
+    # ranks exactly like cosine; cosine itself is unaffected by scaling
+    vectors = [normalize_vector(d.embedding) for d in resp.data]
+    if not vectors or len(vectors[0]) != EMBED_DIM:
         LOGGER.warning(
-            "OPENAI_API_KEY not configured for embeddings; using zero-vector fallback"
+            f"Embedding dims mismatch or empty (got {len(vectors[0]) if vectors else 0}); expected {EMBED_DIM}"
         )
-        return [[0.0] * EMBED_DIM for _ in texts]
+    return vectors
+
+
+def _request_embeddings(texts: List[str]) -> List[List[float]]:
+    """Call the embeddings API with EMBED_MODEL, EMBED_ATTEMPTS times at most.
 
-    models_to_try = [EMBED_MODEL]
-    if EMBED_MODEL != "text-embedding-3-large":
-        models_to_try.append("text-embedding-3-large")
+    There is no cross-model fallback: another model's vectors live in a different
+    embedding space even at EMBED_DIM dimensions, and would be stored and cached
+    under EMBED_MODEL. Failures surface to callers, which store NULL and leave the
+    rows to the backfill worker.
 
+    Raises on failure instead of returning placeholder vectors.
+    """
     last_error: Optional[Exception] = None
-    for model in models_to_try:
+    for attempt in range(1, EMBED_ATTEMPTS + 1):
         try:
-            LOGGER.info(f"Embedding {len(texts)} text(s) with model: {model}")
-            resp = client.embeddings.create(model=model, input=texts)
-            vectors = [d.embedding for d in resp.data]
-            if not vectors or len(vectors[0]) != EMBED_DIM:
-                LOGGER.warning(
-                    f"Embedding dims mismatch or empty (got {len(vectors[0]) if vectors else 0}); expected {EMBED_DIM}"
-                )
-            return vectors
+            return _embed_once(texts)
         except Exception as e:
             last_error = e
-            LOGGER.warning(f"Embedding failed with model {model}: {e}")
+            LOGGER.warning(f"Embedding attempt {attempt}/{EMBED_ATTEMPTS} with model {EMBED_MODEL} failed: {e}")
+    raise RuntimeError(f"All embedding attempts failed (last error: {last_error})") from last_error
+
+
+def embed_texts(texts: List[str]) -> List[Optional[List[float]]]:
+    """Embed texts with OpenAI.
+
+    Order:
+    1) Try EMBED_MODEL (default text-embedding-3-small, 1536 dims), EMBED_ATTEMPTS times
+    2) Return None for every input so callers can skip the search or store NULL and
+       enqueue a backfill (zero vectors would pollute the ANN index)
+    """
+    try:
+        return _request_embeddings(texts)
+    except Exception as e:
+        LOGGER.warning(f"{e}. Returning no embeddings for {len(texts)} text(s).")
+        return [None for _ in texts]
 
-    # Final fallback: zero-vector to keep pipeline functional (dev-only behavior)
-    LOGGER.warning(
-        f"All embedding attempts failed (last error: {last_error}). Using zero-vector fallback of size {EMBED_DIM}."
-    )
-    return [[0.0] * EMBED_DIM for _ in texts]
+
+def embed_texts_bulk(texts: List[str]) -> List[Optional[List[float]]]:
+    """Embed a large list of texts in token-budgeted, concurrent batches.
+
+    Used by ingestion and seeding paths; see bulk_embeddings.BulkEmbedder.
+    Vectors are resolved through the content-addressed embedding store first, so
+    only new or changed text costs an API call. Inputs that fail every retry come
+    back as None; writers store NULL and enqueue them for the backfill worker.
+    """
+    if not texts:
+        return []
+
+    def _embed_missing(missing: List[str]) -> List[Optional[List[float]]]:
+        if not _get_openai():
+            LOGGER.warning("OPENAI_API_KEY not configured for embeddings; deferring to backfill")
+            return [None] * len(missing)
+        return BulkEmbedder(_embed_once).embed(missing)
+
+    return get_content_embedding_store().resolve(texts, EMBED_MODEL, EMBED_DIM, _embed_missing)
+
+
+def semantic_available() -> bool:
+    """True when semantic search can answer: Postgres is ready or the local index is loaded"""
+    return is_ready() or get_local_vector_index().is_available()
+
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    """Get the shared micro-batching dispatcher for query embeddings"""
+    global _BATCHER
+    if _BATCHER is None:
+        with _BATCHER_LOCK:
+            if _BATCHER is None:
+                _BATCHER = EmbeddingBatcher(embed_texts)
+    return _BATCHER
+
+
+def embed_query(query: str) -> Optional[List[float]]:
+    """Embed a single search query, consulting the two-tier query embedding cache first.
+
+    Returns None when embedding fails; failures are never cached.
+    """
+    cache = get_query_embedding_cache()
+    cached = cache.get(query, EMBED_MODEL, EMBED_DIM)
+    if cached is not None:
+        return cached
+
+    start = time.time()
+    if BATCHING_ENABLED:
+        vec = get_embedding_batcher().embed(query)
+    else:
+        vec = embed_texts([query])[0]
+    cache.record_embed_call((time.time() - start) * 1000)
+    if vec and len(vec) == EMBED_DIM:
+        cache.put(query, EMBED_MODEL, EMBED_DIM, vec)
+    return vec
 
 
 def seed_static_kb_from_list(items: List[Dict[str, Any]]) -> int:
@@ -153,7 +231,7 @@ def seed_static_kb_from_list(items: List[Dict[str, Any]]) -> int:
     if not is_ready() or not items:
         return 0
     try:
-        with _CONN.cursor() as cur:
+        with connection() as conn, conn.cursor() as cur:
             cur.execute("SELECT COUNT(*) FROM legal_chunks;")
             count = cur.fetchone()[0]
             if count and count > 0:
@@ -165,16 +243,19 @@ def seed_static_kb_from_list(items: List[Dict[str, Any]]) -> int:
 
     texts = [it.get("content", "") for it in items]
     try:
-        vectors = embed_texts(texts)
+        vectors = embed_texts_bulk(texts)
     except Exception as e:
         LOGGER.error(f"Embedding failed during seed: {e}")
         return 0
 
     inserted = 0
+    deferred: List[str] = []
     try:
-        with _CONN.cursor() as cur:
+        with connection() as conn, conn.cursor() as cur:
             for it, vec in zip(items, vectors):
                 chunk_id = str(uuid.uuid4())
+                if vec is None:
+                    deferred.append(chunk_id)
                 cur.execute(
                     """
                     INSERT INTO legal_chunks (id, parent_id, title, content, category, metadata, embedding)
@@ -196,82 +277,393 @@ def seed_static_kb_from_list(items: List[Dict[str, Any]]) -> int:
     except Exception as e:
         LOGGER.error(f"Failed to seed legal_chunks: {e}")
         return 0
+    enqueue_backfill(deferred, reason="embedding failed during seed")
+    get_vector_index_manager().maybe_maintain(force=True)
     return inserted
 
 
-def semantic_search(query: str, top_k: int = 3) -> List[Dict[str, Any]]:
-    if not is_ready():
+def _active_filters(filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return {k: v for k, v in (filters or {}).items() if k in SEARCH_FILTERS and v not in (None, "")}
+
+
+def _literal(value: Any) -> sql.Literal:
+    # Queries built with these literals still take %(name)s parameters, so '%' must be doubled
+    return sql.Literal(str(value).replace("%", "%%"))
+
+
+def build_filter_clause(filters: Optional[Dict[str, Any]]) -> sql.Composable:
+    """Render search filters as 'AND ...' SQL with literal values.
+
+    Values are inlined as escaped literals rather than bind parameters so the planner
+    can match per-category partial indexes. Dates compare ISO strings from
+    metadata.published_at (or metadata.date).
+    """
+    clauses: List[sql.Composable] = []
+    filters = _active_filters(filters)
+    if "category" in filters:
+        clauses.append(sql.SQL("category = {}").format(_literal(filters["category"])))
+    for key in ("law_type", "jurisdiction"):
+        if key in filters:
+            clauses.append(sql.SQL("metadata->>{} = {}").format(sql.Literal(key), _literal(filters[key])))
+    published = sql.SQL("coalesce(metadata->>'published_at', metadata->>'date') COLLATE \"C\"")
+    if "date_from" in filters:
+        clauses.append(sql.SQL("{} >= {}").format(published, _literal(filters["date_from"])))
+    if "date_to" in filters:
+        # Compare at the bound's precision so '2020-12-31' includes '2020-12-31T10:00'
+        date_to = str(filters["date_to"])
+        clauses.append(sql.SQL("left({}, {}) <= {}").format(published, sql.Literal(len(date_to)), _literal(date_to)))
+    if not clauses:
+        return sql.SQL("")
+    return sql.SQL(" AND ") + sql.SQL(" AND ").join(clauses)
+
+
+def semantic_search(query: str, top_k: int = 3, mode: str = DEFAULT_SEARCH_MODE,
+                    filters: Optional[Dict[str, Any]] = None,
+                    min_relevance: Optional[float] = None, conn=None) -> List[Dict[str, Any]]:
+    """Nearest-neighbour search over legal_chunks.
+
+    mode trades recall for latency: 'fast' (small ef_search/probes), 'balanced'
+    (higher recall) or 'exact' (index scans disabled, exact sequential scan).
+    filters (see SEARCH_FILTERS) and min_relevance are applied in SQL; the latter as
+    a distance bound. Filtered queries use pgvector iterative index scans (or
+    a category partial index); without iterative scans a filtered query that returns
+    fewer than top_k is re-run once with a wider ANN scan, never a sequential scan.
+    The distance operator, query cast and optional first pass (binary shadow column
+    or short Matryoshka prefix, re-ranked on full vectors) follow vector_storage.
+    conn (optional) is a connection the caller already holds, e.g. in a pipeline.
+    """
+    mode = normalize_search_mode(mode)
+    db_ready = is_ready()
+    if not db_ready and not get_local_vector_index().is_available():
         return []
     try:
-        qvec = embed_texts([query])[0]
+        qvec = embed_query(query)
     except Exception as e:
         LOGGER.error(f"Embedding failed for query: {e}")
         return []
+    if qvec is None:
+        LOGGER.warning("No query embedding available; skipping semantic search")
+        return []
 
-    # Prefer cosine distance operator '<=>'; fallback to L2 '<->' if not available
-    sql_cos = """
-        SELECT id, title, content, category, metadata, (1 - (embedding <=> %s::vector(1536))) AS relevance
-        FROM legal_chunks
-        ORDER BY embedding <=> %s::vector(1536)
-        LIMIT %s;
-    """
-    sql_l2 = """
-        SELECT id, title, content, category, metadata, NULL::float AS relevance
+    # Local memory-mapped tier: always in 'prefer' mode, otherwise only without Postgres
+    if LOCAL_INDEX_MODE == "prefer" or not db_ready:
+        local_results = _local_search(qvec, top_k, filters, min_relevance)
+        if local_results is not None:
+            return local_results
+        if not db_ready:
+            return []
+
+    if IVFPQ_SEARCH and mode != "exact" and not _active_filters(filters):
+        ivfpq_results = _ivfpq_search(qvec, top_k, mode, min_relevance)
+        if ivfpq_results is not None:
+            return ivfpq_results
+
+    storage = get_vector_storage()
+    fmt = storage.current()
+    where = build_filter_clause(filters)
+    use_binary, short_dim, candidates = candidate_pass(fmt, mode, top_k)
+    params: Dict[str, Any] = {"q": qvec, "k": top_k, "candidates": candidates}
+    bounded = min_relevance is not None and min_relevance > 0
+    if bounded:
+        params["max_distance"] = fmt.max_distance(min_relevance)
+    has_filters = bool(_active_filters(filters))
+    filtered = bounded or has_filters
+
+    # Cosine (or inner product on normalized storage); fallback to L2 '<->' if not available
+    sql_cos = build_knn_query(fmt, where, bounded)
+    sql_ann = sql_cos
+    if use_binary or short_dim:
+        sql_ann = build_knn_query(fmt, where, bounded, use_binary=use_binary, short_dim=short_dim)
+    sql_l2 = sql.SQL("""
+        SELECT id, updated_at, NULL::float AS relevance
         FROM legal_chunks
-        ORDER BY embedding <-> %s::vector(1536)
-        LIMIT %s;
-    """
+        WHERE embedding IS NOT NULL{where}
+        ORDER BY embedding <-> {q}
+        LIMIT %(k)s;
+    """).format(where=where, q=fmt.query_vector())
+    extra = storage.candidate_settings(candidates) if candidates > top_k else None
     rows: List[tuple] = []
     try:
-        with _CONN.cursor() as cur:
-            cur.execute(sql_cos, (qvec, qvec, top_k))
-            rows = cur.fetchall()
+        rows = _knn_query(sql_ann, params, top_k, mode, filtered, extra, conn=conn)
+        # A distance bound alone legitimately returns fewer rows: only metadata filters
+        # can starve the ANN scan of candidates. Iterative scans (support is cached by the
+        # query above) already keep scanning until LIMIT is met.
+        if has_filters and len(rows) < top_k and mode != "exact":
+            manager = get_vector_index_manager()
+            widened = None if manager.supports_iterative_scan(conn) else manager.widened_settings(top_k, mode)
+            if widened:
+                wide_rows = _knn_query(sql_cos, params, top_k, mode, filtered, widened, conn=conn)
+                if len(wide_rows) > len(rows):
+                    LOGGER.info(f"Filtered ANN scan returned {len(rows)}/{top_k}; wider scan found {len(wide_rows)}")
+                    rows = wide_rows
     except Exception as e:
         LOGGER.warning(f"Cosine operator failed, falling back to L2: {e}")
         try:
-            with _CONN.cursor() as cur:
-                cur.execute(sql_l2, (qvec, top_k))
-                rows = cur.fetchall()
+            rows = _knn_query(sql_l2, params, top_k, mode, filtered, conn=conn)
         except Exception as e2:
             LOGGER.error(f"Vector search failed: {e2}")
+            local_results = _local_search(qvec, top_k, filters, min_relevance)
+            if local_results is not None:
+                LOGGER.info(f"Served semantic search from the local vector index ({len(local_results)} results)")
+            return local_results or []
+
+    # Phase two: documents from the cache (by id and version), misses in one query on
+    # the caller's connection (inside a pipeline that query costs one more round trip)
+    try:
+        docs = hydrate_documents([(doc_id, version) for doc_id, version, _ in rows], conn=conn)
+    except Exception as e:
+        LOGGER.error(f"Could not hydrate search results: {e}")
+        return []
+    results: List[Dict[str, Any]] = []
+    for doc_id, _, relevance in rows:
+        doc = docs.get(doc_id)
+        if doc is not None:
+            results.append(_search_result(doc, float(relevance) if relevance is not None else 0.0))
+    return results
+
+
+def _knn_query(query: sql.Composable, params: Dict[str, Any], top_k: int, mode: str, filtered: bool,
+               extra: Optional[Dict[str, str]] = None, conn=None) -> List[tuple]:
+    """Run one nearest-neighbour query with its scan settings.
+
+    Scan settings (hnsw.ef_search / ivfflat.probes) are SET LOCAL, so they need a
+    transaction; BEGIN, the settings, the query and COMMIT are pipelined into two
+    round trips (one if the caller's pipeline sends more work after the COMMIT).
+    Without settings the query runs alone in autocommit.
+    """
+    with shared_connection(conn) as conn:
+        settings = get_vector_index_manager().scan_settings(conn, top_k, mode, filtered, extra)
+        if not settings:
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                return cur.fetchall()
+        with pipelined(conn), conn.transaction(), conn.cursor() as cur:
+            set_local(cur, settings)
+            cur.execute(query, params)
+            return cur.fetchall()
+
+
+def _search_result(doc: Dict[str, Any], relevance: float) -> Dict[str, Any]:
+    metadata = doc.get("metadata")
+    return {
+        "id": doc["id"],
+        "title": doc.get("title"),
+        "content": doc.get("content"),
+        "category": doc.get("category"),
+        "keywords": metadata.get("keywords", []) if isinstance(metadata, dict) else [],
+        "relevance": relevance,
+    }
+
+
+def _load_documents(doc_ids: List[str], conn=None) -> List[Dict[str, Any]]:
+    with shared_connection(conn) as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT id, parent_id, title, content, category, metadata, updated_at
+            FROM legal_chunks WHERE id = ANY(%s);
+            """,
+            (doc_ids,),
+        )
+        rows = cur.fetchall()
+    return [
+        {
+            "id": rid,
+            "parent_id": parent_id,
+            "title": title,
+            "content": content,
+            "category": category,
+            "metadata": metadata or {},
+            "updated_at": updated_at,
+        }
+        for rid, parent_id, title, content, category, metadata, updated_at in rows
+    ]
+
+
+def hydrate_documents(keys: List[tuple], conn=None) -> Dict[str, Dict[str, Any]]:
+    """Documents for (id, version) pairs; version None trusts the cached copy.
+
+    Misses are loaded through conn when given (no second pool checkout).
+    Returned dicts are shared with the document cache; copy before modifying.
+    """
+    if not keys:
+        return {}
+    return get_document_cache().get_many(keys, lambda missing: _load_documents(missing, conn))
+
+
+def _local_search(qvec: List[float], top_k: int, filters: Optional[Dict[str, Any]],
+                  min_relevance: Optional[float]) -> Optional[List[Dict[str, Any]]]:
+    """Hits from the local memory-mapped index with documents from the cache.
+
+    Misses are loaded from Postgres only while it is reachable; without it the
+    results are limited to cached documents. None means the local tier cannot answer.
+    """
+    hits = local_semantic_search(qvec, top_k=top_k, filters=filters, min_relevance=min_relevance)
+    if not hits:
+        return hits
+
+    def load_if_ready(missing: List[str]) -> List[Dict[str, Any]]:
+        if not is_ready():
+            return []
+        try:
+            return _load_documents(missing)
+        except Exception as e:
+            LOGGER.warning(f"Could not hydrate local index results: {e}")
             return []
 
+    # No version from the local index: cached copies are kept fresh by NOTIFY
+    docs = get_document_cache().get_many([(doc_id, None) for doc_id, _ in hits], load_if_ready)
+    return [_search_result(docs[doc_id], score) for doc_id, score in hits if doc_id in docs]
+
+
+def _ivfpq_search(qvec: List[float], top_k: int, mode: str,
+                  min_relevance: Optional[float]) -> Optional[List[Dict[str, Any]]]:
+    """ANN over the IVF-PQ index, then documents from the cache or one primary-key lookup.
+
+    Returns None when the index is not built so the caller falls back to pgvector.
+    """
+    index = get_ivfpq_index()
+    if not index.is_loaded():
+        return None
+    nprobe = max(1, IVFPQ_NPROBE // 2) if mode == "fast" else IVFPQ_NPROBE
+    try:
+        hits = index.search(qvec, top_k=top_k, nprobe=nprobe)
+    except Exception as e:
+        LOGGER.warning(f"IVF-PQ search failed, using pgvector: {e}")
+        return None
+    if min_relevance is not None and min_relevance > 0:
+        hits = [(doc_id, score) for doc_id, score in hits if score >= min_relevance]
+    if not hits:
+        return []
+    try:
+        # No version from the IVF-PQ index: cached copies are kept fresh by NOTIFY
+        docs = hydrate_documents([(doc_id, None) for doc_id, _ in hits])
+    except Exception as e:
+        LOGGER.warning(f"Could not hydrate IVF-PQ results: {e}")
+        return None
+    results: List[Dict[str, Any]] = []
+    for doc_id, score in hits:
+        doc = docs.get(doc_id)
+        if doc is None:  # deleted since the index was built
+            continue
+        results.append(_search_result(doc, score))
+    return results
+
+
+def keyword_search(query: str, top_k: int = 10, filters: Optional[Dict[str, Any]] = None,
+                   conn=None) -> List[Dict[str, Any]]:
+    """Full-text search over the GIN-indexed search_tsv column, ranked with ts_rank_cd.
+
+    Query terms are OR-ed so a chunk matching only some of them is still returned
+    (ranked lower); relevance is ts_rank_cd normalized into [0, 1).
+    """
+    if not is_ready() or not query or not query.strip():
+        return []
+    fts_sql = sql.SQL("""
+        WITH q AS (
+            SELECT replace(plainto_tsquery({config}, %(query)s)::text, '&', '|')::tsquery AS query
+        )
+        SELECT id, title, content, category, metadata,
+               ts_rank_cd(search_tsv, q.query, 32) AS rank
+        FROM legal_chunks, q
+        WHERE search_tsv @@ q.query{where}
+        ORDER BY rank DESC
+        LIMIT %(k)s;
+    """).format(config=sql.Literal(TS_CONFIG), where=build_filter_clause(filters))
+    try:
+        with shared_connection(conn) as conn, conn.cursor() as cur:
+            cur.execute(fts_sql, {"query": query, "k": top_k})
+            rows = cur.fetchall()
+    except Exception as e:
+        LOGGER.error(f"Full-text search failed: {e}")
+        return []
+
     results: List[Dict[str, Any]] = []
-    for row in rows:
-        doc_id, title, content, category, metadata, relevance = row
+    for doc_id, title, content, category, metadata, rank in rows:
+        metadata = metadata if isinstance(metadata, dict) else {}
         results.append({
             "id": doc_id,
             "title": title,
             "content": content,
             "category": category,
-            "keywords": (metadata or {}).get("keywords", []) if isinstance(metadata, dict) else [],
-            "relevance": float(relevance) if relevance is not None else 0.0,
+            "keywords": metadata.get("keywords", []),
+            "source": metadata.get("source", "Unknown"),
+            "relevance": float(rank or 0.0),
         })
     return results
 
 
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], k: int = RRF_K) -> List[Dict[str, Any]]:
+    """Merge ranked result lists by summing 1 / (k + rank) per document id"""
+    fused: Dict[Any, Dict[str, Any]] = {}
+    for results in result_lists:
+        for rank, item in enumerate(results, start=1):
+            entry = fused.get(item["id"])
+            if entry is None:
+                entry = fused[item["id"]] = {**item, "rrf_score": 0.0}
+            entry["rrf_score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda it: it["rrf_score"], reverse=True)
+
+
+def hybrid_search(query: str, top_k: int = 3, mode: str = DEFAULT_SEARCH_MODE,
+                  filters: Optional[Dict[str, Any]] = None,
+                  min_relevance: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Vector + full-text retrieval merged with reciprocal rank fusion.
+
+    Each result keeps the relevance of the retriever that found it (cosine similarity
+    when the vector leg returned it) and gains rrf_score plus semantic_rank/keyword_rank.
+    Filters apply to both legs; min_relevance bounds the vector leg only.
+    """
+    candidates = max(top_k, HYBRID_CANDIDATES)
+    # Embed first (semantic_search then hits the in-memory cache), so the connection
+    # below is not held during the embeddings API call
+    try:
+        embed_query(query)
+    except Exception as e:
+        LOGGER.warning(f"Query embedding failed: {e}")
+    # One checkout in pipeline mode for both legs: the keyword query goes out with the
+    # vector leg's COMMIT, so the two legs cost two round trips in total
+    with optional_connection() as conn, pipelined(conn):
+        vector_hits = semantic_search(query, top_k=candidates, mode=mode, filters=filters,
+                                      min_relevance=min_relevance, conn=conn)
+        keyword_hits = keyword_search(query, top_k=candidates, filters=filters, conn=conn)
+
+    vector_rank = {it["id"]: i for i, it in enumerate(vector_hits, start=1)}
+    keyword_rank = {it["id"]: i for i, it in enumerate(keyword_hits, start=1)}
+    fused = reciprocal_rank_fusion([vector_hits, keyword_hits])[:top_k]
+    for item in fused:
+        item["semantic_rank"] = vector_rank.get(item["id"])
+        item["keyword_rank"] = keyword_rank.get(item["id"])
+    return fused
+
+
 def upsert_kb_from_list(items: List[Dict[str, Any]]) -> int:
     """Insert or ignore (by deterministic id) knowledge items.
 
     - Computes a deterministic UUIDv5 from title|category|content when id is not provided
-    - Embeds content in batch and inserts with ON CONFLICT DO NOTHING
+    - Embeds content in token-budgeted concurrent batches and inserts with ON CONFLICT DO NOTHING
+    - Chunks whose embedding fails are stored with a NULL vector and queued for backfill
     - Returns number of attempted inserts (may be > actual new rows if conflicts)
     """
     if not is_ready() or not items:
         return 0
     texts = [it.get("content", "") for it in items]
     try:
-        vectors = embed_texts(texts)
+        vectors = embed_texts_bulk(texts)
     except Exception as e:
         LOGGER.error(f"Embedding failed during upsert: {e}")
         return 0
 
     inserted = 0
+    deferred: List[str] = []
+    upserted: List[str] = []
     try:
-        with _CONN.cursor() as cur:
+        with connection() as conn, conn.cursor() as cur:
             for it, vec in zip(items, vectors):
                 base = f"{it.get('title','')}|{it.get('category','')}|{it.get('content','')}"
                 doc_id = it.get("id") or str(uuid.uuid5(uuid.NAMESPACE_URL, base))
+                upserted.append(doc_id)
+                if vec is None:
+                    deferred.append(doc_id)
                 # Merge provided metadata with keywords under a single JSON
                 md = it.get("metadata", {}) or {}
                 if not isinstance(md, dict):
@@ -294,38 +686,22 @@ def upsert_kb_from_list(items: List[Dict[str, Any]]) -> int:
                     ),
                 )
                 inserted += 1
+            notify_changed(cur, upserted)
         LOGGER.info(f"Upsert attempted for {inserted} chunks (conflicts ignored)")
     except Exception as e:
         LOGGER.error(f"Failed to upsert legal_chunks: {e}")
         return 0
+    enqueue_backfill(deferred, reason="embedding failed during upsert")
+    get_vector_index_manager().maybe_maintain()
     return inserted
 
 
 def get_doc_by_id(doc_id: str) -> Optional[Dict[str, Any]]:
-    """Fetch a single document from legal_chunks by id."""
+    """Fetch a single document from legal_chunks by id (through the document cache)."""
     if not is_ready() or not doc_id:
         return None
     try:
-        with _CONN.cursor() as cur:
-            cur.execute(
-                """
-                SELECT id, parent_id, title, content, category, metadata
-                FROM legal_chunks WHERE id = %s
-                """,
-                (doc_id,),
-            )
-            row = cur.fetchone()
-            if not row:
-                return None
-            rid, parent_id, title, content, category, metadata = row
-            return {
-                "id": rid,
-                "parent_id": parent_id,
-                "title": title,
-                "content": content,
-                "category": category,
-                "metadata": metadata or {},
-            }
+        return hydrate_documents([(doc_id, None)]).get(doc_id)
     except Exception as e:
         LOGGER.error(f"Failed to fetch doc by id: {e}")
         return None
@@ -334,48 +710,33 @@ def get_doc_by_id(doc_id: str) -> Optional[Dict[str, Any]]:
 def log_search(query: str, top_k: int, min_relevance: float, search_type: str, result_ids: List[str], 
                user_id: str = None, session_id: str = None, response_time_ms: int = None, 
                category: str = None, success: bool = True) -> None:
+    """Queue a search_logs row (written in batches by the log writer)"""
+    record_query(query)
     if not is_ready():
         return
-    try:
-        with _CONN.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO search_logs (query, top_k, min_relevance, search_type, total, result_ids, 
-                                       user_id, session_id, response_time_ms, category, success)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
-                """,
-                (query, top_k, float(min_relevance), search_type, len(result_ids), Json(result_ids),
-                 user_id, session_id, response_time_ms, category, success),
-            )
-            # Update query analytics
-            _update_query_analytics(query, response_time_ms, success, category)
-    except Exception as e:
-        LOGGER.warning(f"Failed to log search: {e}")
+    submit_log("search_logs", query=query, top_k=top_k, min_relevance=float(min_relevance),
+               search_type=search_type, total=len(result_ids), result_ids=result_ids,
+               user_id=user_id, session_id=session_id, response_time_ms=response_time_ms,
+               category=category, success=success)
+    # Update query analytics
+    _update_query_analytics(query, response_time_ms, success, category)
 
 
 def log_ask(question: str, top_k: int, min_relevance: float, result_ids: List[str],
             user_id: str = None, session_id: str = None, response_time_ms: int = None,
             llm_model: str = None, llm_tokens_used: int = None, llm_cost: float = None,
             category: str = None, success: bool = True, error_message: str = None) -> None:
+    """Queue an ask_logs row (written in batches by the log writer)"""
+    record_query(question)
     if not is_ready():
         return
-    try:
-        with _CONN.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO ask_logs (question, top_k, min_relevance, total_sources, result_ids,
-                                    user_id, session_id, response_time_ms, llm_model, llm_tokens_used,
-                                    llm_cost, category, success, error_message)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
-                """,
-                (question, top_k, float(min_relevance), len(result_ids), Json(result_ids),
-                 user_id, session_id, response_time_ms, llm_model, llm_tokens_used,
-                 llm_cost, category, success, error_message),
-            )
-            # Update query analytics  
-            _update_query_analytics(question, response_time_ms, success, category)
-    except Exception as e:
-        LOGGER.warning(f"Failed to log ask: {e}")
+    submit_log("ask_logs", question=question, top_k=top_k, min_relevance=float(min_relevance),
+               total_sources=len(result_ids), result_ids=result_ids, user_id=user_id,
+               session_id=session_id, response_time_ms=response_time_ms, llm_model=llm_model,
+               llm_tokens_used=llm_tokens_used, llm_cost=llm_cost, category=category,
+               success=success, error_message=error_message)
+    # Update query analytics  
+    _update_query_analytics(question, response_time_ms, success, category)
 
 
 # ============================
@@ -399,7 +760,7 @@ def admin_db_overview() -> Dict[str, Any]:
     # If we have a database connection, enhance with additional information
     if is_ready() and db_overview.get("status") == "success":
         try:
-            with _CONN.cursor() as cur:
+            with connection() as conn, conn.cursor() as cur:
                 # Categories
                 cur.execute("SELECT COALESCE(category,'nd') AS category, COUNT(*) FROM legal_chunks GROUP BY 1 ORDER BY 2 DESC LIMIT 50;")
                 overview["categories"] = [{"category": r[0], "count": int(r[1])} for r in cur.fetchall()]
@@ -440,7 +801,7 @@ def admin_list_legal_chunks(q: Optional[str] = None, category: Optional[str] = N
         return result
     q = (q or "").strip()
     try:
-        with _CONN.cursor() as cur:
+        with connection() as conn, conn.cursor() as cur:
             # Build WHERE clause
             where = []
             params: List[Any] = []
@@ -477,7 +838,7 @@ def admin_list_search_logs(limit: int = 50, offset: int = 0) -> Dict[str, Any]:
     if not is_ready():
         return out
     try:
-        with _CONN.cursor() as cur:
+        with connection() as conn, conn.cursor() as cur:
             cur.execute("SELECT COUNT(*) FROM search_logs;")
             out["total"] = int(cur.fetchone()[0])
             cur.execute(
@@ -512,7 +873,7 @@ def get_db_status() -> Dict[str, Any]:
         return status
     
     try:
-        with _CONN.cursor() as cur:
+        with connection() as conn, conn.cursor() as cur:
             # Get PostgreSQL version
             cur.execute("SELECT version();")
             version_info = cur.fetchone()
@@ -551,7 +912,7 @@ def admin_list_ask_logs(limit: int = 50, offset: int = 0) -> Dict[str, Any]:
     if not is_ready():
         return out
     try:
-        with _CONN.cursor() as cur:
+        with connection() as conn, conn.cursor() as cur:
             cur.execute("SELECT COUNT(*) FROM ask_logs;")
             out["total"] = int(cur.fetchone()[0])
             cur.execute(
@@ -575,18 +936,31 @@ def admin_list_ask_logs(limit: int = 50, offset: int = 0) -> Dict[str, Any]:
 
 def update_legal_chunk(doc_id: str, title: Optional[str] = None, content: Optional[str] = None,
                        category: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None) -> bool:
-    """Update a legal chunk fields. If content changes, refresh embedding."""
+    """Update a legal chunk fields. If content changes, refresh embedding.
+
+    Content identical to what is stored (after whitespace normalization) keeps the
+    existing embedding; changed content is resolved through the embedding store.
+    The comparison uses the row read FOR UPDATE in the same transaction as the
+    UPDATE; the document cache only decides whether to embed before locking it.
+    """
     if not is_ready() or not doc_id:
         return False
+
+    def _embed(text: str) -> Optional[List[float]]:
+        try:
+            return embed_texts_bulk([text])[0]
+        except Exception as e:
+            LOGGER.warning(f"Embedding failed during update_legal_chunk: {e}")
+            return None
+
     try:
         new_vec = None
+        embedded = False
         if content is not None:
-            # create single embedding for content
-            try:
-                new_vec = embed_texts([content])[0]
-            except Exception as e:
-                LOGGER.warning(f"Embedding failed during update_legal_chunk: {e}")
-                new_vec = [0.0] * EMBED_DIM
+            # Embed outside the row lock when the (possibly stale) cached copy differs
+            cached = get_doc_by_id(doc_id)
+            if cached is None or content_hash(cached.get("content") or "") != content_hash(content):
+                new_vec, embedded = _embed(content), True
         sets = []
         params: List[Any] = []
         if title is not None:
@@ -601,14 +975,27 @@ def update_legal_chunk(doc_id: str, title: Optional[str] = None, content: Option
         if metadata is not None:
             sets.append("metadata = %s")
             params.append(Json(metadata))
-        if new_vec is not None:
-            sets.append("embedding = %s")
-            params.append(new_vec)
         if not sets:
             return True  # nothing to update
-        params.append(doc_id)
-        with _CONN.cursor() as cur:
+        reembed = False
+        with connection() as conn, conn.cursor() as cur:
+            if content is not None:
+                cur.execute("SELECT content FROM legal_chunks WHERE id = %s FOR UPDATE;", (doc_id,))
+                row = cur.fetchone()
+                reembed = row is None or content_hash(row[0] or "") != content_hash(content)
+                if reembed and not embedded:
+                    # The cache missed a concurrent change; embed under the lock (rare)
+                    new_vec = _embed(content)
+            if reembed:
+                # NULL (not a zero vector) when embedding failed; the backfill worker retries it
+                sets.append("embedding = %s")
+                params.append(new_vec)
+            sets.append("updated_at = now()")
+            params.append(doc_id)
             cur.execute(f"UPDATE legal_chunks SET {', '.join(sets)} WHERE id = %s;", params)
+            notify_changed(cur, [doc_id])
+        if reembed and new_vec is None:
+            enqueue_backfill([doc_id], reason="embedding failed during update")
         return True
     except Exception as e:
         LOGGER.warning(f"update_legal_chunk failed: {e}")
@@ -619,8 +1006,9 @@ def delete_legal_chunk(doc_id: str) -> bool:
     if not is_ready() or not doc_id:
         return False
     try:
-        with _CONN.cursor() as cur:
+        with connection() as conn, conn.cursor() as cur:
             cur.execute("DELETE FROM legal_chunks WHERE id = %s;", (doc_id,))
+            notify_changed(cur, [doc_id])
         return True
     except Exception as e:
         LOGGER.warning(f"delete_legal_chunk failed: {e}")
@@ -633,43 +1021,10 @@ def delete_legal_chunk(doc_id: str) -> bool:
 
 def _update_query_analytics(query: str, response_time_ms: int = None, success: bool = True, 
                            category: str = None) -> None:
-    """Update aggregated query analytics"""
+    """Update aggregated query analytics (queued; merged per query at write time)"""
     if not query or not is_ready():
         return
-    
-    # Normalize query for analytics
-    normalized = query.lower().strip()
-    
-    try:
-        with _CONN.cursor() as cur:
-            # Use UPSERT to update or insert query analytics
-            cur.execute(
-                """
-                INSERT INTO query_analytics (query_normalized, total_count, last_queried, 
-                                           avg_response_time_ms, success_rate, categories)
-                VALUES (%s, 1, now(), %s, %s, %s)
-                ON CONFLICT (query_normalized) DO UPDATE SET
-                    total_count = query_analytics.total_count + 1,
-                    last_queried = now(),
-                    avg_response_time_ms = CASE 
-                        WHEN %s IS NOT NULL THEN 
-                            (COALESCE(query_analytics.avg_response_time_ms, 0) * query_analytics.total_count + %s) / (query_analytics.total_count + 1)
-                        ELSE query_analytics.avg_response_time_ms
-                    END,
-                    success_rate = (query_analytics.success_rate * query_analytics.total_count + %s) / (query_analytics.total_count + 1),
-                    categories = CASE 
-                        WHEN %s IS NOT NULL THEN 
-                            COALESCE(query_analytics.categories, '{}') || jsonb_build_object(%s, 1)
-                        ELSE query_analytics.categories
-                    END,
-                    updated_at = now()
-                """,
-                (normalized, response_time_ms, 100.0 if success else 0.0, Json({category: 1} if category else {}),
-                 response_time_ms, response_time_ms, 100.0 if success else 0.0, 
-                 category, category)
-            )
-    except Exception as e:
-        LOGGER.warning(f"Failed to update query analytics: {e}")
+    submit_query_analytics(query, response_time_ms, success, category)
 
 
 def log_api_usage(endpoint: str, method: str, status_code: int, response_time_ms: int,
@@ -679,20 +1034,10 @@ def log_api_usage(endpoint: str, method: str, status_code: int, response_time_ms
     """Log API usage for analytics"""
     if not is_ready():
         return
-    try:
-        with _CONN.cursor() as cur:
-            cur.execute(
-                """
-                INSERT INTO api_usage_logs (endpoint, method, status_code, response_time_ms,
-                                          user_id, session_id, ip_address, user_agent,
-                                          request_size_bytes, response_size_bytes, error_message)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
-                """,
-                (endpoint, method, status_code, response_time_ms, user_id, session_id,
-                 ip_address, user_agent, request_size, response_size, error_message)
-            )
-    except Exception as e:
-        LOGGER.warning(f"Failed to log API usage: {e}")
+    submit_log("api_usage_logs", endpoint=endpoint, method=method, status_code=status_code,
+               response_time_ms=response_time_ms, user_id=user_id, session_id=session_id,
+               ip_address=ip_address, user_agent=user_agent, request_size_bytes=request_size,
+               response_size_bytes=response_size, error_message=error_message)
 
 
 def record_system_metric(metric_type: str, metric_name: str, value: float, unit: str = None,
@@ -701,7 +1046,7 @@ def record_system_metric(metric_type: str, metric_name: str, value: float, unit:
     if not is_ready():
         return
     try:
-        with _CONN.cursor() as cur:
+        with connection() as conn, conn.cursor() as cur:
             cur.execute(
                 """
                 INSERT INTO system_metrics (metric_type, metric_name, value, unit, metadata)
@@ -714,188 +1059,34 @@ def record_system_metric(metric_type: str, metric_name: str, value: float, unit:
 
 
 def get_popular_queries(limit: int = 10, days: int = 7) -> List[Dict[str, Any]]:
-    """Get most popular queries from actual search and ask logs in the last N days"""
+    """Get most popular queries of the last N days (from the daily query rollup)"""
     if not is_ready():
         return []
     try:
-        with _CONN.cursor() as cur:
-            cur.execute(
-                """
-                WITH combined_queries AS (
-                    SELECT 
-                        query as search_term,
-                        created_at,
-                        response_time_ms,
-                        success,
-                        'search' as query_type
-                    FROM search_logs 
-                    WHERE created_at > now() - interval '%s days'
-                    AND query IS NOT NULL
-                    AND length(trim(query)) > 0
-                    
-                    UNION ALL
-                    
-                    SELECT 
-                        question as search_term,
-                        created_at,
-                        response_time_ms,
-                        success,
-                        'ask' as query_type
-                    FROM ask_logs 
-                    WHERE created_at > now() - interval '%s days'
-                    AND question IS NOT NULL
-                    AND length(trim(question)) > 0
-                )
-                SELECT 
-                    search_term,
-                    COUNT(*) as total_count,
-                    AVG(response_time_ms) as avg_response_time,
-                    AVG(CASE WHEN success THEN 100.0 ELSE 0.0 END) as success_rate,
-                    MAX(created_at) as last_queried,
-                    string_agg(DISTINCT query_type, ', ') as query_types
-                FROM combined_queries
-                GROUP BY search_term
-                HAVING COUNT(*) >= 1
-                ORDER BY total_count DESC, last_queried DESC
-                LIMIT %s;
-                """,
-                (days, days, limit)
-            )
-            
-            results = []
-            for row in cur.fetchall():
-                search_term = row[0]
-                # Clean up the search term
-                if search_term and len(search_term.strip()) > 2:
-                    results.append({
-                        "query": search_term.strip(),
-                        "count": int(row[1]),
-                        "avg_response_time": float(row[2]) if row[2] else 0,
-                        "success_rate": float(row[3]) if row[3] else 100,
-                        "last_queried": str(row[4]),
-                        "query_types": row[5] or "search"
-                    })
-            
-            return results
-            
+        return [{k: v for k, v in q.items() if k != "avg_context_found"}
+                for q in analytics_rollup.get_top_queries(limit=limit, days=days)]
     except Exception as e:
         LOGGER.warning(f"Failed to get popular queries: {e}")
         return []
 
 
 def get_analytics_overview(days: int = 7) -> Dict[str, Any]:
-    """Get comprehensive analytics overview"""
+    """Get comprehensive analytics overview (from the analytics rollups)"""
     if not is_ready():
         return {}
-    
     try:
-        with _CONN.cursor() as cur:
-            # Total queries
-            cur.execute(
-                "SELECT COUNT(*) FROM search_logs WHERE created_at > now() - interval '%s days';",
-                (days,)
-            )
-            total_searches = int(cur.fetchone()[0])
-            
-            cur.execute(
-                "SELECT COUNT(*) FROM ask_logs WHERE created_at > now() - interval '%s days';",
-                (days,)
-            )
-            total_asks = int(cur.fetchone()[0])
-            
-            # Average response times
-            cur.execute(
-                "SELECT AVG(response_time_ms) FROM search_logs WHERE created_at > now() - interval '%s days' AND response_time_ms IS NOT NULL;",
-                (days,)
-            )
-            avg_search_time = float(cur.fetchone()[0] or 0)
-            
-            cur.execute(
-                "SELECT AVG(response_time_ms) FROM ask_logs WHERE created_at > now() - interval '%s days' AND response_time_ms IS NOT NULL;",
-                (days,)
-            )
-            avg_ask_time = float(cur.fetchone()[0] or 0)
-            
-            # Success rates
-            cur.execute(
-                "SELECT COUNT(*) FILTER (WHERE success = true) * 100.0 / COUNT(*) FROM search_logs WHERE created_at > now() - interval '%s days';",
-                (days,)
-            )
-            search_success_rate = float(cur.fetchone()[0] or 100)
-            
-            cur.execute(
-                "SELECT COUNT(*) FILTER (WHERE success = true) * 100.0 / COUNT(*) FROM ask_logs WHERE created_at > now() - interval '%s days';",
-                (days,)
-            )
-            ask_success_rate = float(cur.fetchone()[0] or 100)
-            
-            # Unique users
-            cur.execute(
-                "SELECT COUNT(DISTINCT session_id) FROM search_logs WHERE created_at > now() - interval '%s days' AND session_id IS NOT NULL;",
-                (days,)
-            )
-            unique_sessions = int(cur.fetchone()[0])
-            
-            # Top categories
-            cur.execute(
-                "SELECT category, COUNT(*) FROM search_logs WHERE created_at > now() - interval '%s days' AND category IS NOT NULL GROUP BY category ORDER BY COUNT(*) DESC LIMIT 5;",
-                (days,)
-            )
-            top_categories = [{"category": row[0], "count": int(row[1])} for row in cur.fetchall()]
-            
-            return {
-                "total_queries": total_searches + total_asks,
-                "total_searches": total_searches,
-                "total_asks": total_asks,
-                "avg_response_time": (avg_search_time + avg_ask_time) / 2 if avg_search_time or avg_ask_time else 0,
-                "avg_search_time": avg_search_time,
-                "avg_ask_time": avg_ask_time,
-                "success_rate": (search_success_rate + ask_success_rate) / 2,
-                "search_success_rate": search_success_rate,
-                "ask_success_rate": ask_success_rate,
-                "unique_sessions": unique_sessions,
-                "top_categories": top_categories,
-                "period_days": days
-            }
+        return analytics_rollup.get_overview(days)
     except Exception as e:
         LOGGER.warning(f"Failed to get analytics overview: {e}")
         return {}
 
 
 def get_query_trends(hours: int = 24) -> List[Dict[str, Any]]:
-    """Get query volume trends by hour"""
+    """Get query volume trends by hour (from the hourly rollup)"""
     if not is_ready():
         return []
     try:
-        with _CONN.cursor() as cur:
-            cur.execute(
-                """
-                SELECT 
-                    date_trunc('hour', created_at) as hour,
-                    COUNT(*) as total_queries,
-                    COUNT(*) as successful_queries,
-                    0 as avg_response_time
-                FROM (
-                    SELECT created_at FROM search_logs 
-                    WHERE created_at > now() - interval '%s hours'
-                    UNION ALL
-                    SELECT created_at FROM ask_logs
-                    WHERE created_at > now() - interval '%s hours'
-                ) combined
-                GROUP BY hour
-                ORDER BY hour;
-                """,
-                (hours, hours)
-            )
-            return [
-                {
-                    "hour": str(row[0]),
-                    "total_queries": int(row[1]),
-                    "successful_queries": int(row[2]),
-                    "avg_response_time": float(row[3]) if row[3] else 0
-                }
-                for row in cur.fetchall()
-            ]
+        return analytics_rollup.get_query_trends(hours)
     except Exception as e:
         LOGGER.warning(f"Failed to get query trends: {e}")
         return []
@@ -6,6 +6,11 @@ from datetime import datetime, timedelta
 import psycopg
 from psycopg.types.json import Json
 
+from db_utils import is_ready as db_is_ready
+from log_writer import submit_log
+from heavy_hitters import record_query
+from analytics_rollup import get_usage_summary, get_dimension_counts
+
 LOGGER = logging.getLogger(__name__)
 
 def log_ask_advanced(question: str, answer: str, top_k: int, min_relevance: float, 
@@ -16,44 +21,29 @@ def log_ask_advanced(question: str, answer: str, top_k: int, min_relevance: floa
                     input_tokens: int = 0, output_tokens: int = 0, finish_reason: str = None,
                     system_fingerprint: str = None, response_id: str = None, 
                     created_timestamp: int = None, logprobs: str = None, conn=None) -> bool:
-    """Enhanced ask logging with comprehensive OpenAI analytics"""
-    if not conn:
-        return False
-    try:
-        with conn.cursor() as cur:
-            # First ensure all columns exist
-            try:
-                cur.execute("""
-                    ALTER TABLE ask_logs ADD COLUMN IF NOT EXISTS response_id VARCHAR(255);
-                    ALTER TABLE ask_logs ADD COLUMN IF NOT EXISTS created_timestamp INTEGER;
-                    ALTER TABLE ask_logs ADD COLUMN IF NOT EXISTS logprobs TEXT;
-                """)
-            except Exception as schema_e:
-                LOGGER.warning(f"Schema update failed (may already exist): {schema_e}")
-            
-            # Insert into ask_logs with comprehensive OpenAI analytics
-            cur.execute("""
-                INSERT INTO ask_logs (
-                    question, answer, top_k, min_relevance, result_ids, search_type, 
-                    success, session_id, user_id, response_time_ms, llm_model, 
-                    llm_tokens_used, llm_cost, user_agent, ip_address, context_found,
-                    input_tokens, output_tokens, finish_reason, system_fingerprint,
-                    response_id, created_timestamp, logprobs
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                question, answer, top_k, min_relevance, Json(result_ids), search_type,
-                success, session_id, user_id, response_time_ms, llm_model,
-                llm_tokens_used, llm_cost, user_agent, ip_address, context_found,
-                input_tokens, output_tokens, finish_reason, system_fingerprint,
-                response_id, created_timestamp, logprobs
-            ))
-        conn.commit()
-        
-        LOGGER.info(f"✅ Advanced ask logged: question={question[:50]}..., tokens={llm_tokens_used}, cost=${llm_cost:.4f}, model={llm_model}")
-        return True
-    except Exception as e:
-        LOGGER.error(f"Failed to log advanced ask: {e}")
+    """Enhanced ask logging with comprehensive OpenAI analytics.
+    
+    The row is queued for the background log writer (conn is accepted for older
+    callers and ignored). Returns False if there is no database or the queue is full.
+    """
+    record_query(question)
+    if not db_is_ready():
         return False
+    queued = submit_log(
+        "ask_logs",
+        question=question, answer=answer, top_k=top_k, min_relevance=min_relevance,
+        total_sources=len(result_ids), result_ids=result_ids, search_type=search_type,
+        success=success, session_id=session_id, user_id=user_id,
+        response_time_ms=response_time_ms, llm_model=llm_model,
+        llm_tokens_used=llm_tokens_used, llm_cost=llm_cost, user_agent=user_agent,
+        ip_address=ip_address, context_found=context_found, input_tokens=input_tokens,
+        output_tokens=output_tokens, finish_reason=finish_reason,
+        system_fingerprint=system_fingerprint, response_id=response_id,
+        created_timestamp=created_timestamp, logprobs=logprobs
+    )
+    if queued:
+        LOGGER.debug(f"Advanced ask queued: question={question[:50]}..., tokens={llm_tokens_used}, cost=${llm_cost:.4f}, model={llm_model}")
+    return queued
 
 
 def log_search_advanced(query: str, top_k: int, min_relevance: float, 
@@ -61,95 +51,43 @@ def log_search_advanced(query: str, top_k: int, min_relevance: float,
                        session_id: str = None, user_id: str = None, response_time_ms: int = 0,
                        user_agent: str = None, ip_address: str = None, context_found: int = 0,
                        conn=None) -> bool:
-    """Enhanced search logging with comprehensive analytics"""
-    if not conn:
-        return False
-    try:
-        with conn.cursor() as cur:
-            # Insert into search_logs with all new fields  
-            cur.execute("""
-                INSERT INTO search_logs (
-                    query, top_k, min_relevance, result_ids, search_type,
-                    success, session_id, user_id, response_time_ms,
-                    user_agent, ip_address, context_found
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                query, top_k, min_relevance, Json(result_ids), search_type,
-                success, session_id, user_id, response_time_ms,
-                user_agent, ip_address, context_found
-            ))
-        conn.commit()
-        
-        LOGGER.info(f"✅ Advanced search logged: query={query[:50]}..., results={context_found}")
-        return True
-    except Exception as e:
-        LOGGER.error(f"Failed to log advanced search: {e}")
+    """Enhanced search logging with comprehensive analytics (queued, see log_ask_advanced)"""
+    record_query(query)
+    if not db_is_ready():
         return False
+    queued = submit_log(
+        "search_logs",
+        query=query, top_k=top_k, min_relevance=min_relevance, search_type=search_type,
+        total=len(result_ids), result_ids=result_ids, success=success,
+        session_id=session_id, user_id=user_id, response_time_ms=response_time_ms,
+        user_agent=user_agent, ip_address=ip_address, context_found=context_found
+    )
+    if queued:
+        LOGGER.debug(f"Advanced search queued: query={query[:50]}..., results={context_found}")
+    return queued
 
 
 def get_rag_performance_metrics(days: int = 7, conn=None) -> Dict[str, Any]:
-    """Get comprehensive RAG performance metrics"""
+    """Get comprehensive RAG performance metrics (totals from the analytics rollups;
+    conn is used for the failure patterns, which come from the raw ask_logs)"""
     if not conn:
         return {}
     
     try:
-        # First ensure the necessary columns exist
-        with conn.cursor() as cur:
-            try:
-                # Add error_message column to ask_logs if it doesn't exist
-                cur.execute("""
-                    ALTER TABLE ask_logs ADD COLUMN IF NOT EXISTS error_message TEXT;
-                """)
-                conn.commit()
-                LOGGER.info("✅ Added error_message column to ask_logs table")
-            except Exception as schema_e:
-                LOGGER.warning(f"Schema update failed: {schema_e}")
-        
+        by_type = {row["search_type"]: row for row in get_dimension_counts("search_type", kind="search", days=days)}
+        search = get_usage_summary("search", days)
+        ask = get_usage_summary("ask", days)
+        semantic = by_type.get("semantic", {})
+        keyword = by_type.get("keyword", {})
+        search_metrics = (search["requests"], semantic.get("count", 0), keyword.get("count", 0),
+                          semantic.get("avg_response_time"), keyword.get("avg_response_time"),
+                          search["avg_context_found"])
+        llm_metrics = (ask["llm_calls"], ask["tokens"], ask["cost"], ask["avg_tokens_per_call"],
+                       ask["avg_cost_per_call"], ask["avg_response_time_ms"], len(ask["models_used"]),
+                       ask["success_rate"] if ask["requests"] else None)
+        context_metrics = (ask["avg_context_found"], ask["no_context_rate"], ask["good_context_rate"])
+
         with conn.cursor() as cur:
-            # Vector search performance
-            cur.execute("""
-                SELECT 
-                    COUNT(*) as total_vector_searches,
-                    COUNT(*) FILTER (WHERE search_type = 'semantic') as semantic_searches,
-                    COUNT(*) FILTER (WHERE search_type = 'keyword') as keyword_searches,
-                    AVG(response_time_ms) FILTER (WHERE search_type = 'semantic') as avg_semantic_time,
-                    AVG(response_time_ms) FILTER (WHERE search_type = 'keyword') as avg_keyword_time,
-                    AVG(context_found) as avg_context_found
-                FROM search_logs 
-                WHERE created_at > now() - interval '%s days'
-            """, (days,))
-            
-            search_metrics = cur.fetchone()
-            
-            # LLM performance 
-            cur.execute("""
-                SELECT 
-                    COUNT(*) as total_llm_calls,
-                    SUM(llm_tokens_used) as total_tokens,
-                    SUM(llm_cost) as total_cost,
-                    AVG(llm_tokens_used) as avg_tokens_per_request,
-                    AVG(llm_cost) as avg_cost_per_request,
-                    AVG(response_time_ms) as avg_llm_response_time,
-                    COUNT(DISTINCT llm_model) as models_used,
-                    COUNT(*) FILTER (WHERE success = true) * 100.0 / COUNT(*) as success_rate
-                FROM ask_logs 
-                WHERE created_at > now() - interval '%s days' AND llm_tokens_used > 0
-            """, (days,))
-            
-            llm_metrics = cur.fetchone()
-            
-            # Context quality metrics
-            cur.execute("""
-                SELECT 
-                    AVG(context_found) as avg_documents_retrieved,
-                    COUNT(*) FILTER (WHERE context_found = 0) * 100.0 / COUNT(*) as no_context_rate,
-                    COUNT(*) FILTER (WHERE context_found >= 3) * 100.0 / COUNT(*) as good_context_rate
-                FROM ask_logs 
-                WHERE created_at > now() - interval '%s days'
-            """, (days,))
-            
-            context_metrics = cur.fetchone()
-            
             # Popular failure patterns - handle case where error_message column might not exist yet
             try:
                 cur.execute("""
@@ -279,23 +217,7 @@ def log_api_usage(api_name: str, endpoint: str, success: bool, response_time_ms:
     
     try:
         with conn.cursor() as cur:
-            # Create api_usage_logs table if it doesn't exist
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS api_usage_logs (
-                    id SERIAL PRIMARY KEY,
-                    api_name VARCHAR(100) NOT NULL,
-                    endpoint VARCHAR(255),
-                    success BOOLEAN NOT NULL DEFAULT true,
-                    response_time_ms INTEGER,
-                    cost DECIMAL(10,6) DEFAULT 0.0,
-                    error_message TEXT,
-                    request_data JSONB,
-                    response_data JSONB,
-                    created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
-                );
-            """)
-            
-            # Insert the log entry
+            # Columns added by migration 0003 (see migrations.py)
             cur.execute("""
                 INSERT INTO api_usage_logs (
                     api_name, endpoint, success, response_time_ms, cost,
@@ -370,14 +292,30 @@ def get_vector_database_health(conn=None) -> Dict[str, Any]:
                 embedded_docs = 0
                 missing_embeddings = 0
             
+            try:
+                from embedding_backfill import get_backfill_queue_status
+                backfill_queue = get_backfill_queue_status(conn=conn)
+            except Exception as queue_e:
+                LOGGER.warning(f"Could not read embedding backfill queue: {queue_e}")
+                backfill_queue = {}
+            
+            try:
+                from vector_index import get_vector_index_manager
+                ann_index = get_vector_index_manager().get_status(conn=conn)
+            except Exception as index_e:
+                LOGGER.warning(f"Could not read vector index status: {index_e}")
+                ann_index = {}
+            
             return {
                 "vector_indexes": vector_indexes,
+                "ann_index": ann_index,
                 "table_sizes": table_sizes,
                 "embedding_status": {
                     "embedded_documents": embedded_docs,
                     "missing_embeddings": missing_embeddings,
                     "embedding_coverage": (embedded_docs / (embedded_docs + missing_embeddings) * 100) if (embedded_docs + missing_embeddings) > 0 else 0
-                }
+                },
+                "backfill_queue": backfill_queue
             }
     except Exception as e:
         LOGGER.error(f"Failed to get vector database health: {e}")
@@ -14,6 +14,11 @@ from dotenv import load_dotenv
 
 # Import our new database utility module
 from db_utils import get_db_manager, initialize_schema
+from bulk_embeddings import BulkEmbedder
+from embedding_cache import get_content_embedding_store
+from embedding_backfill import enqueue_backfill
+from embedding_profiles import get_embedding_profile
+from document_cache import notify_changed
 from openai import OpenAI
 
 load_dotenv()
@@ -208,6 +213,34 @@ def get_openai_client() -> Optional[OpenAI]:
         logger.error(f"❌ Failed to initialize OpenAI client: {e}")
         return None
 
+def embed_documents(openai_client: Optional[OpenAI], docs: List[Dict]) -> List[Optional[List[float]]]:
+    """Embed all document contents, reusing stored embeddings for unchanged text"""
+    embedder = None
+    profile = get_embedding_profile("full")
+
+    def _embed_batch(texts: List[str]) -> List[List[float]]:
+        response = openai_client.embeddings.create(input=texts, **profile.request_kwargs())
+        return [d.embedding for d in response.data]
+
+    def _embed_missing(texts: List[str]) -> List[Optional[List[float]]]:
+        nonlocal embedder
+        if not openai_client:
+            logger.warning(f"⚠️ No OpenAI client; {len(texts)} document(s) will be stored without embeddings")
+            return [None] * len(texts)
+        embedder = BulkEmbedder(_embed_batch)
+        return embedder.embed(texts)
+
+    embeddings = get_content_embedding_store().resolve(
+        [doc["content"] for doc in docs], profile.model, profile.dimensions, _embed_missing
+    )
+    if embedder:
+        stats = embedder.last_stats
+        logger.info(f"✅ Generated {stats['documents'] - stats['failed_inputs']}/{stats['documents']} new embeddings "
+                    f"in {stats['seconds']}s ({stats['docs_per_second']} docs/s, {stats['tokens_per_second']} tokens/s)")
+    elif all(e is not None for e in embeddings):
+        logger.info("✅ All embeddings reused from the embedding store")
+    return embeddings
+
 def seed_database_with_real_data():
     """Seed the database with comprehensive Brazilian legal data"""
     try:
@@ -221,7 +254,7 @@ def seed_database_with_real_data():
             logger.error("❌ Failed to initialize database schema")
             return False
         
-        if not db_manager.is_ready():
+        if not db_manager.wait_ready():
             logger.error("❌ Database not ready for seeding")
             return False
         
@@ -245,22 +278,10 @@ def seed_database_with_real_data():
                 # Insert real legal data
                 inserted_count = 0
                 openai_client = get_openai_client()
+                embeddings = embed_documents(openai_client, legal_data)
                 
-                for doc in legal_data:
+                for doc, embedding in zip(legal_data, embeddings):
                     try:
-                        # Generate embedding if OpenAI is available
-                        embedding = None
-                        if openai_client:
-                            try:
-                                response = openai_client.embeddings.create(
-                                    model="text-embedding-3-small",
-                                    input=doc["content"]
-                                )
-                                embedding = response.data[0].embedding
-                                logger.info(f"✅ Generated embedding for {doc['title'][:30]}...")
-                            except Exception as e:
-                                logger.warning(f"Failed to generate embedding for {doc['title'][:30]}: {e}")
-                        
                         # Prepare metadata
                         metadata = {
                             "source": doc.get("source", ""),
@@ -279,7 +300,8 @@ def seed_database_with_real_data():
                                 content = EXCLUDED.content,
                                 category = EXCLUDED.category,
                                 metadata = EXCLUDED.metadata,
-                                embedding = EXCLUDED.embedding
+                                embedding = EXCLUDED.embedding,
+                                updated_at = now()
                         """, (
                             doc["id"],
                             doc["title"],
@@ -295,9 +317,16 @@ def seed_database_with_real_data():
                         logger.error(f"Failed to insert document {doc['title'][:30]}: {e}")
                         continue
                 
+                notify_changed(cur)
                 conn.commit()
                 logger.info(f"✅ Successfully seeded database with {inserted_count} real legal documents")
                 
+                # Documents stored without an embedding are picked up by the backfill worker
+                deferred = [doc["id"] for doc, embedding in zip(legal_data, embeddings) if embedding is None]
+                if deferred:
+                    enqueue_backfill(deferred, reason="embedding failed during seed", conn=conn)
+                    logger.info(f"⏳ Queued {len(deferred)} document(s) for embedding backfill")
+                
                 # Verify seeding
                 cur.execute("SELECT COUNT(*) FROM legal_chunks")
                 total_count = cur.fetchone()[0]
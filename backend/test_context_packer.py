@@ -0,0 +1,61 @@
+"""
+Tests for context_packer: token budget, duplicate chunks and sentence selection
+"""
+from context_packer import pack_context, select_sentences, split_segments, count_tokens
+
+OPENING = "Art. 7º São direitos dos trabalhadores urbanos e rurais, além de outros que visem à melhoria de sua condição social."
+FILLER = [
+    f"O inciso {n} trata de tema acessório sem relação com a pergunta, descrito aqui com bastante detalhe para ocupar espaço."
+    for n in range(1, 31)
+]
+RELEVANT = "O seguro-desemprego é devido em caso de desemprego involuntário."
+LONG_DOC = " ".join([OPENING] + FILLER[:15] + [RELEVANT] + FILLER[15:])
+QUESTION = "Quem tem direito ao seguro-desemprego?"
+
+
+def doc(doc_id, content, title="Constituição Federal"):
+    return {"id": doc_id, "title": title, "content": content}
+
+
+def test_pack_context_respects_budget():
+    documents = [doc(f"d{i}", LONG_DOC.replace("acessório", f"acessório {i}")) for i in range(5)]
+    for budget in (80, 200, 500):
+        packed = pack_context(QUESTION, documents, budget=budget)
+        assert packed.tokens <= budget
+        assert count_tokens(packed.text) == packed.tokens
+
+
+def test_pack_context_drops_duplicate_chunks():
+    documents = [doc("a", LONG_DOC), doc("b", LONG_DOC), doc("c", RELEVANT + " " + OPENING)]
+    packed = pack_context(QUESTION, documents, budget=5000)
+    assert [d["id"] for d in packed.documents] == ["a"]
+    assert packed.duplicates == 2
+    assert packed.text.count(OPENING) == 1
+
+
+def test_pack_context_truncation_keeps_opening_sentence():
+    packed = pack_context(QUESTION, [doc("a", LONG_DOC)], budget=120)
+    assert packed.truncated == 1
+    assert packed.documents == [{"id": "a", "truncated": True}]
+    assert OPENING in packed.text
+    assert RELEVANT in packed.text
+
+
+def test_select_sentences_respects_budget():
+    segments = split_segments(LONG_DOC)
+    for budget in (40, 100, 300):
+        text = select_sentences(segments, {"seguro", "desemprego"}, budget)
+        assert text
+        assert count_tokens(text) <= budget
+
+
+def test_select_sentences_keeps_opening_sentence_first():
+    segments = split_segments(LONG_DOC)
+    text = select_sentences(segments, {"seguro", "desemprego"}, 80)
+    assert text.startswith(OPENING)
+    assert RELEVANT in text
+    assert FILLER[0] not in text
+
+
+def test_select_sentences_returns_empty_when_nothing_fits():
+    assert select_sentences(split_segments(LONG_DOC), {"seguro"}, 5) == ""
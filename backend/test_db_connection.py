@@ -13,9 +13,9 @@ sys.path.insert(0, str(Path(__file__).parent))
 
 # Import from our new db_utils module
 try:
-    from backend.db_utils import get_db_manager, is_ready, initialize_schema
+    from backend.db_utils import get_db_manager, initialize_schema
 except ImportError:
-    from db_utils import get_db_manager, is_ready, initialize_schema
+    from db_utils import get_db_manager, initialize_schema
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -52,7 +52,7 @@ def test_database_connection():
         print(f"   Schema initialization: {'✓ Success' if success else '✗ Failed'}")
         
         # Test if ready
-        ready = is_ready()
+        ready = get_db_manager().wait_ready()
         print(f"   Database ready: {'✓ Yes' if ready else '✗ No'}")
         
         if ready:
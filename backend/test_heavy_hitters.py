@@ -0,0 +1,94 @@
+"""
+Tests for heavy_hitters: Space-Saving error bounds and summary merges
+"""
+import random
+from collections import Counter
+
+import pytest
+
+from heavy_hitters import SpaceSaving, Summary
+
+NOW = 1_700_000_000.0
+
+
+def skewed_stream(n=5000, keys=300, seed=7):
+    rng = random.Random(seed)
+    weights = [1.0 / (rank + 1) for rank in range(keys)]
+    return rng.choices([f"q{i}" for i in range(keys)], weights=weights, k=n)
+
+
+def sketch_of(stream, capacity):
+    sketch = SpaceSaving(capacity=capacity)
+    for key in stream:
+        sketch.add(key, now=NOW)
+    return sketch
+
+
+def assert_bounds(summary, truth):
+    for key, (count, error, _) in summary.entries.items():
+        assert count >= truth[key]
+        assert count - error <= truth[key]
+
+
+def test_space_saving_never_underestimates():
+    stream = skewed_stream()
+    truth = Counter(stream)
+    sketch = sketch_of(stream, capacity=40)
+    summary = sketch.summary(NOW)
+    assert len(sketch) == 40
+    assert summary.total == pytest.approx(len(stream))
+    assert_bounds(summary, truth)
+    # Every term above total / capacity is guaranteed a counter
+    for key, count in truth.items():
+        if count > len(stream) / 40:
+            assert key in summary.entries
+
+
+def test_space_saving_is_exact_below_capacity():
+    stream = ["a", "b", "a", "c", "a", "b"]
+    summary = sketch_of(stream, capacity=10).summary(NOW)
+    assert {k: (c, e) for k, (c, e, _) in summary.entries.items()} == {
+        "a": (3, 0), "b": (2, 0), "c": (1, 0)}
+    assert summary.min_count == 0.0
+
+
+def test_space_saving_decays_by_half_life():
+    sketch = SpaceSaving(capacity=10, half_life=60)
+    start = sketch.landmark
+    sketch.add("a", now=start)
+    sketch.add("b", now=start + 60)
+    summary = sketch.summary(start + 60)
+    assert summary.entries["a"][0] == pytest.approx(0.5)
+    assert summary.entries["b"][0] == pytest.approx(1.0)
+
+
+def test_merged_summaries_never_underestimate():
+    stream = skewed_stream(seed=11)
+    truth = Counter(stream)
+    half = len(stream) // 2
+    left, right = sketch_of(stream[:half], 40), sketch_of(stream[half:], 40)
+    merged = left.summary(NOW).merge(right.summary(NOW), capacity=40)
+    assert len(merged.entries) == 40
+    assert merged.total == pytest.approx(len(stream))
+    assert_bounds(merged, truth)
+
+
+def test_merge_credits_min_count_of_full_summary():
+    full = Summary({"x": (10.0, 0.0, "x"), "y": (5.0, 1.0, "y")}, min_count=5.0, total=15.0, as_of=NOW)
+    partial = Summary({"z": (3.0, 0.0, "z"), "x": (2.0, 0.0, "x")}, total=5.0, as_of=NOW)
+    merged = full.merge(partial, capacity=3)
+    # z may have had up to full.min_count hits that full no longer tracks
+    assert merged.entries["z"] == (8.0, 5.0, "z")
+    assert merged.entries["x"] == (12.0, 0.0, "x")
+    # y is missing from a summary that was not full: credited nothing
+    assert merged.entries["y"] == (5.0, 1.0, "y")
+    assert merged.min_count == 5.0
+    assert merged.total == 20.0
+
+
+def test_merge_below_capacity_has_no_min_count():
+    a = Summary({"x": (1.0, 0.0, "x")}, as_of=NOW)
+    b = Summary({"y": (2.0, 0.0, "y")}, as_of=NOW)
+    merged = a.merge(b, capacity=5)
+    assert merged.min_count == 0.0
+    assert [key for key, *_ in merged.top(5)] == ["y", "x"]
@@ -0,0 +1,570 @@
+"""
+Vector Index Module for JuSimples
+Lifecycle manager for the legal_chunks ANN index: HNSW or ivfflat selection,
+row-count based ivfflat sizing, concurrent rebuilds and per-query scan settings
+"""
+import os
+import re
+import math
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from psycopg import sql
+
+from db_utils import get_connection, connection, optional_connection, is_ready as db_is_ready, wait_ready
+from vector_storage import get_vector_storage
+from embedding_profiles import get_embedding_profile, TWO_STAGE_SEARCH
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw").lower()
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH_FAST = int(os.getenv("HNSW_EF_SEARCH_FAST", "20"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "100"))
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "0"))  # 0 = sqrt(lists)
+IVFFLAT_MIN_ROWS = int(os.getenv("IVFFLAT_MIN_ROWS", "1000"))
+REBUILD_GROWTH_FACTOR = float(os.getenv("VECTOR_INDEX_REBUILD_GROWTH", "2.0"))
+MAINTENANCE_INTERVAL = float(os.getenv("VECTOR_INDEX_CHECK_SECONDS", "300"))
+# Re-read the active index from the catalog this often so scan settings follow
+# rebuilds done by other processes
+ACTIVE_INDEX_TTL = float(os.getenv("VECTOR_INDEX_ACTIVE_TTL_SECONDS", "60"))
+# Categories with at least this many embedded rows get their own partial ANN index
+PARTIAL_INDEXES_ENABLED = os.getenv("VECTOR_PARTIAL_INDEXES", "true").lower() == "true"
+PARTIAL_INDEX_MIN_ROWS = int(os.getenv("VECTOR_PARTIAL_INDEX_MIN_ROWS", "5000"))
+# Without iterative scans, a filtered query that comes back short is re-run once with
+# this many times the ef_search / probes
+FILTER_WIDEN_FACTOR = int(os.getenv("VECTOR_FILTER_WIDEN_FACTOR", "4"))
+
+# Recall/latency trade-off per request: fast for interactive search, balanced for
+# answer generation, exact to bypass the ANN index entirely
+SEARCH_MODES = ("fast", "balanced", "exact")
+DEFAULT_SEARCH_MODE = "balanced"
+
+TABLE = "legal_chunks"
+INDEX_NAMES = {
+    "hnsw": "legal_chunks_embedding_hnsw_cos",
+    "ivfflat": "legal_chunks_embedding_ivfflat_cos",
+}
+# Expression index over the leading dimensions (two-stage search candidate pass)
+SHORT_INDEX_NAME = "legal_chunks_embedding_short_hnsw"
+# Arbitrary key so only one process rebuilds at a time
+_ADVISORY_LOCK_KEY = 7305114
+
+# Full-column ANN indexes on legal_chunks.embedding, any opclass (partial/expression
+# indexes and the binary shadow column's index are left alone)
+_EMBEDDING_INDEX_RE = re.compile(
+    r"USING (hnsw|ivfflat) \(embedding (\w+)\)(?: WITH \(([^)]*)\))?$", re.IGNORECASE
+)
+
+
+def recommended_lists(rows: int) -> int:
+    """pgvector guidance: rows/1000 up to 1M rows, sqrt(rows) beyond"""
+    if rows <= 1_000_000:
+        return max(10, rows // 1000)
+    return int(math.sqrt(rows))
+
+
+def recommended_probes(lists: int, mode: str = DEFAULT_SEARCH_MODE) -> int:
+    lists = max(1, lists)
+    probes = IVFFLAT_PROBES if IVFFLAT_PROBES > 0 else int(math.sqrt(lists))
+    if mode == "fast":
+        probes = probes // 2
+    return min(lists, max(1, probes))
+
+
+def normalize_search_mode(mode: Optional[str], default: str = DEFAULT_SEARCH_MODE) -> str:
+    """Return a valid search mode, falling back to default for missing/unknown values"""
+    mode = (mode or "").strip().lower()
+    return mode if mode in SEARCH_MODES else default
+
+
+def partial_index_name(category: str) -> str:
+    """Stable, identifier-safe index name for a category's partial index"""
+    slug = re.sub(r"[^a-z0-9]+", "_", (category or "").lower()).strip("_")[:30]
+    digest = hashlib.sha1((category or "").encode("utf-8")).hexdigest()[:8]
+    return f"legal_chunks_embedding_cat_{slug}_{digest}"
+
+
+def set_local(cur, settings: Dict[str, str]) -> None:
+    """SET LOCAL every setting in a single statement (one round trip)"""
+    if not settings:
+        return
+    calls = ", ".join(["set_config(%s, %s, true)"] * len(settings))
+    cur.execute(f"SELECT {calls};", [v for item in settings.items() for v in item])
+
+
+def _parse_options(raw: Optional[str]) -> Dict[str, int]:
+    options: Dict[str, int] = {}
+    for part in (raw or "").split(","):
+        if "=" in part:
+            key, value = part.split("=", 1)
+            try:
+                options[key.strip()] = int(value.strip().strip("'"))
+            except ValueError:
+                continue
+    return options
+
+
+class VectorIndexManager:
+    """Keeps exactly one ANN index on legal_chunks.embedding and tunes scans against it.
+
+    The row count at build time is stored in the index comment, so growth past
+    REBUILD_GROWTH_FACTOR (or an ivfflat index whose lists no longer fit the table)
+    triggers a CREATE INDEX CONCURRENTLY rebuild without blocking writes.
+    """
+
+    def __init__(self, index_type: str = INDEX_TYPE):
+        if index_type not in INDEX_NAMES:
+            logger.warning(f"Unknown VECTOR_INDEX_TYPE '{index_type}', using hnsw")
+            index_type = "hnsw"
+        self.index_type = index_type
+        self._lock = threading.Lock()
+        self._active: Optional[Dict[str, Any]] = None
+        self._active_checked_at = 0.0
+        self._last_check = 0.0
+        self._rebuilding = False
+        self._iterative_scan: Optional[bool] = None
+
+    # -- inspection -------------------------------------------------------
+
+    def list_indexes(self, conn) -> List[Dict[str, Any]]:
+        """Full-column ANN indexes currently defined on legal_chunks.embedding"""
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT c.relname, pg_get_indexdef(c.oid), obj_description(c.oid, 'pg_class'), x.indisvalid
+                FROM pg_index x
+                JOIN pg_class c ON c.oid = x.indexrelid
+                WHERE x.indrelid = %s::regclass;
+                """,
+                (TABLE,),
+            )
+            rows = cur.fetchall()
+        indexes = []
+        for name, indexdef, comment, valid in rows:
+            match = _EMBEDDING_INDEX_RE.search(indexdef or "")
+            if not match:
+                continue
+            built_rows = _parse_options((comment or "").replace(";", ",")).get("rows")
+            indexes.append({
+                "name": name,
+                "type": match.group(1).lower(),
+                "opclass": match.group(2).lower(),
+                "options": _parse_options(match.group(3)),
+                "built_rows": built_rows,
+                "valid": bool(valid),
+            })
+        return indexes
+
+    def count_rows(self, conn) -> int:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT COUNT(*) FROM {TABLE} WHERE embedding IS NOT NULL;")
+            row = cur.fetchone()
+        return int(row[0] or 0) if row else 0
+
+    def active_index(self, conn=None) -> Optional[Dict[str, Any]]:
+        """Return the index used for scan settings, refreshed from the catalog when stale"""
+        if conn is None:
+            return self._active
+        # No index yet (e.g. ivfflat waiting for rows): don't hit the catalog on every query
+        ttl = ACTIVE_INDEX_TTL if self._active is not None else MAINTENANCE_INTERVAL
+        if time.time() - self._active_checked_at < ttl:
+            return self._active
+        self._active_checked_at = time.time()
+        try:
+            indexes = [ix for ix in self.list_indexes(conn) if ix["valid"]]
+            self._active = self._pick_canonical(indexes)
+        except Exception as e:
+            logger.warning(f"Could not inspect vector indexes: {e}")
+        return self._active
+
+    def _pick_canonical(self, indexes: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if not indexes:
+            return None
+        preferred = INDEX_NAMES[self.index_type]
+        for ix in indexes:
+            if ix["name"] == preferred:
+                return ix
+        for ix in indexes:
+            if ix["type"] == self.index_type:
+                return ix
+        return indexes[0]
+
+    def reset(self) -> None:
+        """Forget the cached active index (after indexes were dropped or the format changed)"""
+        self._active, self._active_checked_at = None, 0.0
+
+    # -- lifecycle --------------------------------------------------------
+
+    def ensure_index(self, conn, concurrently: bool = False) -> Optional[str]:
+        """Create the configured index if missing and drop duplicates. Used by migrations
+        (concurrently, which needs an autocommit connection, does not block writes)."""
+        indexes = self.list_indexes(conn)
+        self._drop_invalid(conn, indexes)
+        indexes = [ix for ix in indexes if ix["valid"]]
+        keep = self._pick_canonical(indexes)
+        self._drop_duplicates(conn, indexes, keep)
+
+        if keep is None:
+            rows = self.count_rows(conn)
+            if self.index_type == "ivfflat" and rows < IVFFLAT_MIN_ROWS:
+                # ivfflat centroids trained on an empty/tiny table give poor recall;
+                # exact scans are fast at this size and maintain() builds it later
+                logger.info(f"Skipping ivfflat index until {IVFFLAT_MIN_ROWS} embedded rows (have {rows})")
+                self._active = None
+                return None
+            name = INDEX_NAMES[self.index_type]
+            self._create(conn, name, rows, concurrently=concurrently)
+            keep = next((ix for ix in self.list_indexes(conn) if ix["name"] == name), None)
+        self._active = keep
+        self.ensure_short_index(conn, concurrently=concurrently)
+        return keep["name"] if keep else None
+
+    def needs_rebuild(self, conn) -> Optional[str]:
+        """Return the reason the index should be rebuilt, or None"""
+        active = self._pick_canonical([ix for ix in self.list_indexes(conn) if ix["valid"]])
+        self._active, self._active_checked_at = active, time.time()
+        rows = self.count_rows(conn)
+        if active is None:
+            if self.index_type == "hnsw" or rows >= IVFFLAT_MIN_ROWS:
+                return "missing"
+            return None
+        if active["type"] != self.index_type:
+            return f"type changed ({active['type']} -> {self.index_type})"
+        opclass = get_vector_storage().current(conn).opclass
+        if active["opclass"] != opclass:
+            return f"opclass changed ({active['opclass']} -> {opclass})"
+        if active["type"] == "ivfflat":
+            built = active.get("built_rows")
+            if built is None or rows >= max(built, 1) * REBUILD_GROWTH_FACTOR:
+                return f"table grew ({built} -> {rows} rows)"
+            lists = active["options"].get("lists", 100)
+            target = recommended_lists(rows)
+            if lists > target * 2 or lists * 2 < target:
+                return f"lists={lists} does not fit {rows} rows (target {target})"
+        return None
+
+    def rebuild(self, conn, reason: str = "manual") -> bool:
+        """Build a replacement index CONCURRENTLY, then swap it in for the old ones"""
+        if not conn.autocommit:
+            raise RuntimeError("CREATE INDEX CONCURRENTLY requires an autocommit connection")
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s);", (_ADVISORY_LOCK_KEY,))
+            if not cur.fetchone()[0]:
+                logger.info("Vector index rebuild already running in another process")
+                return False
+        self._rebuilding = True
+        try:
+            start = time.time()
+            rows = self.count_rows(conn)
+            final_name = INDEX_NAMES[self.index_type]
+            tmp_name = f"{final_name}_new"
+            retired_name = f"{final_name}_old"
+            logger.info(f"Rebuilding vector index ({reason}): {self.index_type} over {rows} rows")
+            with conn.cursor() as cur:
+                cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {tmp_name};")
+                cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {retired_name};")
+            self._create(conn, tmp_name, rows, concurrently=True)
+
+            # Swap names in one transaction so an ANN index exists at every point,
+            # then drop the replaced indexes without blocking writes
+            old = [ix["name"] for ix in self.list_indexes(conn) if ix["name"] != tmp_name]
+            with conn.transaction(), conn.cursor() as cur:
+                if final_name in old:
+                    cur.execute(f"ALTER INDEX {final_name} RENAME TO {retired_name};")
+                    old = [retired_name if name == final_name else name for name in old]
+                cur.execute(f"ALTER INDEX {tmp_name} RENAME TO {final_name};")
+            with conn.cursor() as cur:
+                for name in old:
+                    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+            self.reset()
+            self.active_index(conn)
+            logger.info(f"✅ Vector index {final_name} rebuilt in {time.time() - start:.1f}s")
+            return True
+        finally:
+            self._rebuilding = False
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s);", (_ADVISORY_LOCK_KEY,))
+
+    def maybe_maintain(self, force: bool = False) -> Optional[str]:
+        """Throttled check after bulk writes; rebuilds in a background thread when needed"""
+        now = time.time()
+        if not force and now - self._last_check < MAINTENANCE_INTERVAL:
+            return None
+        if self._rebuilding or not self._lock.acquire(blocking=False):
+            return None
+        try:
+            self._last_check = now
+            if not db_is_ready():
+                return None
+            with connection() as conn:
+                reason = self.needs_rebuild(conn)
+                partials = self.missing_partial_indexes(conn)
+                short_missing = TWO_STAGE_SEARCH and not self.has_short_index(conn)
+        except Exception as e:
+            logger.warning(f"Vector index check failed: {e}")
+            return None
+        finally:
+            self._lock.release()
+        if reason or partials or short_missing:
+            threading.Thread(target=self._maintain_in_background, args=(reason,),
+                             name="vector-index-rebuild", daemon=True).start()
+        return reason
+
+    def _maintain_in_background(self, reason: Optional[str]) -> None:
+        # CREATE INDEX CONCURRENTLY holds its connection for the whole build, so use a
+        # dedicated one rather than one from the request pool
+        conn = None
+        try:
+            from db_utils import DatabaseManager
+            conn = DatabaseManager().get_connection()
+            if conn:
+                if reason:
+                    self.rebuild(conn, reason)
+                self.ensure_partial_indexes(conn)
+                self.ensure_short_index(conn, concurrently=True)
+        except Exception as e:
+            logger.error(f"Vector index maintenance failed: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+
+    # -- per-category partial indexes ---------------------------------------
+
+    def missing_partial_indexes(self, conn) -> List[Tuple[str, int]]:
+        """Large categories without a partial index, as (category, embedded rows)"""
+        if not PARTIAL_INDEXES_ENABLED:
+            return []
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT category, COUNT(*) FROM {TABLE}
+                WHERE embedding IS NOT NULL AND category IS NOT NULL
+                GROUP BY category HAVING COUNT(*) >= %s;
+                """,
+                (PARTIAL_INDEX_MIN_ROWS,),
+            )
+            large = cur.fetchall()
+            cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = %s;", (TABLE,))
+            existing = {row[0] for row in cur.fetchall()}
+        return [(cat, int(n)) for cat, n in large if partial_index_name(cat) not in existing]
+
+    def ensure_partial_indexes(self, conn) -> List[str]:
+        """Build partial ANN indexes (WHERE category = ...) for large categories, CONCURRENTLY"""
+        created = []
+        for category, rows in self.missing_partial_indexes(conn):
+            name = partial_index_name(category)
+            try:
+                self._create(conn, name, rows, concurrently=True, category=category)
+                created.append(name)
+            except Exception as e:
+                logger.warning(f"Could not create partial vector index for '{category}': {e}")
+        return created
+
+    # -- two-stage search short-vector index ----------------------------------
+
+    def has_short_index(self, conn) -> bool:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_indexes WHERE tablename = %s AND indexname = %s;",
+                        (TABLE, SHORT_INDEX_NAME))
+            return cur.fetchone() is not None
+
+    def ensure_short_index(self, conn, concurrently: bool = True) -> Optional[str]:
+        """HNSW index on subvector(embedding, 1, short dims) for the two-stage candidate pass.
+
+        An expression index rather than a second column: no extra heap storage and no
+        write-path changes, and the query repeats the same expression to use it.
+        """
+        if not TWO_STAGE_SEARCH or self.has_short_index(conn):
+            return None
+        fmt = get_vector_storage().current(conn)
+        dims = get_embedding_profile("short").dimensions
+        options = f"m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}"
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL(
+                "CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} "
+                "USING hnsw (({expr}) {opclass}) WITH ({options});"
+            ).format(
+                concurrently=sql.SQL("CONCURRENTLY " if concurrently else ""),
+                name=sql.Identifier(SHORT_INDEX_NAME),
+                table=sql.Identifier(TABLE),
+                expr=fmt.prefix(sql.SQL("embedding"), dims),
+                opclass=sql.SQL(fmt.prefix_opclass),
+                options=sql.SQL(options),
+            ))
+        logger.info(f"✅ Created short-vector index {SHORT_INDEX_NAME} ({dims} dims, {options})")
+        return SHORT_INDEX_NAME
+
+    def _create(self, conn, name: str, rows: int, concurrently: bool, category: Optional[str] = None) -> None:
+        if self.index_type == "hnsw":
+            options = f"m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}"
+        else:
+            options = f"lists = {recommended_lists(rows)}"
+        query = sql.SQL(
+            "CREATE INDEX {concurrently}IF NOT EXISTS {name} ON {table} "
+            "USING {method} (embedding {opclass}) WITH ({options}){where};"
+        ).format(
+            concurrently=sql.SQL("CONCURRENTLY " if concurrently else ""),
+            name=sql.Identifier(name),
+            table=sql.Identifier(TABLE),
+            method=sql.SQL(self.index_type),
+            # vector/halfvec, cosine or inner product: must match the stored format
+            opclass=sql.SQL(get_vector_storage().current(conn).opclass),
+            options=sql.SQL(options),
+            # Literal (not a bind parameter) so the planner can match the partial index
+            where=sql.SQL(" WHERE category = {}").format(sql.Literal(category)) if category else sql.SQL(""),
+        )
+        with conn.cursor() as cur:
+            cur.execute(query)
+            cur.execute(sql.SQL("COMMENT ON INDEX {} IS {};").format(
+                sql.Identifier(name), sql.Literal(f"rows={rows}")))
+        logger.info(f"✅ Created {self.index_type} index {name} ({options}, {rows} rows"
+                    f"{', category=' + category if category else ''})")
+
+    def _drop_invalid(self, conn, indexes: List[Dict[str, Any]]) -> None:
+        # Leftovers from an interrupted CONCURRENTLY build still cost writes
+        with conn.cursor() as cur:
+            for ix in indexes:
+                if not ix["valid"]:
+                    logger.info(f"Dropping invalid vector index {ix['name']}")
+                    cur.execute(f"DROP INDEX IF EXISTS {ix['name']};")
+
+    def _drop_duplicates(self, conn, indexes: List[Dict[str, Any]], keep: Optional[Dict[str, Any]]) -> None:
+        with conn.cursor() as cur:
+            for ix in indexes:
+                if keep is not None and ix["name"] != keep["name"]:
+                    logger.info(f"Dropping duplicate vector index {ix['name']} (keeping {keep['name']})")
+                    cur.execute(f"DROP INDEX IF EXISTS {ix['name']};")
+
+    # -- query-time settings ----------------------------------------------
+
+    def supports_iterative_scan(self, conn) -> bool:
+        """pgvector >= 0.8 can keep scanning the index until filtered queries fill LIMIT"""
+        if self._iterative_scan is None:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector';")
+                    row = cur.fetchone()
+                version = tuple(int(p) for p in re.findall(r"\d+", row[0])[:2]) if row else (0, 0)
+                self._iterative_scan = version >= (0, 8)
+            except Exception as e:
+                logger.warning(f"Could not read pgvector version: {e}")
+                self._iterative_scan = False
+        return self._iterative_scan
+
+    def search_settings(self, top_k: int = 10, mode: str = DEFAULT_SEARCH_MODE,
+                        filtered: bool = False) -> Dict[str, str]:
+        """Scan parameters for the active index and mode; ef_search never drops below top_k"""
+        if mode == "exact":
+            # Planner falls back to a sequential scan, i.e. exact distances for every row
+            return {"enable_indexscan": "off", "enable_bitmapscan": "off"}
+        active = self._active
+        if active is None:
+            return {}
+        settings: Dict[str, str] = {}
+        if active["type"] == "hnsw":
+            ef_search = HNSW_EF_SEARCH_FAST if mode == "fast" else HNSW_EF_SEARCH
+            settings["hnsw.ef_search"] = str(min(1000, max(ef_search, top_k)))
+        else:
+            settings["ivfflat.probes"] = str(recommended_probes(active["options"].get("lists", 100), mode))
+        if filtered and self._iterative_scan:
+            # Filters / distance bounds discard index candidates; keep scanning until LIMIT is met
+            settings[f"{active['type']}.iterative_scan"] = "relaxed_order"
+        return settings
+
+    def widened_settings(self, top_k: int = 10, mode: str = DEFAULT_SEARCH_MODE) -> Dict[str, str]:
+        """search_settings with FILTER_WIDEN_FACTOR times the candidates, for re-running a
+        filtered query that came back short; {} when there is no index to widen"""
+        settings = self.search_settings(top_k, mode)
+        if "hnsw.ef_search" in settings:
+            settings["hnsw.ef_search"] = str(min(1000, int(settings["hnsw.ef_search"]) * FILTER_WIDEN_FACTOR))
+        elif "ivfflat.probes" in settings:
+            lists = self._active["options"].get("lists", 100)
+            settings["ivfflat.probes"] = str(min(lists, int(settings["ivfflat.probes"]) * FILTER_WIDEN_FACTOR))
+        else:
+            return {}
+        return settings
+
+    def scan_settings(self, conn, top_k: int = 10, mode: str = DEFAULT_SEARCH_MODE,
+                      filtered: bool = False, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """search_settings plus extra, reading the index catalog through conn if not cached yet"""
+        self.active_index(conn)
+        if filtered:
+            self.supports_iterative_scan(conn)
+        settings = self.search_settings(top_k, mode, filtered)
+        settings.update(extra or {})
+        return settings
+
+    def apply_search_settings(self, cur, top_k: int = 10, mode: str = DEFAULT_SEARCH_MODE,
+                              filtered: bool = False, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+        """SET LOCAL the scan parameters; call inside a transaction before the ANN query"""
+        settings = self.scan_settings(cur.connection, top_k, mode, filtered, extra)
+        set_local(cur, settings)
+        return settings
+
+    def get_status(self, conn=None) -> Dict[str, Any]:
+        with optional_connection(conn) as conn:
+            status: Dict[str, Any] = {"configured_type": self.index_type, "rebuilding": self._rebuilding}
+            if not conn:
+                return status
+            try:
+                rows = self.count_rows(conn)
+                status.update({
+                    "indexes": self.list_indexes(conn),
+                    "embedded_rows": rows,
+                    "active": self.active_index(conn),
+                    "rebuild_reason": self.needs_rebuild(conn),
+                    "search_settings": {m: self.search_settings(mode=m) for m in SEARCH_MODES},
+                    "recommended_lists": recommended_lists(rows),
+                    "iterative_scan": self.supports_iterative_scan(conn),
+                    "storage": get_vector_storage().current(conn).to_dict(),
+                    "two_stage": {
+                        "enabled": TWO_STAGE_SEARCH,
+                        "short_index": self.has_short_index(conn),
+                    },
+                    "missing_partial_indexes": self.missing_partial_indexes(conn),
+                })
+            except Exception as e:
+                status["error"] = str(e)
+            return status
+
+
+# Singleton instance
+vector_index_manager = VectorIndexManager()
+
+
+def get_vector_index_manager() -> VectorIndexManager:
+    """Get the vector index manager singleton"""
+    return vector_index_manager
+
+
+def ensure_vector_index(conn, concurrently: bool = False) -> Optional[str]:
+    """Create/deduplicate the legal_chunks ANN index (called from migrations)"""
+    return vector_index_manager.ensure_index(conn, concurrently=concurrently)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Manage the legal_chunks vector index")
+    parser.add_argument("command", choices=["status", "ensure", "rebuild", "partial"], nargs="?", default="status")
+    parser.add_argument("--type", choices=sorted(INDEX_NAMES), help="Override VECTOR_INDEX_TYPE")
+    args = parser.parse_args()
+
+    if not wait_ready():
+        logger.error("Database not ready")
+        raise SystemExit(1)
+    manager = VectorIndexManager(args.type) if args.type else get_vector_index_manager()
+    conn = get_connection()
+    if args.command == "ensure":
+        manager.ensure_index(conn)
+    elif args.command == "rebuild":
+        manager.rebuild(conn, reason=manager.needs_rebuild(conn) or "manual")
+    elif args.command == "partial":
+        manager.ensure_partial_indexes(conn)
+    for key, value in manager.get_status(conn).items():
+        logger.info(f"{key}: {value}")
@@ -0,0 +1,462 @@
+"""
+Vector Storage Module for JuSimples
+Storage format of legal_chunks.embedding: full-precision vector or halfvec, unit-norm
+vectors searched by inner product, and an optional binary-quantized shadow column
+for a Hamming-distance first pass re-ranked with exact distances
+"""
+import os
+import re
+import math
+import time
+import logging
+import argparse
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from psycopg import sql
+
+from db_utils import get_connection, optional_connection, wait_ready, EMBED_DIM
+from embedding_profiles import get_embedding_profile, TWO_STAGE_SEARCH, TWO_STAGE_CANDIDATE_FACTOR
+
+logger = logging.getLogger(__name__)
+
+# Target format for `python vector_storage.py migrate`; queries always follow the
+# format actually found in the catalog, so a half-finished migration never breaks search
+STORAGE_TYPE = os.getenv("VECTOR_STORAGE", "vector").lower()
+STORAGE_NORMALIZED = os.getenv("VECTOR_NORMALIZED", "false").lower() == "true"
+STORAGE_BINARY = os.getenv("VECTOR_BINARY_QUANTIZATION", "false").lower() == "true"
+# Hamming first pass fetches top_k * factor candidates for exact re-ranking
+BINARY_RERANK_FACTOR = int(os.getenv("VECTOR_BINARY_RERANK_FACTOR", "10"))
+MIGRATE_BATCH_SIZE = int(os.getenv("VECTOR_MIGRATE_BATCH_SIZE", "1000"))
+# Re-detect the format this often so workers follow a migration run elsewhere
+STORAGE_CHECK_SECONDS = float(os.getenv("VECTOR_STORAGE_CHECK_SECONDS", "60"))
+
+STORAGE_TYPES = ("vector", "halfvec")
+TABLE = "legal_chunks"
+BINARY_COLUMN = "embedding_bq"
+BINARY_INDEX = "legal_chunks_embedding_bq_hnsw"
+# Recorded in the column comment by migrate(); unit norm cannot be read from the type
+_NORMALIZED_MARK = "normalized=true"
+_TYPE_RE = re.compile(r"^(vector|halfvec)\((\d+)\)$")
+
+
+def normalize_vector(vec: List[float]) -> List[float]:
+    """Scale to unit length; inner product of unit vectors equals cosine similarity"""
+    norm = math.sqrt(sum(x * x for x in vec))
+    if norm == 0:
+        return list(vec)
+    return [x / norm for x in vec]
+
+
+class StorageFormat:
+    """How legal_chunks.embedding is stored, and the SQL that matches it"""
+
+    def __init__(self, type_name: str = "vector", dim: int = EMBED_DIM,
+                 normalized: bool = False, binary: bool = False):
+        self.type_name = type_name
+        self.dim = dim
+        self.normalized = normalized
+        self.binary = binary
+
+    @property
+    def column_type(self) -> str:
+        return f"{self.type_name}({self.dim})"
+
+    @property
+    def opclass(self) -> str:
+        """Operator class for ANN indexes: inner product on unit vectors, cosine otherwise"""
+        return f"{self.type_name}_{'ip' if self.normalized else 'cosine'}_ops"
+
+    @property
+    def distance_op(self) -> str:
+        # <#> is the negative inner product, so ascending order is still nearest first
+        return "<#>" if self.normalized else "<=>"
+
+    def query_vector(self) -> sql.Composable:
+        """The %(q)s parameter cast to the column type, so the index operator matches"""
+        return sql.SQL("%(q)s::{}").format(sql.SQL(self.column_type))
+
+    def distance(self) -> sql.Composable:
+        return sql.SQL("embedding {} {}").format(sql.SQL(self.distance_op), self.query_vector())
+
+    def prefix(self, source: sql.Composable, dims: int) -> sql.Composable:
+        """Leading dims of a vector expression; identical text in the index and the query"""
+        return sql.SQL("subvector({}, 1, {})::{}({})").format(
+            source, sql.Literal(dims), sql.SQL(self.type_name), sql.Literal(dims))
+
+    @property
+    def prefix_opclass(self) -> str:
+        # Truncated unit vectors are no longer unit length: always compare them by cosine
+        return f"{self.type_name}_cosine_ops"
+
+    def relevance(self, distance: str = "distance") -> sql.Composable:
+        """Cosine similarity from the computed distance"""
+        if self.normalized:
+            return sql.SQL("-{}").format(sql.Identifier(distance))
+        return sql.SQL("1 - {}").format(sql.Identifier(distance))
+
+    def max_distance(self, min_relevance: float) -> float:
+        """Distance bound equivalent to relevance >= min_relevance"""
+        return -float(min_relevance) if self.normalized else 1.0 - float(min_relevance)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "type": self.type_name,
+            "dim": self.dim,
+            "column_type": self.column_type,
+            "normalized": self.normalized,
+            "binary": self.binary,
+            "opclass": self.opclass,
+            "distance_op": self.distance_op,
+        }
+
+
+def candidate_pass(fmt: StorageFormat, mode: str, top_k: int) -> Tuple[bool, Optional[int], int]:
+    """(use_binary, short_dim, candidates) for a query: binary shadow column first,
+    then the short-vector profile when two-stage search is on; exact mode uses neither"""
+    if mode == "exact":
+        return False, None, top_k
+    if fmt.binary:
+        return True, None, top_k * BINARY_RERANK_FACTOR
+    if TWO_STAGE_SEARCH:
+        return False, get_embedding_profile("short").dimensions, top_k * TWO_STAGE_CANDIDATE_FACTOR
+    return False, None, top_k
+
+
+def build_knn_query(fmt: StorageFormat, where: sql.Composable, bounded: bool = False,
+                    use_binary: bool = False, short_dim: Optional[int] = None) -> sql.Composable:
+    """Nearest-neighbour query over legal_chunks with the distance computed once.
+
+    Returns (id, updated_at, relevance) rows only; documents are hydrated separately
+    (see document_cache), so text never travels with the ANN scan.
+
+    where is an " AND ..." filter clause; bounded adds "distance < %(max_distance)s".
+    With use_binary the HNSW bit index picks %(candidates)s rows by Hamming distance,
+    with short_dim the short-vector expression index picks them by the cosine of the
+    leading dimensions; only those candidates are re-ranked with exact distances.
+    The materialized CTE also restores exact ordering after a relaxed-order iterative scan.
+    """
+    bound = sql.SQL(" AND {} < %(max_distance)s").format(fmt.distance()) if bounded else sql.SQL("")
+    first_pass = None
+    if use_binary:
+        first_pass = sql.SQL("{bq} IS NOT NULL{where} ORDER BY {bq} <~> binary_quantize({q})::bit({dim})").format(
+            bq=sql.Identifier(BINARY_COLUMN), q=fmt.query_vector(), dim=sql.Literal(fmt.dim), where=where)
+    elif short_dim:
+        first_pass = sql.SQL("embedding IS NOT NULL{where} ORDER BY {column} <=> {q}").format(
+            column=fmt.prefix(sql.SQL("embedding"), short_dim),
+            q=fmt.prefix(fmt.query_vector(), short_dim), where=where)
+    if first_pass is not None:
+        return sql.SQL("""
+            WITH candidates AS MATERIALIZED (
+                SELECT id FROM legal_chunks
+                WHERE {first_pass}
+                LIMIT %(candidates)s
+            ), nn AS MATERIALIZED (
+                SELECT id, updated_at, {distance} AS distance
+                FROM legal_chunks JOIN candidates USING (id)
+                WHERE embedding IS NOT NULL{bound}
+                ORDER BY distance
+                LIMIT %(k)s
+            )
+            SELECT id, updated_at, {relevance} AS relevance
+            FROM nn ORDER BY distance;
+        """).format(first_pass=first_pass, distance=fmt.distance(), relevance=fmt.relevance(), bound=bound)
+    return sql.SQL("""
+        WITH nn AS MATERIALIZED (
+            SELECT id, updated_at, {distance} AS distance
+            FROM legal_chunks
+            WHERE embedding IS NOT NULL{where}{bound}
+            ORDER BY distance
+            LIMIT %(k)s
+        )
+        SELECT id, updated_at, {relevance} AS relevance
+        FROM nn ORDER BY distance;
+    """).format(distance=fmt.distance(), relevance=fmt.relevance(), where=where, bound=bound)
+
+
+class VectorStorageManager:
+    """Detects the stored format from the catalog and migrates between formats.
+
+    halfvec halves the heap and index size of the 1536-dim embeddings; the binary
+    shadow column (a generated bit(1536)) is 32x smaller than vector and gives a
+    cheap Hamming first pass whose candidates are re-ranked exactly.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._format: Optional[StorageFormat] = None
+        self._checked_at = 0.0
+
+    def detect(self, conn) -> StorageFormat:
+        """Read column type, normalization mark and shadow column from the catalog"""
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT a.attname, format_type(a.atttypid, a.atttypmod),
+                       col_description(a.attrelid, a.attnum)
+                FROM pg_attribute a
+                WHERE a.attrelid = %s::regclass AND a.attname IN ('embedding', %s)
+                  AND NOT a.attisdropped;
+                """,
+                (TABLE, BINARY_COLUMN),
+            )
+            columns = {name: (type_name, comment) for name, type_name, comment in cur.fetchall()}
+        type_name, dim, normalized = "vector", EMBED_DIM, False
+        if "embedding" in columns:
+            declared, comment = columns["embedding"]
+            match = _TYPE_RE.match(declared or "")
+            if match:
+                type_name, dim = match.group(1), int(match.group(2))
+            normalized = _NORMALIZED_MARK in (comment or "")
+        fmt = StorageFormat(type_name, dim, normalized, BINARY_COLUMN in columns)
+        with self._lock:
+            self._format, self._checked_at = fmt, time.time()
+        return fmt
+
+    def current(self, conn=None) -> StorageFormat:
+        """Cached format, re-detected every STORAGE_CHECK_SECONDS; the last known format
+        (plain vector/cosine if never detected) while the DB is down"""
+        fmt = self._format
+        if fmt is not None and time.time() - self._checked_at < STORAGE_CHECK_SECONDS:
+            return fmt
+        try:
+            with optional_connection(conn) as conn:
+                if conn is not None:
+                    return self.detect(conn)
+        except Exception as e:
+            logger.warning(f"Could not detect vector storage format: {e}")
+        if fmt is not None:
+            # Keep serving the last known format; retry after another interval
+            self._checked_at = time.time()
+            return fmt
+        return StorageFormat()
+
+    def candidate_settings(self, candidates: int) -> Dict[str, str]:
+        """First-pass indexes (bit, short-vector) are HNSW; ef_search must cover the candidate count"""
+        return {"hnsw.ef_search": str(min(1000, max(40, candidates)))}
+
+    # -- migration --------------------------------------------------------
+
+    def migrate(self, conn, type_name: str = STORAGE_TYPE, normalize: bool = STORAGE_NORMALIZED,
+                binary: bool = STORAGE_BINARY) -> Dict[str, Any]:
+        """Convert legal_chunks.embedding to the target format and rebuild its indexes.
+
+        ALTER COLUMN TYPE rewrites the table under an exclusive lock, so run this in a
+        maintenance window. Normalization runs in batches and is resumable.
+        """
+        if type_name not in STORAGE_TYPES:
+            raise ValueError(f"Unknown storage type '{type_name}' (expected one of {STORAGE_TYPES})")
+        if not conn.autocommit:
+            raise RuntimeError("Vector storage migration requires an autocommit connection")
+        from vector_index import get_vector_index_manager
+
+        start = time.time()
+        before = self.detect(conn)
+        target = StorageFormat(type_name, before.dim, normalize or before.normalized, binary)
+        report: Dict[str, Any] = {"from": before.to_dict(), "to": target.to_dict(), "steps": []}
+        index_manager = get_vector_index_manager()
+
+        if before.binary and (not binary or before.type_name != type_name):
+            # Generated columns block ALTER TYPE of the columns they read
+            self._drop_binary_column(conn)
+            report["steps"].append("dropped binary column")
+        if before.type_name != type_name or before.opclass != target.opclass:
+            dropped = self._drop_ann_indexes(conn)
+            report["steps"].append(f"dropped {len(dropped)} ANN index(es)")
+        if before.type_name != type_name:
+            logger.info(f"Converting {TABLE}.embedding {before.column_type} -> {type_name}({before.dim})")
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("ALTER TABLE {table} ALTER COLUMN embedding TYPE {t} USING embedding::{t};").format(
+                    table=sql.Identifier(TABLE), t=sql.SQL(target.column_type)))
+            report["steps"].append(f"converted column to {target.column_type}")
+        if normalize and not before.normalized:
+            updated = self._normalize_rows(conn)
+            with conn.cursor() as cur:
+                cur.execute(sql.SQL("COMMENT ON COLUMN {}.embedding IS {};").format(
+                    sql.Identifier(TABLE), sql.Literal(_NORMALIZED_MARK)))
+            report["steps"].append(f"normalized {updated} rows")
+        if binary and not self.detect(conn).binary:
+            self._add_binary_column(conn, target)
+            report["steps"].append("added binary column and index")
+
+        self.detect(conn)
+        index_manager.reset()
+        index_manager.ensure_index(conn)
+        index_manager.ensure_partial_indexes(conn)
+        report["sizes"] = self.sizes(conn)
+        report["seconds"] = round(time.time() - start, 1)
+        logger.info(f"✅ Vector storage migrated in {report['seconds']}s: {report['steps']}")
+        return report
+
+    def _drop_ann_indexes(self, conn) -> List[str]:
+        """Full-column and per-category ANN indexes; their opclass is tied to the format"""
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT c.relname FROM pg_index x
+                JOIN pg_class c ON c.oid = x.indexrelid
+                JOIN pg_am am ON am.oid = c.relam
+                WHERE x.indrelid = %s::regclass AND am.amname IN ('hnsw', 'ivfflat')
+                  AND c.relname <> %s;
+                """,
+                (TABLE, BINARY_INDEX),
+            )
+            names = [row[0] for row in cur.fetchall()]
+            for name in names:
+                logger.info(f"Dropping vector index {name}")
+                cur.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {};").format(sql.Identifier(name)))
+        return names
+
+    def _normalize_rows(self, conn) -> int:
+        """l2_normalize every embedding in id-ordered batches (short transactions, resumable)"""
+        total, last_id = 0, ""
+        while True:
+            with conn.transaction(), conn.cursor() as cur:
+                cur.execute(
+                    """
+                    WITH batch AS (
+                        SELECT id FROM legal_chunks
+                        WHERE embedding IS NOT NULL AND id > %s
+                        ORDER BY id LIMIT %s
+                    )
+                    UPDATE legal_chunks c SET embedding = l2_normalize(c.embedding)
+                    FROM batch WHERE c.id = batch.id
+                    RETURNING c.id;
+                    """,
+                    (last_id, MIGRATE_BATCH_SIZE),
+                )
+                ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                return total
+            total += len(ids)
+            last_id = max(ids)
+            logger.info(f"Normalized {total} embeddings")
+
+    def _add_binary_column(self, conn, fmt: StorageFormat) -> None:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL(
+                "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {col} bit({dim}) "
+                "GENERATED ALWAYS AS (binary_quantize(embedding)::bit({dim})) STORED;"
+            ).format(table=sql.Identifier(TABLE), col=sql.Identifier(BINARY_COLUMN), dim=sql.Literal(fmt.dim)))
+            cur.execute(sql.SQL(
+                "CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} USING hnsw ({col} bit_hamming_ops);"
+            ).format(name=sql.Identifier(BINARY_INDEX), table=sql.Identifier(TABLE), col=sql.Identifier(BINARY_COLUMN)))
+        logger.info(f"✅ Added {BINARY_COLUMN} with HNSW Hamming index {BINARY_INDEX}")
+
+    def _drop_binary_column(self, conn) -> None:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("ALTER TABLE {} DROP COLUMN IF EXISTS {};").format(
+                sql.Identifier(TABLE), sql.Identifier(BINARY_COLUMN)))
+
+    # -- measurement ------------------------------------------------------
+
+    def sizes(self, conn) -> Dict[str, Any]:
+        """Heap (incl. TOAST) and per-index sizes of legal_chunks in bytes"""
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_table_size(%s::regclass);", (TABLE,))
+            table_bytes = int(cur.fetchone()[0] or 0)
+            cur.execute(
+                """
+                SELECT c.relname, pg_relation_size(c.oid) FROM pg_index x
+                JOIN pg_class c ON c.oid = x.indexrelid
+                WHERE x.indrelid = %s::regclass ORDER BY 2 DESC;
+                """,
+                (TABLE,),
+            )
+            indexes = {name: int(size) for name, size in cur.fetchall()}
+        return {"table_bytes": table_bytes, "index_bytes": indexes}
+
+    def measure_recall(self, conn, sample: int = 50, k: int = 10, mode: str = "balanced") -> Dict[str, Any]:
+        """recall@k of the configured search path against an exact scan, using stored rows as queries"""
+        from vector_index import get_vector_index_manager
+
+        fmt = self.detect(conn)
+        index_manager = get_vector_index_manager()
+        use_binary, short_dim, candidates = candidate_pass(fmt, mode, k)
+        approx_query = build_knn_query(fmt, sql.SQL(""), use_binary=use_binary, short_dim=short_dim)
+        exact_query = build_knn_query(fmt, sql.SQL(""))
+        with conn.cursor() as cur:
+            # ::vector so halfvec rows come back as arrays too
+            cur.execute(
+                "SELECT embedding::vector FROM legal_chunks WHERE embedding IS NOT NULL ORDER BY random() LIMIT %s;",
+                (sample,),
+            )
+            queries = [[float(x) for x in row[0]] for row in cur.fetchall()]
+        hits, approx_ms, exact_ms = 0, [], []
+        for qvec in queries:
+            params = {"q": qvec, "k": k, "candidates": candidates}
+            with conn.transaction(), conn.cursor() as cur:
+                index_manager.apply_search_settings(
+                    cur, k, mode, extra=self.candidate_settings(candidates) if candidates > k else None)
+                t0 = time.perf_counter()
+                cur.execute(approx_query, params)
+                approx = [row[0] for row in cur.fetchall()]
+                approx_ms.append((time.perf_counter() - t0) * 1000)
+            with conn.transaction(), conn.cursor() as cur:
+                index_manager.apply_search_settings(cur, k, "exact")
+                t0 = time.perf_counter()
+                cur.execute(exact_query, params)
+                exact = [row[0] for row in cur.fetchall()]
+                exact_ms.append((time.perf_counter() - t0) * 1000)
+            hits += len(set(approx) & set(exact))
+        n = max(1, len(queries))
+        return {
+            "format": fmt.to_dict(),
+            "mode": mode,
+            "queries": len(queries),
+            f"recall@{k}": round(hits / (n * k), 4),
+            "approx_ms_avg": round(sum(approx_ms) / n, 2),
+            "exact_ms_avg": round(sum(exact_ms) / n, 2),
+        }
+
+    def get_status(self, conn=None) -> Dict[str, Any]:
+        with optional_connection(conn) as conn:
+            status: Dict[str, Any] = {
+                "configured": StorageFormat(STORAGE_TYPE, EMBED_DIM, STORAGE_NORMALIZED, STORAGE_BINARY).to_dict(),
+            }
+            if not conn:
+                return status
+            try:
+                status["current"] = self.detect(conn).to_dict()
+                status["sizes"] = self.sizes(conn)
+            except Exception as e:
+                status["error"] = str(e)
+            return status
+
+
+# Singleton instance
+vector_storage_manager = VectorStorageManager()
+
+
+def get_vector_storage() -> VectorStorageManager:
+    """Get the vector storage manager singleton"""
+    return vector_storage_manager
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Inspect or migrate the legal_chunks embedding storage format")
+    parser.add_argument("command", choices=["status", "migrate", "recall"], nargs="?", default="status")
+    parser.add_argument("--type", choices=STORAGE_TYPES, default=STORAGE_TYPE, help="Override VECTOR_STORAGE")
+    parser.add_argument("--normalize", action="store_true", default=STORAGE_NORMALIZED,
+                        help="Normalize rows and search by inner product")
+    parser.add_argument("--binary", action="store_true", default=STORAGE_BINARY,
+                        help="Add the binary-quantized shadow column for Hamming pre-filtering")
+    parser.add_argument("--sample", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--mode", default="balanced")
+    args = parser.parse_args()
+
+    if not wait_ready():
+        logger.error("Database not ready")
+        raise SystemExit(1)
+    conn = get_connection()
+    manager = get_vector_storage()
+    if args.command == "migrate":
+        result = manager.migrate(conn, args.type, args.normalize, args.binary)
+    elif args.command == "recall":
+        result = manager.measure_recall(conn, args.sample, args.k, args.mode)
+    else:
+        result = manager.get_status(conn)
+    for key, value in result.items():
+        logger.info(f"{key}: {value}")